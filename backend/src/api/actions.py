@@ -71,7 +71,14 @@ async def cleanup_history():
         config = await config_manager.get_config()
         history_service = await get_history_service()
         
-        result = await history_service.cleanup_old_data(config.history_retention_days)
+        result = await history_service.cleanup_old_data(
+            config.history_retention_days,
+            rollup_retention_days={
+                "1m": config.rollup_1m_retention_days,
+                "15m": config.rollup_15m_retention_days,
+                "1h": config.rollup_1h_retention_days,
+            }
+        )
         
         return {
             "success": True,
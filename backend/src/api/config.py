@@ -7,10 +7,10 @@ from fastapi import APIRouter, HTTPException, UploadFile, File
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from models import Config, NotifierConfig
+from models import Config
 from config import get_config_manager, APP_VERSION
 from services.notifier import get_notifier_service
-from services.monitor import get_monitor
+from services.hook_graph import resolve_dependencies
 import io
 
 router = APIRouter()
@@ -28,6 +28,9 @@ class ConfigUpdate(BaseModel):
     notification_enabled: bool = True
     sample_interval_seconds: int
     history_retention_days: int
+    rollup_1m_retention_days: int = 90
+    rollup_15m_retention_days: int = 365
+    rollup_1h_retention_days: int = 1825
     poll_interval_seconds: int
     cleanup_interval_hours: int
     pre_shutdown_hooks: List[Dict[str, Any]] = []
@@ -36,6 +39,7 @@ class ConfigUpdate(BaseModel):
     wol_on_power_restore: bool = False
     wol_delay_seconds: int = 60
     device_status_check_interval_seconds: int = 60
+    battery_test_sample_interval_seconds: int = 1
     battery_install_date: Optional[str] = None
     # UPS 监控模式配置
     monitoring_mode: Optional[str] = None
@@ -70,58 +74,24 @@ async def update_config(config_update: ConfigUpdate):
         if not channel.get("id"):
             channel["id"] = str(uuid.uuid4())
 
+    # 校验关机前置任务依赖（引用不存在的任务或存在循环依赖）
+    try:
+        resolve_dependencies([h for h in config_update.pre_shutdown_hooks if h.get("enabled", True)])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # 转换为 Config 对象
     config = Config(**config_update.dict())
     
-    # 更新配置
-    await config_manager.update_config(config)
-    
-    # 重新配置通知服务
-    notifier_service = get_notifier_service()
-    notify_channels = [NotifierConfig(**ch) for ch in config.notify_channels]
-    notifier_service.configure(notify_channels, config.notify_events, config.notification_enabled)
-
-    # ========== 热更新运行中的服务实例 ==========
-
-    # 2. ShutdownManager（关机策略）
-    monitor = get_monitor()
-    if monitor and monitor.shutdown_manager:
-        sm = monitor.shutdown_manager
-        old_vals = (sm.wait_minutes, sm.battery_percent, sm.final_wait_seconds,
-                    sm.estimated_runtime_threshold, sm.test_mode)
-
-        sm.wait_minutes = config.shutdown_wait_minutes
-        sm.battery_percent = config.shutdown_battery_percent
-        sm.final_wait_seconds = config.shutdown_final_wait_seconds
-        sm.estimated_runtime_threshold = config.estimated_runtime_threshold
-        sm.test_mode = config.test_mode
-
-        new_vals = (sm.wait_minutes, sm.battery_percent, sm.final_wait_seconds,
-                    sm.estimated_runtime_threshold, sm.test_mode)
-        if old_vals != new_vals:
-            logger.info(
-                f"ShutdownManager hot-reloaded: wait={sm.wait_minutes}min, "
-                f"battery={sm.battery_percent}%, final_wait={sm.final_wait_seconds}s, "
-                f"runtime_threshold={sm.estimated_runtime_threshold}min, "
-                f"test_mode={sm.test_mode}"
-            )
-
-    # 3. UpsMonitor（轮询间隔 + config 引用）
-    if monitor:
-        old_poll = monitor.poll_interval
-        old_sample = monitor.sample_interval
-
-        monitor.poll_interval = config.poll_interval_seconds
-        monitor.sample_interval = config.sample_interval_seconds
-        monitor.config = config  # 同步 monitoring_mode, event_driven_* 等
-
-        if old_poll != monitor.poll_interval or old_sample != monitor.sample_interval:
-            logger.info(
-                f"UpsMonitor hot-reloaded: poll_interval={monitor.poll_interval}s, "
-                f"sample_interval={monitor.sample_interval}s"
-            )
-
-    return {"success": True, "message": "配置已更新"}
+    # 只写入有变化的配置项；通知服务、关机策略、轮询间隔等由变更订阅者热更新
+    change = await config_manager.update_config(config)
+
+    return {
+        "success": True,
+        "message": "配置已更新",
+        "version": config_manager.version,
+        "changed": sorted(change.keys) if change else [],
+    }
 
 
 @router.post("/config/test-notify")
@@ -317,8 +287,10 @@ def validate_config_structure(config_dict: dict) -> tuple[bool, str]:
         'shutdown_wait_minutes', 'shutdown_battery_percent',
         'shutdown_final_wait_seconds', 'estimated_runtime_threshold',
         'sample_interval_seconds', 'history_retention_days',
+        'rollup_1m_retention_days', 'rollup_15m_retention_days', 'rollup_1h_retention_days',
         'poll_interval_seconds', 'cleanup_interval_hours',
-        'wol_delay_seconds', 'device_status_check_interval_seconds'
+        'wol_delay_seconds', 'device_status_check_interval_seconds',
+        'battery_test_sample_interval_seconds'
     ]
     
     for field in int_fields:
@@ -462,14 +434,9 @@ async def import_config(
         # 创建新的 Config 对象
         new_config = Config(**final_dict)
         
-        # 更新配置
+        # 更新配置（变更订阅者负责热更新相关服务）
         await config_manager.update_config(new_config)
         
-        # 重新配置通知服务
-        notifier_service = get_notifier_service()
-        notify_channels = [NotifierConfig(**ch) for ch in new_config.notify_channels]
-        notifier_service.configure(notify_channels, new_config.notify_events, new_config.notification_enabled)
-        
         # 统计受影响的配置项
         affected_count = len(config_dict.keys())
         
@@ -579,11 +546,15 @@ async def compare_config(file: UploadFile = File(...), mode: str = "merge"):
             'estimated_runtime_threshold': '预计运行时间阈值(秒)',
             'sample_interval_seconds': '数据采样间隔(秒)',
             'history_retention_days': '历史数据保留天数',
+            'rollup_1m_retention_days': '1分钟降采样保留天数',
+            'rollup_15m_retention_days': '15分钟降采样保留天数',
+            'rollup_1h_retention_days': '1小时降采样保留天数',
             'poll_interval_seconds': '轮询间隔(秒)',
             'cleanup_interval_hours': '清理间隔(小时)',
             'wol_delay_seconds': 'WOL 延迟时间(秒)',
             'wol_on_power_restore': '电源恢复后 WOL 唤醒',
             'device_status_check_interval_seconds': '设备状态检查间隔(秒)',
+            'battery_test_sample_interval_seconds': '电池测试采样间隔(秒)',
             'notification_enabled': '启用通知',
             'notify_events': '通知事件类型',
             'notify_channels': '通知渠道',
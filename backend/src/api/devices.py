@@ -2,7 +2,7 @@
 import asyncio
 import logging
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Path
+from fastapi import APIRouter, HTTPException, Path, Query
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
 from hooks.registry import get_registry
@@ -10,6 +10,8 @@ from config import get_config_manager
 from services.wol import send_wol
 from services.history import HistoryService
 from services.notifier import get_notifier_service
+from services.ssh_pool import get_ssh_pool
+from services.device_reachability import device_hooks, get_reachability_service
 from db.database import get_db
 from models import EventType
 
@@ -87,43 +89,7 @@ async def get_device_by_index(device_index: int) -> tuple:
     """
     config_manager = await get_config_manager()
     config = await config_manager.get_config()
-    hooks_config = config.pre_shutdown_hooks
-    
-    # 仅在测试模式为 "mock" 时且没有配置纳管设备时，注入两台模拟设备
-    # 生产模式(production)和演练模式(dry_run)不应显示假数据
-    if config.test_mode == "mock" and (not hooks_config or len(hooks_config) == 0):
-        hooks_config = [
-            {
-                "name": "Mock Linux Server",
-                "hook_id": "ssh_shutdown",
-                "enabled": True,
-                "priority": 1,
-                "config": {
-                    "host": "192.168.1.100",
-                    "port": 22,
-                    "username": "admin",
-                    "auth_type": "password",
-                    "password": "mock_password",
-                    "mac_address": "AA:BB:CC:DD:EE:01",
-                    "broadcast_address": "255.255.255.255"
-                }
-            },
-            {
-                "name": "Mock NAS",
-                "hook_id": "synology_shutdown",
-                "enabled": True,
-                "priority": 2,
-                "config": {
-                    "host": "192.168.1.200",
-                    "port": 22,
-                    "username": "admin",
-                    "auth_type": "password",
-                    "password": "mock_password",
-                    "mac_address": "AA:BB:CC:DD:EE:02",
-                    "broadcast_address": "255.255.255.255"
-                }
-            }
-        ]
+    hooks_config = device_hooks(config)
     
     if not hooks_config or device_index >= len(hooks_config):
         raise HTTPException(status_code=404, detail="设备不存在")
@@ -163,43 +129,7 @@ async def list_devices():
     """
     config_manager = await get_config_manager()
     config = await config_manager.get_config()
-    hooks_config = config.pre_shutdown_hooks
-    
-    # 仅在测试模式为 "mock" 时且没有配置纳管设备时，注入两台模拟设备
-    # 生产模式(production)和演练模式(dry_run)不应显示假数据
-    if config.test_mode == "mock" and (not hooks_config or len(hooks_config) == 0):
-        hooks_config = [
-            {
-                "name": "Mock Linux Server",
-                "hook_id": "ssh_shutdown",
-                "enabled": True,
-                "priority": 1,
-                "config": {
-                    "host": "192.168.1.100",
-                    "port": 22,
-                    "username": "admin",
-                    "auth_type": "password",
-                    "password": "mock_password",
-                    "mac_address": "AA:BB:CC:DD:EE:01",
-                    "broadcast_address": "255.255.255.255"
-                }
-            },
-            {
-                "name": "Mock NAS",
-                "hook_id": "synology_shutdown",
-                "enabled": True,
-                "priority": 2,
-                "config": {
-                    "host": "192.168.1.200",
-                    "port": 22,
-                    "username": "admin",
-                    "auth_type": "password",
-                    "password": "mock_password",
-                    "mac_address": "AA:BB:CC:DD:EE:02",
-                    "broadcast_address": "255.255.255.255"
-                }
-            }
-        ]
+    hooks_config = device_hooks(config)
     
     devices = []
     registry = get_registry()
@@ -230,7 +160,7 @@ async def list_devices():
 @router.get("/devices/status")
 async def get_devices_status():
     """
-    批量检查所有设备连通性
+    获取所有设备连通性（后台定期探测的缓存结果）
     
     Returns:
         {
@@ -241,118 +171,64 @@ async def get_devices_status():
                     "hook_id": "ssh_shutdown",
                     "online": true,
                     "last_check": "2026-02-11T12:00:00",
-                    "error": null
+                    "error": null,
+                    "latency_ms": 12.5,
+                    "avg_latency_ms": 13.1
                 }
             ]
         }
     """
     config_manager = await get_config_manager()
     config = await config_manager.get_config()
-    hooks_config = config.pre_shutdown_hooks
-    
-    # 仅在测试模式为 "mock" 时且没有配置纳管设备时，注入两台模拟设备
-    # 生产模式(production)和演练模式(dry_run)不应显示假数据
-    if config.test_mode == "mock" and (not hooks_config or len(hooks_config) == 0):
-        hooks_config = [
-            {
-                "name": "Mock Linux Server",
-                "hook_id": "ssh_shutdown",
-                "enabled": True,
-                "priority": 1,
-                "config": {
-                    "host": "192.168.1.100",
-                    "port": 22,
-                    "username": "admin",
-                    "auth_type": "password",
-                    "password": "mock_password",
-                    "mac_address": "AA:BB:CC:DD:EE:01",
-                    "broadcast_address": "255.255.255.255"
-                }
-            },
-            {
-                "name": "Mock NAS",
-                "hook_id": "synology_shutdown",
-                "enabled": True,
-                "priority": 2,
-                "config": {
-                    "host": "192.168.1.200",
-                    "port": 22,
-                    "username": "admin",
-                    "auth_type": "password",
-                    "password": "mock_password",
-                    "mac_address": "AA:BB:CC:DD:EE:02",
-                    "broadcast_address": "255.255.255.255"
-                }
-            }
-        ]
+    hooks_config = device_hooks(config)
     
     if not hooks_config:
         return {"devices": []}
     
     registry = get_registry()
-    devices = []
     
-    # 并行检测所有设备状态
-    async def check_device(index: int, hook_config: dict) -> dict:
-        """检测单个设备状态"""
-        hook_id = hook_config.get("hook_id")
-        hook_name = hook_config.get("name", "Unknown")
-        
+    # 状态来自后台探测缓存，不再每次请求都连接设备
+    statuses = await get_reachability_service().get_statuses(hooks_config)
+    
+    devices = []
+    for index, (hook_config, status) in enumerate(zip(hooks_config, statuses)):
         # Get supported_actions from hook class
         supported_actions = ["shutdown"]  # Default
         try:
-            hook_class = registry.get_hook(hook_id)
+            hook_class = registry.get_hook(hook_config.get("hook_id"))
             if hasattr(hook_class, 'supported_actions'):
                 supported_actions = hook_class.supported_actions
         except Exception:
             pass
         
-        device_status = {
+        devices.append({
             "index": index,
-            "name": hook_name,
-            "hook_id": hook_id,
-            "online": False,
-            "last_check": datetime.now().isoformat(),
-            "error": None,
+            **status,
             "supported_actions": supported_actions
-        }
-        
-        if not hook_config.get("enabled", True):
-            device_status["error"] = "设备已禁用"
-            return device_status
-        
-        try:
-            # 创建 hook 实例
-            hook_instance = registry.create_instance(hook_id, hook_config.get("config", {}))
-            
-            # 测试连接（带超时）
-            success = await asyncio.wait_for(
-                hook_instance.test_connection(),
-                timeout=5.0
-            )
-            
-            device_status["online"] = success
-            if not success:
-                device_status["error"] = "连接测试失败"
-        
-        except asyncio.TimeoutError:
-            device_status["error"] = "连接超时"
-        except ConnectionError as e:
-            device_status["error"] = str(e)
-        except ValueError as e:
-            device_status["error"] = f"配置错误: {str(e)}"
-        except Exception as e:
-            device_status["error"] = str(e)
-        
-        return device_status
-    
-    # 并行检测所有设备
-    tasks = [check_device(i, hook_config) for i, hook_config in enumerate(hooks_config)]
-    devices = await asyncio.gather(*tasks, return_exceptions=False)
+        })
     
     return {"devices": devices}
 
 
+@router.get("/devices/{device_index}/reachability")
+async def get_device_reachability(device_index: int = Path(..., ge=0)):
+    """
+    获取设备最近的连通性探测结果和延迟历史
+    
+    Args:
+        device_index: 设备索引
+    """
+    config_manager = await get_config_manager()
+    config = await config_manager.get_config()
+    hooks_config = device_hooks(config)
+    
+    if device_index >= len(hooks_config):
+        raise HTTPException(status_code=404, detail="设备不存在")
+    
+    statuses = await get_reachability_service().get_statuses([hooks_config[device_index]], history=True)
+    return {"index": device_index, **statuses[0]}
+
+
 @router.post("/devices/{device_index}/execute")
 async def execute_device_command(
     device_index: int = Path(..., ge=0),
@@ -383,30 +259,11 @@ async def execute_device_command(
     
     # 执行命令
     try:
-        import asyncssh
-        
         config = hook_config.get("config", {})
-        host = config.get("host")
-        port = config.get("port", 22)
-        username = config.get("username")
-        auth_type = config.get("auth_type", "password")
-        
-        # 准备 SSH 连接参数
-        connect_kwargs = {
-            "host": host,
-            "port": port,
-            "username": username,
-            "known_hosts": None
-        }
         
-        if auth_type == "password":
-            connect_kwargs["password"] = config.get("password")
-        else:
-            connect_kwargs["client_keys"] = [config.get("private_key")]
-        
-        # 连接并执行命令
+        # 复用会话池中的连接执行命令
         try:
-            async with asyncssh.connect(**connect_kwargs) as conn:
+            async with get_ssh_pool().session(config) as conn:
                 result = await asyncio.wait_for(
                     conn.run(request.command, check=False),
                     timeout=SSH_COMMAND_TIMEOUT
@@ -499,23 +356,10 @@ async def check_device(device_index: int = Path(..., ge=0)) -> DeviceCheckRespon
         system_info = None
         if success and hook_id in ["ssh_shutdown", "lazycat_shutdown", "synology_shutdown", "qnap_shutdown"]:
             try:
-                import asyncssh
                 config = hook_config.get("config", {})
                 
-                connect_kwargs = {
-                    "host": config.get("host"),
-                    "port": config.get("port", 22),
-                    "username": config.get("username"),
-                    "known_hosts": None
-                }
-                
-                if config.get("auth_type", "password") == "password":
-                    connect_kwargs["password"] = config.get("password")
-                else:
-                    connect_kwargs["client_keys"] = [config.get("private_key")]
-                
                 try:
-                    async with asyncssh.connect(**connect_kwargs) as conn:
+                    async with get_ssh_pool().session(config) as conn:
                         result = await asyncio.wait_for(
                             conn.run("uname -a || hostname", check=False),
                             timeout=3.0
@@ -766,29 +610,9 @@ async def get_device_logs(device_index: int = Path(..., ge=0)):
     
     # 执行日志查看命令
     try:
-        import asyncssh
-        
-        host = config.get("host")
-        port = config.get("port", 22)
-        username = config.get("username")
-        auth_type = config.get("auth_type", "password")
-        
-        # 准备 SSH 连接参数
-        connect_kwargs = {
-            "host": host,
-            "port": port,
-            "username": username,
-            "known_hosts": None
-        }
-        
-        if auth_type == "password":
-            connect_kwargs["password"] = config.get("password")
-        else:
-            connect_kwargs["client_keys"] = [config.get("private_key")]
-        
-        # 连接并执行日志命令
+        # 复用会话池中的连接执行日志命令
         try:
-            async with asyncssh.connect(**connect_kwargs) as conn:
+            async with get_ssh_pool().session(config) as conn:
                 result = await asyncio.wait_for(
                     conn.run(log_command, check=False),
                     timeout=30.0
@@ -1020,8 +844,9 @@ async def hibernate_device(device_index: int = Path(..., ge=0)):
 class ScheduledActionRequest(BaseModel):
     """定时操作请求"""
     action: str  # shutdown, wake, sleep, hibernate, reboot
-    scheduled_time: str  # ISO 格式的计划执行时间
-    repeat: str = "once"  # once, daily, weekly
+    scheduled_time: Optional[str] = None  # ISO 格式的计划执行时间（cron 任务可省略）
+    repeat: str = "once"  # once, daily, weekly, cron
+    cron: Optional[str] = None  # cron 表达式（分 时 日 月 周），repeat 为 cron 时必填
 
 
 @router.post("/devices/{device_index}/schedule")
@@ -1053,13 +878,15 @@ async def schedule_device_action(
         )
     
     # Parse scheduled time
-    try:
-        scheduled_time = datetime.fromisoformat(request.scheduled_time.replace('Z', '+00:00'))
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid scheduled_time format: {e}")
+    scheduled_time = None
+    if request.scheduled_time:
+        try:
+            scheduled_time = datetime.fromisoformat(request.scheduled_time.replace('Z', '+00:00'))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid scheduled_time format: {e}")
     
     # Validate repeat
-    valid_repeats = ["once", "daily", "weekly"]
+    valid_repeats = ["once", "daily", "weekly", "cron"]
     if request.repeat not in valid_repeats:
         raise HTTPException(
             status_code=400,
@@ -1073,13 +900,15 @@ async def schedule_device_action(
             device_name=device_name,
             action=request.action,
             scheduled_time=scheduled_time,
-            repeat=request.repeat
+            repeat=request.repeat,
+            cron=request.cron
         )
         
+        when = f"cron '{request.cron}'" if request.repeat == "cron" else f"at {scheduled_time}"
         return {
             "success": True,
             "schedule_id": schedule_id,
-            "message": f"定时任务已创建：{device_name} {request.action} at {scheduled_time}"
+            "message": f"定时任务已创建：{device_name} {request.action} {when}"
         }
     
     except ValueError as e:
@@ -1132,7 +961,7 @@ async def delete_device_schedule(
     await get_device_by_index(device_index)
     
     scheduler = get_scheduler()
-    success = await scheduler.remove_schedule(schedule_id)
+    success = scheduler.has_schedule(schedule_id, device_index) and await scheduler.remove_schedule(schedule_id)
     
     if success:
         return {
@@ -1143,6 +972,37 @@ async def delete_device_schedule(
         raise HTTPException(status_code=404, detail="定时任务不存在")
 
 
+@router.get("/devices/{device_index}/schedules/{schedule_id}/runs")
+async def get_device_schedule_runs(
+    device_index: int = Path(..., ge=0),
+    schedule_id: str = Path(...),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    获取定时任务的执行记录
+    
+    Args:
+        device_index: 设备索引
+        schedule_id: 定时任务ID
+        limit: 返回条数
+    
+    Returns:
+        执行记录（最新的在前）
+    """
+    from services.scheduler import get_scheduler
+    
+    # Verify device exists
+    await get_device_by_index(device_index)
+    
+    scheduler = get_scheduler()
+    # 已完成的一次性任务不在任务列表中，但执行记录仍然保留
+    runs = await scheduler.get_runs(schedule_id, limit=limit, device_index=device_index)
+    if not runs and not scheduler.has_schedule(schedule_id, device_index):
+        raise HTTPException(status_code=404, detail="定时任务不存在")
+    
+    return {"runs": runs}
+
+
 @router.get("/schedules/all")
 async def get_all_schedules():
     """
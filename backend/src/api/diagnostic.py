@@ -5,6 +5,8 @@ from datetime import datetime
 from fastapi import APIRouter
 from config import settings, APP_VERSION
 from services.monitor import get_monitor
+from services.diagnostics_collector import get_diagnostics_collector
+from services.storage_stats import load_storage_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -80,35 +82,16 @@ async def export_diagnostic_report():
                 "last_update": current_data.last_update.isoformat() if current_data.last_update else None,
             }
     
-    # 原始 UPS 变量（尽量获取全部）
-    try:
-        if monitor and hasattr(monitor, 'nut_client'):
-            client = monitor.nut_client
-            if hasattr(client, 'list_vars'):
-                raw_vars = await client.list_vars()
-                report["ups_variables"] = raw_vars
-    except Exception as e:
-        report["ups_variables_error"] = str(e)
+    # 原始 UPS 变量：监控器变量目录中的最新值（不访问 NUT）
+    if monitor and hasattr(monitor, 'var_catalog'):
+        report["ups_variables"] = monitor.var_catalog.snapshot()
     
-    # 可写变量
-    try:
-        if monitor and hasattr(monitor, 'nut_client'):
-            client = monitor.nut_client
-            if hasattr(client, 'list_rw'):
-                rw_vars = await client.list_rw()
-                report["writable_variables"] = rw_vars
-    except Exception as e:
-        report["writable_variables_error"] = str(e)
-    
-    # 支持的命令
-    try:
-        if monitor and hasattr(monitor, 'nut_client'):
-            client = monitor.nut_client
-            if hasattr(client, 'list_commands'):
-                commands = await client.list_commands()
-                report["supported_commands"] = commands
-    except Exception as e:
-        report["supported_commands_error"] = str(e)
+    # 可写变量和支持的命令：后台收集器在连接建立或驱动变化时刷新
+    capabilities = get_diagnostics_collector().capabilities()
+    report["writable_variables"] = capabilities["writable_variables"]
+    report["supported_commands"] = capabilities["supported_commands"]
+    if capabilities["error"]:
+        report["capabilities_error"] = capabilities["error"]
     
     # 最近事件
     try:
@@ -133,8 +116,13 @@ async def export_diagnostic_report():
     # 数据库统计
     try:
         db = await get_db()
+        # events / metrics 使用触发器维护的行数，不做全表 COUNT(*)
+        storage_tables = await load_storage_stats(db)
         stats = {}
-        for table in ["events", "metrics", "config", "battery_test_reports", "monitoring_stats"]:
+        for table in ["events", "metrics", "config", "battery_test_reports", "battery_test_samples", "monitoring_stats"]:
+            if table in storage_tables:
+                stats[table] = storage_tables[table]["rows"]
+                continue
             count = await db.fetch_one(f"SELECT COUNT(*) as cnt FROM {table}")
             stats[table] = count["cnt"] if count else 0
         report["database_stats"] = stats
@@ -85,6 +85,8 @@ async def detailed_health():
         "current_status": monitor._current_status.value if monitor._current_status else "unknown",
         "poll_interval": monitor.poll_interval,
         "sample_interval": monitor.sample_interval,
+        "var_catalog": monitor.var_catalog.get_stats(),
+        "anomaly_detector": monitor.anomaly_detector.get_stats(),
     }
     
     # 获取 NUT 连接状态
@@ -120,6 +122,98 @@ async def detailed_health():
             "last_update": monitor._current_data.last_update.isoformat()
         }
     
+    # 指标写入队列统计
+    metric_writer_info = None
+    try:
+        from services.history import get_history_service
+        history_service = await get_history_service()
+        if history_service.metric_writer is not None:
+            metric_writer_info = history_service.metric_writer.get_stats()
+    except Exception:
+        pass
+
+    # WebSocket 推送统计
+    websocket_info = None
+    try:
+        from api.websocket import manager
+        websocket_info = manager.get_stats()
+    except Exception:
+        pass
+
+    # 预测缓存统计（未访问过预测接口时为 None）
+    prediction_cache_info = None
+    try:
+        from services import prediction_cache
+        if prediction_cache._prediction_cache is not None:
+            prediction_cache_info = prediction_cache._prediction_cache.get_stats()
+    except Exception:
+        pass
+
+    # 通知分发队列统计
+    notifier_info = None
+    try:
+        from services.notifier import get_notifier_service
+        notifier_info = get_notifier_service().get_stats()
+    except Exception:
+        pass
+
+    # HTTP 客户端池统计
+    http_pool_info = None
+    try:
+        from services.http_pool import get_http_pool
+        http_pool_info = get_http_pool().get_stats()
+    except Exception:
+        pass
+
+    # 设备连通性探测统计
+    reachability_info = None
+    try:
+        from services.device_reachability import get_reachability_service
+        reachability_info = get_reachability_service().get_stats()
+    except Exception:
+        pass
+
+    # 设备定时任务调度统计
+    scheduler_info = None
+    try:
+        from services.scheduler import get_scheduler
+        scheduler_info = get_scheduler().get_stats()
+    except Exception:
+        pass
+
+    # 诊断信息收集器统计
+    diagnostics_info = None
+    try:
+        from services.diagnostics_collector import get_diagnostics_collector
+        diagnostics_info = get_diagnostics_collector().get_stats()
+    except Exception:
+        pass
+
+    # SSH 会话池统计
+    ssh_pool_info = None
+    try:
+        from services.ssh_pool import get_ssh_pool
+        ssh_pool_info = get_ssh_pool().get_stats()
+    except Exception:
+        pass
+
+    # 电池测试采样写入统计（未开始过测试时为 None）
+    battery_test_info = None
+    try:
+        from services import battery_test_report
+        if battery_test_report._report_service is not None:
+            battery_test_info = battery_test_report._report_service.get_stats()
+    except Exception:
+        pass
+
+    # 数据库连接与查询耗时统计
+    database_info = None
+    try:
+        from db.database import get_db
+        database_info = (await get_db()).get_stats()
+    except Exception:
+        pass
+
     # 组装结果
     result = {
         "status": "healthy" if monitor._running and nut_info["connected"] else "degraded",
@@ -127,6 +221,17 @@ async def detailed_health():
         "monitor": monitor_info,
         "nut": nut_info,
         "ups": ups_info,
+        "metric_writer": metric_writer_info,
+        "websocket": websocket_info,
+        "prediction_cache": prediction_cache_info,
+        "notifier": notifier_info,
+        "http_pool": http_pool_info,
+        "ssh_pool": ssh_pool_info,
+        "device_reachability": reachability_info,
+        "diagnostics": diagnostics_info,
+        "scheduler": scheduler_info,
+        "battery_test": battery_test_info,
+        "database": database_info,
         "retry_stats": {
             "nut_reconnect_count": monitor._reconnect_count,
             "nut_connection_notified": monitor._connection_notified
@@ -2,33 +2,71 @@
 from fastapi import APIRouter, Query, HTTPException
 from fastapi.responses import StreamingResponse
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
 import csv
 import io
+import tempfile
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill
-from models import EventType
+from openpyxl.utils import get_column_letter
+from db.metric_store import from_epoch_ms
+from models import DEFAULT_UPS_ID, EventType
 from services.history import get_history_service
+from services.event_query import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EventQuery
 
 router = APIRouter()
 
 
+def _event_query(
+    days: int,
+    event_type: Optional[str],
+    types: Optional[str],
+    ups_id: Optional[str],
+    q: Optional[str],
+) -> dict:
+    """解析事件查询的公共参数"""
+    event_types = [t.strip() for t in (types or "").split(",") if t.strip()]
+    if event_type:
+        event_types.append(event_type)
+    for value in event_types:
+        try:
+            EventType(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid event_type: {value}")
+    return {
+        "since": datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days),
+        "event_types": event_types,
+        "ups_id": ups_id,
+        "search": q.strip() if q and q.strip() else None,
+    }
+
+
 @router.get("/history/events")
 async def get_events(
-    days: int = Query(7, ge=1, le=365, description="查询最近几天的事件"),
-    event_type: Optional[str] = Query(None, description="过滤事件类型")
+    days: int = Query(7, ge=1, le=3650, description="查询最近几天的事件"),
+    event_type: Optional[str] = Query(None, description="过滤事件类型"),
+    types: Optional[str] = Query(None, description="过滤多个事件类型（逗号分隔）"),
+    ups_id: Optional[str] = Query(None, description="过滤 UPS（多 UPS 监控），默认返回全部"),
+    q: Optional[str] = Query(None, max_length=200, description="全文检索 message 和 metadata（空格分隔，全部匹配）"),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor）"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="每页事件数"),
 ):
-    """获取历史事件"""
+    """获取历史事件（时间倒序，键集分页）"""
     history_service = await get_history_service()
-    
-    event_type_enum = None
-    if event_type:
-        try:
-            event_type_enum = EventType(event_type)
-        except ValueError:
-            pass
-    
-    events = await history_service.get_events(days, event_type_enum)
+    test_mode = await history_service.current_test_mode()
+    query = EventQuery(
+        test_mode=test_mode,
+        cursor=cursor,
+        limit=limit,
+        **_event_query(days, event_type, types, ups_id, q),
+    )
+
+    try:
+        events, next_cursor = await history_service.query_events(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "events": [
@@ -38,26 +76,69 @@ async def get_events(
                 "message": event.message,
                 # Convert to UTC ISO format with Z suffix for proper timezone handling
                 "timestamp": event.timestamp.isoformat().replace('+00:00', 'Z'),
-                "metadata": event.metadata
+                "metadata": event.metadata,
+                "ups_id": event.ups_id
             }
             for event in events
-        ]
+        ],
+        "next_cursor": next_cursor,
     }
 
 
+@router.get("/history/events/stats")
+async def get_event_stats(
+    days: int = Query(7, ge=1, le=3650, description="统计最近几天的事件"),
+    ups_id: Optional[str] = Query(None, description="过滤 UPS（多 UPS 监控），默认统计全部"),
+    q: Optional[str] = Query(None, max_length=200, description="全文检索条件"),
+):
+    """按事件类型统计数量（事件页的统计卡片，不受分页影响）"""
+    history_service = await get_history_service()
+    query = EventQuery(
+        test_mode=await history_service.current_test_mode(),
+        **_event_query(days, None, None, ups_id, q),
+    )
+    counts = await history_service.count_events_by_type(query)
+    return {"counts": counts, "total": sum(counts.values())}
+
+
 @router.get("/history/metrics")
 async def get_metrics(
-    hours: int = Query(None, ge=1, le=720, description="查询最近几小时的指标"),
-    minutes: int = Query(None, ge=1, le=60, description="查询最近几分钟的指标")
+    hours: int = Query(None, ge=1, le=43800, description="查询最近几小时的指标（超过 720 小时时自动使用降采样数据）"),
+    minutes: int = Query(None, ge=1, le=60, description="查询最近几分钟的指标"),
+    max_points: int = Query(None, ge=10, le=20000, description="点数预算，指定后按范围自动选择降采样层级"),
+    ups_id: str = Query(DEFAULT_UPS_ID, description="UPS 标识（多 UPS 监控）")
 ):
     """获取历史指标"""
     history_service = await get_history_service()
+
+    # 超过 30 天的范围只提供降采样数据
+    if max_points is None and hours is not None and hours > 720:
+        max_points = 2000
+
+    # 指定点数预算时按范围选择原始数据或 rollup 层级
+    if max_points is not None and minutes is None:
+        series = await history_service.get_metric_series(
+            hours if hours is not None else 24,
+            max_points=max_points,
+            ups_id=ups_id
+        )
+        return {
+            "resolution": series["resolution"],
+            "metrics": [
+                {
+                    **point,
+                    # Convert to UTC ISO format with Z suffix for proper timezone handling
+                    "timestamp": point["timestamp"].isoformat().replace('+00:00', 'Z'),
+                }
+                for point in series["points"]
+            ]
+        }
     
     # 优先使用 minutes 参数，否则使用 hours
     if minutes is not None:
         # 将分钟转换为小时（至少1小时以确保能获取数据）
         query_hours = max(1, minutes / 60)
-        metrics = await history_service.get_metrics(query_hours)
+        metrics = await history_service.get_metrics(query_hours, ups_id=ups_id)
 
         # 过滤到指定分钟范围内的数据
         if metrics:
@@ -67,7 +148,7 @@ async def get_metrics(
             metrics = [m for m in metrics if m.timestamp.replace(tzinfo=timezone.utc) >= cutoff_time]
     else:
         query_hours = hours if hours is not None else 24
-        metrics = await history_service.get_metrics(query_hours)
+        metrics = await history_service.get_metrics(query_hours, ups_id=ups_id)
 
     return {
         "metrics": [
@@ -94,9 +175,10 @@ async def export_history(
     format: str = Query("csv", description="导出格式: csv 或 xlsx"),
     type: str = Query("all", description="数据类型: events, metrics, 或 all"),
     start_date: Optional[str] = Query(None, description="开始日期 (ISO格式)"),
-    end_date: Optional[str] = Query(None, description="结束日期 (ISO格式)")
+    end_date: Optional[str] = Query(None, description="结束日期 (ISO格式)"),
+    ups_id: Optional[str] = Query(None, description="UPS 标识（事件默认全部，指标默认主 UPS）")
 ):
-    """导出历史数据"""
+    """导出历史数据（流式输出，内存占用与时间范围无关）"""
     # 验证格式
     if format not in ["csv", "xlsx"]:
         raise HTTPException(status_code=400, detail="format 必须是 'csv' 或 'xlsx'")
@@ -121,13 +203,12 @@ async def export_history(
                 end_dt = end_dt.replace(tzinfo=None)
         else:
             end_dt = datetime.now()
-        
-        # 限制最多90天
-        if (end_dt - start_dt).days > 90:
-            raise HTTPException(status_code=400, detail="导出时间范围不能超过90天")
     
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
+
+    if start_dt > end_dt:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
     
     history_service = await get_history_service()
     
@@ -137,173 +218,150 @@ async def export_history(
     
     # 根据格式导出
     if format == "csv":
-        return await export_csv(history_service, type, start_dt, end_dt, filename)
+        return await export_csv(history_service, type, start_dt, end_dt, filename, ups_id)
     else:
-        return await export_xlsx(history_service, type, start_dt, end_dt, filename)
+        return await export_xlsx(history_service, type, start_dt, end_dt, filename, ups_id)
 
 
-async def export_csv(history_service, data_type: str, start_dt: datetime, end_dt: datetime, filename: str):
-    """导出为 CSV 格式"""
-    output = io.StringIO()
-    
-    if data_type in ["events", "all"]:
-        # 导出事件
-        days = (end_dt - start_dt).days + 1
-        events = await history_service.get_events(days, None)
-        
-        # 过滤日期范围
-        filtered_events = [e for e in events if start_dt <= e.timestamp.replace(tzinfo=None) <= end_dt]
-        
-        writer = csv.writer(output)
-        writer.writerow(['时间', '事件类型', '描述'])
-        
-        for event in filtered_events:
-            writer.writerow([
-                event.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                event.event_type.value,
-                event.message
-            ])
-        
-        if data_type == "all":
-            writer.writerow([])  # 空行分隔
-    
-    if data_type in ["metrics", "all"]:
-        # 导出指标
-        hours = int((end_dt - start_dt).total_seconds() / 3600) + 1
-        metrics = await history_service.get_metrics(hours)
-        
-        # 过滤日期范围（统一转为无时区比较）
-        filtered_metrics = [m for m in metrics if start_dt <= m.timestamp.replace(tzinfo=None) <= end_dt]
-        
-        writer = csv.writer(output)
-        if data_type == "all":
-            writer.writerow(['指标数据'])
-        writer.writerow(['时间', '电池电量(%)', '输入电压(V)', '输出电压(V)', '负载(%)', '温度(°C)', '运行时间(秒)', '功率(W)', '用电量(kWh)'])
-
-        for metric in filtered_metrics:
-            writer.writerow([
-                metric.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                metric.battery_charge if metric.battery_charge is not None else '',
-                metric.input_voltage if metric.input_voltage is not None else '',
-                metric.output_voltage if metric.output_voltage is not None else '',
-                metric.load_percent if metric.load_percent is not None else '',
-                metric.temperature if metric.temperature is not None else '',
-                metric.battery_runtime if metric.battery_runtime is not None else '',
-                round(metric.power_watts, 1) if metric.power_watts is not None else '',
-                round(metric.energy_kwh, 3) if metric.energy_kwh is not None else ''
-            ])
-    
-    # 创建响应
-    output.seek(0)
+EVENT_HEADERS = ['时间', '事件类型', '描述']
+METRIC_HEADERS = ['时间', '电池电量(%)', '输入电压(V)', '输出电压(V)', '负载(%)', '温度(°C)', '运行时间(秒)', '功率(W)', '用电量(kWh)']
+
+# XLSX 列宽（write-only 模式无法在写入后按内容自动调整）
+EVENT_COLUMN_WIDTHS = [21, 20, 50]
+METRIC_COLUMN_WIDTHS = [21, 13, 13, 13, 10, 11, 14, 10, 13]
+
+# XLSX 临时文件的流式读取块大小
+XLSX_READ_CHUNK = 64 * 1024
+
+
+def _format_timestamp(value) -> str:
+    """数据库时间戳格式化为 YYYY-MM-DD HH:MM:SS"""
+    return datetime.fromisoformat(str(value)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _event_row(row) -> list:
+    """事件行 → 导出列"""
+    return [_format_timestamp(row['timestamp']), row['event_type'], row['message']]
+
+
+def _metric_row(row) -> list:
+    """指标行 → 导出列（缺失值为 None）"""
+    return [
+        from_epoch_ms(row['ts']).strftime('%Y-%m-%d %H:%M:%S'),
+        row['battery_charge'],
+        row['input_voltage'],
+        row['output_voltage'],
+        row['load_percent'],
+        row['temperature'],
+        row['battery_runtime'],
+        round(row['power_watts'], 1) if row['power_watts'] is not None else None,
+        round(row['energy_kwh'], 3) if row['energy_kwh'] is not None else None
+    ]
+
+
+async def export_csv(history_service, data_type: str, start_dt: datetime, end_dt: datetime, filename: str,
+                     ups_id: Optional[str] = None):
+    """导出为 CSV 格式（按块生成，每块写出后即释放）"""
+
+    async def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def take() -> str:
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return text
+
+        if data_type in ["events", "all"]:
+            writer.writerow(EVENT_HEADERS)
+            async for rows in history_service.iter_events(start_dt, end_dt, ups_id=ups_id):
+                writer.writerows(_event_row(row) for row in rows)
+                yield take()
+
+            if data_type == "all":
+                writer.writerow([])  # 空行分隔
+
+        if data_type in ["metrics", "all"]:
+            if data_type == "all":
+                writer.writerow(['指标数据'])
+            writer.writerow(METRIC_HEADERS)
+            async for rows in history_service.iter_metrics(start_dt, end_dt, ups_id=ups_id or DEFAULT_UPS_ID):
+                writer.writerows(
+                    ['' if value is None else value for value in _metric_row(row)]
+                    for row in rows
+                )
+                yield take()
+
+        tail = take()
+        if tail:
+            yield tail
+
     return StreamingResponse(
-        iter([output.getvalue()]),
+        generate(),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 
-async def export_xlsx(history_service, data_type: str, start_dt: datetime, end_dt: datetime, filename: str):
-    """导出为 Excel 格式"""
-    wb = Workbook()
-    
-    # 样式定义
+def _styled_header(ws, headers: list, widths: list) -> list:
+    """write-only 工作表的表头行和列宽"""
     header_font = Font(bold=True, size=12)
     header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    
+    for index, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    cells = []
+    for title in headers:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = header_font
+        cell.fill = header_fill
+        cells.append(cell)
+    return cells
+
+
+async def export_xlsx(history_service, data_type: str, start_dt: datetime, end_dt: datetime, filename: str,
+                      ups_id: Optional[str] = None):
+    """导出为 Excel 格式
+
+    使用 openpyxl write-only 模式：行数据直接写入临时文件而不是保存在
+    内存中的单元格对象里，最终的 xlsx 也写入临时文件后分块流式返回。
+    """
+    wb = Workbook(write_only=True)
+
     if data_type in ["events", "all"]:
-        # 创建事件工作表
-        ws_events = wb.active
-        ws_events.title = "事件记录"
-        
-        # 设置表头
-        headers = ['时间', '事件类型', '描述']
-        ws_events.append(headers)
-        
-        # 应用表头样式
-        for cell in ws_events[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-        
-        # 获取并写入数据
-        days = (end_dt - start_dt).days + 1
-        events = await history_service.get_events(days, None)
-        filtered_events = [e for e in events if start_dt <= e.timestamp.replace(tzinfo=None) <= end_dt]
-        
-        for event in filtered_events:
-            ws_events.append([
-                event.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                event.event_type.value,
-                event.message
-            ])
-        
-        # 自动调整列宽
-        for column in ws_events.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws_events.column_dimensions[column_letter].width = adjusted_width
-    
+        ws_events = wb.create_sheet(title="事件记录")
+        ws_events.append(_styled_header(ws_events, EVENT_HEADERS, EVENT_COLUMN_WIDTHS))
+        async for rows in history_service.iter_events(start_dt, end_dt, ups_id=ups_id):
+            for row in rows:
+                ws_events.append(_event_row(row))
+
     if data_type in ["metrics", "all"]:
-        # 创建指标工作表
-        if data_type == "all":
-            ws_metrics = wb.create_sheet(title="指标数据")
-        else:
-            ws_metrics = wb.active
-            ws_metrics.title = "指标数据"
-        
-        # 设置表头
-        headers = ['时间', '电池电量(%)', '输入电压(V)', '输出电压(V)', '负载(%)', '温度(°C)', '运行时间(秒)', '功率(W)', '用电量(kWh)']
-        ws_metrics.append(headers)
-
-        # 应用表头样式
-        for cell in ws_metrics[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-
-        # 获取并写入数据
-        hours = int((end_dt - start_dt).total_seconds() / 3600) + 1
-        metrics = await history_service.get_metrics(hours)
-        filtered_metrics = [m for m in metrics if start_dt <= m.timestamp.replace(tzinfo=None) <= end_dt]
-
-        for metric in filtered_metrics:
-            ws_metrics.append([
-                metric.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                metric.battery_charge,
-                metric.input_voltage,
-                metric.output_voltage,
-                metric.load_percent,
-                metric.temperature,
-                metric.battery_runtime,
-                round(metric.power_watts, 1) if metric.power_watts is not None else None,
-                round(metric.energy_kwh, 3) if metric.energy_kwh is not None else None
-            ])
-        
-        # 自动调整列宽
-        for column in ws_metrics.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 30)
-            ws_metrics.column_dimensions[column_letter].width = adjusted_width
-    
-    # 保存到内存
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+        ws_metrics = wb.create_sheet(title="指标数据")
+        ws_metrics.append(_styled_header(ws_metrics, METRIC_HEADERS, METRIC_COLUMN_WIDTHS))
+        async for rows in history_service.iter_metrics(start_dt, end_dt, ups_id=ups_id or DEFAULT_UPS_ID):
+            for row in rows:
+                ws_metrics.append(_metric_row(row))
+
+    # 压缩打包可能较慢，放到线程中执行
+    output = tempfile.TemporaryFile()
+    try:
+        await asyncio.to_thread(wb.save, output)
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+
+    def read_chunks():
+        with output:
+            while True:
+                chunk = output.read(XLSX_READ_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+
     return StreamingResponse(
-        iter([output.getvalue()]),
+        read_chunks(),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -2,12 +2,12 @@
 import asyncio
 import logging
 import os
-from datetime import datetime
 from fastapi import APIRouter, HTTPException, File, UploadFile
 from pydantic import BaseModel
 from typing import Dict, Any, List
 from hooks.registry import get_registry
 from config import get_config_manager
+from services.device_reachability import get_reachability_service
 
 logger = logging.getLogger(__name__)
 
@@ -66,7 +66,7 @@ async def test_hook(request: HookTestRequest):
 @router.get("/hooks/status")
 async def get_hooks_status():
     """
-    批量检测所有已配置 hook 设备的连接状态
+    获取所有已启用 hook 设备的连接状态（后台定期探测的缓存结果）
     
     Returns:
         {
@@ -95,57 +95,12 @@ async def get_hooks_status():
     if not enabled_hooks:
         return {"devices": []}
     
-    registry = get_registry()
-    devices = []
-    
-    # 并行检测所有设备状态（带超时）
-    async def check_device(hook_config: dict) -> dict:
-        """检测单个设备状态"""
-        hook_id = hook_config.get("hook_id")
-        hook_name = hook_config.get("name", "Unknown")
-        priority = hook_config.get("priority", 99)
-        config = hook_config.get("config", {})
-        
-        device_status = {
-            "name": hook_name,
-            "hook_id": hook_id,
-            "priority": priority,
-            "online": False,
-            "last_check": datetime.now().isoformat(),
-            "error": None
-        }
-        
-        try:
-            # 创建 hook 实例
-            hook_instance = registry.create_instance(hook_id, config)
-            
-            # 测试连接（带超时）
-            success = await asyncio.wait_for(
-                hook_instance.test_connection(),
-                timeout=DEVICE_CONNECTION_TIMEOUT
-            )
-            
-            device_status["online"] = success
-            if not success:
-                device_status["error"] = "连接测试失败"
-        
-        except asyncio.TimeoutError:
-            device_status["error"] = f"连接超时（{DEVICE_CONNECTION_TIMEOUT}秒）"
-            logger.warning(f"Device '{hook_name}' connection timeout")
-        
-        except ValueError as e:
-            device_status["error"] = f"配置错误: {str(e)}"
-            logger.error(f"Device '{hook_name}' config error: {e}")
-        
-        except Exception as e:
-            device_status["error"] = str(e)
-            logger.error(f"Device '{hook_name}' check failed: {e}")
-        
-        return device_status
-    
-    # 并行检测所有设备
-    tasks = [check_device(hook_config) for hook_config in enabled_hooks]
-    devices = await asyncio.gather(*tasks, return_exceptions=False)
+    # 状态来自后台探测缓存，不再每次请求都连接设备
+    statuses = await get_reachability_service().get_statuses(enabled_hooks)
+    devices = [
+        {**status, "priority": hook_config.get("priority", 99)}
+        for hook_config, status in zip(enabled_hooks, statuses)
+    ]
     
     return {"devices": devices}
 
@@ -1,6 +1,8 @@
 """状态 API"""
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 from services.monitor import get_monitor
+from services.monitor_group import get_monitor_group
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,9 +10,17 @@ router = APIRouter()
 
 
 @router.get("/status")
-async def get_status():
+async def get_status(
+    ups_id: Optional[str] = Query(None, description="UPS 标识（多 UPS 监控），默认主 UPS")
+):
     """获取 UPS 实时状态"""
-    monitor = get_monitor()
+    group = get_monitor_group()
+    if ups_id and group:
+        monitor = group.get(ups_id)
+        if monitor is None:
+            raise HTTPException(status_code=404, detail=f"Unknown UPS: {ups_id}")
+    else:
+        monitor = get_monitor()
     
     if monitor is None:
         raise HTTPException(status_code=503, detail="Monitor not initialized")
@@ -29,3 +39,13 @@ async def get_status():
     
 
     return response
+
+
+@router.get("/status/units")
+async def get_units():
+    """获取所有受监控 UPS 的状态摘要"""
+    group = get_monitor_group()
+    if group is None:
+        raise HTTPException(status_code=503, detail="Monitor not initialized")
+
+    return {"units": group.get_summary()}
@@ -16,6 +16,8 @@ from enum import Enum
 from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from services.history import get_history_service
+from services.diagnostics_collector import get_diagnostics_collector, mask_sensitive_data
+from services.storage_stats import forecast_usage, load_storage_stats
 from services.monitor import get_monitor
 from db.database import get_db
 from config import settings, get_config_manager, APP_VERSION
@@ -705,74 +707,36 @@ async def get_storage_info():
         if os.path.exists(db_path):
             db_size = os.path.getsize(db_path)
         
-        # 获取事件和指标统计（直接从数据库查询）
+        # 读取触发器维护的统计（不扫描数据表）
         db = await get_db()
-        
-        # 统计事件数量
-        row = await db.fetch_one("SELECT COUNT(*) FROM events")
-        event_count = row[0] if row else 0
-        
-        # 获取最早事件时间
-        row = await db.fetch_one("SELECT timestamp FROM events ORDER BY timestamp ASC LIMIT 1")
-        earliest_event_time = row[0] if row else None
-        
-        # 统计指标数量
-        row = await db.fetch_one("SELECT COUNT(*) FROM metrics")
-        metric_count = row[0] if row else 0
-        
-        # 获取最早指标时间
-        row = await db.fetch_one("SELECT timestamp FROM metrics ORDER BY timestamp ASC LIMIT 1")
-        earliest_metric_time = row[0] if row else None
-        
+        tables = await load_storage_stats(db)
+        events = tables.get("events", {})
+        metrics = tables.get("metrics", {})
+
         # 确定最早记录时间
-        earliest_time = None
-        if earliest_event_time and earliest_metric_time:
-            earliest_time = min(earliest_event_time, earliest_metric_time)
-        elif earliest_event_time:
-            earliest_time = earliest_event_time
-        elif earliest_metric_time:
-            earliest_time = earliest_metric_time
+        earliest = [t for t in (events.get("earliest"), metrics.get("earliest")) if t]
+        earliest_time = min(earliest) if earliest else None
+
+        config_manager = await get_config_manager()
+        config = await config_manager.get_config()
         
         return {
             "db_size_bytes": db_size,
             "db_size_mb": round(db_size / 1024 / 1024, 2),
-            "event_count": event_count,
-            "metric_count": metric_count,
-            "earliest_record_time": earliest_time
+            "event_count": events.get("rows", 0),
+            "metric_count": metrics.get("rows", 0),
+            "earliest_record_time": earliest_time,
+            "tables": {
+                name: {key: value for key, value in stats.items() if key != "daily"}
+                for name, stats in tables.items()
+            },
+            "daily": {name: stats["daily"] for name, stats in tables.items()},
+            "forecast": forecast_usage(tables, config, db_size),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取存储信息失败: {str(e)}")
 
 
-def mask_sensitive_data(obj, parent_key=''):
-    """
-    递归遮蔽敏感信息
-    
-    敏感字段列表：password, token, secret, key, api_key, api_secret, 
-                 private_key, smtp_password, webhook_token, nut_password
-    """
-    sensitive_keywords = {
-        'password', 'token', 'secret', 'key', 'api_key',
-        'api_secret', 'private_key', 'smtp_password',
-        'webhook_token', 'nut_password'
-    }
-    
-    if isinstance(obj, dict):
-        masked = {}
-        for k, v in obj.items():
-            # 检查键名是否包含敏感词
-            is_sensitive = any(keyword in k.lower() for keyword in sensitive_keywords)
-            if is_sensitive and v:
-                masked[k] = "***"
-            else:
-                masked[k] = mask_sensitive_data(v, k)
-        return masked
-    elif isinstance(obj, list):
-        return [mask_sensitive_data(item, parent_key) for item in obj]
-    else:
-        return obj
-
-
 @router.get("/system/diagnostics")
 async def get_diagnostics():
     """
@@ -803,8 +767,6 @@ async def get_diagnostics():
         monitor = get_monitor()
         ups_status = {}
         ups_raw_variables = {}
-        ups_writable_vars = {}
-        ups_supported_commands = []
         if monitor:
             ups_data = monitor.get_current_data()
             if ups_data:
@@ -847,41 +809,23 @@ async def get_diagnostics():
                     "last_update": ups_data.last_update.isoformat() if ups_data.last_update else None,
                 }
 
-            # 获取原始 UPS 变量
-            try:
-                client = monitor.nut_client
-                if hasattr(client, 'list_vars'):
-                    ups_raw_variables = await client.list_vars()
-            except Exception as e:
-                ups_raw_variables = {"error": str(e)}
-
-            # 获取可写变量
-            try:
-                client = monitor.nut_client
-                if hasattr(client, 'list_rw'):
-                    ups_writable_vars = await client.list_rw()
-            except Exception:
-                pass
+            # 原始 UPS 变量：监控器变量目录中的最新值（不访问 NUT）
+            ups_raw_variables = monitor.var_catalog.snapshot()
 
-            # 获取支持的命令
-            try:
-                client = monitor.nut_client
-                if hasattr(client, 'list_commands'):
-                    ups_supported_commands = await client.list_commands()
-            except Exception:
-                pass
+        # 可写变量和支持的命令：收集器在连接建立或驱动变化时刷新
+        collector = get_diagnostics_collector()
+        capabilities = collector.capabilities()
+        ups_writable_vars = capabilities["writable_variables"]
+        ups_supported_commands = capabilities["supported_commands"]
         
-        # 获取完整配置（脱敏）用于复现用户环境
+        # 获取完整配置（脱敏）用于复现用户环境（配置变更前复用同一份脱敏结果）
+        config_dict, full_config_masked = await collector.config_parts()
         config_manager = await get_config_manager()
         config = await config_manager.get_config()
-        config_dict = config.dict()
         
         # 添加 test_mode 到 system_info (从 Config 获取，而不是从 Settings)
         system_info["test_mode"] = config_dict.get("test_mode", "production")
         
-        # 完整配置（脱敏处理）
-        full_config_masked = mask_sensitive_data(config_dict)
-        
         config_summary = {
             "shutdown_wait_minutes": config_dict.get("shutdown_wait_minutes"),
             "shutdown_battery_percent": config_dict.get("shutdown_battery_percent"),
@@ -892,18 +836,8 @@ async def get_diagnostics():
             "wol_on_power_restore": config_dict.get("wol_on_power_restore")
         }
         
-        # 获取最近事件（最近7天，最多取前50条）
-        history_service = await get_history_service()
-        recent_events_raw = await history_service.get_events(days=7)
-        # 限制返回最多50条
-        recent_events_raw = recent_events_raw[:50]
-        recent_events = []
-        for event in recent_events_raw:
-            recent_events.append({
-                "timestamp": event.timestamp.isoformat(),
-                "event_type": event.event_type.value,
-                "message": event.message
-            })
+        # 获取最近事件（最近7天，最多取前50条；有新事件写入前复用缓存）
+        recent_events = await collector.recent_events()
         
         # 获取关机管理器状态
         shutdown_manager_status = {}
@@ -917,16 +851,13 @@ async def get_diagnostics():
             db_size = os.path.getsize(db_path)
         
         db = await get_db()
-        row = await db.fetch_one("SELECT COUNT(*) FROM events")
-        events_count = row[0] if row else 0
-        
-        row = await db.fetch_one("SELECT COUNT(*) FROM metrics")
-        metrics_count = row[0] if row else 0
+        storage_tables = await load_storage_stats(db)
         
         database_info = {
             "size_bytes": db_size,
-            "events_count": events_count,
-            "metrics_count": metrics_count
+            "events_count": storage_tables.get("events", {}).get("rows", 0),
+            "metrics_count": storage_tables.get("metrics", {}).get("rows", 0),
+            "forecast": forecast_usage(storage_tables, config, db_size),
         }
         
         # 获取设备状态（脱敏）
@@ -960,6 +891,8 @@ async def get_diagnostics():
             "ups_raw_variables": ups_raw_variables,
             "ups_writable_variables": ups_writable_vars,
             "ups_supported_commands": ups_supported_commands,
+            "ups_capabilities_refreshed_at": capabilities["refreshed_at"],
+            "ups_recent_snapshots": collector.snapshots(),
             "backend_config": {
                 "ups_backend": settings.ups_backend,
                 "nut_host": settings.nut_host if settings.ups_backend == "nut" else None,
@@ -2,7 +2,7 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 import logging
 
 from services.monitor import get_monitor
@@ -204,6 +204,13 @@ def _safe_int(value) -> Optional[int]:
         return None
 
 
+# 电池测试期间每次采样读取的变量
+BATTERY_TEST_VARS = [
+    'battery.charge', 'battery.voltage', 'battery.runtime', 'ups.load', 'input.voltage',
+    'ups.status', 'ups.test.result',
+]
+
+
 async def monitor_test_completion(report_service, monitor, test_type: str):
     """后台任务：监控测试完成状态"""
     import asyncio
@@ -211,13 +218,14 @@ async def monitor_test_completion(report_service, monitor, test_type: str):
     # 根据测试类型设置参数
     if test_type == 'quick':
         timeout = 120  # 快速测试最多等 2 分钟
-        interval = 2   # 每 2 秒采样一次
         min_wait = 15  # 至少等 15 秒（快速测试通常需要 10-30 秒）
     else:
         timeout = 1800  # 深度测试最多 30 分钟（电池放电到低电量需要时间）
-        interval = 15   # 每 15 秒采样一次（深度测试时间长，不需要太频繁）
         min_wait = 60   # 至少等 60 秒（深度测试需要更长时间才开始有明显变化）
 
+    # 采样间隔（默认 1 秒），采样批量写入 battery_test_samples
+    interval = max(1, monitor.config.battery_test_sample_interval_seconds) if monitor.config else 1
+
     start_time = datetime.now()
     sample_count = 0
     saw_cal = False  # 新增：是否曾经看到 CAL 状态
@@ -235,8 +243,8 @@ async def monitor_test_completion(report_service, monitor, test_type: str):
             break
 
         try:
-            # 获取当前 UPS 状态
-            all_vars = await monitor.nut_client.list_vars()
+            # 获取当前 UPS 状态（只读取需要的变量，高频采样时不做整表 LIST VAR）
+            all_vars = await monitor.nut_client.get_vars(BATTERY_TEST_VARS)
             if not all_vars:
                 logger.warning("[BatteryTest] Failed to get UPS variables")
                 continue
@@ -252,11 +260,11 @@ async def monitor_test_completion(report_service, monitor, test_type: str):
             # 添加采样
             await report_service.add_sample(ups_data)
             sample_count += 1
-            logger.info(f"[BatteryTest] Sample #{sample_count}: charge={ups_data.get('battery_charge')}%, elapsed={elapsed:.1f}s")
+            logger.debug(f"[BatteryTest] Sample #{sample_count}: charge={ups_data.get('battery_charge')}%, elapsed={elapsed:.1f}s")
 
             # 获取测试结果
-            test_result = all_vars.get('ups.test.result', '')
-            ups_status = all_vars.get('ups.status', '')
+            test_result = all_vars.get('ups.test.result') or ''
+            ups_status = all_vars.get('ups.status') or ''
             has_test_result_var = bool(test_result)  # UPS 是否提供此变量
 
             # 检查是否正在测试（状态包含 CAL = 校准/测试）
@@ -657,14 +665,36 @@ async def get_test_reports(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/ups/test-reports/compare")
+async def compare_test_reports(
+    ids: List[int] = Query(..., description="要对比的报告 ID，可重复，如 ids=1&ids=2"),
+    max_points: int = Query(300, ge=10, le=5000, description="每条曲线的最大点数")
+):
+    """按测试经过时间对齐多个电池测试的放电曲线"""
+    from services.battery_test_report import get_battery_test_report_service
+
+    if len(ids) > 10:
+        raise HTTPException(status_code=400, detail="最多同时对比 10 个报告")
+
+    try:
+        report_service = await get_battery_test_report_service()
+        return await report_service.get_aligned_curves(ids, max_points=max_points)
+    except Exception as e:
+        logger.error(f"Error comparing test reports: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/ups/test-reports/{report_id}")
-async def get_test_report_by_id(report_id: int):
+async def get_test_report_by_id(
+    report_id: int,
+    max_points: int = Query(300, ge=0, le=100000, description="采样曲线最大点数（超出时按时间桶平均，0 返回全部采样）")
+):
     """获取单个电池测试报告详情"""
     from services.battery_test_report import get_battery_test_report_service
 
     try:
         report_service = await get_battery_test_report_service()
-        report = await report_service.get_report(report_id)
+        report = await report_service.get_report(report_id, max_points=max_points)
 
         if not report:
             raise HTTPException(status_code=404, detail="报告不存在")
@@ -1,8 +1,26 @@
-"""WebSocket API"""
+"""WebSocket API
+
+状态推送协议：
+
+- 每次状态更新只序列化一次，编码后的文本帧被所有连接复用
+- 客户端通过 ``delta=1`` 订阅增量帧：``status_delta`` 只包含变化的字段，
+  附带递增的 ``seq``；每隔 KEYFRAME_INTERVAL 次更新（或字段集合变化、
+  客户端落后、发送 ``resync`` 时）发送带 ``seq`` 的完整 ``status_update`` 关键帧
+- 未指定 ``delta`` 的客户端保持原有行为，始终收到完整的 ``status_update``
+- 每个连接有独立的发送任务和有界队列，慢客户端只会丢弃自己过期的状态帧，
+  不会阻塞其他客户端和监控回调
+- 客户端可通过 ``max_rate``（每秒最多状态帧数）限制推送频率，
+  限流期间的多次更新合并为一帧
+"""
 import asyncio
+import json
 import logging
+import time
+from collections import deque
 from datetime import datetime
+from typing import Deque, Dict, List, Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from models import DEFAULT_UPS_ID
 from services.monitor import get_monitor
 from config import settings
 
@@ -10,37 +28,237 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 每隔多少次更新强制发送一次关键帧
+KEYFRAME_INTERVAL = 30
+
+# 每个连接的普通消息（事件、进度、心跳）队列上限
+CLIENT_QUEUE_SIZE = 100
+
+
+def _encode(message: dict) -> str:
+    """编码消息（与 send_json 的默认编码一致）"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class StatusStream:
+    """单台 UPS 的状态流：维护序号、上一次快照并生成增量帧"""
+
+    def __init__(self, ups_id: str, primary: bool):
+        self.ups_id = ups_id
+        self.primary = primary
+        self.seq = 0
+        self._snapshot: Optional[dict] = None
+        self._since_keyframe = 0
+        # 最近一次更新的已编码帧
+        self.full_frame: Optional[str] = None
+        self.delta_frame: Optional[str] = None
+
+    @property
+    def full_type(self) -> str:
+        return "status_update" if self.primary else "unit_status_update"
+
+    @property
+    def delta_type(self) -> str:
+        return "status_delta" if self.primary else "unit_status_delta"
+
+    def publish(self, payload: dict):
+        """
+        发布新的状态快照，生成完整帧和增量帧（各编码一次）
+
+        增量帧为 None 表示本次必须发送关键帧（首帧、到达关键帧间隔，或字段
+        集合发生变化——增量帧无法表达删除的字段）。
+        """
+        previous = self._snapshot
+        self.seq += 1
+        self._snapshot = payload
+
+        self.full_frame = _encode({"type": self.full_type, "seq": self.seq, "data": payload})
+
+        self._since_keyframe += 1
+        if previous is None or self._since_keyframe >= KEYFRAME_INTERVAL or payload.keys() != previous.keys():
+            self._since_keyframe = 0
+            self.delta_frame = None
+            return
+
+        changed = {key: value for key, value in payload.items() if previous.get(key) != value}
+        self.delta_frame = _encode({
+            "type": self.delta_type,
+            "seq": self.seq,
+            "ups_id": self.ups_id,
+            "data": changed,
+        })
+
+
+class ClientChannel:
+    """单个 WebSocket 连接的发送通道"""
+
+    def __init__(self, websocket: WebSocket, delta: bool = False, max_rate: Optional[float] = None):
+        self.websocket = websocket
+        self.delta = delta
+        self.set_rate(max_rate)
+
+        self._messages: Deque[str] = deque()
+        # ups_id -> 待发送的最新状态帧（新帧覆盖旧帧）
+        self._pending_status: Dict[str, str] = {}
+        # ups_id -> 客户端已收到（或即将收到）的最新序号
+        self._delivered_seq: Dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._last_status_sent = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+        # 统计
+        self.sent = 0
+        self.dropped = 0
+
+    def set_rate(self, max_rate: Optional[float]):
+        """设置每秒最多状态帧数（None 或 <= 0 表示不限）"""
+        self.min_interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0.0
+
+    def start(self):
+        """启动发送任务"""
+        self._task = asyncio.create_task(self._send_loop())
+
+    async def close(self):
+        """停止发送任务"""
+        self.closed = True
+        self._wakeup.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def enqueue(self, frame: str):
+        """放入普通消息；队列满时丢弃最旧的消息"""
+        if len(self._messages) >= CLIENT_QUEUE_SIZE:
+            self._messages.popleft()
+            self.dropped += 1
+        self._messages.append(frame)
+        self._wakeup.set()
+
+    def offer_status(self, stream: StatusStream, force_keyframe: bool = False):
+        """放入状态帧，未发送的旧状态帧被直接替换"""
+        if stream.full_frame is None:
+            return
+        stale = stream.ups_id in self._pending_status
+        if stale:
+            self.dropped += 1
+
+        # 增量帧只能接在客户端已收到的上一帧之后，否则发送关键帧
+        use_delta = (
+            self.delta
+            and not force_keyframe
+            and not stale
+            and stream.delta_frame is not None
+            and self._delivered_seq.get(stream.ups_id) == stream.seq - 1
+        )
+        self._pending_status[stream.ups_id] = stream.delta_frame if use_delta else stream.full_frame
+        self._delivered_seq[stream.ups_id] = stream.seq
+        self._wakeup.set()
+
+    async def _send_loop(self):
+        """发送循环：先发普通消息，再按限流发送状态帧"""
+        try:
+            while not self.closed:
+                timeout = None
+                if self._pending_status:
+                    timeout = max(0.0, self._last_status_sent + self.min_interval - time.monotonic())
+                if timeout != 0:
+                    # 限流等待期间到达的状态更新会覆盖待发送帧
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                self._wakeup.clear()
+
+                while self._messages:
+                    await self.websocket.send_text(self._messages.popleft())
+                    self.sent += 1
+
+                if self._pending_status and time.monotonic() >= self._last_status_sent + self.min_interval:
+                    pending, self._pending_status = self._pending_status, {}
+                    for frame in pending.values():
+                        await self.websocket.send_text(frame)
+                        self.sent += 1
+                    self._last_status_sent = time.monotonic()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug(f"WebSocket send loop stopped: {e}")
+            self.closed = True
+
 
 class ConnectionManager:
     """WebSocket 连接管理器"""
-    
+
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
+        self._channels: Dict[WebSocket, ClientChannel] = {}
+        self._streams: Dict[str, StatusStream] = {}
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        """当前连接列表"""
+        return list(self._channels)
+
+    async def connect(self, websocket: WebSocket, delta: bool = False, max_rate: Optional[float] = None) -> ClientChannel:
         """接受连接"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
+        channel = ClientChannel(websocket, delta=delta, max_rate=max_rate)
+        self._channels[websocket] = channel
+        channel.start()
+        return channel
+
+    async def disconnect(self, websocket: WebSocket):
         """断开连接"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        channel = self._channels.pop(websocket, None)
+        if channel:
+            await channel.close()
+
+    def _prune(self):
+        """移除发送失败的连接"""
+        for websocket, channel in list(self._channels.items()):
+            if channel.closed:
+                self._channels.pop(websocket, None)
 
     async def broadcast(self, message: dict):
-        """广播消息到所有连接"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to WebSocket: {e}")
-                disconnected.append(connection)
-        
-        # 移除断开的连接
-        for conn in disconnected:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
+        """广播消息到所有连接（编码一次，各连接独立发送，不等待）"""
+        self._prune()
+        frame = _encode(message)
+        for channel in self._channels.values():
+            channel.enqueue(frame)
+
+    def get_stream(self, ups_id: str) -> StatusStream:
+        """获取 UPS 的状态流"""
+        stream = self._streams.get(ups_id)
+        if stream is None:
+            stream = StatusStream(ups_id, primary=ups_id == DEFAULT_UPS_ID)
+            self._streams[ups_id] = stream
+        return stream
+
+    async def publish_status(self, ups_id: str, payload: dict):
+        """发布状态快照到所有连接"""
+        self._prune()
+        stream = self.get_stream(ups_id)
+        stream.publish(payload)
+        for channel in self._channels.values():
+            channel.offer_status(stream)
+
+    def send_keyframes(self, channel: ClientChannel):
+        """向单个连接发送所有 UPS 的当前完整状态"""
+        for stream in self._streams.values():
+            channel.offer_status(stream, force_keyframe=True)
+
+    def get_stats(self) -> dict:
+        """连接与推送统计"""
+        return {
+            "connections": len(self._channels),
+            "delta_clients": sum(1 for c in self._channels.values() if c.delta),
+            "frames_sent": sum(c.sent for c in self._channels.values()),
+            "frames_dropped": sum(c.dropped for c in self._channels.values()),
+            "streams": {ups_id: stream.seq for ups_id, stream in self._streams.items()},
+        }
 
 
 manager = ConnectionManager()
@@ -52,67 +270,101 @@ def verify_ws_token(token: str) -> bool:
     return token == expected_token
 
 
+def _status_payload(monitor) -> Optional[dict]:
+    """序列化监控器当前状态（含关机状态）"""
+    data = monitor.get_current_data()
+    if data is None:
+        return None
+    # 使用 Pydantic 的 model_dump() 自动序列化所有字段（包括 Phase 1-4 新增字段）
+    payload = data.model_dump(mode='json')
+    payload["shutdown"] = monitor.shutdown_manager.get_status()
+    return payload
+
+
+def _handle_client_message(channel: ClientChannel, text: str):
+    """处理客户端控制消息（resync / set_rate）"""
+    if text == "resync":
+        manager.send_keyframes(channel)
+        return
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return
+    if isinstance(message, dict) and message.get("type") == "set_rate":
+        try:
+            channel.set_rate(float(message.get("max_rate") or 0))
+        except (TypeError, ValueError):
+            pass
+
+
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(default="")):
-    """WebSocket 端点，实时推送 UPS 状态"""
+async def websocket_endpoint(
+    websocket: WebSocket,
+    token: str = Query(default=""),
+    delta: bool = Query(default=False),
+    max_rate: Optional[float] = Query(default=None)
+):
+    """WebSocket 端点，实时推送 UPS 状态
+
+    Query 参数：
+        delta: 是否接收增量状态帧
+        max_rate: 每秒最多状态帧数（不指定则不限）
+    """
     # 验证 token
     if not verify_ws_token(token):
         logger.warning(f"WebSocket connection rejected: invalid token")
         await websocket.close(code=4001, reason="Unauthorized")
         return
 
-    await manager.connect(websocket)
-    
+    channel = await manager.connect(websocket, delta=delta, max_rate=max_rate)
+
     try:
-        # 发送初始状态
-        monitor = get_monitor()
-        if monitor and monitor.get_current_data():
-            data = monitor.get_current_data()
-            shutdown_status = monitor.shutdown_manager.get_status()
-            
-            # 使用 Pydantic 的 model_dump() 自动序列化所有字段（包括 Phase 1-4 新增字段）
-            response_data = data.model_dump(mode='json')
-            response_data["shutdown"] = shutdown_status
-
-            await websocket.send_json({
-                "type": "status_update",
-                "data": response_data
-            })
-        
+        # 发送初始状态（关键帧）
+        from services.monitor_group import get_monitor_group
+        group = get_monitor_group()
+        monitors = group.monitors() if group else [m for m in [get_monitor()] if m]
+        for monitor in monitors:
+            stream = manager.get_stream(monitor.ups_id)
+            if stream.full_frame is None:
+                payload = _status_payload(monitor)
+                if payload is None:
+                    continue
+                stream.publish(payload)
+            channel.offer_status(stream, force_keyframe=True)
+
         # 心跳任务
         async def heartbeat():
             try:
                 while True:
                     await asyncio.sleep(25)  # 每25秒发送心跳
-                    try:
-                        await websocket.send_json({"type": "ping"})
-                    except Exception:
-                        break
+                    channel.enqueue(_encode({"type": "ping"}))
             except asyncio.CancelledError:
                 pass
-        
+
         heartbeat_task = asyncio.create_task(heartbeat())
-        
+
         # 保持连接并接收客户端消息
         while True:
             try:
                 data = await asyncio.wait_for(websocket.receive_text(), timeout=30)
                 # 简单的心跳响应
                 if data == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    channel.enqueue(_encode({"type": "pong"}))
                 elif data == "pong":
                     pass  # 客户端响应心跳
+                else:
+                    _handle_client_message(channel, data)
             except asyncio.TimeoutError:
                 # 30秒没有消息，断开连接
                 logger.warning("WebSocket client timeout, disconnecting")
                 break
-    
+
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(websocket)
     finally:
+        await manager.disconnect(websocket)
         # 取消心跳任务
         if 'heartbeat_task' in locals():
             heartbeat_task.cancel()
@@ -123,22 +375,39 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(default=""
 
 
 async def broadcast_status_update(data):
-    """广播状态更新（由 monitor 调用）"""
-    from services.monitor import get_monitor
+    """广播状态更新（由 monitor 调用）
+
+    主 UPS 使用 status_update / status_delta，附加 UPS 使用
+    unit_status_update / unit_status_delta（data 中带 ups_id），
+    避免覆盖主 UPS 的仪表盘。
+    """
+    from services.monitor_group import get_monitor_group
+    group = get_monitor_group()
+    monitor = group.get(data.ups_id) if group else get_monitor()
+
+    if monitor:
+        payload = data.model_dump(mode='json')
+        payload["shutdown"] = monitor.shutdown_manager.get_status()
+        await manager.publish_status(data.ups_id, payload)
+
+
+async def broadcast_offline_status(ups_id: str, shutdown_status: dict):
+    """广播 UPS 离线状态（连接断开时由 monitor 调用）"""
+    await manager.publish_status(ups_id, {
+        "ups_id": ups_id,
+        "status": "offline",
+        "last_update": None,
+        "shutdown": shutdown_status
+    })
+
+
+async def broadcast_shutdown_status():
+    """广播主 UPS 的最新关机状态（关机流程结束时调用）"""
     monitor = get_monitor()
-    
     if monitor:
-        shutdown_status = monitor.shutdown_manager.get_status()
-        
-        # 使用 Pydantic 的 model_dump() 自动序列化所有字段（包括 Phase 1-4 新增字段）
-        response_data = data.model_dump(mode='json')
-        response_data["shutdown"] = shutdown_status
-        
-
-        await manager.broadcast({
-            "type": "status_update",
-            "data": response_data
-        })
+        payload = _status_payload(monitor)
+        if payload is not None:
+            await manager.publish_status(monitor.ups_id, payload)
 
 
 async def broadcast_event(event_type: str, message: str, metadata: dict = None):
@@ -164,10 +433,18 @@ async def broadcast_config_changed():
     })
 
 
+async def broadcast_device_status(status: dict):
+    """广播设备连通性变化（由设备连通性服务调用）"""
+    await manager.broadcast({
+        "type": "device_status",
+        "data": status
+    })
+
+
 async def broadcast_hook_progress(progress_data: dict):
     """
     广播 hook 执行进度（由 HookExecutor 调用）
-    
+
     Args:
         progress_data: 进度数据，包含 type 和 data 字段
     """
@@ -1,10 +1,14 @@
 """配置管理模块"""
+import asyncio
+import copy
+import inspect
 import json
 import logging
 import os
 import secrets
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Any
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
 from pydantic_settings import BaseSettings
 from models import Config
 
@@ -36,13 +40,19 @@ class Settings(BaseSettings):
     nut_username: str = "monuser"
     nut_password: str = "monuser"
     nut_ups_name: str = ""  # 留空则自动发现
+    nut_aux_connections: int = 1  # 辅助连接数（LIST RW / LIST CMD 等慢查询走独立连接，0 表示不启用）
+
+    # 附加 UPS（多 UPS 监控），JSON 数组，如 [{"id": "rack2", "host": "nut-server", "ups_name": "ups2"}]
+    ups_units: str = ""
 
     # apcupsd 配置
     apcupsd_host: str = "127.0.0.1"
     apcupsd_port: int = 3551
+    apcupsd_snapshot_ttl: float = 2.0  # 状态快照缓存时间（秒），期间的变量读取共用一次 status 请求
 
     # 数据库 (默认为项目根目录下的 data 文件夹)
     database_path: str = str(DATA_DIR / "ups_guard.db")
+    database_read_connections: int = 2  # 只读连接数（分析查询与写入并行，0 表示读写共用一个连接）
 
     # 日志
     log_level: str = "INFO"
@@ -129,12 +139,75 @@ logger.info(f"NUT_UPS_NAME: {settings.nut_ups_name or '(auto-discover)'}")
 logger.info(f"DATABASE_PATH: {settings.database_path}")
 
 
+def _serialize_value(value: Any) -> str:
+    """配置值在 config 表中的存储形式"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+@dataclass
+class ConfigChange:
+    """一次配置更新的变更事件"""
+    version: int
+    config: Config
+    # 配置项 -> (旧值, 新值)
+    changes: Dict[str, Tuple[Any, Any]] = field(default_factory=dict)
+
+    @property
+    def keys(self) -> FrozenSet[str]:
+        return frozenset(self.changes)
+
+    def touches(self, *keys: str) -> bool:
+        """是否修改了任意一个指定配置项"""
+        return any(key in self.changes for key in keys)
+
+    def without(self, keys: Iterable[str]) -> "ConfigChange":
+        """去掉指定配置项后的变更（订阅者对这些配置项有自己的取值时使用）"""
+        excluded = set(keys)
+        return ConfigChange(
+            self.version, self.config, {k: v for k, v in self.changes.items() if k not in excluded}
+        )
+
+
 class ConfigManager:
-    """配置管理器"""
+    """
+    配置管理器
+
+    update_config 与缓存比较后只写入有变化的配置项，所有写入在同一个事务中
+    完成；提交成功后才替换缓存并递增配置版本，读取方不会看到只更新了一半的
+    配置。随后向订阅者发布 ConfigChange，订阅者只需处理自己关心的配置项。
+    """
     
     def __init__(self, db):
         self.db = db
         self._cache: Optional[Config] = None
+        # 已持久化的配置值（序列化后），用于计算差异；不受外部修改缓存对象影响
+        self._stored: Dict[str, str] = {}
+        self._snapshot: Dict[str, Any] = {}
+        self._version = 0
+        self._lock = asyncio.Lock()
+        # (回调, 关心的配置项；None 表示全部)
+        self._subscribers: List[Tuple[Callable, Optional[FrozenSet[str]]]] = []
+
+    @property
+    def version(self) -> int:
+        """配置版本，每次有实际变更的更新后加一"""
+        return self._version
+
+    def subscribe(self, callback: Callable, keys: Optional[List[str]] = None):
+        """
+        订阅配置变更
+
+        Args:
+            callback: 回调函数（同步或异步），参数为 ConfigChange
+            keys: 只在这些配置项变化时回调；None 表示任意变更
+        """
+        self._subscribers.append((callback, frozenset(keys) if keys is not None else None))
+
+    def unsubscribe(self, callback: Callable):
+        """取消订阅"""
+        self._subscribers = [(cb, keys) for cb, keys in self._subscribers if cb is not callback]
     
     async def get_config(self) -> Config:
         """获取配置"""
@@ -154,8 +227,9 @@ class ConfigManager:
             if key in ['shutdown_wait_minutes', 'shutdown_battery_percent', 
                       'shutdown_final_wait_seconds', 'estimated_runtime_threshold',
                       'sample_interval_seconds', 'history_retention_days',
+                      'rollup_1m_retention_days', 'rollup_15m_retention_days', 'rollup_1h_retention_days',
                       'poll_interval_seconds', 'cleanup_interval_hours', 'wol_delay_seconds',
-                      'device_status_check_interval_seconds',
+                      'device_status_check_interval_seconds', 'battery_test_sample_interval_seconds',
                       'retry_notification_max', 'retry_hook_max', 'retry_http_max',
                       'retry_wol_count', 'retry_db_max']:
                 config_dict[key] = int(value)
@@ -171,21 +245,63 @@ class ConfigManager:
                 config_dict[key] = value
         
         self._cache = Config(**config_dict)
+        self._stored = {row['key']: row['value'] for row in rows}
+        self._snapshot = copy.deepcopy(self._cache.dict())
 
-    async def update_config(self, config: Config):
-        """更新配置"""
-        for key, value in config.dict().items():
-            if isinstance(value, (list, dict)):
-                value_str = json.dumps(value)
-            else:
-                value_str = str(value)
-            
-            await self.db.execute(
-                "INSERT OR REPLACE INTO config (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
-                (key, value_str)
-            )
-        
-        self._cache = config
+    async def update_config(self, config: Config) -> Optional[ConfigChange]:
+        """
+        更新配置
+
+        Returns:
+            有实际变更时返回 ConfigChange，否则返回 None
+        """
+        async with self._lock:
+            if self._cache is None:
+                await self._load_config()
+
+            new_values = config.dict()
+            serialized = {key: _serialize_value(value) for key, value in new_values.items()}
+            # 数据库中尚未保存的配置项（沿用默认值）也一并写入
+            writes = [
+                (key, value_str) for key, value_str in serialized.items()
+                if self._stored.get(key) != value_str
+            ]
+            changes = {
+                key: (self._snapshot.get(key), copy.deepcopy(new_values[key]))
+                for key, value_str in serialized.items()
+                if key not in self._snapshot or _serialize_value(self._snapshot[key]) != value_str
+            }
+
+            if writes:
+                await self.db.execute_many(
+                    "INSERT OR REPLACE INTO config (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                    writes
+                )
+                self._stored.update(writes)
+
+            self._cache = config
+            self._snapshot = copy.deepcopy(new_values)
+            if not changes:
+                return None
+
+            self._version += 1
+            change = ConfigChange(version=self._version, config=config, changes=changes)
+            logger.info(f"Config updated to version {self._version}: {', '.join(sorted(changes))}")
+
+        await self._publish(change)
+        return change
+
+    async def _publish(self, change: ConfigChange):
+        """通知订阅者，单个订阅者出错不影响其他订阅者"""
+        for callback, keys in list(self._subscribers):
+            if keys is not None and not change.touches(*keys):
+                continue
+            try:
+                result = callback(change)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Config change subscriber {getattr(callback, '__qualname__', callback)} failed: {e}")
 
     async def get_value(self, key: str, default: Any = None) -> Any:
         """获取单个配置项"""
@@ -195,8 +311,7 @@ class ConfigManager:
     async def set_value(self, key: str, value: Any):
         """设置单个配置项"""
         config = await self.get_config()
-        setattr(config, key, value)
-        await self.update_config(config)
+        await self.update_config(config.model_copy(update={key: value}))
 
 
 # 全局配置管理器实例
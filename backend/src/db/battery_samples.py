@@ -0,0 +1,134 @@
+"""电池测试采样表
+
+测试期间的采样原来放在内存列表里，测试结束时作为一个 JSON 写入
+battery_test_reports.samples：中途崩溃全部丢失，深度测试的列表持续增长。
+
+现在采样追加写入 battery_test_samples：
+
+- elapsed_ms 为相对测试开始的毫秒数，不同测试的放电曲线直接按经过时间对齐
+- WITHOUT ROWID，主键 (report_id, elapsed_ms)：同一测试的采样在 B 树中连续
+  存放，读取一个报告就是一次主键区间扫描
+- 读取时在 SQL 中按时间桶聚合（downsample_sql），返回的点数与测试时长无关
+"""
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATTERY_SAMPLE_COLUMNS: Tuple[str, ...] = (
+    "battery_charge",
+    "battery_voltage",
+    "battery_runtime",
+    "load_percent",
+    "input_voltage",
+)
+
+# 与 db/schema.sql 中的定义保持一致
+CREATE_BATTERY_SAMPLES_SQL = """
+CREATE TABLE IF NOT EXISTS battery_test_samples (
+    report_id INTEGER NOT NULL,
+    elapsed_ms INTEGER NOT NULL,
+    battery_charge REAL,
+    battery_voltage REAL,
+    battery_runtime INTEGER,
+    load_percent REAL,
+    input_voltage REAL,
+    PRIMARY KEY (report_id, elapsed_ms)
+) WITHOUT ROWID
+"""
+
+# 同一毫秒的重复采样只保留第一条
+INSERT_BATTERY_SAMPLE_SQL = (
+    f"INSERT OR IGNORE INTO battery_test_samples (report_id, elapsed_ms, {', '.join(BATTERY_SAMPLE_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * (len(BATTERY_SAMPLE_COLUMNS) + 2))})"
+)
+
+
+def parse_started_at(value) -> datetime:
+    """报告的 started_at（ISO 格式，无时区视为 UTC）→ 带时区 datetime"""
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def elapsed_ms(started_at: datetime, moment: datetime) -> int:
+    """相对测试开始的毫秒数（时钟回拨时记为 0）"""
+    return max(0, int((moment - started_at).total_seconds() * 1000))
+
+
+def sample_row(report_id: int, elapsed: int, ups_data) -> tuple:
+    """生成 INSERT_BATTERY_SAMPLE_SQL 的参数"""
+    return (report_id, elapsed, *(ups_data.get(column) for column in BATTERY_SAMPLE_COLUMNS))
+
+
+def downsample_sql(bucket_ms: int) -> str:
+    """
+    按时间桶聚合一个报告的采样（参数：report_id）
+
+    每桶返回桶起点的经过时间和各指标平均值，同一 bucket_ms 下不同测试的点
+    落在相同的时间网格上；bucket_ms <= 1 时返回原始采样。
+    """
+    if bucket_ms <= 1:
+        return (
+            f"SELECT elapsed_ms, {', '.join(BATTERY_SAMPLE_COLUMNS)} FROM battery_test_samples "
+            f"WHERE report_id = ? ORDER BY elapsed_ms"
+        )
+    averages = ", ".join(
+        f"CAST(ROUND(AVG({column})) AS INTEGER) AS {column}" if column == "battery_runtime"
+        else f"AVG({column}) AS {column}"
+        for column in BATTERY_SAMPLE_COLUMNS
+    )
+    return (
+        f"SELECT elapsed_ms / {int(bucket_ms)} * {int(bucket_ms)} AS bucket, {averages} FROM battery_test_samples "
+        f"WHERE report_id = ? GROUP BY bucket ORDER BY bucket"
+    )
+
+
+def bucket_size(span_ms: int, sample_count: int, max_points: int) -> int:
+    """把 span_ms 内的采样聚合到不超过 max_points 个点所需的时间桶（毫秒，取整秒）"""
+    if max_points <= 0 or sample_count <= max_points:
+        return 1
+    bucket = -(-(span_ms + 1) // max_points)
+    return -(-bucket // 1000) * 1000
+
+
+def _legacy_rows(report_id: int, started_at, samples_json: str) -> List[tuple]:
+    started = parse_started_at(started_at)
+    rows = []
+    for sample in json.loads(samples_json):
+        moment = parse_started_at(sample["timestamp"])
+        rows.append(sample_row(report_id, elapsed_ms(started, moment), sample))
+    return rows
+
+
+async def migrate_battery_samples(conn):
+    """创建采样表，并把旧报告中 JSON 格式的采样搬入新表"""
+    await conn.execute(CREATE_BATTERY_SAMPLES_SQL)
+
+    async with conn.execute(
+        "SELECT id, started_at, samples FROM battery_test_reports WHERE samples IS NOT NULL"
+    ) as cursor:
+        reports = await cursor.fetchall()
+
+    moved = 0
+    for report_id, started_at, samples_json in reports:
+        try:
+            rows = _legacy_rows(report_id, started_at, samples_json)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Skipping unreadable samples of battery test report #{report_id}: {e}")
+            rows = []
+        await conn.executemany(INSERT_BATTERY_SAMPLE_SQL, rows)
+        await conn.execute("UPDATE battery_test_reports SET samples = NULL WHERE id = ?", (report_id,))
+        moved += len(rows)
+
+    await conn.commit()
+    if reports:
+        logger.info(f"Moved {moved} samples of {len(reports)} battery test reports to battery_test_samples")
+
+
+def sample_timestamp(started_at: Optional[datetime], elapsed: int) -> Optional[str]:
+    """采样的绝对时间（ISO 格式）"""
+    if started_at is None:
+        return None
+    return (started_at + timedelta(milliseconds=elapsed)).isoformat()
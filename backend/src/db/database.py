@@ -1,22 +1,125 @@
-"""数据库管理模块"""
+"""数据库管理模块
+
+每个 aiosqlite 连接是一个后台线程，所有语句在该线程上排队执行。原来
+读写共用一个连接：长时间的分析查询（长范围指标、导出、COUNT(*) 统计）
+会排在监控循环的事件 / 采样写入前面，反之亦然，WAL 的读写并发完全
+没有用上。
+
+现在按角色使用连接：
+
+- 写连接（self.conn）：唯一的写入者，schema 初始化、迁移和所有写入都在
+  这里执行；写操作由锁串行化，事务之间不会互相穿插
+- 只读连接池：fetch_one / fetch_all 从池中取空闲的只读连接，WAL 下读取
+  不阻塞写入，长查询不会再推迟 POWER_LOST 等事件的写入
+
+每个连接使用较大的预编译语句缓存（sqlite3 cached_statements），并记录
+每类语句的执行次数、耗时和等待连接的时间，慢查询写入日志。
+"""
+import asyncio
+import re
+import time
 import aiosqlite
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# 默认只读连接数
+DEFAULT_READ_CONNECTIONS = 2
+
+# 每个连接的预编译语句缓存数量（sqlite3 默认 128）
+STATEMENT_CACHE_SIZE = 256
+
+# 超过该耗时（秒）的语句记录为慢查询
+SLOW_QUERY_SECONDS = 0.5
+
+# 按语句统计的最大条目数（超出后不再新增）
+MAX_TRACKED_STATEMENTS = 200
+
+
+class QueryStats:
+    """按连接角色和语句统计执行耗时"""
+
+    def __init__(self, slow_seconds: float = SLOW_QUERY_SECONDS):
+        self.slow_seconds = slow_seconds
+        # 角色 -> {count, total, max, wait_total, wait_max, slow}
+        self._roles: Dict[str, Dict[str, float]] = {}
+        # 语句 -> {count, total, max}
+        self._statements: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip()[:160]
+
+    def record(self, role: str, query: str, elapsed: float, waited: float = 0.0):
+        stats = self._roles.setdefault(
+            role, {"count": 0, "total": 0.0, "max": 0.0, "wait_total": 0.0, "wait_max": 0.0, "slow": 0}
+        )
+        stats["count"] += 1
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+        statement = self._normalize(query)
+        entry = self._statements.get(statement)
+        if entry is None and len(self._statements) < MAX_TRACKED_STATEMENTS:
+            entry = self._statements[statement] = {"count": 0, "total": 0.0, "max": 0.0}
+        if entry is not None:
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+
+        if elapsed >= self.slow_seconds:
+            stats["slow"] += 1
+            logger.warning(f"Slow {role} query ({elapsed:.2f}s, waited {waited:.2f}s): {statement}")
+
+    def get_stats(self, top: int = 10) -> dict:
+        roles = {
+            role: {
+                "count": int(stats["count"]),
+                "avg_ms": round(stats["total"] / stats["count"] * 1000, 2) if stats["count"] else 0,
+                "max_ms": round(stats["max"] * 1000, 2),
+                "avg_wait_ms": round(stats["wait_total"] / stats["count"] * 1000, 2) if stats["count"] else 0,
+                "max_wait_ms": round(stats["wait_max"] * 1000, 2),
+                "slow": int(stats["slow"]),
+            }
+            for role, stats in self._roles.items()
+        }
+        slowest = sorted(self._statements.items(), key=lambda item: item[1]["total"], reverse=True)[:top]
+        return {
+            "roles": roles,
+            "top_statements": [
+                {
+                    "sql": statement,
+                    "count": int(entry["count"]),
+                    "total_ms": round(entry["total"] * 1000, 2),
+                    "max_ms": round(entry["max"] * 1000, 2),
+                }
+                for statement, entry in slowest
+            ],
+        }
+
 
 class Database:
     """数据库管理类"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, read_connections: int = DEFAULT_READ_CONNECTIONS):
         self.db_path = db_path
-        self.conn: Optional[aiosqlite.Connection] = None
+        self.read_connections = read_connections
+        self.conn: Optional[aiosqlite.Connection] = None  # 写连接
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._write_lock = asyncio.Lock()
+        self.query_stats = QueryStats()
+        self.metric_migration = None  # 旧格式指标采样的后台搬迁
+        self._metric_migration_task: Optional[asyncio.Task] = None
     
     async def connect(self):
         """连接数据库"""
-        self.conn = await aiosqlite.connect(self.db_path)
+        self.conn = await aiosqlite.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
         self.conn.row_factory = aiosqlite.Row
         
         # 启用 WAL 模式以提高并发性能
@@ -31,11 +134,70 @@ class Database:
         
         # 完整性检查
         await self._integrity_check()
+
+        # schema 就绪后再打开只读连接
+        await self._open_readers()
+
+        # 旧格式的指标采样在后台搬迁
+        await self._start_metric_migration()
+
+    async def _start_metric_migration(self):
+        """存在 metrics_legacy 时启动后台搬迁任务"""
+        from db.metric_store import LegacyMetricMigration, has_legacy_metrics
+        if not await has_legacy_metrics(self.conn):
+            return
+        self.metric_migration = LegacyMetricMigration(self)
+        self._metric_migration_task = asyncio.create_task(self.metric_migration.run())
+
+    async def _open_readers(self):
+        """打开只读连接池（内存数据库无法共享，只使用写连接）"""
+        if self.read_connections <= 0 or self.db_path == ":memory:":
+            return
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        idle: asyncio.Queue = asyncio.Queue()
+        try:
+            for _ in range(self.read_connections):
+                reader = await aiosqlite.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+                reader.row_factory = aiosqlite.Row
+                self._readers.append(reader)
+                await reader.execute("PRAGMA query_only=1")
+                idle.put_nowait(reader)
+        except Exception as e:
+            logger.warning(f"Failed to open read-only connections, reads share the writer: {e}")
+            for reader in self._readers:
+                await reader.close()
+            self._readers = []
+            return
+        self._idle_readers = idle
     
     async def close(self):
         """关闭数据库连接"""
+        if self._metric_migration_task is not None:
+            self._metric_migration_task.cancel()
+            try:
+                await self._metric_migration_task
+            except asyncio.CancelledError:
+                pass
+            self._metric_migration_task = None
+        for reader in self._readers:
+            await reader.close()
+        self._readers = []
+        self._idle_readers = None
         if self.conn:
             await self.conn.close()
+
+    @asynccontextmanager
+    async def _reader(self):
+        """取一个空闲的只读连接（没有只读连接时使用写连接）"""
+        idle = self._idle_readers
+        if idle is None:
+            yield self.conn, "writer"
+            return
+        reader = await idle.get()
+        try:
+            yield reader, "reader"
+        finally:
+            idle.put_nowait(reader)
     
     async def _init_schema(self):
         """初始化数据库结构"""
@@ -133,6 +295,43 @@ class Database:
                 await self.conn.execute("ALTER TABLE metrics ADD COLUMN energy_kwh REAL")
             await self.conn.commit()
 
+            # Migration 6: Add ups_id column to events and metrics tables (multi-UPS monitoring)
+            for table in ("events", "metrics"):
+                cursor = await self.conn.execute(f"PRAGMA table_info({table})")
+                columns = await cursor.fetchall()
+                column_names = [col[1] for col in columns]
+
+                if 'ups_id' not in column_names:
+                    await self.conn.execute(f"ALTER TABLE {table} ADD COLUMN ups_id TEXT DEFAULT 'default'")
+                # 紧凑格式的 metrics 表按 (test_mode, ups_id, ts) 主键存储，不需要该索引
+                if 'ts' not in column_names:
+                    await self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ups_id ON {table}(ups_id)")
+            await self.conn.commit()
+
+            # Migration 7: Create metric rollup tables (1m / 15m / 1h) and backfill from raw samples
+            from db.rollups import CREATE_ROLLUP_TABLES_SQL, backfill_rollups, drop_legacy_rollup_tables
+            await drop_legacy_rollup_tables(self.conn)
+            for create_sql in CREATE_ROLLUP_TABLES_SQL:
+                await self.conn.execute(create_sql)
+            await self.conn.commit()
+            await backfill_rollups(self.conn)
+
+            # Migration 8: Composite event indexes and full-text index (event query engine)
+            from db.event_index import migrate_event_indexes
+            await migrate_event_indexes(self.conn)
+
+            # Migration 9: Compact metrics layout (integer epoch ms, WITHOUT ROWID), rows copied in background
+            from db.metric_store import migrate_metric_layout
+            await migrate_metric_layout(self.conn)
+
+            # Migration 10: Trigger-maintained storage statistics
+            from db.storage_stats import migrate_storage_stats
+            await migrate_storage_stats(self.conn)
+
+            # Migration 11: Append-only battery test samples (moved out of battery_test_reports.samples JSON)
+            from db.battery_samples import migrate_battery_samples
+            await migrate_battery_samples(self.conn)
+
         except Exception as e:
             logger.error(f"Error during migrations: {e}")
     
@@ -151,31 +350,68 @@ class Database:
     
     async def execute(self, query: str, params: tuple = ()):
         """执行SQL语句"""
-        async with self.conn.execute(query, params) as cursor:
-            await self.conn.commit()
+        requested = time.monotonic()
+        async with self._write_lock:
+            started = time.monotonic()
+            async with self.conn.execute(query, params) as cursor:
+                await self.conn.commit()
+            self.query_stats.record("writer", query, time.monotonic() - started, started - requested)
             return cursor
     
     async def fetch_one(self, query: str, params: tuple = ()):
         """查询单行"""
-        async with self.conn.execute(query, params) as cursor:
-            return await cursor.fetchone()
+        requested = time.monotonic()
+        async with self._reader() as (conn, role):
+            started = time.monotonic()
+            async with conn.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+            self.query_stats.record(role, query, time.monotonic() - started, started - requested)
+            return row
     
     async def fetch_all(self, query: str, params: tuple = ()):
         """查询多行"""
-        async with self.conn.execute(query, params) as cursor:
-            return await cursor.fetchall()
+        requested = time.monotonic()
+        async with self._reader() as (conn, role):
+            started = time.monotonic()
+            async with conn.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+            self.query_stats.record(role, query, time.monotonic() - started, started - requested)
+            return rows
     
     async def execute_many(self, query: str, params_list: list):
         """批量执行SQL语句（使用事务）"""
-        async with self.conn.execute("BEGIN"):
-            try:
-                for params in params_list:
-                    await self.conn.execute(query, params)
-                await self.conn.commit()
-            except Exception as e:
-                await self.conn.rollback()
-                logger.error(f"Transaction failed, rolled back: {e}")
-                raise
+        await self.execute_transaction([(query, params_list)])
+
+    async def execute_transaction(self, operations: list):
+        """在同一事务中执行多组批量语句
+
+        Args:
+            operations: [(SQL, 参数列表), ...]
+        """
+        requested = time.monotonic()
+        async with self._write_lock:
+            started = time.monotonic()
+            async with self.conn.execute("BEGIN"):
+                try:
+                    for query, params_list in operations:
+                        await self.conn.executemany(query, params_list)
+                    await self.conn.commit()
+                except Exception as e:
+                    await self.conn.rollback()
+                    logger.error(f"Transaction failed, rolled back: {e}")
+                    raise
+            label = operations[0][0] if len(operations) == 1 else f"TRANSACTION ({len(operations)} statements)"
+            self.query_stats.record("writer", label, time.monotonic() - started, started - requested)
+
+    def get_stats(self) -> dict:
+        """连接与查询耗时统计"""
+        return {
+            "read_connections": len(self._readers),
+            "idle_readers": self._idle_readers.qsize() if self._idle_readers is not None else 0,
+            "statement_cache_size": STATEMENT_CACHE_SIZE,
+            "metric_migration": self.metric_migration.get_stats() if self.metric_migration else None,
+            **self.query_stats.get_stats(),
+        }
 
 
 # 全局数据库实例
@@ -190,10 +426,10 @@ async def get_db() -> Database:
     return db
 
 
-async def init_db(db_path: str):
+async def init_db(db_path: str, read_connections: int = DEFAULT_READ_CONNECTIONS):
     """初始化数据库"""
     global db
-    db = Database(db_path)
+    db = Database(db_path, read_connections)
     await db.connect()
 
 
@@ -0,0 +1,88 @@
+"""事件表索引与全文检索
+
+事件查询总是带 test_mode 过滤、按时间倒序分页，原来的单列索引
+（timestamp / event_type / test_mode）只能用上一个，剩余条件逐行过滤。
+复合索引按实际访问模式建立，末尾隐含 rowid(id)，可以直接支撑
+(timestamp, id) 键集分页：
+
+- (test_mode, timestamp)：事件页默认查询
+- (test_mode, event_type, timestamp)：按类型过滤
+- (test_mode, ups_id, timestamp)：按 UPS 过滤
+
+全文检索使用 FTS5 外部内容表（不重复存储正文），覆盖 message 和
+metadata，由触发器与 events 表保持同步。使用 trigram 分词，中文消息
+也能按任意子串（≥3 个字符）检索；SQLite 不支持 FTS5 / trigram 时不创建，
+查询退回 LIKE。
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENTS_FTS_TABLE = "events_fts"
+
+# trigram 分词的最短检索词长度，更短的词退回 LIKE
+FTS_MIN_TERM_LENGTH = 3
+
+CREATE_EVENT_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_events_mode_time ON events(test_mode, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_events_mode_type_time ON events(test_mode, event_type, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_events_mode_ups_time ON events(test_mode, ups_id, timestamp)",
+]
+
+# 被复合索引前缀覆盖的旧索引
+DROP_LEGACY_EVENT_INDEXES_SQL = [
+    "DROP INDEX IF EXISTS idx_events_test_mode",
+]
+
+CREATE_EVENTS_FTS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {EVENTS_FTS_TABLE} USING fts5(
+        message, metadata, content='events', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events BEGIN
+        INSERT INTO {EVENTS_FTS_TABLE}(rowid, message, metadata) VALUES (new.id, new.message, new.metadata);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+        INSERT INTO {EVENTS_FTS_TABLE}({EVENTS_FTS_TABLE}, rowid, message, metadata)
+        VALUES ('delete', old.id, old.message, old.metadata);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS events_fts_update AFTER UPDATE OF message, metadata ON events BEGIN
+        INSERT INTO {EVENTS_FTS_TABLE}({EVENTS_FTS_TABLE}, rowid, message, metadata)
+        VALUES ('delete', old.id, old.message, old.metadata);
+        INSERT INTO {EVENTS_FTS_TABLE}(rowid, message, metadata) VALUES (new.id, new.message, new.metadata);
+    END
+    """,
+]
+
+
+async def has_events_fts(conn) -> bool:
+    """事件全文索引是否存在"""
+    async with conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (EVENTS_FTS_TABLE,)
+    ) as cursor:
+        return await cursor.fetchone() is not None
+
+
+async def migrate_event_indexes(conn):
+    """创建复合索引和全文索引（首次创建全文索引时从现有事件重建）"""
+    for sql in CREATE_EVENT_INDEXES_SQL + DROP_LEGACY_EVENT_INDEXES_SQL:
+        await conn.execute(sql)
+    await conn.commit()
+
+    if await has_events_fts(conn):
+        return
+    try:
+        for sql in CREATE_EVENTS_FTS_SQL:
+            await conn.execute(sql)
+        await conn.execute(f"INSERT INTO {EVENTS_FTS_TABLE}({EVENTS_FTS_TABLE}) VALUES ('rebuild')")
+        await conn.commit()
+        logger.info("Created full-text index for events")
+    except Exception as e:
+        await conn.rollback()
+        logger.warning(f"FTS5 trigram tokenizer unavailable, event search falls back to LIKE: {e}")
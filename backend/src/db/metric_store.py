@@ -0,0 +1,282 @@
+"""指标采样的紧凑存储格式
+
+原来的 metrics 表每条采样：rowid 主键、19 字节的文本时间戳，时间戳 /
+test_mode / ups_id 各有一个二级索引（每个索引再存一份键和 rowid），
+非整数的 REAL 值各占 8 字节。按时间范围查询时比较文本，Python 再对
+每行执行 datetime.fromisoformat。
+
+新格式：
+
+- ts 为 UTC epoch 毫秒整数
+- WITHOUT ROWID，主键 (test_mode, ups_id, ts)：同一 UPS 的采样在 B 树中
+  按时间连续存放，范围查询就是一次主键区间扫描，不需要任何二级索引
+- 指标按固定倍数存为整数（电压 / 百分比精确到 0.1），SQLite 按数值大小
+  只用 1~3 字节存储
+
+读取时在 SQL 中除以倍数（decoded_columns_sql），调用方拿到的值与原来一致。
+
+旧格式的表在启动时改名为 metrics_legacy（只修改 schema，立即完成），
+再由 LegacyMetricMigration 在后台按从新到旧的顺序分块搬迁，每块一个
+短事务，期间采样写入和查询照常进行；全部搬迁后删除旧表。
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from models import DEFAULT_UPS_ID
+
+logger = logging.getLogger(__name__)
+
+# 指标列 -> 存储倍数（存储值 = round(实际值 × 倍数)）
+METRIC_SCALES: Dict[str, int] = {
+    "battery_charge": 10,  # 0.1 %
+    "battery_runtime": 1,  # 秒
+    "input_voltage": 10,  # 0.1 V
+    "output_voltage": 10,  # 0.1 V
+    "load_percent": 10,  # 0.1 %
+    "temperature": 10,  # 0.1 °C
+    "power_watts": 10,  # 0.1 W
+    "energy_kwh": 1_000_000,  # 累计值逐条累加，保留到 0.001 Wh
+}
+
+METRIC_COLUMNS: Tuple[str, ...] = tuple(METRIC_SCALES)
+
+LEGACY_TABLE = "metrics_legacy"
+
+# 后台搬迁每块的行数和块之间的间隔（秒）
+LEGACY_COPY_CHUNK = 5000
+LEGACY_COPY_PAUSE = 0.05
+
+_EPOCH = datetime(1970, 1, 1)
+
+# 与 db/schema.sql 中的定义保持一致
+CREATE_METRICS_SQL = """
+CREATE TABLE IF NOT EXISTS metrics (
+    test_mode TEXT NOT NULL DEFAULT 'production',
+    ups_id TEXT NOT NULL DEFAULT 'default',
+    ts INTEGER NOT NULL,
+    battery_charge INTEGER,
+    battery_runtime INTEGER,
+    input_voltage INTEGER,
+    output_voltage INTEGER,
+    load_percent INTEGER,
+    temperature INTEGER,
+    power_watts INTEGER,
+    energy_kwh INTEGER,
+    PRIMARY KEY (test_mode, ups_id, ts)
+) WITHOUT ROWID
+"""
+
+# 同一 UPS 同一毫秒的重复采样只保留第一条
+INSERT_METRIC_SQL = (
+    f"INSERT OR IGNORE INTO metrics (test_mode, ups_id, ts, {', '.join(METRIC_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * (len(METRIC_COLUMNS) + 3))})"
+)
+
+
+def to_epoch_ms(value) -> int:
+    """datetime（无时区视为 UTC）、数据库时间字符串或 epoch 毫秒 → epoch 毫秒"""
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(milliseconds=1)
+
+
+def from_epoch_ms(ms: int) -> datetime:
+    """epoch 毫秒 → 无时区 UTC datetime"""
+    return _EPOCH + timedelta(milliseconds=ms)
+
+
+def next_ts(last_ts: Dict[Tuple[str, str], int], sampled_at, test_mode: str, ups_id: str = DEFAULT_UPS_ID) -> int:
+    """
+    同一 UPS 的采样时间严格递增（epoch 毫秒）
+
+    主键包含 ts，同一毫秒内的连续采样依次顺延 1 毫秒，避免被 INSERT OR IGNORE 丢弃。
+
+    Args:
+        last_ts: (test_mode, ups_id) -> 上一条采样的 ts，调用方持有并原地更新
+    """
+    key = (test_mode, ups_id)
+    ts = max(to_epoch_ms(sampled_at), last_ts.get(key, -1) + 1)
+    last_ts[key] = ts
+    return ts
+
+
+def encode_value(column: str, value) -> Optional[int]:
+    """实际值 → 存储整数（与 SQLite ROUND 一致，.5 远离 0 取整）"""
+    if value is None:
+        return None
+    scaled = value * METRIC_SCALES[column]
+    return int(scaled + 0.5) if scaled >= 0 else -int(-scaled + 0.5)
+
+
+def decode_value(column: str, raw) -> Optional[float]:
+    """存储整数 → 实际值"""
+    if raw is None:
+        return None
+    scale = METRIC_SCALES[column]
+    return raw if scale == 1 else raw / scale
+
+
+def decoded_columns_sql(columns: Sequence[str] = METRIC_COLUMNS) -> str:
+    """读取时换算回实际值的列表达式（保留原列名）"""
+    parts = []
+    for column in columns:
+        scale = METRIC_SCALES[column]
+        parts.append(column if scale == 1 else f"{column} / {float(scale)} AS {column}")
+    return ", ".join(parts)
+
+
+def metric_row(sampled_at, values: Mapping, test_mode: str, ups_id: str = DEFAULT_UPS_ID) -> tuple:
+    """
+    生成 INSERT_METRIC_SQL 的参数
+
+    Args:
+        sampled_at: 采样时间（datetime、数据库时间字符串（UTC）或 epoch 毫秒）
+        values: 指标列 -> 实际值（缺少的列为 NULL）
+        test_mode: 测试模式
+        ups_id: UPS 标识
+    """
+    return (
+        test_mode,
+        ups_id,
+        to_epoch_ms(sampled_at),
+        *(encode_value(column, values.get(column)) for column in METRIC_COLUMNS),
+    )
+
+
+async def metric_groups(db, table: str = "metrics") -> List[Tuple[str, str]]:
+    """
+    表中出现过的 (test_mode, ups_id) 组合
+
+    按主键逐组跳跃查找（每组一次索引定位），不扫描全表。主键以
+    (test_mode, ups_id) 开头的表（metrics 及各 rollup 表）都适用。
+    """
+    groups = []
+    row = await db.fetch_one(f"SELECT test_mode, ups_id FROM {table} ORDER BY test_mode, ups_id LIMIT 1")
+    while row is not None:
+        groups.append((row[0], row[1]))
+        row = await db.fetch_one(
+            f"SELECT test_mode, ups_id FROM {table} WHERE (test_mode, ups_id) > (?, ?) "
+            "ORDER BY test_mode, ups_id LIMIT 1",
+            (row[0], row[1])
+        )
+    return groups
+
+
+async def metric_time_range(db) -> Tuple[Optional[int], Optional[int]]:
+    """全表最早 / 最新采样时间（epoch 毫秒），每组取主键区间的两端"""
+    earliest = latest = None
+    for test_mode, ups_id in await metric_groups(db):
+        row = await db.fetch_one(
+            "SELECT MIN(ts), MAX(ts) FROM metrics WHERE test_mode = ? AND ups_id = ?",
+            (test_mode, ups_id)
+        )
+        if row[0] is None:
+            continue
+        earliest = row[0] if earliest is None else min(earliest, row[0])
+        latest = row[1] if latest is None else max(latest, row[1])
+    return earliest, latest
+
+
+async def _table_columns(conn, table: str) -> List[str]:
+    async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+        return [row[1] for row in await cursor.fetchall()]
+
+
+async def has_legacy_metrics(conn) -> bool:
+    """是否还有待搬迁的旧格式采样表"""
+    return bool(await _table_columns(conn, LEGACY_TABLE))
+
+
+async def migrate_metric_layout(conn):
+    """旧格式的 metrics 表改名为 metrics_legacy 并创建新表（数据由后台任务搬迁）"""
+    columns = await _table_columns(conn, "metrics")
+    if "ts" in columns:
+        return
+    if await has_legacy_metrics(conn):
+        logger.warning(f"Both legacy metrics and {LEGACY_TABLE} exist, skipping layout migration")
+        return
+
+    # 改名时旧表的索引和触发器随之转移到 metrics_legacy
+    await conn.execute(f"ALTER TABLE metrics RENAME TO {LEGACY_TABLE}")
+    await conn.execute(CREATE_METRICS_SQL)
+    await conn.commit()
+    logger.info(f"Renamed legacy metrics table to {LEGACY_TABLE}, samples will be migrated in the background")
+
+
+# 旧格式 → 新格式（时间戳按 UTC 换算为毫秒，无法解析的行跳过）
+_COPY_SQL = f"""
+    INSERT OR IGNORE INTO metrics (test_mode, ups_id, ts, {', '.join(METRIC_COLUMNS)})
+    SELECT * FROM (
+        SELECT
+            COALESCE(test_mode, 'production'),
+            COALESCE(ups_id, '{DEFAULT_UPS_ID}'),
+            CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER) AS ts,
+            {', '.join(f"CAST(ROUND({column} * {scale}) AS INTEGER)" for column, scale in METRIC_SCALES.items())}
+        FROM {LEGACY_TABLE} WHERE id >= ?
+    )
+    WHERE ts IS NOT NULL
+"""
+
+
+class LegacyMetricMigration:
+    """后台把 metrics_legacy 的采样搬迁到新表
+
+    从最新的采样开始，每块在一个短事务中复制并删除旧表中的对应行，
+    中途停止后下次启动从剩余的行继续。最近的数据最先可见，图表和
+    预测很快恢复；更早的历史逐步补齐。
+    """
+
+    def __init__(self, db, chunk_size: Optional[int] = None, pause: float = LEGACY_COPY_PAUSE):
+        self.db = db
+        self.chunk_size = chunk_size or LEGACY_COPY_CHUNK
+        self.pause = pause
+        self._remaining: Optional[int] = None
+        self._copied = 0
+        self._done = False
+
+    async def run(self):
+        """搬迁全部剩余行（出错时记录日志并停止，下次启动继续）"""
+        try:
+            row = await self.db.fetch_one(f"SELECT COUNT(*) FROM {LEGACY_TABLE}")
+            self._remaining = row[0]
+            logger.info(f"Migrating {self._remaining} legacy metric samples")
+
+            while True:
+                row = await self.db.fetch_one(
+                    f"SELECT id FROM {LEGACY_TABLE} ORDER BY id DESC LIMIT 1 OFFSET ?",
+                    (self.chunk_size - 1,)
+                )
+                # 不足一块时搬迁全部剩余行
+                boundary = row[0] if row else 0
+                await self.db.execute_transaction([
+                    (_COPY_SQL, [(boundary,)]),
+                    (f"DELETE FROM {LEGACY_TABLE} WHERE id >= ?", [(boundary,)]),
+                ])
+                moved = self.chunk_size if row else self._remaining
+                self._copied += moved
+                self._remaining = max(0, self._remaining - moved)
+                if row is None:
+                    break
+                await asyncio.sleep(self.pause)
+
+            await self.db.execute(f"DROP TABLE IF EXISTS {LEGACY_TABLE}")
+            self._remaining = 0
+            self._done = True
+            logger.info(f"Legacy metrics migration finished ({self._copied} samples)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Legacy metrics migration failed, will resume on next start: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "done": self._done,
+            "copied": self._copied,
+            "remaining": self._remaining,
+        }
@@ -0,0 +1,224 @@
+"""指标降采样（rollup）表定义
+
+原始采样写入 metrics 表的同时，增量聚合到 1 分钟 / 15 分钟 / 1 小时
+三个 rollup 表。每个桶按列保存 min / max / sum / count / last，
+avg 由 sum / count 得出。长时间范围的图表查询直接读取粗粒度表，
+原始采样只需保留较短时间。
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from db.metric_store import decoded_columns_sql, from_epoch_ms
+from models import DEFAULT_UPS_ID
+
+logger = logging.getLogger(__name__)
+
+# 参与聚合的指标列
+ROLLUP_COLUMNS = [
+    "battery_charge",
+    "battery_runtime",
+    "input_voltage",
+    "output_voltage",
+    "load_percent",
+    "temperature",
+    "power_watts",
+    "energy_kwh",
+]
+
+# 聚合层级：名称 -> (表名, 桶宽度秒数)，由细到粗
+ROLLUP_TIERS: Dict[str, Tuple[str, int]] = {
+    "1m": ("metrics_rollup_1m", 60),
+    "15m": ("metrics_rollup_15m", 900),
+    "1h": ("metrics_rollup_1h", 3600),
+}
+
+# 原始采样的最小间隔（断电时 10 秒），用于估算原始数据点数
+RAW_MIN_INTERVAL_SECONDS = 10
+
+# 与 SQLite CURRENT_TIMESTAMP 一致的时间格式（UTC）
+DB_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _create_table_sql(table: str) -> str:
+    """生成 rollup 表的建表语句"""
+    column_defs = []
+    for col in ROLLUP_COLUMNS:
+        column_defs.extend([
+            f"{col}_min REAL",
+            f"{col}_max REAL",
+            f"{col}_sum REAL DEFAULT 0",
+            f"{col}_count INTEGER DEFAULT 0",
+            f"{col}_last REAL",
+        ])
+    columns = ",\n    ".join(column_defs)
+    return f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    test_mode TEXT NOT NULL,
+    ups_id TEXT NOT NULL DEFAULT '{DEFAULT_UPS_ID}',
+    bucket TIMESTAMP NOT NULL,
+    samples INTEGER DEFAULT 0,
+    {columns},
+    PRIMARY KEY (test_mode, ups_id, bucket)
+)"""
+
+
+def _upsert_sql(table: str) -> str:
+    """生成增量聚合的 UPSERT 语句"""
+    insert_cols = ["test_mode", "ups_id", "bucket", "samples"]
+    updates = ["samples = samples + 1"]
+    for col in ROLLUP_COLUMNS:
+        insert_cols.extend([f"{col}_min", f"{col}_max", f"{col}_sum", f"{col}_count", f"{col}_last"])
+        updates.extend([
+            f"{col}_min = MIN(COALESCE({col}_min, excluded.{col}_min), COALESCE(excluded.{col}_min, {col}_min))",
+            f"{col}_max = MAX(COALESCE({col}_max, excluded.{col}_max), COALESCE(excluded.{col}_max, {col}_max))",
+            f"{col}_sum = COALESCE({col}_sum, 0) + COALESCE(excluded.{col}_sum, 0)",
+            f"{col}_count = COALESCE({col}_count, 0) + excluded.{col}_count",
+            f"{col}_last = COALESCE(excluded.{col}_last, {col}_last)",
+        ])
+    placeholders = ", ".join(["?", "?", "?", "1"] + ["?"] * (len(insert_cols) - 4))
+    return (
+        f"INSERT INTO {table} ({', '.join(insert_cols)}) VALUES ({placeholders}) "
+        f"ON CONFLICT(test_mode, ups_id, bucket) DO UPDATE SET {', '.join(updates)}"
+    )
+
+
+CREATE_ROLLUP_TABLES_SQL = [_create_table_sql(table) for table, _ in ROLLUP_TIERS.values()]
+UPSERT_ROLLUP_SQL = {name: _upsert_sql(table) for name, (table, _) in ROLLUP_TIERS.items()}
+
+
+def bucket_start(timestamp: datetime, resolution_seconds: int) -> str:
+    """计算采样所属桶的起始时间（UTC，数据库格式）"""
+    epoch = int(timestamp.replace(tzinfo=timezone.utc).timestamp())
+    floored = epoch - (epoch % resolution_seconds)
+    return datetime.fromtimestamp(floored, timezone.utc).strftime(DB_TIMESTAMP_FORMAT)
+
+
+def build_rollup_params(sample: dict, test_mode: str, ups_id: str = DEFAULT_UPS_ID) -> Dict[str, tuple]:
+    """
+    为一条采样生成各层级 UPSERT 的参数
+
+    Args:
+        sample: 包含 timestamp（UTC naive datetime）及 ROLLUP_COLUMNS 的字典
+        test_mode: 测试模式
+        ups_id: UPS 标识
+
+    Returns:
+        层级名称 -> 参数元组
+    """
+    values = []
+    for col in ROLLUP_COLUMNS:
+        value = sample.get(col)
+        values.extend([value, value, value, 1 if value is not None else 0, value])
+
+    return {
+        name: (test_mode, ups_id, bucket_start(sample["timestamp"], resolution), *values)
+        for name, (_, resolution) in ROLLUP_TIERS.items()
+    }
+
+
+def build_rollup_operations(samples: List[Tuple[dict, str, str]]) -> List[Tuple[str, list]]:
+    """
+    为一批采样生成 (SQL, 参数列表) 操作，可与原始插入放在同一事务中执行
+
+    Args:
+        samples: [(采样字典, test_mode, ups_id), ...]，按时间顺序
+    """
+    params_by_tier: Dict[str, list] = {name: [] for name in ROLLUP_TIERS}
+    for sample, test_mode, ups_id in samples:
+        for name, params in build_rollup_params(sample, test_mode, ups_id).items():
+            params_by_tier[name].append(params)
+    return [(UPSERT_ROLLUP_SQL[name], params) for name, params in params_by_tier.items() if params]
+
+
+def select_tier(hours: float, max_points: int) -> Optional[str]:
+    """
+    根据时间范围和点数预算选择数据层级
+
+    选择满足点数预算的最细粒度层级；原始数据按最小采样间隔估算点数。
+    所有层级都超出预算时返回最粗的层级。
+
+    Returns:
+        None 表示使用原始数据，否则为层级名称（如 "15m"）
+    """
+    window_seconds = hours * 3600
+    if window_seconds / RAW_MIN_INTERVAL_SECONDS <= max_points:
+        return None
+    for name, (_, resolution) in ROLLUP_TIERS.items():
+        if window_seconds / resolution <= max_points:
+            return name
+    return list(ROLLUP_TIERS)[-1]
+
+
+async def drop_legacy_rollup_tables(conn):
+    """删除缺少 ups_id 维度的旧版 rollup 表（随后重建并回填）"""
+    for table, _ in ROLLUP_TIERS.values():
+        async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+            column_names = [col[1] for col in await cursor.fetchall()]
+        if column_names and "ups_id" not in column_names:
+            logger.info(f"Rebuilding legacy rollup table {table} with ups_id dimension")
+            await conn.execute(f"DROP TABLE {table}")
+    await conn.commit()
+
+
+async def backfill_rollups(conn, chunk_size: int = 5000):
+    """
+    从已有原始采样重建 rollup 表（仅在 rollup 表为空时执行一次）
+
+    Args:
+        conn: aiosqlite 连接
+        chunk_size: 每批读取的原始采样数
+    """
+    first_table = next(iter(ROLLUP_TIERS.values()))[0]
+    async with conn.execute(f"SELECT 1 FROM {first_table} LIMIT 1") as cursor:
+        if await cursor.fetchone():
+            return
+    async with conn.execute("SELECT 1 FROM metrics LIMIT 1") as cursor:
+        if not await cursor.fetchone():
+            return
+
+    async with conn.execute("PRAGMA table_info(metrics)") as cursor:
+        compact = "ts" in [col[1] for col in await cursor.fetchall()]
+
+    logger.info("Backfilling metric rollup tables from raw samples...")
+    total = 0
+    if compact:
+        # 紧凑格式：按主键 (test_mode, ups_id, ts) 键集分页，每组内按时间顺序
+        query = (
+            f"SELECT test_mode, ups_id, ts, {decoded_columns_sql(ROLLUP_COLUMNS)} FROM metrics "
+            f"WHERE (test_mode, ups_id, ts) > (?, ?, ?) ORDER BY test_mode, ups_id, ts LIMIT ?"
+        )
+        key = ("", "", 0)
+    else:
+        # 迁移前的旧格式（rowid 表，文本时间戳）
+        columns = ", ".join(ROLLUP_COLUMNS)
+        query = f"SELECT id, timestamp, test_mode, ups_id, {columns} FROM metrics WHERE id > ? ORDER BY id LIMIT ?"
+        key = (0,)
+
+    while True:
+        async with conn.execute(query, (*key, chunk_size)) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            break
+
+        samples = []
+        for row in rows:
+            if compact:
+                timestamp = from_epoch_ms(row["ts"])
+            else:
+                try:
+                    timestamp = datetime.fromisoformat(str(row["timestamp"])).replace(tzinfo=None)
+                except ValueError:
+                    continue
+            sample = {col: row[col] for col in ROLLUP_COLUMNS}
+            sample["timestamp"] = timestamp
+            samples.append((sample, row["test_mode"] or "production", row["ups_id"] or DEFAULT_UPS_ID))
+
+        for sql, params in build_rollup_operations(samples):
+            await conn.executemany(sql, params)
+        await conn.commit()
+
+        last = rows[-1]
+        key = (last["test_mode"], last["ups_id"], last["ts"]) if compact else (last["id"],)
+        total += len(rows)
+
+    logger.info(f"Backfilled metric rollups from {total} raw samples")
@@ -12,23 +12,25 @@ CREATE TABLE IF NOT EXISTS events (
     message TEXT,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     metadata TEXT,  -- JSON格式存储额外信息
-    test_mode TEXT DEFAULT 'production'  -- 测试模式: production, mock, dry_run
+    test_mode TEXT DEFAULT 'production',  -- 测试模式: production, mock, dry_run
+    ups_id TEXT DEFAULT 'default'  -- UPS 标识（多 UPS 监控）
 );
 
--- 指标采样表
+-- 指标采样表（紧凑格式，见 db/metric_store.py，与其中的 CREATE_METRICS_SQL 保持一致）
 CREATE TABLE IF NOT EXISTS metrics (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    battery_charge REAL,
-    battery_runtime INTEGER,
-    input_voltage REAL,
-    output_voltage REAL,
-    load_percent REAL,
-    temperature REAL,
-    test_mode TEXT DEFAULT 'production',  -- 测试模式: production, mock, dry_run
-    power_watts REAL,  -- 实时功率 (W)
-    energy_kwh REAL  -- 累计用电量 (kWh, 度)
-);
+    test_mode TEXT NOT NULL DEFAULT 'production',  -- 测试模式: production, mock, dry_run
+    ups_id TEXT NOT NULL DEFAULT 'default',  -- UPS 标识（多 UPS 监控）
+    ts INTEGER NOT NULL,  -- 采样时间 (UTC epoch 毫秒)
+    battery_charge INTEGER,  -- 电量 (0.1 %)
+    battery_runtime INTEGER,  -- 剩余运行时间 (秒)
+    input_voltage INTEGER,  -- 输入电压 (0.1 V)
+    output_voltage INTEGER,  -- 输出电压 (0.1 V)
+    load_percent INTEGER,  -- 负载 (0.1 %)
+    temperature INTEGER,  -- 温度 (0.1 °C)
+    power_watts INTEGER,  -- 实时功率 (0.1 W)
+    energy_kwh INTEGER,  -- 累计用电量 (10^-6 kWh)
+    PRIMARY KEY (test_mode, ups_id, ts)
+) WITHOUT ROWID;
 
 -- 电池测试报告表
 CREATE TABLE IF NOT EXISTS battery_test_reports (
@@ -56,12 +58,24 @@ CREATE TABLE IF NOT EXISTS battery_test_reports (
     ups_manufacturer TEXT,
     ups_model TEXT,
     ups_serial TEXT,
-    -- 采样数据（JSON 格式）
-    samples TEXT,  -- 测试期间的电池数据采样点
+    -- 采样数据（旧版 JSON 格式，已迁移到 battery_test_samples）
+    samples TEXT,
     -- 元数据
     metadata TEXT
 );
 
+-- 电池测试采样（追加写入，按 (报告, 经过毫秒数) 聚簇）
+CREATE TABLE IF NOT EXISTS battery_test_samples (
+    report_id INTEGER NOT NULL,
+    elapsed_ms INTEGER NOT NULL,  -- 相对测试开始的毫秒数
+    battery_charge REAL,
+    battery_voltage REAL,
+    battery_runtime INTEGER,
+    load_percent REAL,
+    input_voltage REAL,
+    PRIMARY KEY (report_id, elapsed_ms)
+) WITHOUT ROWID;
+
 -- 监控统计表
 CREATE TABLE IF NOT EXISTS monitoring_stats (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -77,13 +91,52 @@ CREATE TABLE IF NOT EXISTS monitoring_stats (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 关机前置任务耗时统计（关机时间规划使用）
+CREATE TABLE IF NOT EXISTS hook_durations (
+    hook_name TEXT PRIMARY KEY,
+    avg_seconds REAL NOT NULL,  -- 耗时指数加权平均 (秒)
+    max_seconds REAL NOT NULL,  -- 历史最长耗时 (秒)
+    last_seconds REAL NOT NULL,  -- 最近一次耗时 (秒)
+    runs INTEGER DEFAULT 0,  -- 已记录的执行次数
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 设备定时任务
+CREATE TABLE IF NOT EXISTS device_schedules (
+    schedule_id TEXT PRIMARY KEY,
+    device_index INTEGER NOT NULL,
+    device_name TEXT NOT NULL,
+    action TEXT NOT NULL,  -- shutdown/wake/reboot/sleep/hibernate
+    scheduled_time TIMESTAMP,  -- 首次计划时间（cron 任务为空）
+    repeat TEXT NOT NULL,  -- once/daily/weekly/cron
+    cron TEXT,  -- cron 表达式 (repeat=cron)
+    enabled BOOLEAN DEFAULT 1,
+    created_at TIMESTAMP NOT NULL,
+    last_executed TIMESTAMP,
+    next_execution TIMESTAMP
+);
+
+-- 设备定时任务执行记录
+CREATE TABLE IF NOT EXISTS device_schedule_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    schedule_id TEXT NOT NULL,
+    device_index INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    due_at TIMESTAMP NOT NULL,  -- 计划执行时间
+    started_at TIMESTAMP NOT NULL,  -- 实际开始时间（错过的任务为发现时间）
+    finished_at TIMESTAMP,
+    result TEXT NOT NULL,  -- success/failed/missed
+    message TEXT
+);
+
 -- 创建索引
 CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
 CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type);
 -- Note: idx_events_test_mode is created by migration after ensuring column exists
-CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics(timestamp);
--- Note: idx_metrics_test_mode is created by migration after ensuring column exists
+-- Note: metrics 按主键 (test_mode, ups_id, ts) 聚簇存储，不需要二级索引
+-- Note: idx_events_ups_id is created by migration
 CREATE INDEX IF NOT EXISTS idx_monitoring_stats_date ON monitoring_stats(date);
+CREATE INDEX IF NOT EXISTS idx_device_schedule_runs_schedule ON device_schedule_runs(schedule_id, id);
 
 -- 插入默认配置
 INSERT OR IGNORE INTO config (key, value) VALUES 
@@ -0,0 +1,224 @@
+"""存储统计表
+
+存储页原来每次请求都对 events / metrics 执行 COUNT(*) 并查询最早记录，
+数据库越大越慢。现在由触发器在写入和删除时增量维护：
+
+- storage_stats：每个表的行数、最早 / 最新时间、估算数据量（字节）
+- storage_daily：每个表每天新增的行数和字节数，用于计算增长速度
+
+字节数按每行实际内容长度估算（不含页和索引开销），API 再按数据库文件
+实际大小校准。首次迁移时从现有数据一次性回填。
+
+metrics 和各 rollup 表没有时间索引（按 (test_mode, ups_id, 时间) 主键聚簇），
+删除触发器不能逐行重新查询最早 / 最新时间（每删一行扫描一次全表）；批量删除
+后由 refresh_metric_bounds / refresh_rollup_bounds 按主键逐组计算。
+"""
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db.metric_store import METRIC_COLUMNS, from_epoch_ms, metric_groups, metric_time_range
+from db.rollups import DB_TIMESTAMP_FORMAT, ROLLUP_COLUMNS, ROLLUP_TIERS
+
+logger = logging.getLogger(__name__)
+
+# 每行固定开销（rowid、记录头等）
+ROW_OVERHEAD_BYTES = 24
+
+
+def _text_bytes(column: str) -> str:
+    return f"COALESCE(LENGTH(CAST({column} AS BLOB)), 0)"
+
+
+def _events_bytes(prefix: str) -> str:
+    columns = ("event_type", "message", "timestamp", "metadata", "test_mode", "ups_id")
+    return f"({ROW_OVERHEAD_BYTES} + " + " + ".join(_text_bytes(prefix + c) for c in columns) + ")"
+
+
+def _int_bytes(column: str) -> str:
+    """SQLite 整数的变长存储大小"""
+    return (
+        f"(CASE WHEN {column} IS NULL THEN 0 WHEN ABS({column}) < 128 THEN 1 "
+        f"WHEN ABS({column}) < 32768 THEN 2 WHEN ABS({column}) < 8388608 THEN 3 "
+        f"WHEN ABS({column}) < 2147483648 THEN 4 WHEN ABS({column}) < 140737488355328 THEN 6 ELSE 8 END)"
+    )
+
+
+def _metrics_bytes(prefix: str) -> str:
+    # WITHOUT ROWID 表没有 rowid，记录头按每列 1 字节计算
+    columns = ("ts",) + METRIC_COLUMNS
+    return f"({len(columns) + 2} + " + " + ".join(
+        [_int_bytes(prefix + c) for c in columns] + [_text_bytes(prefix + c) for c in ("test_mode", "ups_id")]
+    ) + ")"
+
+
+def _rollup_bytes(prefix: str) -> str:
+    numeric = len(ROLLUP_COLUMNS) * 5 + 1
+    return f"({ROW_OVERHEAD_BYTES} + {numeric * 8} + " + " + ".join(
+        _text_bytes(prefix + c) for c in ("bucket", "test_mode", "ups_id")
+    ) + ")"
+
+
+def _column(name: str) -> Callable[[str], str]:
+    return lambda prefix: prefix + name
+
+
+def _epoch_ms(prefix: str) -> str:
+    return f"datetime({prefix}ts / 1000, 'unixepoch')"
+
+
+# 统计的表：表名 -> (时间表达式生成函数, 行字节数表达式生成函数, 时间列是否有索引)
+TRACKED_TABLES: Dict[str, Tuple[Callable[[str], str], Callable[[str], str], bool]] = {
+    "events": (_column("timestamp"), _events_bytes, True),
+    "metrics": (_epoch_ms, _metrics_bytes, False),
+    **{table: (_column("bucket"), _rollup_bytes, False) for table, _ in ROLLUP_TIERS.values()},
+}
+
+CREATE_STORAGE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS storage_stats (
+        table_name TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        earliest TIMESTAMP,
+        latest TIMESTAMP,
+        bytes INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS storage_daily (
+        table_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, day)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def _trigger_sql(table: str) -> List[str]:
+    time_of, row_bytes, indexed = TRACKED_TABLES[table]
+    new_bytes, old_bytes = row_bytes("new."), row_bytes("old.")
+    new_time, old_time = time_of("new."), time_of("old.")
+    if indexed:
+        # 删除了最早 / 最新的行时按索引重新查询
+        earliest = f"CASE WHEN {old_time} <= earliest THEN (SELECT MIN({time_of('')}) FROM {table}) ELSE earliest END"
+        latest = f"CASE WHEN {old_time} >= latest THEN (SELECT MAX({time_of('')}) FROM {table}) ELSE latest END"
+    else:
+        # 只在表清空时重置，其余由 refresh_metric_bounds / refresh_rollup_bounds 更新
+        earliest = "CASE WHEN row_count <= 1 THEN NULL ELSE earliest END"
+        latest = "CASE WHEN row_count <= 1 THEN NULL ELSE latest END"
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS storage_stats_{table}_insert AFTER INSERT ON {table} BEGIN
+            UPDATE storage_stats SET
+                row_count = row_count + 1,
+                bytes = bytes + {new_bytes},
+                earliest = CASE WHEN earliest IS NULL OR {new_time} < earliest THEN {new_time} ELSE earliest END,
+                latest = CASE WHEN latest IS NULL OR {new_time} > latest THEN {new_time} ELSE latest END
+            WHERE table_name = '{table}';
+            INSERT INTO storage_daily (table_name, day, rows, bytes)
+            VALUES ('{table}', date({new_time}), 1, {new_bytes})
+            ON CONFLICT(table_name, day) DO UPDATE SET rows = rows + 1, bytes = bytes + excluded.bytes;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS storage_stats_{table}_delete AFTER DELETE ON {table} BEGIN
+            UPDATE storage_stats SET
+                row_count = MAX(row_count - 1, 0),
+                bytes = MAX(bytes - {old_bytes}, 0),
+                earliest = {earliest},
+                latest = {latest}
+            WHERE table_name = '{table}';
+            UPDATE storage_daily SET rows = rows - 1, bytes = MAX(bytes - {old_bytes}, 0)
+            WHERE table_name = '{table}' AND day = date({old_time});
+            DELETE FROM storage_daily
+            WHERE table_name = '{table}' AND day = date({old_time}) AND rows <= 0;
+        END
+        """,
+    ]
+
+
+async def _backfill(conn, table: str):
+    """从现有数据回填（每个表只执行一次）"""
+    time_of, row_bytes, _ = TRACKED_TABLES[table]
+    await conn.execute(
+        f"""
+        INSERT OR REPLACE INTO storage_stats (table_name, row_count, earliest, latest, bytes)
+        SELECT '{table}', COUNT(*), MIN({time_of('')}), MAX({time_of('')}), COALESCE(SUM({row_bytes('')}), 0)
+        FROM {table}
+        """
+    )
+    await conn.execute("DELETE FROM storage_daily WHERE table_name = ?", (table,))
+    await conn.execute(
+        f"""
+        INSERT INTO storage_daily (table_name, day, rows, bytes)
+        SELECT '{table}', date({time_of('')}), COUNT(*), SUM({row_bytes('')})
+        FROM {table} GROUP BY date({time_of('')})
+        """
+    )
+
+
+async def migrate_storage_stats(conn):
+    """创建统计表和触发器，首次创建时回填现有数据"""
+    for sql in CREATE_STORAGE_TABLES_SQL:
+        await conn.execute(sql)
+
+    async with conn.execute("SELECT table_name FROM storage_stats") as cursor:
+        existing = {row[0] for row in await cursor.fetchall()}
+
+    # 表改名重建（如 metrics 转为紧凑格式）后旧触发器跟随旧表，需要重新统计
+    async with conn.execute(
+        "SELECT name, tbl_name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'storage_stats_%'"
+    ) as cursor:
+        for name, tbl_name in await cursor.fetchall():
+            table = name[len("storage_stats_"):].rsplit("_", 1)[0]
+            if table in TRACKED_TABLES and tbl_name != table:
+                await conn.execute(f"DROP TRIGGER {name}")
+                existing.discard(table)
+
+    for table in TRACKED_TABLES:
+        if table not in existing:
+            await _backfill(conn, table)
+            logger.info(f"Backfilled storage stats for {table}")
+        # 删除触发器的实现可能随版本变化（如 rollup 表不再逐行查询边界），每次重建
+        await conn.execute(f"DROP TRIGGER IF EXISTS storage_stats_{table}_delete")
+        for sql in _trigger_sql(table):
+            await conn.execute(sql)
+    await conn.commit()
+
+
+async def refresh_metric_bounds(db):
+    """批量删除指标后重新计算 metrics 的最早 / 最新时间"""
+    earliest, latest = await metric_time_range(db)
+
+    def _format(ms: Optional[int]) -> Optional[str]:
+        return from_epoch_ms(ms).strftime(DB_TIMESTAMP_FORMAT) if ms is not None else None
+
+    await db.execute(
+        "UPDATE storage_stats SET earliest = ?, latest = ? WHERE table_name = 'metrics'",
+        (_format(earliest), _format(latest))
+    )
+
+
+async def refresh_rollup_bounds(db, tables: Optional[List[str]] = None):
+    """
+    批量删除 rollup 后重新计算最早 / 最新时间
+
+    Args:
+        tables: 需要更新的 rollup 表，默认全部
+    """
+    for table in tables or [table for table, _ in ROLLUP_TIERS.values()]:
+        earliest = latest = None
+        for test_mode, ups_id in await metric_groups(db, table):
+            row = await db.fetch_one(
+                f"SELECT MIN(bucket), MAX(bucket) FROM {table} WHERE test_mode = ? AND ups_id = ?",
+                (test_mode, ups_id)
+            )
+            if row[0] is None:
+                continue
+            earliest = row[0] if earliest is None else min(earliest, row[0])
+            latest = row[1] if latest is None else max(latest, row[1])
+        await db.execute(
+            "UPDATE storage_stats SET earliest = ?, latest = ? WHERE table_name = ?",
+            (earliest, latest, table)
+        )
@@ -1,6 +1,6 @@
 """关机前置任务插件基类"""
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 
 class PreShutdownHook(ABC):
@@ -74,6 +74,15 @@ class PreShutdownHook(ABC):
         """
         pass
     
+    def http_endpoints(self) -> List[Tuple[str, Optional[str], bool]]:
+        """
+        任务会访问的 HTTP 端点，用于配置加载时预先创建共享客户端
+        
+        Returns:
+            (URL, 代理地址, 是否校验证书) 列表，非 HTTP 任务返回空列表
+        """
+        return []
+    
     async def test_connection(self) -> bool:
         """
         测试连接（子类可覆盖）
@@ -82,3 +91,20 @@ class PreShutdownHook(ABC):
             是否连接成功
         """
         return await self.execute()
+    
+    async def probe(self) -> bool:
+        """
+        无副作用的连通性探测（后台周期性调用）
+        
+        默认使用子类覆盖的 test_connection()；未覆盖 test_connection() 或其
+        实现会执行实际操作的插件必须覆盖本方法，否则不做后台探测。
+        
+        Returns:
+            是否连接成功
+        
+        Raises:
+            NotImplementedError: 插件无法在不执行操作的情况下探测
+        """
+        if type(self).test_connection is PreShutdownHook.test_connection:
+            raise NotImplementedError(f"{self.hook_id} does not support side-effect-free probing")
+        return await self.test_connection()
@@ -1,4 +1,5 @@
 """通用 HTTP API 关机插件"""
+import asyncio
 import logging
 import json
 from typing import Dict, Any, List
@@ -6,6 +7,7 @@ import httpx
 from hooks.base import PreShutdownHook
 from hooks.registry import registry
 from utils.retry import async_retry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -102,6 +104,9 @@ class HTTPAPIHook(PreShutdownHook):
             except json.JSONDecodeError:
                 raise ValueError("请求体必须是有效的 JSON 格式")
     
+    def http_endpoints(self):
+        return [(self.config["url"], None, False)]
+
     async def execute(self) -> bool:
         """执行 HTTP API 调用（带重试）"""
         url = self.config["url"]
@@ -129,7 +134,7 @@ class HTTPAPIHook(PreShutdownHook):
         
         async def _do_request():
             """执行单次 HTTP 请求"""
-            async with httpx.AsyncClient(verify=False, timeout=timeout) as client:
+            async with get_http_pool().client(url, verify=False, timeout=timeout) as client:
                 if method == "GET":
                     response = await client.get(url, headers=headers)
                 elif method == "POST":
@@ -164,6 +169,18 @@ class HTTPAPIHook(PreShutdownHook):
         """测试 HTTP API 连接"""
         return await self.execute()
 
+    async def probe(self) -> bool:
+        """只建立到 API 主机的 TCP 连接，不发送请求（test_connection 会实际调用 API）"""
+        url = httpx.URL(self.config["url"])
+        port = url.port or (443 if url.scheme == "https" else 80)
+        _, writer = await asyncio.open_connection(url.host, port)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
 
 # 自动注册插件
 registry.register(HTTPAPIHook)
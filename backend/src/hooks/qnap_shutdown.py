@@ -5,6 +5,7 @@ import httpx
 from hooks.base import PreShutdownHook
 from hooks.registry import registry
 from utils.retry import async_retry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -101,6 +102,10 @@ class QNAPShutdownHook(PreShutdownHook):
         if "password" not in self.config or not self.config["password"]:
             raise ValueError("密码不能为空")
     
+    def http_endpoints(self):
+        protocol = "https" if self.config.get("use_https", "true") == "true" else "http"
+        return [(f"{protocol}://{self.config['host']}:{self.config.get('port', 443)}", None, False)]
+
     async def execute(self) -> bool:
         """执行威联通 NAS 关机（带重试）"""
         host = self.config["host"]
@@ -114,7 +119,7 @@ class QNAPShutdownHook(PreShutdownHook):
         
         async def _login():
             """登录获取 sid（带重试）"""
-            async with httpx.AsyncClient(verify=False, timeout=30) as client:
+            async with get_http_pool().client(base_url, verify=False, timeout=30) as client:
                 login_url = f"{base_url}/cgi-bin/authLogin.cgi"
                 login_data = {
                     "user": username,
@@ -141,7 +146,7 @@ class QNAPShutdownHook(PreShutdownHook):
         
         async def _shutdown(sid: str):
             """执行关机命令（带重试，但谨慎）"""
-            async with httpx.AsyncClient(verify=False, timeout=30) as client:
+            async with get_http_pool().client(base_url, verify=False, timeout=30) as client:
                 shutdown_url = f"{base_url}/cgi-bin/sys/sysRequest.cgi"
                 shutdown_params = {
                     "subfunc": "power_mgmt",
@@ -188,7 +193,7 @@ class QNAPShutdownHook(PreShutdownHook):
         base_url = f"{protocol}://{host}:{port}"
         
         try:
-            async with httpx.AsyncClient(verify=False, timeout=15) as client:
+            async with get_http_pool().client(base_url, verify=False, timeout=15) as client:
                 # 尝试登录
                 login_url = f"{base_url}/cgi-bin/authLogin.cgi"
                 login_data = {
@@ -22,6 +22,11 @@ class HookRegistry:
         """
         self._mock_mode = enabled
 
+    @property
+    def mock_mode(self) -> bool:
+        """是否为 Mock 模式"""
+        return self._mock_mode
+
     def register(self, hook_class: Type[PreShutdownHook]):
         """
         注册 hook 插件
@@ -6,6 +6,7 @@ import asyncssh
 from hooks.base import PreShutdownHook
 from hooks.registry import registry
 from utils.retry import async_retry
+from services.ssh_pool import get_ssh_pool
 
 logger = logging.getLogger(__name__)
 
@@ -134,32 +135,17 @@ class SSHShutdownHook(PreShutdownHook):
                 raise ValueError("使用私钥认证时，私钥不能为空")
     
     async def execute(self) -> bool:
-        """执行 SSH 远程关机（带连接重试）"""
+        """执行 SSH 远程关机（带连接重试，复用会话池中的连接）"""
         host = self.config["host"]
         port = self.config.get("port", 22)
-        username = self.config["username"]
-        auth_type = self.config.get("auth_type", "password")
         shutdown_command = self.config.get("shutdown_command", "sudo shutdown -h now")
         pre_commands_str = self.config.get("pre_commands", "").strip()
-        
-        # 准备认证参数
-        connect_kwargs = {
-            "host": host,
-            "port": port,
-            "username": username,
-            "known_hosts": None  # 禁用 host key 检查
-        }
-        
-        if auth_type == "password":
-            connect_kwargs["password"] = self.config["password"]
-        else:
-            # 使用私钥认证
-            connect_kwargs["client_keys"] = [self.config["private_key"]]
+        pool = get_ssh_pool()
         
         async def _connect_and_execute():
             """连接并执行命令（带连接重试）"""
-            # 连接 SSH
-            async with asyncssh.connect(**connect_kwargs) as conn:
+            # 预关机命令和关机命令在同一个连接上执行
+            async with pool.session(self.config) as conn:
                 # 执行预关机命令
                 if pre_commands_str:
                     pre_commands = [cmd.strip() for cmd in pre_commands_str.split("\n") if cmd.strip()]
@@ -174,8 +160,10 @@ class SSHShutdownHook(PreShutdownHook):
                 except (asyncio.TimeoutError, asyncssh.ConnectionLost, asyncssh.DisconnectError):
                     # 预期的行为：关机命令会导致连接断开
                     pass
-                
-                return True
+            
+            # 主机正在关机，连接不再可用
+            pool.discard(self.config)
+            return True
         
         try:
             # 使用 async_retry 进行连接重试（仅连接阶段）
@@ -196,25 +184,10 @@ class SSHShutdownHook(PreShutdownHook):
         """测试 SSH 连接（带重试）"""
         host = self.config["host"]
         port = self.config.get("port", 22)
-        username = self.config["username"]
-        auth_type = self.config.get("auth_type", "password")
-        
-        # 准备认证参数
-        connect_kwargs = {
-            "host": host,
-            "port": port,
-            "username": username,
-            "known_hosts": None
-        }
-        
-        if auth_type == "password":
-            connect_kwargs["password"] = self.config["password"]
-        else:
-            connect_kwargs["client_keys"] = [self.config["private_key"]]
         
         async def _test_connect():
             """测试连接"""
-            async with asyncssh.connect(**connect_kwargs) as conn:
+            async with get_ssh_pool().session(self.config) as conn:
                 result = await conn.run("echo 'SSH connection test successful'", check=True, timeout=10)
                 return True
         
@@ -233,28 +206,12 @@ class SSHShutdownHook(PreShutdownHook):
             return False
     
     async def _execute_ssh_command(self, command: str, operation_name: str = "operation") -> bool:
-        """通用 SSH 命令执行方法"""
+        """通用 SSH 命令执行方法（重启 / 睡眠 / 休眠，执行后连接不再可用）"""
         host = self.config["host"]
-        port = self.config.get("port", 22)
-        username = self.config["username"]
-        auth_type = self.config.get("auth_type", "password")
+        pool = get_ssh_pool()
         
         try:
-            # 准备认证参数
-            connect_kwargs = {
-                "host": host,
-                "port": port,
-                "username": username,
-                "known_hosts": None
-            }
-            
-            if auth_type == "password":
-                connect_kwargs["password"] = self.config["password"]
-            else:
-                connect_kwargs["client_keys"] = [self.config["private_key"]]
-            
-            # 连接 SSH
-            async with asyncssh.connect(**connect_kwargs) as conn:
+            async with pool.session(self.config) as conn:
 
                 # 执行命令（不等待响应太久，因为连接可能会断开）
                 try:
@@ -262,7 +219,8 @@ class SSHShutdownHook(PreShutdownHook):
                 except (asyncio.TimeoutError, asyncssh.ConnectionLost, asyncssh.DisconnectError):
                     # 预期的行为：某些命令会导致连接断开
                     pass
-                return True
+            pool.discard(self.config)
+            return True
         
         except asyncssh.Error as e:
             logger.error(f"SSH error for {host} during {operation_name}: {e}")
@@ -5,6 +5,7 @@ import httpx
 from hooks.base import PreShutdownHook
 from hooks.registry import registry
 from utils.retry import async_retry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -102,6 +103,10 @@ class SynologyShutdownHook(PreShutdownHook):
         if "password" not in self.config or not self.config["password"]:
             raise ValueError("密码不能为空")
     
+    def http_endpoints(self):
+        protocol = "https" if self.config.get("use_https", "true") == "true" else "http"
+        return [(f"{protocol}://{self.config['host']}:{self.config.get('port', 5001)}", None, False)]
+
     async def execute(self) -> bool:
         """执行群晖 NAS 关机（带重试）"""
         host = self.config["host"]
@@ -115,7 +120,7 @@ class SynologyShutdownHook(PreShutdownHook):
         
         async def _login():
             """登录获取 SID（带重试）"""
-            async with httpx.AsyncClient(verify=False, timeout=30) as client:
+            async with get_http_pool().client(base_url, verify=False, timeout=30) as client:
                 auth_url = f"{base_url}/webapi/auth.cgi"
                 auth_params = {
                     "api": "SYNO.API.Auth",
@@ -138,7 +143,7 @@ class SynologyShutdownHook(PreShutdownHook):
         
         async def _shutdown(sid: str):
             """执行关机命令（带重试，但谨慎）"""
-            async with httpx.AsyncClient(verify=False, timeout=30) as client:
+            async with get_http_pool().client(base_url, verify=False, timeout=30) as client:
                 shutdown_url = f"{base_url}/webapi/entry.cgi"
                 shutdown_params = {
                     "api": "SYNO.Core.System",
@@ -186,7 +191,7 @@ class SynologyShutdownHook(PreShutdownHook):
         base_url = f"{protocol}://{host}:{port}"
         
         try:
-            async with httpx.AsyncClient(verify=False, timeout=15) as client:
+            async with get_http_pool().client(base_url, verify=False, timeout=15) as client:
                 # 尝试登录
                 auth_url = f"{base_url}/webapi/auth.cgi"
                 auth_params = {
@@ -5,6 +5,7 @@ from typing import Dict, Any, List
 import asyncssh
 from hooks.base import PreShutdownHook
 from hooks.registry import registry
+from services.ssh_pool import get_ssh_pool
 
 logger = logging.getLogger(__name__)
 
@@ -108,23 +109,15 @@ class WindowsShutdownHook(PreShutdownHook):
             raise ValueError("密码不能为空")
     
     async def execute(self) -> bool:
-        """执行 Windows 远程关机"""
+        """执行 Windows 远程关机（复用会话池中的连接）"""
         host = self.config["host"]
-        port = self.config.get("port", 22)
-        username = self.config["username"]
-        password = self.config["password"]
         shutdown_command = self.config.get("shutdown_command", "shutdown /s /t 60 /c \"UPS power lost\"")
         pre_commands_str = self.config.get("pre_commands", "").strip()
+        pool = get_ssh_pool()
         
         try:
-            # 连接 SSH
-            async with asyncssh.connect(
-                host=host,
-                port=port,
-                username=username,
-                password=password,
-                known_hosts=None  # 禁用 host key 检查
-            ) as conn:
+            # 预关机命令和关机命令在同一个连接上执行
+            async with pool.session(self.config) as conn:
 
                 # 执行预关机命令
                 if pre_commands_str:
@@ -140,14 +133,15 @@ class WindowsShutdownHook(PreShutdownHook):
                 try:
                     # Windows shutdown 命令通常会成功返回
                     result = await asyncio.wait_for(conn.run(shutdown_command, check=False), timeout=10)
-                    if result.exit_status == 0:
-                        return True
-                    else:
+                    if result.exit_status != 0:
                         logger.error(f"Shutdown command failed on {host} (exit {result.exit_status})")
                         return False
                 except asyncio.TimeoutError:
                     logger.warning(f"Shutdown command on {host} timed out (might still succeed)")
-                    return True
+
+            # 主机即将关机，连接不再可用
+            pool.discard(self.config)
+            return True
         
         except asyncssh.Error as e:
             logger.error(f"SSH error for {host}: {e}")
@@ -159,18 +153,9 @@ class WindowsShutdownHook(PreShutdownHook):
     async def test_connection(self) -> bool:
         """测试 Windows SSH 连接"""
         host = self.config["host"]
-        port = self.config.get("port", 22)
-        username = self.config["username"]
-        password = self.config["password"]
         
         try:
-            async with asyncssh.connect(
-                host=host,
-                port=port,
-                username=username,
-                password=password,
-                known_hosts=None
-            ) as conn:
+            async with get_ssh_pool().session(self.config) as conn:
                 result = await conn.run("echo SSH connection test successful", check=True, timeout=10)
                 return True
         
@@ -179,20 +164,12 @@ class WindowsShutdownHook(PreShutdownHook):
             return False
     
     async def _execute_windows_command(self, command: str, operation_name: str = "operation") -> bool:
-        """通用 Windows SSH 命令执行方法"""
+        """通用 Windows SSH 命令执行方法（重启 / 睡眠 / 休眠，执行后连接不再可用）"""
         host = self.config["host"]
-        port = self.config.get("port", 22)
-        username = self.config["username"]
-        password = self.config["password"]
+        pool = get_ssh_pool()
         
         try:
-            async with asyncssh.connect(
-                host,
-                port=port,
-                username=username,
-                password=password,
-                known_hosts=None
-            ) as conn:
+            async with pool.session(self.config) as conn:
 
                 # 执行命令（不等待响应太久，因为连接可能会断开）
                 try:
@@ -200,7 +177,8 @@ class WindowsShutdownHook(PreShutdownHook):
                 except (asyncio.TimeoutError, asyncssh.ConnectionLost, asyncssh.DisconnectError):
                     # 预期的行为：某些命令会导致连接断开
                     pass
-                return True
+            pool.discard(self.config)
+            return True
         
         except asyncssh.Error as e:
             logger.error(f"SSH error for {host} during {operation_name}: {e}")
@@ -20,10 +20,16 @@ from services.apcupsd_client import create_ups_client
 from services.lzc_shutdown import create_shutdown_client
 from services.shutdown_manager import ShutdownManager
 from services.monitor import UpsMonitor, set_monitor
-from services.notifier import get_notifier_service
+from services.monitor_group import MonitorGroup, create_unit_monitor, parse_ups_units, set_monitor_group
+from services.notifier import NOTIFY_CONFIG_KEYS, get_notifier_service
+from services.http_pool import get_http_pool, prewarm_from_config
+from services.ssh_pool import get_ssh_pool
+from services.shutdown_planner import get_hook_duration_store
+from services.device_reachability import get_reachability_service
+from services.diagnostics_collector import get_diagnostics_collector
 from services.history import get_history_service
 from api.router import router
-from api.websocket import broadcast_status_update
+from api.websocket import broadcast_status_update, broadcast_device_status
 from models import EventType, NotifierConfig
 from middleware.auth import AuthMiddleware
 from utils.crypto import init_crypto_manager
@@ -82,7 +88,10 @@ async def lifespan(app: FastAPI):
     )
 
     # 初始化数据库
-    await init_db(settings.database_path)
+    await init_db(settings.database_path, settings.database_read_connections)
+
+    # 加载关机前置任务历史耗时（关机时间规划使用）
+    await get_hook_duration_store().load()
 
     # 加载配置
     config_manager = await get_config_manager()
@@ -93,6 +102,13 @@ async def lifespan(app: FastAPI):
     notify_channels = [NotifierConfig(**ch) for ch in config.notify_channels]
     notifier_service.configure(notify_channels, config.notify_events, config.notification_enabled)
 
+    # 预先创建通知渠道和 HTTP 类关机前置任务使用的共享客户端
+    prewarm_from_config(config)
+
+    # 启用指标批量写入（断电期间高频采样合并为一次事务）
+    history_service = await get_history_service()
+    await history_service.start_metric_writer()
+
     # 创建 UPS 客户端（根据配置选择后端）
     ups_client = create_ups_client(
         backend=settings.ups_backend,
@@ -102,6 +118,8 @@ async def lifespan(app: FastAPI):
         password=settings.nut_password,
         ups_name=settings.nut_ups_name,
         mock_mode=settings.mock_mode,
+        aux_pool_size=settings.nut_aux_connections,
+        snapshot_ttl=settings.apcupsd_snapshot_ttl,
     )
     
     # 创建关机客户端
@@ -130,15 +148,28 @@ async def lifespan(app: FastAPI):
         config=config
     )
     set_monitor(monitor)
+
+    # 多 UPS 监控：主 UPS + UPS_UNITS 中声明的附加 UPS
+    monitor_group = MonitorGroup()
+    monitor_group.add(monitor)
+    for unit in parse_ups_units(settings.ups_units):
+        monitor_group.add(create_unit_monitor(
+            unit,
+            config,
+            shutdown_client,
+            mock_mode=settings.mock_mode,
+            aux_pool_size=settings.nut_aux_connections,
+            snapshot_ttl=settings.apcupsd_snapshot_ttl,
+        ))
+    set_monitor_group(monitor_group)
     
     # 添加 WebSocket 广播回调
-    monitor.add_status_callback(broadcast_status_update)
+    monitor_group.add_status_callback(broadcast_status_update)
     
     # 启动监控
-    await monitor.start()
+    await monitor_group.start()
 
     # 记录启动事件
-    history_service = await get_history_service()
     await history_service.add_event(
         EventType.STARTUP,
         "UPS Guard 服务已启动"
@@ -156,7 +187,14 @@ async def lifespan(app: FastAPI):
                 
                 # 再次获取配置以使用最新的保留天数
                 config = await config_manager.get_config()
-                result = await history_service.cleanup_old_data(config.history_retention_days)
+                result = await history_service.cleanup_old_data(
+                    config.history_retention_days,
+                    rollup_retention_days={
+                        "1m": config.rollup_1m_retention_days,
+                        "15m": config.rollup_15m_retention_days,
+                        "1h": config.rollup_1h_retention_days,
+                    }
+                )
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -169,6 +207,29 @@ async def lifespan(app: FastAPI):
     scheduler = get_scheduler()
     await scheduler.start()
 
+    # 启动设备连通性后台探测（状态变化通过 WebSocket 推送）
+    reachability_service = get_reachability_service()
+    reachability_service.add_change_callback(broadcast_device_status)
+    await reachability_service.start()
+
+    # 启动诊断信息后台收集（诊断接口不再实时访问 NUT）
+    diagnostics_collector = get_diagnostics_collector()
+    history_service.add_write_listener(diagnostics_collector.invalidate_events)
+    await diagnostics_collector.start(monitor)
+
+    # 配置变更时只热更新受影响的服务
+    config_subscriptions = [
+        (notifier_service.apply_config, NOTIFY_CONFIG_KEYS),
+        (lambda change: prewarm_from_config(change.config), ["notify_channels", "pre_shutdown_hooks"]),
+        (lambda change: reachability_service.invalidate(),
+         ["pre_shutdown_hooks", "device_status_check_interval_seconds"]),
+        # 每台 UPS 的监控器都要同步（附加 UPS 单独配置的关机策略项除外）
+        *((unit_monitor.apply_config, None) for unit_monitor in monitor_group.monitors()),
+        (diagnostics_collector.invalidate_config, None),
+    ]
+    for callback, keys in config_subscriptions:
+        config_manager.subscribe(callback, keys)
+
     # 运行期间
     try:
         yield
@@ -176,13 +237,23 @@ async def lifespan(app: FastAPI):
         logger.info("Received shutdown signal, cleaning up...")
     finally:
         # 关闭时清理
+        for callback, _ in config_subscriptions:
+            config_manager.unsubscribe(callback)
         cleanup_task_handle.cancel()
         try:
             await cleanup_task_handle
         except asyncio.CancelledError:
             pass
         await scheduler.stop()
-        await monitor.stop()
+        await reachability_service.stop()
+        await diagnostics_collector.stop()
+        await monitor_group.stop()
+        # 尽量发送队列中剩余的通知（发送失败会写事件日志，需在关闭数据库前完成）
+        await notifier_service.stop()
+        await get_http_pool().close()
+        await get_ssh_pool().close()
+        # 关闭数据库前写入队列中剩余的指标采样
+        await history_service.stop_metric_writer()
         await close_db()
         logger.info("Shutdown complete")
 
@@ -4,6 +4,9 @@ from typing import Optional, List
 from pydantic import BaseModel, Field
 from enum import Enum
 
+# 主 UPS 的标识（单机部署时所有数据都属于该 UPS）
+DEFAULT_UPS_ID = "default"
+
 
 class UpsStatus(str, Enum):
     """UPS 状态枚举"""
@@ -47,6 +50,8 @@ class EventType(str, Enum):
     UPS_PARAM_CHANGED = "UPS_PARAM_CHANGED"
     # 电池维护事件
     BATTERY_REPLACED = "BATTERY_REPLACED"
+    # 在线异常检测事件
+    ANOMALY_DETECTED = "ANOMALY_DETECTED"
     # 前端事件
     FRONTEND_ERROR = "FRONTEND_ERROR"
     FRONTEND_USER_ACTION = "FRONTEND_USER_ACTION"
@@ -132,6 +137,8 @@ class UpsData(BaseModel):
     ups_alarm_del: Optional[str] = None  # 蜂鸣器策略 (ALARMDEL)
     ups_backend: Optional[str] = None  # 当前后端类型: nut/apcupsd
     ups_starttime: Optional[str] = None  # UPS 守护进程启动时间
+    # 多 UPS 监控
+    ups_id: str = DEFAULT_UPS_ID  # UPS 标识
 
 
 class Event(BaseModel):
@@ -141,6 +148,7 @@ class Event(BaseModel):
     message: str
     timestamp: datetime = Field(default_factory=datetime.now)
     metadata: Optional[dict] = None
+    ups_id: str = DEFAULT_UPS_ID
 
 
 class Metric(BaseModel):
@@ -177,6 +185,9 @@ class Config(BaseModel):
     notification_enabled: bool = True  # 通知总开关
     sample_interval_seconds: int = 60
     history_retention_days: int = 30
+    rollup_1m_retention_days: int = 90  # 1 分钟降采样数据保留天数
+    rollup_15m_retention_days: int = 365  # 15 分钟降采样数据保留天数
+    rollup_1h_retention_days: int = 1825  # 1 小时降采样数据保留天数
     poll_interval_seconds: int = 5  # NUT 状态轮询间隔（秒）
     cleanup_interval_hours: int = 24  # 历史数据清理间隔（小时）
     pre_shutdown_hooks: List[dict] = []  # 关机前置任务配置列表
@@ -185,6 +196,7 @@ class Config(BaseModel):
     wol_on_power_restore: bool = False  # 来电后自动发送 WOL
     wol_delay_seconds: int = 60  # 来电后等待多少秒再发 WOL
     device_status_check_interval_seconds: int = 60  # 设备状态检测间隔（秒），0 表示禁用
+    battery_test_sample_interval_seconds: int = 1  # 电池测试期间的采样间隔（秒）
     
     # 电池信息（用户自定义）
     battery_install_date: Optional[str] = None  # 电池安装/更换日期（YYYY-MM-DD 格式），用户手动设置
@@ -231,3 +243,19 @@ class MonitoringStats(BaseModel):
     uptime_seconds: int = 0  # 运行时长
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class UpsUnitConfig(BaseModel):
+    """附加 UPS 配置（多 UPS 监控，来自 UPS_UNITS 环境变量）"""
+    id: str  # UPS 标识，用于 API / WebSocket / 历史数据
+    backend: str = "nut"  # nut / apcupsd
+    host: str
+    port: Optional[int] = None  # 留空使用后端默认端口
+    username: str = ""
+    password: str = ""
+    ups_name: str = ""  # 同一 upsd 上有多台 UPS 时必须指定
+    # 关机策略：默认仅监控，不触发宿主机关机
+    shutdown_enabled: bool = False
+    shutdown_wait_minutes: Optional[int] = None  # 留空使用全局配置
+    shutdown_battery_percent: Optional[int] = None
+    estimated_runtime_threshold: Optional[int] = None
@@ -66,6 +66,15 @@ class NotifierPlugin(ABC):
         """
         pass
     
+    def http_endpoints(self) -> List[Tuple[str, Optional[str], bool]]:
+        """
+        插件会访问的 HTTP 端点，用于配置加载时预先创建共享客户端
+        
+        Returns:
+            (URL, 代理地址, 是否校验证书) 列表，非 HTTP 插件返回空列表
+        """
+        return []
+    
     async def test(self) -> Tuple[bool, Optional[str]]:
         """
         测试通知配置是否正确
@@ -1,5 +1,4 @@
 """钉钉机器人通知插件"""
-import httpx
 import logging
 import time
 import hmac
@@ -9,6 +8,7 @@ from urllib.parse import quote_plus
 from typing import Dict, Any, List
 from plugins.base import NotifierPlugin
 from plugins.registry import registry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +71,9 @@ class DingTalkPlugin(NotifierPlugin):
         sign = quote_plus(base64.b64encode(hmac_code))
         return sign
     
+    def http_endpoints(self):
+        return [(self.config["webhook_url"], None, True)]
+
     async def send(self, title: str, content: str, level: str = "info", timestamp: str = ""):
         """
         发送钉钉机器人通知
@@ -106,7 +109,7 @@ class DingTalkPlugin(NotifierPlugin):
         }
         
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with get_http_pool().client(webhook_url, timeout=10) as client:
                 response = await client.post(webhook_url, json=data)
                 result = response.json()
                 
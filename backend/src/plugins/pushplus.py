@@ -1,9 +1,9 @@
 """PushPlus 通知插件"""
-import httpx
 import logging
 from typing import Dict, Any, List
 from plugins.base import NotifierPlugin
 from plugins.registry import registry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +41,9 @@ class PushPlusPlugin(NotifierPlugin):
         if "token" not in self.config or not self.config["token"]:
             raise ValueError("PushPlus Token 不能为空")
     
+    def http_endpoints(self):
+        return [("http://www.pushplus.plus/send", None, True)]
+
     async def send(self, title: str, content: str, level: str = "info", timestamp: str = ""):
         """
         发送 PushPlus 通知
@@ -73,7 +76,7 @@ class PushPlusPlugin(NotifierPlugin):
             data["topic"] = topic
         
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with get_http_pool().client(url, timeout=10) as client:
                 response = await client.post(url, json=data)
                 result = response.json()
                 
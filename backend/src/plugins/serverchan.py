@@ -1,9 +1,9 @@
 """Server酱通知插件"""
-import httpx
 import logging
 from typing import Dict, Any, List
 from plugins.base import NotifierPlugin
 from plugins.registry import registry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +36,9 @@ class ServerChanPlugin(NotifierPlugin):
         if not self.config["sendkey"].startswith("SCT"):
             raise ValueError("Server酱 SendKey 格式不正确，应以 SCT 开头")
     
+    def http_endpoints(self):
+        return [("https://sctapi.ftqq.com/", None, True)]
+
     async def send(self, title: str, content: str, level: str = "info", timestamp: str = ""):
         """
         发送 Server酱 通知
@@ -62,7 +65,7 @@ class ServerChanPlugin(NotifierPlugin):
         }
         
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with get_http_pool().client(url, timeout=10) as client:
                 response = await client.post(url, data=data)
                 result = response.json()
                 
@@ -4,6 +4,7 @@ import logging
 from typing import Dict, Any, List
 from plugins.base import NotifierPlugin
 from plugins.registry import registry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +66,9 @@ class TelegramPlugin(NotifierPlugin):
             if len(parts[1]) < 10:
                 raise ValueError("Telegram Bot Token 格式不正确，Token 太短")
 
+    def http_endpoints(self):
+        return [("https://api.telegram.org/", self.config.get("proxy_url") or None, True)]
+
     async def send(self, title: str, content: str, level: str = "info", timestamp: str = ""):
         """
         发送 Telegram 通知
@@ -100,7 +104,7 @@ class TelegramPlugin(NotifierPlugin):
             if proxy_url:
                 proxies = proxy_url
             
-            async with httpx.AsyncClient(timeout=10, proxy=proxies) as client:
+            async with get_http_pool().client(url, proxy=proxies, timeout=10) as client:
                 response = await client.post(url, json=data)
 
                 # 处理 HTTP 错误
@@ -1,11 +1,11 @@
 """通用 Webhook 通知插件"""
-import httpx
 import logging
 import json
 from datetime import datetime
 from typing import Dict, Any, List
 from plugins.base import NotifierPlugin
 from plugins.registry import registry
+from services.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +83,9 @@ class WebhookPlugin(NotifierPlugin):
             except json.JSONDecodeError:
                 raise ValueError("消息体模板必须是有效的 JSON 格式")
     
+    def http_endpoints(self):
+        return [(self.config["url"], None, True)]
+
     async def send(self, title: str, content: str, level: str = "info", timestamp: str = ""):
         """
         发送 Webhook 通知
@@ -124,7 +127,7 @@ class WebhookPlugin(NotifierPlugin):
             data = self._get_default_payload(title, content, level, timestamp)
         
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
+            async with get_http_pool().client(url, timeout=10) as client:
                 if method == "POST":
                     response = await client.post(url, json=data, headers=headers)
                 else:  # GET
@@ -0,0 +1,240 @@
+"""在线异常检测
+
+MLPredictor.detect_anomalies 只在打开预测页面时对整个窗口批量计算
+均值 ± 3σ，异常要等有人查看才会被发现。在线检测器挂在监控热路径上，
+每个样本到达时只做常数量的计算：
+
+- 每个信号维护指数加权均值 / 方差（EWMA），内存 O(1)；
+  预热阶段权重取 max(1/n, α)，等价于 Welford 累计均值 / 方差，
+  之后平滑过渡为时间常数 tau 的指数加权
+- 偏离均值超过 3σ（4σ 为 high）判为异常；σ 设下限，
+  避免长时间完全平稳的信号因极小波动误报
+- 负载与上一个样本相比跳变超过 20% 判为负载突变
+- 温度超过 45°C 直接判为过热（无需预热）
+- 输入电压 / 频率只在市电供电时检测，停电期间的 0V 不参与统计
+
+去抖：同一类型需连续 confirm_samples 个样本异常才确认，
+确认后在 cooldown 秒内不再重复上报。
+"""
+import logging
+import math
+import time
+from typing import Dict, List, NamedTuple, Optional
+from models import UpsData, UpsStatus
+
+logger = logging.getLogger(__name__)
+
+
+class SignalRule(NamedTuple):
+    """单个信号的检测参数"""
+    label: str
+    unit: str
+    min_std: float  # σ 下限
+    mains_only: bool  # 仅在市电供电时检测
+
+
+# 基于统计偏离检测的信号
+SIGNAL_RULES = {
+    "input_voltage": SignalRule("输入电压", "V", 1.0, True),
+    "output_voltage": SignalRule("输出电压", "V", 1.0, False),
+    "input_frequency": SignalRule("输入频率", "Hz", 0.05, True),
+    "temperature": SignalRule("温度", "°C", 0.5, False),
+}
+
+# 参与检测的 UPS 状态（其余状态下读数不可信）
+ACTIVE_STATUSES = {UpsStatus.ONLINE, UpsStatus.ON_BATTERY, UpsStatus.LOW_BATTERY}
+
+# 默认检测参数
+DEFAULT_TAU = 3600  # 指数加权时间常数（秒）
+DEFAULT_WARMUP = 30  # 预热样本数
+DEFAULT_SIGMA = 3.0
+DEFAULT_HIGH_SIGMA = 4.0
+DEFAULT_LOAD_STEP = 20.0  # 负载突变阈值（%）
+DEFAULT_TEMPERATURE_LIMIT = 45.0  # 过热阈值（°C）
+DEFAULT_CONFIRM_SAMPLES = 2
+DEFAULT_COOLDOWN = 600  # 同类异常重复上报间隔（秒）
+
+
+class EwmaStats:
+    """指数加权均值 / 方差（预热阶段等价于 Welford）"""
+
+    __slots__ = ("count", "mean", "var")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def update(self, value: float, alpha: float):
+        self.count += 1
+        a = max(alpha, 1.0 / self.count)
+        diff = value - self.mean
+        incr = a * diff
+        self.mean += incr
+        self.var = (1 - a) * (self.var + diff * incr)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(max(0.0, self.var))
+
+
+class OnlineAnomalyDetector:
+    """单台 UPS 的在线异常检测器"""
+
+    def __init__(
+        self,
+        tau: float = DEFAULT_TAU,
+        warmup: int = DEFAULT_WARMUP,
+        sigma: float = DEFAULT_SIGMA,
+        high_sigma: float = DEFAULT_HIGH_SIGMA,
+        load_step: float = DEFAULT_LOAD_STEP,
+        temperature_limit: float = DEFAULT_TEMPERATURE_LIMIT,
+        confirm_samples: int = DEFAULT_CONFIRM_SAMPLES,
+        cooldown: float = DEFAULT_COOLDOWN,
+    ):
+        """
+        Args:
+            tau: 指数加权时间常数（秒）
+            warmup: 统计偏离检测前需要的样本数
+            sigma: 判为异常的偏离倍数
+            high_sigma: 判为 high 的偏离倍数
+            load_step: 负载突变阈值（%）
+            temperature_limit: 过热阈值（°C）
+            confirm_samples: 确认异常需要的连续异常样本数
+            cooldown: 同类异常重复上报间隔（秒）
+        """
+        self.tau = tau
+        self.warmup = warmup
+        self.sigma = sigma
+        self.high_sigma = high_sigma
+        self.load_step = load_step
+        self.temperature_limit = temperature_limit
+        self.confirm_samples = confirm_samples
+        self.cooldown = cooldown
+
+        self._stats: Dict[str, EwmaStats] = {signal: EwmaStats() for signal in SIGNAL_RULES}
+        self._last_update: Optional[float] = None
+        self._last_load: Optional[float] = None
+        # 异常类型 -> 连续异常样本数
+        self._streaks: Dict[str, int] = {}
+        # 异常类型 -> 最近一次上报时刻（monotonic）
+        self._reported_at: Dict[str, float] = {}
+
+        # 统计
+        self._samples = 0
+        self._candidates = 0
+        self._reported = 0
+        self._suppressed = 0
+
+    def observe(self, data: UpsData, now: Optional[float] = None) -> List[dict]:
+        """
+        处理一个样本，返回本次确认的异常列表
+
+        异常的字段与 MLPredictor.build_anomaly_report 一致
+        （type / severity / message / current_value ...）。
+        """
+        if data.status not in ACTIVE_STATUSES:
+            # 离线 / 关机期间的读数不参与统计，负载基线也重新开始
+            self._last_load = None
+            return []
+
+        now = time.monotonic() if now is None else now
+        dt = 0.0 if self._last_update is None else max(0.0, now - self._last_update)
+        self._last_update = now
+        alpha = 1.0 - math.exp(-dt / self.tau) if self.tau > 0 else 1.0
+        on_mains = data.status == UpsStatus.ONLINE
+        self._samples += 1
+
+        candidates: Dict[str, dict] = {}
+        for signal, rule in SIGNAL_RULES.items():
+            value = getattr(data, signal, None)
+            if value is None or (rule.mains_only and not on_mains):
+                continue
+            stats = self._stats[signal]
+            if stats.count >= self.warmup:
+                anomaly = self._check_deviation(signal, rule, value, stats)
+                if anomaly:
+                    candidates[signal] = anomaly
+            stats.update(value, alpha)
+
+        temperature = data.temperature
+        if temperature is not None and temperature > self.temperature_limit:
+            # 过热优先于统计偏离（同一类型）
+            candidates["temperature"] = {
+                "type": "temperature",
+                "severity": "high" if temperature > self.temperature_limit + 5 else "medium",
+                "message": f"温度过高: {temperature:.1f}°C",
+                "current_value": temperature,
+                "threshold": self.temperature_limit,
+            }
+
+        load = data.load_percent
+        if load is not None:
+            if self._last_load is not None and abs(load - self._last_load) > self.load_step:
+                change = abs(load - self._last_load)
+                candidates["load_change"] = {
+                    "type": "load_change",
+                    "severity": "medium",
+                    "message": f"负载突变: {change:.1f}% (从 {self._last_load:.1f}% 到 {load:.1f}%)",
+                    "current_value": load,
+                    "change": change,
+                }
+            self._last_load = load
+
+        return self._debounce(candidates, now)
+
+    def _check_deviation(self, signal: str, rule: SignalRule, value: float, stats: EwmaStats) -> Optional[dict]:
+        std = max(stats.std, rule.min_std)
+        deviation = abs(value - stats.mean)
+        if deviation <= self.sigma * std:
+            return None
+        low, high = stats.mean - self.sigma * std, stats.mean + self.sigma * std
+        return {
+            "type": signal,
+            "severity": "high" if deviation > self.high_sigma * std else "medium",
+            "message": f"{rule.label}异常: {value:.1f}{rule.unit} (正常范围: {low:.1f}-{high:.1f}{rule.unit})",
+            "current_value": value,
+            "expected_range": [low, high],
+        }
+
+    def _debounce(self, candidates: Dict[str, dict], now: float) -> List[dict]:
+        # 本次未出现的类型中断连续计数
+        for anomaly_type in list(self._streaks):
+            if anomaly_type not in candidates:
+                del self._streaks[anomaly_type]
+
+        confirmed = []
+        for anomaly_type, anomaly in candidates.items():
+            self._candidates += 1
+            streak = self._streaks.get(anomaly_type, 0) + 1
+            self._streaks[anomaly_type] = streak
+            # 负载突变本身就是一次性跳变，无需连续确认
+            required = 1 if anomaly_type == "load_change" else self.confirm_samples
+            if streak < required:
+                continue
+            last = self._reported_at.get(anomaly_type)
+            if last is not None and now - last < self.cooldown:
+                self._suppressed += 1
+                continue
+            self._reported_at[anomaly_type] = now
+            self._reported += 1
+            confirmed.append(anomaly)
+        return confirmed
+
+    def get_stats(self) -> dict:
+        """检测器统计"""
+        return {
+            "samples": self._samples,
+            "candidates": self._candidates,
+            "reported": self._reported,
+            "suppressed": self._suppressed,
+            "signals": {
+                signal: {
+                    "count": stats.count,
+                    "mean": round(stats.mean, 3),
+                    "std": round(stats.std, 3),
+                    "warmed_up": stats.count >= self.warmup,
+                }
+                for signal, stats in self._stats.items()
+            },
+        }
@@ -1,11 +1,26 @@
-"""apcupsd 异步客户端 - 通过 NIS 协议与 apcupsd 通信"""
+"""apcupsd 异步客户端 - 通过 NIS 协议与 apcupsd 通信
+
+NIS 每次 status 请求返回全部变量，一次往返的结果作为快照缓存 snapshot_ttl
+秒，get_var / get_vars / list_vars / list_ups 共用，短时间内的多次读取
+只访问一次 apcupsd。
+
+NIS 没有 NUT LISTEN 那样的推送，start_listen 用独立连接定期读取 events
+（apcupsd 事件日志），出现新的事件行时使快照失效并回调监控器，断电 / 恢复
+等状态变化无需等到下一次轮询。
+"""
 import asyncio
 import logging
-from typing import Dict, Optional, Protocol
-from datetime import datetime
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 状态快照的默认缓存时间（秒）
+DEFAULT_SNAPSHOT_TTL = 2.0
+
+# 事件日志的读取间隔（秒）
+EVENTS_POLL_INTERVAL = 2.0
+
 
 # apcupsd KEY -> NUT 变量名映射
 APCUPSD_TO_NUT_MAP = {
@@ -55,13 +70,19 @@ STATUS_MAP = {
     "COMMLOST": "OFF",
 }
 
+# NUT 变量名 -> apcupsd KEY
+NUT_TO_APCUPSD_MAP = {v: k for k, v in APCUPSD_TO_NUT_MAP.items()}
+
 
 class ApcupsdClient:
     """apcupsd NIS 协议异步客户端"""
 
-    def __init__(self, host: str, port: int = 3551):
+    def __init__(self, host: str, port: int = 3551, snapshot_ttl: float = DEFAULT_SNAPSHOT_TTL,
+                 events_interval: float = EVENTS_POLL_INTERVAL):
         self.host = host
         self.port = port
+        self.snapshot_ttl = snapshot_ttl
+        self.events_interval = events_interval
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
         self._connected = False
@@ -70,6 +91,19 @@ class ApcupsdClient:
         self._last_connection_error: Optional[str] = None
         self._raw_data: Dict[str, str] = {}  # 原始 apcupsd 数据
 
+        # status 快照：原始数据 + NUT 风格变量，共享同一次往返
+        self._conversation_lock = asyncio.Lock()
+        self._vars: Dict[str, str] = {}
+        self._snapshot_at: Optional[float] = None
+        self._snapshot_hits = 0
+        self._snapshot_fetches = 0
+
+        # 事件日志监听
+        self._events_client: Optional["ApcupsdClient"] = None
+        self._events_task: Optional[asyncio.Task] = None
+        self._on_data_changed: Optional[Callable] = None
+        self._last_event: Optional[str] = None
+
     async def connect(self) -> None:
         """连接到 apcupsd NIS 服务器"""
         try:
@@ -109,6 +143,9 @@ class ApcupsdClient:
             "reconnect_attempts": self._reconnect_attempts,
             "last_error": self._last_connection_error,
             "backend": "apcupsd",
+            "snapshot_hits": self._snapshot_hits,
+            "snapshot_fetches": self._snapshot_fetches,
+            "listening": self._events_task is not None,
         }
 
     async def _reconnect(self) -> bool:
@@ -147,17 +184,17 @@ class ApcupsdClient:
             )
             return False
 
-    async def _fetch_status(self, timeout: float = 10.0) -> Dict[str, str]:
-        """获取 apcupsd 状态数据"""
+    async def _request(self, command: bytes, timeout: float = 10.0) -> List[str]:
+        """发送 NIS 命令，读取到 END APC 为止的各行"""
         if not self._connected:
             if not await self._reconnect():
                 raise RuntimeError("Not connected to apcupsd and reconnection failed")
 
         try:
-            self.writer.write(b"status\n")
+            self.writer.write(command)
             await self.writer.drain()
 
-            data: Dict[str, str] = {}
+            lines: List[str] = []
             while True:
                 line = await asyncio.wait_for(
                     self.reader.readline(), timeout=timeout
@@ -171,53 +208,95 @@ class ApcupsdClient:
                     break
                 if not line_str or line_str.startswith("BEGIN APC"):
                     continue
+                lines.append(line_str)
 
-                # 解析 KEY : VALUE 格式
-                if " : " in line_str:
-                    key, value = line_str.split(" : ", 1)
-                    data[key.strip()] = value.strip()
-                elif ":" in line_str:
-                    key, value = line_str.split(":", 1)
-                    data[key.strip()] = value.strip()
-
-            self._raw_data = data
-            return data
+            return lines
 
         except asyncio.TimeoutError:
             logger.error("Timeout reading from apcupsd")
             self._connected = False
             raise
         except Exception as e:
-            logger.error(f"Error fetching apcupsd status: {e}")
+            logger.error(f"Error reading apcupsd {command.decode().strip()}: {e}")
             self._connected = False
             raise
 
+    async def _fetch_status(self, timeout: float = 10.0) -> Dict[str, str]:
+        """获取 apcupsd 状态数据"""
+        data: Dict[str, str] = {}
+        for line_str in await self._request(b"status\n", timeout):
+            # 解析 KEY : VALUE 格式
+            if " : " in line_str:
+                key, value = line_str.split(" : ", 1)
+                data[key.strip()] = value.strip()
+            elif ":" in line_str:
+                key, value = line_str.split(":", 1)
+                data[key.strip()] = value.strip()
+
+        self._raw_data = data
+        return data
+
+    async def _fetch_events(self, timeout: float = 10.0) -> List[str]:
+        """获取 apcupsd 事件日志（从旧到新）"""
+        return await self._request(b"events\n", timeout)
+
+    def _snapshot_fresh(self) -> bool:
+        return (
+            self._snapshot_at is not None
+            and time.monotonic() - self._snapshot_at < self.snapshot_ttl
+        )
+
+    async def _snapshot(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        返回 (原始数据, NUT 风格变量)
+
+        快照未过期时直接返回；过期时只有一个调用方发起 status 请求，
+        同时等待的调用方拿到同一份结果。
+        """
+        if self._snapshot_fresh():
+            self._snapshot_hits += 1
+            return self._raw_data, self._vars
+
+        async with self._conversation_lock:
+            if self._snapshot_fresh():
+                self._snapshot_hits += 1
+                return self._raw_data, self._vars
+
+            raw_data = await self._fetch_status()
+            self._vars = self._build_vars(raw_data)
+            self._snapshot_fetches += 1
+            # 空响应不缓存，下次读取重新请求
+            self._snapshot_at = time.monotonic() if raw_data else None
+            return raw_data, self._vars
+
+    def invalidate_snapshot(self) -> None:
+        """丢弃状态快照，下次读取重新请求 apcupsd"""
+        self._snapshot_at = None
+
+    def _build_vars(self, raw_data: Dict[str, str]) -> Dict[str, str]:
+        """原始数据 -> NUT 风格 key + 原始 apc_ key"""
+        vars_dict: Dict[str, str] = {}
+
+        for apc_key, value in raw_data.items():
+            # 保存原始 key（加 apc_ 前缀）
+            vars_dict[f"apc_{apc_key.lower()}"] = value
+
+            # 映射到 NUT 风格 key
+            nut_key = APCUPSD_TO_NUT_MAP.get(apc_key)
+            if nut_key:
+                vars_dict[nut_key] = self._process_value(apc_key, value)
+
+        return vars_dict
+
     async def get_var(self, var_name: str) -> Optional[str]:
         """获取单个变量值（使用 NUT 风格的变量名）"""
         try:
-            data = await self._fetch_status()
-            # 先尝试 NUT -> apcupsd 反向映射
-            nut_to_apc = {v: k for k, v in APCUPSD_TO_NUT_MAP.items()}
-            apc_key = nut_to_apc.get(var_name)
-            if apc_key and apc_key in data:
-                value = data[apc_key]
-                # 特殊处理：TIMELEFT 分钟 -> 秒
-                if apc_key == "TIMELEFT":
-                    return str(int(float(value.replace(" Minutes", "")) * 60))
-                # 特殊处理：LOADPCT 去掉 %
-                if apc_key == "LOADPCT":
-                    return value.replace(" Percent", "").replace("%", "")
-                # 特殊处理：BCHARGE 去掉 %
-                if apc_key == "BCHARGE":
-                    return value.replace(" Percent", "").replace("%", "")
-                return value
-
-            # 尝试直接匹配（可能是 apc_ 前缀的原始 key）
-            if var_name.startswith("apc_"):
-                raw_key = var_name[4:].upper()
-                return data.get(raw_key)
-
-            return data.get(var_name)
+            raw_data, vars_dict = await self._snapshot()
+            # NUT 风格 key 与 apc_ 前缀的原始 key
+            if var_name in vars_dict:
+                return vars_dict[var_name]
+            # 直接使用 apcupsd KEY
+            return raw_data.get(var_name)
         except Exception as e:
             logger.error(f"Error getting variable {var_name}: {e}")
             self._connected = False
@@ -226,33 +305,27 @@ class ApcupsdClient:
     async def list_vars(self) -> Dict[str, str]:
         """列出所有变量（返回 NUT 风格的 key + 原始 apc_ key）"""
         try:
-            raw_data = await self._fetch_status()
+            _, vars_dict = await self._snapshot()
 
-            if not raw_data:
+            if not vars_dict:
                 logger.warning("No data received from apcupsd")
                 self._connected = False
                 return {}
 
-            # 构建统一格式的变量字典
-            vars_dict: Dict[str, str] = {}
-
-            for apc_key, value in raw_data.items():
-                # 保存原始 key（加 apc_ 前缀）
-                vars_dict[f"apc_{apc_key.lower()}"] = value
-
-                # 映射到 NUT 风格 key
-                nut_key = APCUPSD_TO_NUT_MAP.get(apc_key)
-                if nut_key:
-                    processed = self._process_value(apc_key, value)
-                    vars_dict[nut_key] = processed
-
-            return vars_dict
+            return dict(vars_dict)
 
         except Exception as e:
             logger.error(f"Error listing variables: {e}")
             self._connected = False
             return {}
 
+    async def get_vars(self, var_names: List[str]) -> Dict[str, Optional[str]]:
+        """批量获取多个变量值（共用状态快照）"""
+        vars_dict = await self.list_vars()
+        if not vars_dict:
+            return {}
+        return {name: vars_dict.get(name) for name in var_names}
+
     def _process_value(self, apc_key: str, value: str) -> str:
         """处理 apcupsd 值，转换为 NUT 兼容格式"""
         # 去掉单位后缀
@@ -289,7 +362,7 @@ class ApcupsdClient:
     async def list_ups(self) -> list:
         """列出 UPS 设备（apcupsd 只管理一个 UPS）"""
         try:
-            data = await self._fetch_status()
+            data, _ = await self._snapshot()
             model = data.get("MODEL", "Unknown UPS")
             serial = data.get("SERIALNO", "")
             return [{"name": "ups", "description": f"{model} ({serial})"}]
@@ -319,6 +392,94 @@ class ApcupsdClient:
         """列出支持的命令（apcupsd NIS 不支持）"""
         return []
 
+    async def start_listen(self, ups_name: str, on_data_changed: Callable) -> bool:
+        """
+        开始监听 apcupsd 事件日志
+
+        与 EventDrivenNutClient.start_listen 接口一致。事件日志使用独立连接
+        读取，不占用状态查询的连接。
+
+        Args:
+            ups_name: UPS 名称（apcupsd 只管理一个 UPS，仅用于日志）
+            on_data_changed: 出现新事件时的回调函数
+
+        Returns:
+            bool: 是否成功启动监听
+        """
+        if self._events_task:
+            return True
+
+        events_client = ApcupsdClient(self.host, self.port)
+        try:
+            await events_client.connect()
+            lines = await events_client._fetch_events()
+        except Exception as e:
+            logger.warning(f"apcupsd events not available: {e}")
+            await events_client.disconnect()
+            return False
+
+        # 已有的事件作为基线，只通知之后新增的
+        self._last_event = lines[-1] if lines else None
+        self._events_client = events_client
+        self._on_data_changed = on_data_changed
+        self._events_task = asyncio.create_task(self._events_loop())
+        logger.info(f"Started apcupsd event listening for UPS: {ups_name}")
+        return True
+
+    async def stop_listen(self):
+        """停止监听（只关闭事件日志连接）"""
+        if self._events_task:
+            self._events_task.cancel()
+            try:
+                await self._events_task
+            except asyncio.CancelledError:
+                pass
+            self._events_task = None
+
+        if self._events_client:
+            await self._events_client.disconnect()
+            self._events_client = None
+        self._on_data_changed = None
+        logger.info("Stopped apcupsd event listening")
+
+    @staticmethod
+    def _new_events(lines: List[str], last_event: Optional[str]) -> List[str]:
+        """上次看到的最后一行之后的事件（日志被截断或轮转时视为全部是新事件）"""
+        if last_event is None:
+            return lines
+        for index in range(len(lines) - 1, -1, -1):
+            if lines[index] == last_event:
+                return lines[index + 1:]
+        return lines
+
+    async def _events_loop(self):
+        """定期读取事件日志，出现新事件时刷新快照并回调"""
+        try:
+            while True:
+                await asyncio.sleep(self.events_interval)
+                try:
+                    lines = await self._events_client._fetch_events()
+                except Exception as e:
+                    # 连接已标记断开，下次读取时重连
+                    logger.debug(f"Failed to read apcupsd events: {e}")
+                    continue
+
+                new_events = self._new_events(lines, self._last_event)
+                if not new_events:
+                    continue
+                self._last_event = lines[-1]
+                for event in new_events:
+                    logger.info(f"apcupsd event: {event}")
+
+                self.invalidate_snapshot()
+                if self._on_data_changed:
+                    try:
+                        await self._on_data_changed()
+                    except Exception as e:
+                        logger.error(f"Error handling apcupsd event: {e}")
+        except asyncio.CancelledError:
+            pass
+
 
 def create_ups_client(
     backend: str,
@@ -328,13 +489,25 @@ def create_ups_client(
     password: str = "",
     ups_name: str = "",
     mock_mode: bool = False,
+    aux_pool_size: int = 0,
+    discover_ups: bool = True,
+    snapshot_ttl: float = DEFAULT_SNAPSHOT_TTL,
 ):
-    """创建 UPS 客户端工厂函数"""
+    """创建 UPS 客户端工厂函数
+
+    Args:
+        aux_pool_size: NUT 辅助连接数（用于 LIST RW / LIST CMD 等慢查询，0 表示不启用）
+        discover_ups: 是否自动发现 UPS 名称（False 时使用指定的 ups_name）
+        snapshot_ttl: apcupsd 状态快照缓存时间（秒）
+    """
     if mock_mode:
         from services.nut_client import MockNutClient
         return MockNutClient(host, port, username, password, ups_name)
     elif backend == "apcupsd":
-        return ApcupsdClient(host, port)
+        return ApcupsdClient(host, port, snapshot_ttl=snapshot_ttl)
     else:
         from services.nut_client import RealNutClient
-        return RealNutClient(host, port, username, password, ups_name)
+        return RealNutClient(
+            host, port, username, password, ups_name,
+            aux_pool_size=aux_pool_size, discover_ups=discover_ups
+        )
@@ -1,16 +1,37 @@
-"""电池测试报告服务"""
-import asyncio
-import json
+"""电池测试报告服务
+
+测试期间的采样追加写入 battery_test_samples（见 db/battery_samples.py），
+在内存中攒够 SAMPLE_BATCH_SIZE 条或距上次写入超过 SAMPLE_FLUSH_INTERVAL 秒
+时合并为一次写入，中途崩溃最多丢失一个批次。读取报告时在 SQL 中降采样。
+"""
 import logging
+import time
 from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any
 
+from db.battery_samples import (
+    BATTERY_SAMPLE_COLUMNS, INSERT_BATTERY_SAMPLE_SQL, bucket_size, downsample_sql,
+    elapsed_ms, parse_started_at, sample_row, sample_timestamp,
+)
+
 logger = logging.getLogger(__name__)
 
+# 采样批量写入：条数上限和最长间隔（秒）
+SAMPLE_BATCH_SIZE = 30
+SAMPLE_FLUSH_INTERVAL = 10.0
+
+# 写入失败时内存中最多保留的采样数（1 Hz 下约 1 小时）
+MAX_PENDING_SAMPLES = 3600
+
+# 返回的曲线点数上限：报告详情 / 报告列表
+DEFAULT_MAX_POINTS = 300
+LIST_MAX_POINTS = 60
+
+# 对比曲线的最小时间桶（毫秒），不同测试的 1 Hz 采样落在同一网格上
+COMPARE_MIN_BUCKET_MS = 1000
+
 # 全局变量：当前正在进行的测试
 _current_test: Optional[Dict[str, Any]] = None
-_test_samples: List[Dict[str, Any]] = []
-_sampling_task: Optional[asyncio.Task] = None
 
 
 class BatteryTestReportService:
@@ -18,6 +39,10 @@ class BatteryTestReportService:
 
     def __init__(self, db):
         self.db = db
+        self._pending: List[tuple] = []
+        self._last_flush = time.monotonic()
+        self._samples_written = 0
+        self._samples_dropped = 0
 
     async def start_test(self, test_type: str, test_type_label: str, ups_data: Dict[str, Any]) -> int:
         """
@@ -25,7 +50,10 @@ class BatteryTestReportService:
 
         返回: 测试报告 ID
         """
-        global _current_test, _test_samples
+        global _current_test
+
+        # 上一个测试未正常结束时残留的采样
+        await self.flush_samples()
 
         now = datetime.now(timezone.utc)
 
@@ -54,7 +82,6 @@ class BatteryTestReportService:
                 ups_data.get('ups_serial'),
             )
         )
-        await self.db.conn.commit()
 
         report_id = cursor.lastrowid
 
@@ -63,31 +90,58 @@ class BatteryTestReportService:
             'id': report_id,
             'test_type': test_type,
             'started_at': now,
+            'last_elapsed': 0,
         }
-        _test_samples = [{
-            'timestamp': now.isoformat(),
-            'battery_charge': ups_data.get('battery_charge'),
-            'battery_voltage': ups_data.get('battery_voltage'),
-            'battery_runtime': ups_data.get('battery_runtime'),
-        }]
+        # 起始采样立即写入
+        self._pending.append(sample_row(report_id, 0, ups_data))
+        await self.flush_samples()
 
         logger.info(f"Started battery test report #{report_id} ({test_type_label})")
         return report_id
 
     async def add_sample(self, ups_data: Dict[str, Any]):
-        """添加采样数据"""
-        global _test_samples
-
+        """添加采样数据（批量写入，不是每条都访问数据库）"""
         if _current_test is None:
             return
 
-        now = datetime.now(timezone.utc)
-        _test_samples.append({
-            'timestamp': now.isoformat(),
-            'battery_charge': ups_data.get('battery_charge'),
-            'battery_voltage': ups_data.get('battery_voltage'),
-            'battery_runtime': ups_data.get('battery_runtime'),
-        })
+        self._pending.append(sample_row(_current_test['id'], self._next_elapsed(), ups_data))
+        if (len(self._pending) >= SAMPLE_BATCH_SIZE
+                or time.monotonic() - self._last_flush >= SAMPLE_FLUSH_INTERVAL):
+            await self.flush_samples()
+
+    @staticmethod
+    def _next_elapsed(now: Optional[datetime] = None) -> int:
+        """当前测试的经过毫秒数（严格递增，同一毫秒的采样顺延 1 毫秒）"""
+        now = now or datetime.now(timezone.utc)
+        elapsed = max(elapsed_ms(_current_test['started_at'], now), _current_test['last_elapsed'] + 1)
+        _current_test['last_elapsed'] = elapsed
+        return elapsed
+
+    async def flush_samples(self) -> int:
+        """
+        写入内存中的采样
+
+        Returns:
+            写入的采样数（失败时为 0，采样留在内存中下次重试）
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return 0
+
+        batch = self._pending
+        self._pending = []
+        try:
+            await self.db.execute_many(INSERT_BATTERY_SAMPLE_SQL, batch)
+        except Exception as e:
+            # 放回队列，超出上限时丢弃最旧的采样
+            pending = batch + self._pending
+            self._samples_dropped += max(0, len(pending) - MAX_PENDING_SAMPLES)
+            self._pending = pending[-MAX_PENDING_SAMPLES:]
+            logger.error(f"Failed to write {len(batch)} battery test samples: {e}")
+            return 0
+
+        self._samples_written += len(batch)
+        return len(batch)
 
     async def complete_test(self, result: str, result_text: str, ups_data: Dict[str, Any]) -> Optional[int]:
         """
@@ -95,7 +149,7 @@ class BatteryTestReportService:
 
         返回: 测试报告 ID，如果没有正在进行的测试返回 None
         """
-        global _current_test, _test_samples
+        global _current_test
 
         if _current_test is None:
             logger.warning("No battery test in progress")
@@ -107,12 +161,8 @@ class BatteryTestReportService:
         duration = int((now - started_at).total_seconds())
 
         # 添加最后一个采样点
-        _test_samples.append({
-            'timestamp': now.isoformat(),
-            'battery_charge': ups_data.get('battery_charge'),
-            'battery_voltage': ups_data.get('battery_voltage'),
-            'battery_runtime': ups_data.get('battery_runtime'),
-        })
+        self._pending.append(sample_row(report_id, self._next_elapsed(now), ups_data))
+        await self.flush_samples()
 
         # 更新报告
         await self.db.execute(
@@ -126,8 +176,7 @@ class BatteryTestReportService:
                 end_battery_voltage = ?,
                 end_battery_runtime = ?,
                 end_load_percent = ?,
-                end_input_voltage = ?,
-                samples = ?
+                end_input_voltage = ?
             WHERE id = ?
             """,
             (
@@ -140,27 +189,26 @@ class BatteryTestReportService:
                 ups_data.get('battery_runtime'),
                 ups_data.get('load_percent'),
                 ups_data.get('input_voltage'),
-                json.dumps(_test_samples),
                 report_id,
             )
         )
-        await self.db.conn.commit()
 
         logger.info(f"Completed battery test report #{report_id}: {result}")
 
         # 清除当前测试
         _current_test = None
-        _test_samples = []
 
         return report_id
 
     async def cancel_test(self) -> Optional[int]:
         """取消当前测试"""
-        global _current_test, _test_samples
+        global _current_test
 
         if _current_test is None:
             return None
 
+        await self.flush_samples()
+
         report_id = _current_test['id']
         now = datetime.now(timezone.utc)
         started_at = _current_test['started_at']
@@ -172,8 +220,7 @@ class BatteryTestReportService:
                 completed_at = ?,
                 duration_seconds = ?,
                 result = ?,
-                result_text = ?,
-                samples = ?
+                result_text = ?
             WHERE id = ?
             """,
             (
@@ -181,16 +228,13 @@ class BatteryTestReportService:
                 duration,
                 'cancelled',
                 '测试已取消',
-                json.dumps(_test_samples),
                 report_id,
             )
         )
-        await self.db.conn.commit()
 
         logger.info(f"Cancelled battery test report #{report_id}")
 
         _current_test = None
-        _test_samples = []
 
         return report_id
 
@@ -198,8 +242,14 @@ class BatteryTestReportService:
         """获取当前正在进行的测试"""
         return _current_test
 
-    async def get_report(self, report_id: int) -> Optional[Dict[str, Any]]:
-        """获取单个测试报告"""
+    async def get_report(self, report_id: int, max_points: int = DEFAULT_MAX_POINTS) -> Optional[Dict[str, Any]]:
+        """
+        获取单个测试报告
+
+        Args:
+            report_id: 报告 ID
+            max_points: 采样曲线的最大点数（超出时按时间桶平均，0 表示返回全部采样）
+        """
         row = await self.db.fetch_one(
             "SELECT * FROM battery_test_reports WHERE id = ?",
             (report_id,)
@@ -208,7 +258,7 @@ class BatteryTestReportService:
         if not row:
             return None
 
-        return self._row_to_report(row)
+        return await self._row_to_report(row, max_points)
 
     async def get_reports(
         self,
@@ -248,7 +298,7 @@ class BatteryTestReportService:
 
         rows = await self.db.fetch_all(query, tuple(params))
 
-        return [self._row_to_report(row) for row in rows]
+        return [await self._row_to_report(row, LIST_MAX_POINTS) for row in rows]
 
     async def get_latest_report(self) -> Optional[Dict[str, Any]]:
         """获取最新的测试报告"""
@@ -259,16 +309,74 @@ class BatteryTestReportService:
         if not row:
             return None
 
-        return self._row_to_report(row)
+        return await self._row_to_report(row, LIST_MAX_POINTS)
+
+    async def get_aligned_curves(self, report_ids: List[int], max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Any]:
+        """
+        按经过时间对齐多个测试的放电曲线
+
+        所有报告使用同一个时间桶，返回的点在相同的经过时间上，可直接对比。
+        """
+        placeholders = ", ".join("?" * len(report_ids))
+        rows = await self.db.fetch_all(
+            f"SELECT id, test_type, test_type_label, started_at, result FROM battery_test_reports "
+            f"WHERE id IN ({placeholders}) ORDER BY started_at",
+            tuple(report_ids)
+        )
+
+        extents = {row['id']: await self._sample_extent(row['id']) for row in rows}
+        longest = max((span for _, span in extents.values()), default=0)
+        most = max((count for count, _ in extents.values()), default=0)
+        bucket_ms = max(COMPARE_MIN_BUCKET_MS, bucket_size(longest, most, max_points))
+
+        curves = []
+        for row in rows:
+            samples = await self._fetch_samples(row['id'], bucket_ms, None)
+            curves.append({
+                'id': row['id'],
+                'test_type': row['test_type'],
+                'test_type_label': row['test_type_label'],
+                'started_at': row['started_at'],
+                'result': row['result'],
+                'sample_count': extents[row['id']][0],
+                'samples': samples,
+            })
+
+        return {'bucket_seconds': bucket_ms / 1000, 'reports': curves}
+
+    async def _sample_extent(self, report_id: int):
+        """(采样数, 最后一条采样的经过毫秒数)，主键区间扫描"""
+        row = await self.db.fetch_one(
+            "SELECT COUNT(*), MAX(elapsed_ms) FROM battery_test_samples WHERE report_id = ?",
+            (report_id,)
+        )
+        return row[0], row[1] or 0
 
-    def _row_to_report(self, row) -> Dict[str, Any]:
-        """将数据库行转换为报告字典"""
+    async def _fetch_samples(self, report_id: int, bucket_ms: int, started_at: Optional[datetime]) -> List[Dict[str, Any]]:
+        """读取（降采样后的）采样曲线"""
+        rows = await self.db.fetch_all(downsample_sql(bucket_ms), (report_id,))
         samples = []
-        if row['samples']:
-            try:
-                samples = json.loads(row['samples'])
-            except:
-                pass
+        for row in rows:
+            sample = {
+                'elapsed_seconds': row[0] / 1000,
+                **{column: row[column] for column in BATTERY_SAMPLE_COLUMNS},
+            }
+            if started_at is not None:
+                sample['timestamp'] = sample_timestamp(started_at, row[0])
+            samples.append(sample)
+        return samples
+
+    async def _row_to_report(self, row, max_points: int) -> Dict[str, Any]:
+        """将数据库行转换为报告字典（附带降采样后的采样曲线）"""
+        if _current_test is not None and _current_test['id'] == row['id']:
+            # 进行中的测试先写入内存中的采样
+            await self.flush_samples()
+
+        sample_count, span = await self._sample_extent(row['id'])
+        bucket_ms = bucket_size(span, sample_count, max_points)
+        samples = []
+        if sample_count:
+            samples = await self._fetch_samples(row['id'], bucket_ms, parse_started_at(row['started_at']))
 
         # 计算电量变化
         charge_change = None
@@ -305,7 +413,17 @@ class BatteryTestReportService:
                 'serial': row['ups_serial'],
             },
             'samples': samples,
-            'sample_count': len(samples),
+            'sample_count': sample_count,
+            'sample_bucket_seconds': bucket_ms / 1000 if bucket_ms > 1 else None,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """采样写入统计"""
+        return {
+            'current_test': _current_test['id'] if _current_test else None,
+            'pending_samples': len(self._pending),
+            'samples_written': self._samples_written,
+            'samples_dropped': self._samples_dropped,
         }
 
 
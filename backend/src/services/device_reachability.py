@@ -0,0 +1,377 @@
+"""设备连通性缓存
+
+/api/devices/status 原来每次请求都为每台设备创建 hook 实例并执行
+test_connection()（5 秒超时），打开多个仪表盘就会对被纳管主机持续
+发起 SSH / HTTP 探测。
+
+现在由后台服务按 device_status_check_interval_seconds 探测：
+
+- 每台设备独立计时，下次探测时间带随机抖动，避免所有设备同时探测
+- 并发探测数有上限
+- 保存最新状态和最近的延迟历史，接口直接读取缓存
+- 状态变化（在线 / 离线、错误信息）时回调通知（WebSocket 推送）
+- 配置中新增或修改的设备在首次请求时立即探测一次，多个请求共享
+  同一次探测
+- 间隔为 0 时不做周期探测，只在缓存缺失时按需探测
+- 探测调用插件的 probe()，不会执行关机等实际操作
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认参数
+DEFAULT_PROBE_TIMEOUT = 5.0  # 秒
+DEFAULT_CONCURRENCY = 8
+DEFAULT_HISTORY_SIZE = 60
+DEFAULT_JITTER = 0.2  # 探测间隔的随机抖动比例
+IDLE_CHECK_INTERVAL = 5.0  # 无到期设备时重新读取配置的间隔（秒）
+
+# Mock 模式且未配置设备时展示的模拟设备
+MOCK_DEVICES = [
+    {
+        "name": "Mock Linux Server",
+        "hook_id": "ssh_shutdown",
+        "enabled": True,
+        "priority": 1,
+        "config": {
+            "host": "192.168.1.100",
+            "port": 22,
+            "username": "admin",
+            "auth_type": "password",
+            "password": "mock_password",
+            "mac_address": "AA:BB:CC:DD:EE:01",
+            "broadcast_address": "255.255.255.255"
+        }
+    },
+    {
+        "name": "Mock NAS",
+        "hook_id": "synology_shutdown",
+        "enabled": True,
+        "priority": 2,
+        "config": {
+            "host": "192.168.1.200",
+            "port": 22,
+            "username": "admin",
+            "auth_type": "password",
+            "password": "mock_password",
+            "mac_address": "AA:BB:CC:DD:EE:02",
+            "broadcast_address": "255.255.255.255"
+        }
+    }
+]
+
+
+def device_hooks(config) -> List[dict]:
+    """设备列表（配置中的关机前置任务）
+
+    仅在测试模式为 "mock" 且没有配置纳管设备时注入两台模拟设备，
+    生产模式和演练模式不显示假数据。
+    """
+    hooks_config = config.pre_shutdown_hooks
+    if config.test_mode == "mock" and not hooks_config:
+        return MOCK_DEVICES
+    return hooks_config or []
+
+
+def device_key(hook_config: dict) -> str:
+    """设备标识（配置变化后视为新设备，重新探测）"""
+    raw = json.dumps(
+        [hook_config.get("hook_id"), hook_config.get("name"), hook_config.get("config", {})],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class DeviceState:
+    """单台设备的最新探测结果"""
+
+    __slots__ = ("name", "hook_id", "online", "error", "latency_ms", "last_check", "history")
+
+    def __init__(self, name: str, hook_id: str, history_size: int):
+        self.name = name
+        self.hook_id = hook_id
+        self.online = False
+        self.error: Optional[str] = None
+        self.latency_ms: Optional[float] = None
+        self.last_check: Optional[str] = None
+        # (检测时间, 延迟毫秒；离线为 None)
+        self.history: Deque[Tuple[str, Optional[float]]] = deque(maxlen=history_size)
+
+    def record(self, online: bool, error: Optional[str], latency_ms: Optional[float]) -> bool:
+        """记录一次探测结果，返回状态是否变化"""
+        changed = self.last_check is None or online != self.online or error != self.error
+        self.online = online
+        self.error = error
+        self.latency_ms = latency_ms if online else None
+        self.last_check = datetime.now().isoformat()
+        self.history.append((self.last_check, self.latency_ms))
+        return changed
+
+    def avg_latency_ms(self) -> Optional[float]:
+        samples = [latency for _, latency in self.history if latency is not None]
+        return round(sum(samples) / len(samples), 2) if samples else None
+
+
+class DeviceReachabilityService:
+    """后台设备连通性探测服务"""
+
+    def __init__(
+        self,
+        probe_timeout: float = DEFAULT_PROBE_TIMEOUT,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        history_size: int = DEFAULT_HISTORY_SIZE,
+        jitter: float = DEFAULT_JITTER,
+    ):
+        """
+        Args:
+            probe_timeout: 单次探测超时（秒）
+            concurrency: 最大并发探测数
+            history_size: 每台设备保留的延迟历史条数
+            jitter: 探测间隔的随机抖动比例
+        """
+        self.probe_timeout = probe_timeout
+        self.history_size = history_size
+        self.jitter = jitter
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        self._states: Dict[str, DeviceState] = {}
+        self._next_due: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._callbacks: List[Callable] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+        # 统计
+        self._probes = 0
+        self._failures = 0
+        self._total_probe_ms = 0.0
+        self._changes = 0
+        self._interval = 0
+
+    def add_change_callback(self, callback: Callable):
+        """添加状态变化回调（参数为设备状态字典，不含 index）"""
+        self._callbacks.append(callback)
+
+    async def start(self):
+        """启动后台探测"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台探测"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+
+    def invalidate(self):
+        """配置变更后立即重新读取设备列表"""
+        self._wakeup.set()
+
+    async def _load(self) -> Tuple[List[dict], int]:
+        from config import get_config_manager
+        config_manager = await get_config_manager()
+        config = await config_manager.get_config()
+        return device_hooks(config), config.device_status_check_interval_seconds
+
+    def _schedule_next(self, key: str, interval: float, now: float):
+        spread = interval * self.jitter
+        self._next_due[key] = now + interval + random.uniform(-spread, spread)
+
+    async def _run(self):
+        """后台探测循环：到期的设备发起探测，然后休眠到下一台设备到期"""
+        while True:
+            try:
+                hooks_config, interval = await self._load()
+                self._interval = interval
+                self._prune(hooks_config)
+
+                now = time.monotonic()
+                sleep_for = IDLE_CHECK_INTERVAL
+                if interval > 0:
+                    for hook_config in hooks_config:
+                        if not hook_config.get("enabled", True):
+                            continue
+                        key = device_key(hook_config)
+                        due = self._next_due.get(key)
+                        if due is None:
+                            # 首次出现的设备在一个间隔内随机错开
+                            due = now + random.uniform(0, min(interval, IDLE_CHECK_INTERVAL))
+                            self._next_due[key] = due
+                        if due <= now:
+                            self._schedule_next(key, interval, now)
+                            self._probe_in_background(key, hook_config)
+                        else:
+                            sleep_for = min(sleep_for, due - now)
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(sleep_for, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in device reachability loop: {e}")
+                await asyncio.sleep(IDLE_CHECK_INTERVAL)
+
+    def _prune(self, hooks_config: List[dict]):
+        """移除已不在配置中的设备"""
+        keys = {device_key(h) for h in hooks_config}
+        for key in list(self._states):
+            if key not in keys:
+                del self._states[key]
+        for key in list(self._next_due):
+            if key not in keys:
+                del self._next_due[key]
+
+    def _probe_in_background(self, key: str, hook_config: dict) -> asyncio.Task:
+        """发起探测（同一设备同一时间只有一个探测）"""
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._probe(key, hook_config))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._inflight.pop(k, None) if self._inflight.get(k) is t else None)
+        return task
+
+    async def _probe(self, key: str, hook_config: dict):
+        """探测单台设备并记录结果"""
+        from hooks.registry import get_registry
+
+        hook_id = hook_config.get("hook_id")
+        hook_name = hook_config.get("name", "Unknown")
+        online = False
+        error = None
+        latency_ms = None
+
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                hook_instance = get_registry().create_instance(hook_id, hook_config.get("config", {}))
+                # probe() 不执行设备操作（HTTP API 等插件的 test_connection 会实际调用接口）
+                online = await asyncio.wait_for(hook_instance.probe(), timeout=self.probe_timeout)
+                if not online:
+                    error = "连接测试失败"
+            except NotImplementedError:
+                error = "该设备类型不支持后台连通性检测"
+            except asyncio.TimeoutError:
+                error = "连接超时"
+            except ConnectionError as e:
+                error = str(e)
+            except ValueError as e:
+                error = f"配置错误: {str(e)}"
+            except Exception as e:
+                error = str(e)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self._probes += 1
+        self._total_probe_ms += elapsed_ms
+        if online:
+            latency_ms = round(elapsed_ms, 2)
+        else:
+            self._failures += 1
+
+        state = self._states.get(key)
+        if state is None:
+            state = DeviceState(hook_name, hook_id, self.history_size)
+            self._states[key] = state
+        if state.record(online, error, latency_ms):
+            self._changes += 1
+            if state.history and len(state.history) > 1:
+                logger.info(f"Device '{hook_name}' is now {'online' if online else 'offline'}" + (f": {error}" if error else ""))
+            await self._notify_change(self._to_dict(state))
+
+    async def _notify_change(self, status: dict):
+        for callback in self._callbacks:
+            try:
+                await callback(status)
+            except Exception as e:
+                logger.error(f"Error in device status callback: {e}")
+
+    def _to_dict(self, state: Optional[DeviceState], history: bool = False) -> dict:
+        if state is None:
+            return {"online": False, "last_check": None, "error": "尚未检测", "latency_ms": None}
+        result = {
+            "name": state.name,
+            "hook_id": state.hook_id,
+            "online": state.online,
+            "last_check": state.last_check,
+            "error": state.error,
+            "latency_ms": state.latency_ms,
+            "avg_latency_ms": state.avg_latency_ms(),
+        }
+        if history:
+            result["history"] = [{"timestamp": ts, "latency_ms": latency} for ts, latency in state.history]
+        return result
+
+    async def get_statuses(self, hooks_config: List[dict], history: bool = False) -> List[dict]:
+        """
+        按配置顺序返回设备状态
+
+        缓存中没有的已启用设备（新增或修改过配置）立即探测一次。
+
+        Args:
+            hooks_config: 设备配置列表
+            history: 是否附带延迟历史
+        """
+        missing = []
+        for hook_config in hooks_config:
+            if hook_config.get("enabled", True):
+                key = device_key(hook_config)
+                if key not in self._states:
+                    missing.append(self._probe_in_background(key, hook_config))
+        if missing:
+            await asyncio.gather(*missing, return_exceptions=True)
+
+        statuses = []
+        for hook_config in hooks_config:
+            if not hook_config.get("enabled", True):
+                status = self._to_dict(None)
+                status["error"] = "设备已禁用"
+            else:
+                status = self._to_dict(self._states.get(device_key(hook_config)), history)
+            status["name"] = hook_config.get("name", "Unknown")
+            status["hook_id"] = hook_config.get("hook_id")
+            statuses.append(status)
+        return statuses
+
+    def get_stats(self) -> dict:
+        """获取探测统计"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self._interval,
+            "devices": len(self._states),
+            "online": sum(1 for s in self._states.values() if s.online),
+            "probes": self._probes,
+            "failures": self._failures,
+            "in_flight": len(self._inflight),
+            "state_changes": self._changes,
+            "avg_probe_ms": round(self._total_probe_ms / self._probes, 2) if self._probes else None,
+        }
+
+
+# 全局服务实例
+_reachability_service: Optional[DeviceReachabilityService] = None
+
+
+def get_reachability_service() -> DeviceReachabilityService:
+    """获取设备连通性服务实例"""
+    global _reachability_service
+    if _reachability_service is None:
+        _reachability_service = DeviceReachabilityService()
+    return _reachability_service
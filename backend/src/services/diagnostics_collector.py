@@ -0,0 +1,286 @@
+"""诊断信息收集器
+
+/system/diagnostics 原来每次请求都在监控器使用的 NUT 连接上执行
+LIST VAR、LIST RW、LIST CMD，再查询 7 天事件并对整份配置脱敏，
+打开诊断页面就会和状态轮询争用同一个连接。
+
+现在由后台收集器维护报告的各个部分，接口只读取缓存：
+
+- UPS 变量：直接使用监控器变量目录（VariableCatalog）中的最新值
+- 可写变量和即时命令：只在连接建立（重连）或驱动变化时刷新一次
+- 状态快照：按固定间隔从监控器当前数据记录，保留最近一段时间
+- 最近事件、脱敏配置：首次使用时加载，事件写入 / 配置变更后失效
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认参数
+DEFAULT_SNAPSHOT_INTERVAL = 30.0  # 秒
+DEFAULT_SNAPSHOT_HISTORY = 120  # 30 秒间隔下保留 1 小时
+RECENT_EVENTS_DAYS = 7
+RECENT_EVENTS_LIMIT = 50
+EVENTS_MAX_AGE = 300.0  # 没有新事件时也定期重新加载（秒），让 7 天窗口向前移动
+
+# 判断驱动是否变化的变量
+DRIVER_VARIABLES = ("driver.name", "driver.version", "ups.mfr", "ups.model", "ups.serial")
+
+SENSITIVE_KEYWORDS = {
+    'password', 'token', 'secret', 'key', 'api_key',
+    'api_secret', 'private_key', 'smtp_password',
+    'webhook_token', 'nut_password'
+}
+
+
+def mask_sensitive_data(obj, parent_key=''):
+    """
+    递归遮蔽敏感信息
+
+    敏感字段列表：password, token, secret, key, api_key, api_secret,
+                 private_key, smtp_password, webhook_token, nut_password
+    """
+    if isinstance(obj, dict):
+        masked = {}
+        for k, v in obj.items():
+            # 检查键名是否包含敏感词
+            is_sensitive = any(keyword in k.lower() for keyword in SENSITIVE_KEYWORDS)
+            if is_sensitive and v:
+                masked[k] = "***"
+            else:
+                masked[k] = mask_sensitive_data(v, k)
+        return masked
+    elif isinstance(obj, list):
+        return [mask_sensitive_data(item, parent_key) for item in obj]
+    else:
+        return obj
+
+
+def driver_key(variables: Dict[str, str]) -> Optional[Tuple[Optional[str], ...]]:
+    """驱动标识（变量表为空时返回 None）"""
+    if not variables:
+        return None
+    return tuple(variables.get(name) for name in DRIVER_VARIABLES)
+
+
+def _client_connected(client) -> bool:
+    is_connected = getattr(client, "is_connected", None)
+    return is_connected() if callable(is_connected) else True
+
+
+class DiagnosticsCollector:
+    """后台诊断信息收集器"""
+
+    def __init__(
+        self,
+        snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+        history_size: int = DEFAULT_SNAPSHOT_HISTORY,
+    ):
+        """
+        Args:
+            snapshot_interval: 状态快照和连接检查的间隔（秒）
+            history_size: 保留的状态快照条数
+        """
+        self.snapshot_interval = snapshot_interval
+        self._monitor = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+        # UPS 能力（可写变量、即时命令）
+        self._writable_variables: Dict[str, dict] = {}
+        self._supported_commands: List[str] = []
+        self._capabilities_at: Optional[str] = None
+        self._capabilities_reason: Optional[str] = None
+        self._capabilities_error: Optional[str] = None
+        self._driver_key = None
+        self._was_connected = False
+        self._capabilities_stale = True
+
+        self._snapshots: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+
+        # 报告的缓存部分
+        self._events: Optional[List[dict]] = None
+        self._events_loaded_at = 0.0
+        self._config: Optional[Tuple[dict, dict]] = None
+
+        # 统计
+        self._capability_refreshes = 0
+        self._events_loads = 0
+        self._config_loads = 0
+
+    async def start(self, monitor):
+        """启动后台收集（监控器的连接和变量目录作为数据来源）"""
+        self._monitor = monitor
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台收集"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def invalidate_events(self, kind: str = "event", ups_id: Optional[str] = None, event_type=None):
+        """历史写入监听器：事件写入或数据清空后重新加载最近事件"""
+        if kind in ("event", "reset"):
+            self._events = None
+
+    def invalidate_config(self, change=None):
+        """配置变更后重新脱敏（测试模式变化也影响最近事件）"""
+        self._config = None
+        self._events = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error collecting diagnostics: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.snapshot_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def collect(self):
+        """检查连接和驱动变化并记录一条状态快照（不访问 NUT，除非需要刷新能力）"""
+        monitor = self._monitor
+        if monitor is None:
+            return
+
+        client = monitor.nut_client
+        connected = _client_connected(client)
+        key = driver_key(monitor.var_catalog.snapshot())
+
+        reason = None
+        if connected and not self._was_connected:
+            reason = "connected"
+        elif connected and key is not None and self._driver_key is not None and key != self._driver_key:
+            reason = "driver changed"
+        elif connected and self._capabilities_stale:
+            reason = "retry"
+        self._was_connected = connected
+        if key is not None:
+            self._driver_key = key
+
+        if reason:
+            await self.refresh_capabilities(client, reason)
+
+        data = monitor.get_current_data()
+        if data is not None:
+            self._snapshots.append({
+                "timestamp": datetime.now().isoformat(),
+                "connected": connected,
+                "status": data.status.value,
+                "status_raw": data.status_raw,
+                "battery_charge": data.battery_charge,
+                "battery_runtime": data.battery_runtime,
+                "input_voltage": data.input_voltage,
+                "output_voltage": data.output_voltage,
+                "load_percent": data.load_percent,
+                "temperature": data.temperature,
+            })
+
+    async def refresh_capabilities(self, client, reason: str):
+        """读取可写变量和即时命令（失败时保留上次结果，下次收集时重试）"""
+        try:
+            writable = await client.list_rw() if hasattr(client, "list_rw") else {}
+            commands = await client.list_commands() if hasattr(client, "list_commands") else []
+        except Exception as e:
+            self._capabilities_error = str(e)
+            self._capabilities_stale = True
+            logger.warning(f"Failed to refresh UPS capabilities ({reason}): {e}")
+            return
+
+        self._writable_variables = writable or {}
+        self._supported_commands = commands or []
+        self._capabilities_at = datetime.now().isoformat()
+        self._capabilities_reason = reason
+        self._capabilities_error = None
+        self._capabilities_stale = False
+        self._capability_refreshes += 1
+        logger.info(
+            f"UPS capabilities refreshed ({reason}): "
+            f"{len(self._writable_variables)} writable variables, {len(self._supported_commands)} commands"
+        )
+
+    def capabilities(self) -> Dict[str, Any]:
+        """缓存的可写变量和即时命令"""
+        return {
+            "writable_variables": self._writable_variables,
+            "supported_commands": self._supported_commands,
+            "refreshed_at": self._capabilities_at,
+            "reason": self._capabilities_reason,
+            "error": self._capabilities_error,
+        }
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        """最近的状态快照（从旧到新）"""
+        return list(self._snapshots)
+
+    async def recent_events(self) -> List[dict]:
+        """最近 7 天的事件（最多 50 条）"""
+        if self._events is None or time.monotonic() - self._events_loaded_at >= EVENTS_MAX_AGE:
+            from services.event_query import EventQuery
+            from services.history import get_history_service
+            history_service = await get_history_service()
+            events, _ = await history_service.query_events(EventQuery(
+                test_mode=await history_service.current_test_mode(),
+                since=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=RECENT_EVENTS_DAYS),
+                limit=RECENT_EVENTS_LIMIT,
+            ))
+            self._events = [
+                {
+                    "timestamp": event.timestamp.isoformat(),
+                    "event_type": event.event_type.value,
+                    "message": event.message
+                }
+                for event in events
+            ]
+            self._events_loaded_at = time.monotonic()
+            self._events_loads += 1
+        return self._events
+
+    async def config_parts(self) -> Tuple[dict, dict]:
+        """(配置字典, 脱敏后的配置字典)"""
+        if self._config is None:
+            from config import get_config_manager
+            config_manager = await get_config_manager()
+            config_dict = (await config_manager.get_config()).dict()
+            self._config = (config_dict, mask_sensitive_data(config_dict))
+            self._config_loads += 1
+        return self._config
+
+    def get_stats(self) -> dict:
+        """获取收集器统计"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "connected": self._was_connected,
+            "capability_refreshes": self._capability_refreshes,
+            "capabilities_refreshed_at": self._capabilities_at,
+            "snapshots": len(self._snapshots),
+            "events_loads": self._events_loads,
+            "config_loads": self._config_loads,
+        }
+
+
+# 全局服务实例
+_diagnostics_collector: Optional[DiagnosticsCollector] = None
+
+
+def get_diagnostics_collector() -> DiagnosticsCollector:
+    """获取诊断信息收集器实例"""
+    global _diagnostics_collector
+    if _diagnostics_collector is None:
+        _diagnostics_collector = DiagnosticsCollector()
+    return _diagnostics_collector
@@ -0,0 +1,143 @@
+"""事件查询
+
+事件页原来一次取回时间窗口内的全部事件，多年的历史（DATACHANGED 驱动的
+事件很多）会让接口和页面都越来越慢。这里按 (timestamp, id) 键集分页：
+游标记录上一页最后一条事件，下一页从它之后继续，翻页代价与页码无关，
+分页期间新写入的事件也不会导致重复或遗漏。
+
+支持多事件类型过滤、UPS 过滤和 message / metadata 全文检索
+（db.event_index 中的 FTS5 索引，不可用或检索词过短时退回 LIKE）。
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from db.event_index import EVENTS_FTS_TABLE, FTS_MIN_TERM_LENGTH
+from db.rollups import DB_TIMESTAMP_FORMAT
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+EVENT_COLUMNS = "id, event_type, message, timestamp, metadata, ups_id"
+
+
+@dataclass
+class EventQuery:
+    """事件查询条件"""
+    test_mode: str
+    since: Optional[datetime] = None  # UTC，无时区
+    until: Optional[datetime] = None  # UTC，无时区
+    event_types: Sequence[str] = field(default_factory=tuple)
+    ups_id: Optional[str] = None
+    search: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: int = DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(timestamp: str, event_id: int) -> str:
+    """生成分页游标"""
+    raw = json.dumps([timestamp, event_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    解析分页游标
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, event_id = json.loads(raw)
+        if not isinstance(timestamp, str) or not isinstance(event_id, int):
+            raise TypeError
+        return timestamp, event_id
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def search_terms(text: Optional[str]) -> List[str]:
+    """拆分检索词（空白分隔，全部匹配）"""
+    return [term for term in (text or "").split() if term]
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def page_size(limit: int) -> int:
+    """限制每页数量在 1 ~ MAX_PAGE_SIZE 之间"""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def build_filter(query: EventQuery, fts_enabled: bool) -> Tuple[List[str], list]:
+    """除分页以外的 WHERE 条件"""
+    conditions = ["test_mode = ?"]
+    params: list = [query.test_mode]
+    if query.since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(query.since.strftime(DB_TIMESTAMP_FORMAT))
+    if query.until is not None:
+        conditions.append("timestamp <= ?")
+        # 包含结束秒内带小数秒的记录
+        params.append(query.until.strftime(DB_TIMESTAMP_FORMAT) + ".999999")
+    if query.event_types:
+        conditions.append(f"event_type IN ({', '.join('?' for _ in query.event_types)})")
+        params.extend(query.event_types)
+    if query.ups_id:
+        conditions.append("ups_id = ?")
+        params.append(query.ups_id)
+
+    terms = search_terms(query.search)
+    fts_terms = [t for t in terms if fts_enabled and len(t) >= FTS_MIN_TERM_LENGTH]
+    if fts_terms:
+        conditions.append(f"id IN (SELECT rowid FROM {EVENTS_FTS_TABLE} WHERE {EVENTS_FTS_TABLE} MATCH ?)")
+        params.append(" ".join(_fts_phrase(t) for t in fts_terms))
+    for term in terms:
+        if term in fts_terms:
+            continue
+        pattern = f"%{_escape_like(term)}%"
+        conditions.append("(message LIKE ? ESCAPE '\\' OR metadata LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern])
+    return conditions, params
+
+
+def build_page_query(query: EventQuery, fts_enabled: bool) -> Tuple[str, tuple]:
+    """
+    生成一页事件的查询（多取一条用于判断是否还有下一页）
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    conditions, params = build_filter(query, fts_enabled)
+    if query.cursor:
+        timestamp, event_id = decode_cursor(query.cursor)
+        # 行值比较可以直接使用 (…, timestamp, rowid) 索引定位
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend([timestamp, event_id])
+    sql = (
+        f"SELECT {EVENT_COLUMNS} FROM events WHERE {' AND '.join(conditions)} "
+        f"ORDER BY timestamp DESC, id DESC LIMIT ?"
+    )
+    return sql, tuple(params + [page_size(query.limit) + 1])
+
+
+def build_type_counts_query(query: EventQuery, fts_enabled: bool) -> Tuple[str, tuple]:
+    """按事件类型统计数量（忽略分页游标和类型过滤）"""
+    unfiltered = EventQuery(
+        test_mode=query.test_mode,
+        since=query.since,
+        until=query.until,
+        ups_id=query.ups_id,
+        search=query.search,
+    )
+    conditions, params = build_filter(unfiltered, fts_enabled)
+    sql = f"SELECT event_type, COUNT(*) FROM events WHERE {' AND '.join(conditions)} GROUP BY event_type"
+    return sql, tuple(params)
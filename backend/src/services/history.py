@@ -1,21 +1,99 @@
 """历史记录服务"""
 import json
 import logging
-from datetime import datetime, timedelta
-from typing import List, Optional
-from models import Event, Metric, EventType
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from db.rollups import (
+    DB_TIMESTAMP_FORMAT, ROLLUP_COLUMNS, ROLLUP_TIERS, UPSERT_ROLLUP_SQL,
+    build_rollup_params, select_tier,
+)
+from db.event_index import has_events_fts
+from db.metric_store import (
+    INSERT_METRIC_SQL, decode_value, decoded_columns_sql, from_epoch_ms, metric_groups, metric_row, next_ts,
+    to_epoch_ms,
+)
+from db.storage_stats import refresh_metric_bounds, refresh_rollup_bounds
+from models import DEFAULT_UPS_ID, Event, Metric, EventType
+from services.event_query import EventQuery, build_page_query, build_type_counts_query, encode_cursor, page_size
+from services.metric_frame import FRAME_COLUMNS, MetricFrame
 from utils.retry import async_retry
 
 logger = logging.getLogger(__name__)
 
+# 导出时每次读取的行数
+EXPORT_CHUNK_SIZE = 1000
+
 
 class HistoryService:
     """历史记录服务"""
     
     def __init__(self, db):
         self.db = db
+        self.metric_writer = None  # 启用后 add_metric 走批量写入队列
+        # 写入监听器: callback(kind, ups_id, event_type)，kind 为 event / metrics / reset
+        self._write_listeners = []
+        self._fts_enabled: Optional[bool] = None
+        # (test_mode, ups_id) -> 上一条直接写入的采样 ts（epoch 毫秒）
+        self._last_metric_ts: Dict[Tuple[str, str], int] = {}
+
+    def add_write_listener(self, callback):
+        """添加写入监听器（事件写入、采样落库、数据清空后调用）"""
+        self._write_listeners.append(callback)
+
+    def _notify_write(self, kind: str, ups_id: Optional[str] = None, event_type: Optional[EventType] = None):
+        """通知写入监听器（监听器异常不影响写入）"""
+        for callback in self._write_listeners:
+            try:
+                callback(kind, ups_id, event_type)
+            except Exception as e:
+                logger.error(f"Error in history write listener: {e}")
+
+    async def start_metric_writer(self, flush_interval: float = 30.0, batch_size: int = 50, max_queue_size: int = 5000):
+        """
+        启用指标批量写入（write-behind）
+
+        Args:
+            flush_interval: 最长刷新间隔（秒）
+            batch_size: 队列达到该数量时立即刷新
+            max_queue_size: 队列上限
+        """
+        if self.metric_writer is not None:
+            return
+        from services.metric_writer import MetricWriter
+        self.metric_writer = MetricWriter(
+            self.db,
+            flush_interval=flush_interval,
+            batch_size=batch_size,
+            max_queue_size=max_queue_size,
+            on_flush=self._on_metrics_flushed,
+        )
+        await self.metric_writer.start()
+
+    async def stop_metric_writer(self):
+        """停止批量写入并刷新剩余采样"""
+        if self.metric_writer is None:
+            return
+        await self.metric_writer.stop()
+        self.metric_writer = None
+
+    def _on_metrics_flushed(self, ups_ids):
+        """批量写入完成回调"""
+        for ups_id in ups_ids:
+            self._notify_write("metrics", ups_id)
+
+    async def flush_metrics(self):
+        """立即写入队列中的采样（读取前调用，保证读到最新数据）"""
+        if self.metric_writer is not None:
+            await self.metric_writer.flush()
     
-    async def add_event(self, event_type: EventType, message: str, metadata: Optional[dict] = None, test_mode: str = None):
+    async def add_event(
+        self,
+        event_type: EventType,
+        message: str,
+        metadata: Optional[dict] = None,
+        test_mode: str = None,
+        ups_id: str = DEFAULT_UPS_ID,
+    ):
         """
         添加事件记录（带重试，处理 SQLite 锁定）
         
@@ -24,6 +102,7 @@ class HistoryService:
             message: 事件消息
             metadata: 元数据
             test_mode: 测试模式 (如果为None，从配置获取)
+            ups_id: UPS 标识
         """
         # Get test_mode from config if not provided
         if test_mode is None:
@@ -36,13 +115,14 @@ class HistoryService:
                 logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
                 test_mode = 'production'
         
-        metadata_str = json.dumps(metadata) if metadata else None
+        # 保留中文原文，便于全文检索
+        metadata_str = json.dumps(metadata, ensure_ascii=False) if metadata else None
         
         async def _do_insert():
             """执行数据库插入"""
             await self.db.execute(
-                "INSERT INTO events (event_type, message, metadata, test_mode) VALUES (?, ?, ?, ?)",
-                (event_type.value, message, metadata_str, test_mode)
+                "INSERT INTO events (event_type, message, metadata, test_mode, ups_id) VALUES (?, ?, ?, ?, ?)",
+                (event_type.value, message, metadata_str, test_mode, ups_id)
             )
         
         try:
@@ -56,12 +136,19 @@ class HistoryService:
                 retry_exceptions=(Exception,),  # SQLite 锁定、临时错误等
                 operation_name=f"Database add_event ({event_type.value})"
             )
+            self._notify_write("event", ups_id, event_type)
         except Exception as e:
             logger.error(f"Failed to add event after retries: {e}")
             # 不抛出异常，避免影响主流程
         
 
-    async def get_events(self, days: int = 7, event_type: Optional[EventType] = None, test_mode: str = None) -> List[Event]:
+    async def get_events(
+        self,
+        days: int = 7,
+        event_type: Optional[EventType] = None,
+        test_mode: str = None,
+        ups_id: Optional[str] = None,
+    ) -> List[Event]:
         """
         获取历史事件
         
@@ -69,6 +156,7 @@ class HistoryService:
             days: 查询最近几天的事件
             event_type: 过滤事件类型
             test_mode: 测试模式过滤 (如果为None，从配置获取)
+            ups_id: UPS 过滤 (如果为None，返回所有 UPS 的事件)
         
         Returns:
             事件列表
@@ -88,50 +176,100 @@ class HistoryService:
         from datetime import timezone
         since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
         
+        conditions = ["timestamp >= ?", "test_mode = ?"]
+        params = [since, test_mode]
         if event_type:
-            query = """
-                SELECT id, event_type, message, timestamp, metadata 
-                FROM events 
-                WHERE timestamp >= ? AND event_type = ? AND test_mode = ?
-                ORDER BY timestamp DESC
-            """
-            rows = await self.db.fetch_all(query, (since, event_type.value, test_mode))
-        else:
-            query = """
-                SELECT id, event_type, message, timestamp, metadata 
-                FROM events 
-                WHERE timestamp >= ? AND test_mode = ?
-                ORDER BY timestamp DESC
-            """
-            rows = await self.db.fetch_all(query, (since, test_mode))
-        
-        events = []
-        for row in rows:
-            # Parse timestamp from database (UTC stored by SQLite CURRENT_TIMESTAMP)
-            timestamp = datetime.fromisoformat(row['timestamp'])
-            # Explicitly mark as UTC by adding timezone info, then convert to ISO format with Z suffix
-            from datetime import timezone as tz
-            if timestamp.tzinfo is None:
-                timestamp = timestamp.replace(tzinfo=tz.utc)
-            
-            event = Event(
-                id=row['id'],
-                event_type=EventType(row['event_type']),
-                message=row['message'],
-                timestamp=timestamp,
-                metadata=json.loads(row['metadata']) if row['metadata'] else None
-            )
-            events.append(event)
+            conditions.append("event_type = ?")
+            params.append(event_type.value)
+        if ups_id:
+            conditions.append("ups_id = ?")
+            params.append(ups_id)
+
+        query = f"""
+            SELECT id, event_type, message, timestamp, metadata, ups_id
+            FROM events 
+            WHERE {' AND '.join(conditions)}
+            ORDER BY timestamp DESC
+        """
+        rows = await self.db.fetch_all(query, tuple(params))
         
-        return events
+        return [self._row_to_event(row) for row in rows]
+
+    @staticmethod
+    def _row_to_event(row) -> Event:
+        """数据库行转换为 Event"""
+        # Parse timestamp from database (UTC stored by SQLite CURRENT_TIMESTAMP)
+        timestamp = datetime.fromisoformat(row['timestamp'])
+        # Explicitly mark as UTC by adding timezone info, then convert to ISO format with Z suffix
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+        return Event(
+            id=row['id'],
+            event_type=EventType(row['event_type']),
+            message=row['message'],
+            timestamp=timestamp,
+            metadata=json.loads(row['metadata']) if row['metadata'] else None,
+            ups_id=row['ups_id'] or DEFAULT_UPS_ID
+        )
+
+    @staticmethod
+    async def current_test_mode() -> str:
+        """当前配置的测试模式（读取失败时为 production）"""
+        try:
+            from config import get_config_manager
+            config_manager = await get_config_manager()
+            config = await config_manager.get_config()
+            return config.test_mode
+        except Exception as e:
+            logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
+            return 'production'
+
+    async def _events_fts_enabled(self) -> bool:
+        """事件全文索引是否可用（首次查询时检查）"""
+        if self._fts_enabled is None:
+            try:
+                self._fts_enabled = await has_events_fts(self.db.conn)
+            except Exception as e:
+                logger.warning(f"Failed to check events full-text index: {e}")
+                self._fts_enabled = False
+        return self._fts_enabled
+
+    async def query_events(self, query: EventQuery) -> Tuple[List[Event], Optional[str]]:
+        """
+        分页查询事件（时间倒序）
+
+        Args:
+            query: 查询条件，cursor 为上一页返回的游标
+
+        Returns:
+            (事件列表, 下一页游标)；没有更多事件时游标为 None
+
+        Raises:
+            ValueError: 游标格式无效
+        """
+        sql, params = build_page_query(query, await self._events_fts_enabled())
+        rows = await self.db.fetch_all(sql, params)
+        page = rows[:page_size(query.limit)]
+        next_cursor = None
+        if len(rows) > len(page):
+            next_cursor = encode_cursor(page[-1]['timestamp'], page[-1]['id'])
+        return [self._row_to_event(row) for row in page], next_cursor
+
+    async def count_events_by_type(self, query: EventQuery) -> Dict[str, int]:
+        """按事件类型统计数量（使用与 query_events 相同的时间、UPS 和检索条件）"""
+        sql, params = build_type_counts_query(query, await self._events_fts_enabled())
+        rows = await self.db.fetch_all(sql, params)
+        return {row[0]: row[1] for row in rows}
     
-    async def add_metric(self, metric: Metric, test_mode: str = None):
+    async def add_metric(self, metric: Metric, test_mode: str = None, ups_id: str = DEFAULT_UPS_ID):
         """
         添加指标采样（带重试，处理 SQLite 锁定）
         
         Args:
             metric: 指标数据
             test_mode: 测试模式 (如果为None，从配置获取)
+            ups_id: UPS 标识
         """
         # Get test_mode from config if not provided
         if test_mode is None:
@@ -143,51 +281,61 @@ class HistoryService:
             except Exception as e:
                 logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
                 test_mode = 'production'
+
+        if self.metric_writer is not None:
+            # 批量写入模式：仅入队，由 MetricWriter 合并为一次事务
+            self.metric_writer.enqueue(metric, test_mode, ups_id)
+            return
         
         async def _do_insert():
             """执行数据库插入"""
+            sampled_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
             # 计算累计用电量: 上一条记录的 energy_kwh + 本次采样间隔的用电量
             energy_kwh = metric.energy_kwh
             if energy_kwh is None and metric.power_watts is not None:
                 try:
-                    # 获取上一条记录的时间戳和能耗
+                    # 获取上一条记录的时间戳和能耗（主键区间的最后一行）
                     row = await self.db.fetch_one(
-                        "SELECT timestamp, energy_kwh FROM metrics WHERE test_mode = ? ORDER BY timestamp DESC LIMIT 1",
-                        (test_mode,)
+                        "SELECT ts, energy_kwh FROM metrics WHERE test_mode = ? AND ups_id = ? "
+                        "ORDER BY ts DESC LIMIT 1",
+                        (test_mode, ups_id)
                     )
                     if row and row[1] is not None:
                         # 计算时间间隔（小时）
-                        prev_time = datetime.fromisoformat(str(row[0]))
-                        now = datetime.now()
-                        dt_hours = (now - prev_time).total_seconds() / 3600
+                        prev_time = from_epoch_ms(row[0])
+                        prev_energy = decode_value("energy_kwh", row[1])
+                        dt_hours = (sampled_at - prev_time).total_seconds() / 3600
                         if dt_hours > 0 and dt_hours < 24:  # 防止异常数据
-                            energy_kwh = row[1] + (metric.power_watts * dt_hours / 1000)
+                            energy_kwh = prev_energy + (metric.power_watts * dt_hours / 1000)
                         else:
-                            energy_kwh = row[1]
+                            energy_kwh = prev_energy
                     elif metric.power_watts is not None:
                         # 首条记录
                         energy_kwh = 0.0
                 except Exception:
                     energy_kwh = 0.0
 
-            await self.db.execute(
-                """
-                INSERT INTO metrics
-                (battery_charge, battery_runtime, input_voltage, output_voltage, load_percent, temperature, test_mode, power_watts, energy_kwh)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    metric.battery_charge,
-                    metric.battery_runtime,
-                    metric.input_voltage,
-                    metric.output_voltage,
-                    metric.load_percent,
-                    metric.temperature,
-                    test_mode,
-                    metric.power_watts,
-                    energy_kwh
-                )
-            )
+            sample = {
+                "timestamp": sampled_at,
+                "battery_charge": metric.battery_charge,
+                "battery_runtime": metric.battery_runtime,
+                "input_voltage": metric.input_voltage,
+                "output_voltage": metric.output_voltage,
+                "load_percent": metric.load_percent,
+                "temperature": metric.temperature,
+                "power_watts": metric.power_watts,
+                "energy_kwh": energy_kwh,
+            }
+            ts = next_ts(self._last_metric_ts, sampled_at, test_mode, ups_id)
+            await self.db.execute(INSERT_METRIC_SQL, metric_row(ts, sample, test_mode, ups_id))
+
+            # 增量更新 rollup 表（失败不影响原始采样，避免重试时重复插入）
+            try:
+                for tier, params in build_rollup_params(sample, test_mode, ups_id).items():
+                    await self.db.execute(UPSERT_ROLLUP_SQL[tier], params)
+            except Exception as e:
+                logger.warning(f"Failed to update metric rollups: {e}")
         
         try:
             # 使用 async_retry 处理 SQLite 锁定等临时错误
@@ -201,17 +349,19 @@ class HistoryService:
                 operation_name="Database add_metric"
             )
             logger.debug(f"Metric sample recorded (test_mode={test_mode})")
+            self._notify_write("metrics", ups_id)
         except Exception as e:
             logger.error(f"Failed to add metric after retries: {e}")
             # 不抛出异常，避免影响主流程
     
-    async def get_metrics(self, hours: int = 24, test_mode: str = None) -> List[Metric]:
+    async def get_metrics(self, hours: int = 24, test_mode: str = None, ups_id: str = DEFAULT_UPS_ID) -> List[Metric]:
         """
         获取历史指标
         
         Args:
             hours: 查询最近几小时的指标
             test_mode: 测试模式过滤 (如果为None，从配置获取)
+            ups_id: UPS 标识
         
         Returns:
             指标列表
@@ -226,34 +376,22 @@ class HistoryService:
             except Exception as e:
                 logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
                 test_mode = 'production'
+
+        await self.flush_metrics()
         
-        # Use UTC time to match SQLite's CURRENT_TIMESTAMP which stores UTC
-        from datetime import timezone
         since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
-        
-        query = """
-            SELECT id, timestamp, battery_charge, battery_runtime,
-                   input_voltage, output_voltage, load_percent, temperature,
-                   power_watts, energy_kwh
-            FROM metrics
-            WHERE timestamp >= ? AND test_mode = ?
-            ORDER BY timestamp ASC
-        """
 
-        rows = await self.db.fetch_all(query, (since, test_mode))
+        # 主键 (test_mode, ups_id, ts) 区间扫描，数值在 SQL 中换算
+        rows = await self.db.fetch_all(
+            f"SELECT ts, {decoded_columns_sql()} FROM metrics "
+            f"WHERE test_mode = ? AND ups_id = ? AND ts >= ? ORDER BY ts ASC",
+            (test_mode, ups_id, to_epoch_ms(since))
+        )
 
         metrics = []
         for row in rows:
-            # Parse timestamp from database (UTC stored by SQLite CURRENT_TIMESTAMP)
-            timestamp = datetime.fromisoformat(row['timestamp'])
-            # Explicitly mark as UTC by adding timezone info
-            from datetime import timezone as tz
-            if timestamp.tzinfo is None:
-                timestamp = timestamp.replace(tzinfo=tz.utc)
-
             metric = Metric(
-                id=row['id'],
-                timestamp=timestamp,
+                timestamp=datetime.fromtimestamp(row['ts'] / 1000, timezone.utc),
                 battery_charge=row['battery_charge'],
                 battery_runtime=row['battery_runtime'],
                 input_voltage=row['input_voltage'],
@@ -267,12 +405,268 @@ class HistoryService:
         
         return metrics
     
-    async def cleanup_old_data(self, retention_days: int):
+    async def get_metric_series(
+        self,
+        hours: float = 24,
+        max_points: int = 2000,
+        test_mode: str = None,
+        ups_id: str = DEFAULT_UPS_ID,
+    ) -> dict:
+        """
+        按点数预算获取指标曲线
+
+        在满足点数预算的前提下选择最细粒度的数据层级：短时间范围返回原始采样，
+        长时间范围返回 1m / 15m / 1h rollup（avg 为主值，附带 min / max）。
+
+        Args:
+            hours: 查询最近几小时
+            max_points: 点数预算
+            test_mode: 测试模式过滤 (如果为None，从配置获取)
+            ups_id: UPS 标识
+
+        Returns:
+            {"resolution": "raw" | "1m" | "15m" | "1h", "points": [...]}
+        """
+        tier = select_tier(hours, max_points)
+        if tier is None:
+            metrics = await self.get_metrics(hours, test_mode, ups_id)
+            return {
+                "resolution": "raw",
+                "points": [
+                    {
+                        "id": m.id,
+                        "timestamp": m.timestamp,
+                        **{col: getattr(m, col) for col in ROLLUP_COLUMNS},
+                    }
+                    for m in metrics
+                ],
+            }
+
+        # Get test_mode from config if not provided
+        if test_mode is None:
+            try:
+                from config import get_config_manager
+                config_manager = await get_config_manager()
+                config = await config_manager.get_config()
+                test_mode = config.test_mode
+            except Exception as e:
+                logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
+                test_mode = 'production'
+
+        await self.flush_metrics()
+
+        table = ROLLUP_TIERS[tier][0]
+        since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+        select_cols = ", ".join(
+            f"{col}_min, {col}_max, {col}_sum, {col}_count, {col}_last" for col in ROLLUP_COLUMNS
+        )
+        rows = await self.db.fetch_all(
+            f"SELECT bucket, samples, {select_cols} FROM {table} "
+            f"WHERE test_mode = ? AND ups_id = ? AND bucket >= ? ORDER BY bucket ASC",
+            (test_mode, ups_id, since.strftime(DB_TIMESTAMP_FORMAT))
+        )
+
+        points = []
+        for row in rows:
+            timestamp = datetime.fromisoformat(row['bucket']).replace(tzinfo=timezone.utc)
+            point = {"id": None, "timestamp": timestamp, "samples": row['samples']}
+            for col in ROLLUP_COLUMNS:
+                count = row[f"{col}_count"]
+                if col == "energy_kwh":
+                    # 累计值取桶内最后一个值
+                    point[col] = row[f"{col}_last"]
+                else:
+                    point[col] = row[f"{col}_sum"] / count if count else None
+                point[f"{col}_min"] = row[f"{col}_min"]
+                point[f"{col}_max"] = row[f"{col}_max"]
+            if point["battery_runtime"] is not None:
+                point["battery_runtime"] = int(point["battery_runtime"])
+            points.append(point)
+
+        return {"resolution": tier, "points": points}
+
+    async def get_metric_frame(
+        self,
+        hours: float = 24,
+        test_mode: str = None,
+        ups_id: str = DEFAULT_UPS_ID,
+        start: Optional[datetime] = None,
+    ) -> MetricFrame:
+        """
+        获取列式指标帧（用于预测分析，跳过 Metric 对象构造）
+
+        Args:
+            hours: 查询最近几小时
+            test_mode: 测试模式过滤 (如果为None，从配置获取)
+            ups_id: UPS 标识
+            start: 起始时间（UTC，无时区，包含该时刻），指定时忽略 hours
+
+        Returns:
+            按时间升序的 MetricFrame
+        """
+        # Get test_mode from config if not provided
+        if test_mode is None:
+            try:
+                from config import get_config_manager
+                config_manager = await get_config_manager()
+                config = await config_manager.get_config()
+                test_mode = config.test_mode
+            except Exception as e:
+                logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
+                test_mode = 'production'
+
+        await self.flush_metrics()
+
+        since = start or datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+        rows = await self.db.fetch_all(
+            f"SELECT ts / 1000.0, {decoded_columns_sql(FRAME_COLUMNS)} FROM metrics "
+            f"WHERE test_mode = ? AND ups_id = ? AND ts >= ? ORDER BY ts ASC",
+            (test_mode, ups_id, to_epoch_ms(since))
+        )
+        return MetricFrame.from_rows(rows)
+
+    async def iter_events(
+        self,
+        start: datetime,
+        end: datetime,
+        test_mode: str = None,
+        ups_id: Optional[str] = None,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+    ) -> AsyncIterator[list]:
+        """
+        按时间范围分块读取事件（时间倒序，用于导出）
+
+        Args:
+            start: 开始时间（UTC，无时区）
+            end: 结束时间（UTC，无时区）
+            test_mode: 测试模式过滤 (如果为None，从配置获取)
+            ups_id: UPS 过滤 (如果为None，返回所有 UPS 的事件)
+            chunk_size: 每块行数
+
+        Yields:
+            数据库行列表（id, event_type, message, timestamp, metadata, ups_id）
+        """
+        conditions = ["ups_id = ?"] if ups_id else []
+        params = [ups_id] if ups_id else []
+        async for rows in self._iter_range(
+            "events", "id, event_type, message, timestamp, metadata, ups_id",
+            start, end, test_mode, conditions, params, chunk_size, descending=True
+        ):
+            yield rows
+
+    async def iter_metrics(
+        self,
+        start: datetime,
+        end: datetime,
+        test_mode: str = None,
+        ups_id: str = DEFAULT_UPS_ID,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+    ) -> AsyncIterator[list]:
+        """
+        按时间范围分块读取指标（时间正序，用于导出）
+
+        Args:
+            start: 开始时间（UTC，无时区）
+            end: 结束时间（UTC，无时区）
+            test_mode: 测试模式过滤 (如果为None，从配置获取)
+            ups_id: UPS 标识
+            chunk_size: 每块行数
+
+        Yields:
+            数据库行列表（ts 为 epoch 毫秒，其余列为实际值）
+        """
+        if test_mode is None:
+            try:
+                from config import get_config_manager
+                config_manager = await get_config_manager()
+                config = await config_manager.get_config()
+                test_mode = config.test_mode
+            except Exception as e:
+                logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
+                test_mode = 'production'
+
+        await self.flush_metrics()
+
+        # 主键唯一，按 ts 键集分页；包含结束秒内的采样
+        last_ts = to_epoch_ms(start) - 1
+        end_ts = to_epoch_ms(end.replace(microsecond=0)) + 999
+        while True:
+            rows = await self.db.fetch_all(
+                f"SELECT ts, {decoded_columns_sql()} FROM metrics "
+                f"WHERE test_mode = ? AND ups_id = ? AND ts > ? AND ts <= ? ORDER BY ts ASC LIMIT ?",
+                (test_mode, ups_id, last_ts, end_ts, chunk_size)
+            )
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            last_ts = rows[-1]['ts']
+
+    async def _iter_range(
+        self,
+        table: str,
+        columns: str,
+        start: datetime,
+        end: datetime,
+        test_mode: Optional[str],
+        conditions: list,
+        params: list,
+        chunk_size: int,
+        descending: bool,
+    ) -> AsyncIterator[list]:
+        """
+        按 (timestamp, id) 键集分页读取
+
+        每块是一次独立的短查询，不会在整个导出期间占用共享连接上的读游标，
+        采样写入和 WAL checkpoint 可以在块之间正常进行。
+        """
+        if test_mode is None:
+            try:
+                from config import get_config_manager
+                config_manager = await get_config_manager()
+                config = await config_manager.get_config()
+                test_mode = config.test_mode
+            except Exception as e:
+                logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
+                test_mode = 'production'
+
+        base_conditions = ["timestamp >= ?", "timestamp <= ?", "test_mode = ?"] + conditions
+        base_params = [
+            start.strftime(DB_TIMESTAMP_FORMAT),
+            # 包含结束秒内带小数秒的记录
+            end.strftime(DB_TIMESTAMP_FORMAT) + ".999999",
+            test_mode,
+        ] + params
+        op, order = ("<", "DESC") if descending else (">", "ASC")
+
+        cursor = None
+        while True:
+            where = list(base_conditions)
+            query_params = list(base_params)
+            if cursor is not None:
+                where.append(f"(timestamp {op} ? OR (timestamp = ? AND id {op} ?))")
+                query_params.extend([cursor[0], cursor[0], cursor[1]])
+            rows = await self.db.fetch_all(
+                f"SELECT {columns} FROM {table} WHERE {' AND '.join(where)} "
+                f"ORDER BY timestamp {order}, id {order} LIMIT ?",
+                tuple(query_params + [chunk_size])
+            )
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1]
+            cursor = (last['timestamp'], last['id'])
+
+    async def cleanup_old_data(self, retention_days: int, rollup_retention_days: Optional[dict] = None):
         """
         清理过期数据
         
         Args:
-            retention_days: 保留天数
+            retention_days: 原始事件和指标的保留天数
+            rollup_retention_days: 各 rollup 层级的保留天数，如 {"1m": 90, "15m": 365, "1h": 1825}
         
         Returns:
             清理的记录数
@@ -286,17 +680,47 @@ class HistoryService:
         )
         events_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
         
-        # 清理指标
-        cursor = await self.db.execute(
-            "DELETE FROM metrics WHERE timestamp < ?",
-            (cutoff,)
-        )
-        metrics_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
-        
+        # 清理指标（逐组按主键区间删除，避免扫描全表）
+        metrics_deleted = 0
+        for test_mode, ups_id in await metric_groups(self.db):
+            cursor = await self.db.execute(
+                "DELETE FROM metrics WHERE test_mode = ? AND ups_id = ? AND ts < ?",
+                (test_mode, ups_id, to_epoch_ms(cutoff))
+            )
+            metrics_deleted += cursor.rowcount if hasattr(cursor, 'rowcount') else 0
+        if metrics_deleted:
+            await refresh_metric_bounds(self.db)
+
+        # 清理 rollup（各层级独立保留期，未配置的层级不清理）
+        rollups_deleted = 0
+        pruned_tables = []
+        now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+        for tier, days in (rollup_retention_days or {}).items():
+            if tier not in ROLLUP_TIERS or not days:
+                continue
+            rollup_cutoff = (now_utc - timedelta(days=days)).strftime(DB_TIMESTAMP_FORMAT)
+            table = ROLLUP_TIERS[tier][0]
+            deleted = 0
+            # 逐组按主键区间删除（bucket 没有单独的索引）
+            for test_mode, ups_id in await metric_groups(self.db, table):
+                cursor = await self.db.execute(
+                    f"DELETE FROM {table} WHERE test_mode = ? AND ups_id = ? AND bucket < ?",
+                    (test_mode, ups_id, rollup_cutoff)
+                )
+                deleted += cursor.rowcount if hasattr(cursor, 'rowcount') else 0
+            if deleted:
+                rollups_deleted += deleted
+                pruned_tables.append(table)
+        if pruned_tables:
+            await refresh_rollup_bounds(self.db, pruned_tables)
+
+        if events_deleted or metrics_deleted:
+            self._notify_write("reset")
 
         return {
             "events_deleted": events_deleted,
-            "metrics_deleted": metrics_deleted
+            "metrics_deleted": metrics_deleted,
+            "rollups_deleted": rollups_deleted
         }
 
     async def cleanup_all_data(self):
@@ -306,6 +730,9 @@ class HistoryService:
         Returns:
             清理的记录数
         """
+        # 先写入队列中的采样，避免清空后又被写回
+        await self.flush_metrics()
+
         # 清理所有事件
         cursor = await self.db.execute("DELETE FROM events")
         events_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
@@ -314,14 +741,23 @@ class HistoryService:
         cursor = await self.db.execute("DELETE FROM metrics")
         metrics_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
 
+        # 清理所有 rollup
+        for table, _ in ROLLUP_TIERS.values():
+            await self.db.execute(f"DELETE FROM {table}")
+
         # 清理所有电池测试报告
         cursor = await self.db.execute("DELETE FROM battery_test_reports")
         reports_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
+        await self.db.execute("DELETE FROM battery_test_samples")
 
         # 清理所有监控统计
         cursor = await self.db.execute("DELETE FROM monitoring_stats")
         stats_deleted = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
 
+        if self.metric_writer is not None:
+            self.metric_writer.reset_energy_state()
+        self._notify_write("reset")
+
         return {
             "events_deleted": events_deleted,
             "metrics_deleted": metrics_deleted,
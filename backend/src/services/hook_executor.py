@@ -3,14 +3,22 @@ import asyncio
 import logging
 import time
 from typing import List, Dict, Any, Optional, Callable
-from collections import defaultdict
 from hooks.registry import get_registry
+from services.hook_graph import (
+    critical_path, estimated_seconds, hook_label, latest_finish_times, safe_dependencies, successors
+)
+from services.shutdown_planner import HookDurationStore
 
 logger = logging.getLogger(__name__)
 
+# 同时执行的 hook 数量上限
+DEFAULT_MAX_PARALLEL = 16
+# 截止时间临近时单次尝试的最短超时（秒）
+MIN_ATTEMPT_TIMEOUT = 5.0
+
 
 class HookExecutor:
-    """Hook 执行器，负责按优先级编排执行所有 hook"""
+    """Hook 执行器，负责按依赖图编排执行所有 hook"""
     
     def __init__(
         self, 
@@ -19,7 +27,11 @@ class HookExecutor:
         test_mode: str = "production",
         progress_callback: Optional[Callable] = None,
         cancellation_callback: Optional[Callable[[], bool]] = None,
-        urgent: bool = False
+        urgent: bool = False,
+        max_parallel: int = DEFAULT_MAX_PARALLEL,
+        runtime_budget: Optional[float] = None,
+        duration_estimates: Optional[Dict[str, float]] = None,
+        duration_store: Optional[HookDurationStore] = None
     ):
         """
         初始化 Hook 执行器
@@ -34,6 +46,13 @@ class HookExecutor:
             cancellation_callback: 取消检查回调函数。返回 True 表示需要取消执行。
             urgent: 是否为紧急关机模式（续航过短等场景），
                     设置后 hook 可通过 self.urgent 感知并调整行为
+            max_parallel: 同时执行的 hook 数量上限
+            runtime_budget: 全部 hook 必须完成的时间（秒，通常由剩余续航推算），
+                            为 None 时不限制
+            duration_estimates: 各 hook 的预计耗时（秒，按名称），为 None 时使用
+                                duration_store 中的历史实测耗时，没有记录的 hook
+                                使用配置项 estimated_seconds
+            duration_store: 实测耗时记录，生产模式下执行完成后写入；为 None 时不记录
         """
         self.registry = get_registry()
         self.hooks_config = hooks_config
@@ -42,15 +61,25 @@ class HookExecutor:
         self.progress_callback = progress_callback
         self.cancellation_callback = cancellation_callback
         self.urgent = urgent
+        self.max_parallel = max(1, max_parallel)
+        self.runtime_budget = runtime_budget
+        self.duration_store = duration_store
+        if duration_estimates is None:
+            duration_estimates = duration_store.estimates() if duration_store is not None else {}
+        self.duration_estimates = duration_estimates
 
     async def execute_all(self, hooks_config: Optional[List[dict]] = None) -> dict:
         """
-        按优先级编排执行所有 hook：
-        1. 按 priority 分组（数字小的先执行）
-        2. 同优先级的 hook 并行执行（asyncio.gather）
-        3. 不同优先级串行执行
-        4. 每个 hook 有独立超时（配置项 timeout，默认120秒）
-        5. 支持 on_failure 策略：continue（失败继续）/ abort（失败终止）
+        按依赖图编排执行所有 hook：
+        1. 任务用 depends_on 声明依赖；未声明时依赖优先级数字更小的最近一组
+        2. 依赖全部结束即可开始，不等待同组其他任务；同时执行的任务数
+           不超过 max_parallel，就绪任务中余量最小（关键路径上）的先执行
+        3. 每个 hook 有独立超时（配置项 timeout，默认120秒）；设置了
+           runtime_budget 时超时还受按续航推算的截止时间限制（预算不足以
+           完成关键路径时只按截止时间排序，不截断超时）
+        4. 支持 on_failure 策略：continue（失败继续）/ abort（失败终止，
+           尚未开始的任务全部跳过）
+        5. 依赖失败（continue 策略）不影响后续任务执行
         
         Args:
             hooks_config: Hook 配置列表（可选，使用初始化时的配置）
@@ -61,7 +90,10 @@ class HookExecutor:
                 success: 成功数,
                 failed: 失败数,
                 skipped: 跳过数,
-                details: [{hook_name, success, error, duration}]
+                details: [{hook_name, success, error, duration}],
+                elapsed: 总耗时,
+                timeline: [{hook_name, status, start, end, duration, deadline, depends_on}],
+                critical_path: [hook_name]
             }
         """
         # 使用传入的配置或初始化时的配置
@@ -69,192 +101,213 @@ class HookExecutor:
             hooks_config = self.hooks_config
         
         if not hooks_config:
-            return {
-                "total": 0,
-                "success": 0,
-                "failed": 0,
-                "skipped": 0,
-                "details": []
-            }
+            return self._empty_result(0, 0)
         
         # 过滤出启用的 hook
         enabled_hooks = [h for h in hooks_config if h.get("enabled", True)]
         
         if not enabled_hooks:
-            return {
-                "total": len(hooks_config),
-                "success": 0,
-                "failed": 0,
-                "skipped": len(hooks_config),
-                "details": []
-            }
-        
+            return self._empty_result(len(hooks_config), len(hooks_config))
 
-        # 按优先级分组
-        priority_groups = defaultdict(list)
-        for hook_config in enabled_hooks:
-            priority = hook_config.get("priority", 99)
-            priority_groups[priority].append(hook_config)
-        
-        # 按优先级排序
-        sorted_priorities = sorted(priority_groups.keys())
+        # 解析依赖（配置有误时退回纯优先级顺序）
+        deps = safe_dependencies(enabled_hooks)
+        dependents = successors(deps)
+
+        # 最晚完成时间：有续航预算时作为截止时间，否则只用于排序
+        durations = [estimated_seconds(h, self.duration_estimates) for h in enabled_hooks]
+        budget = self.runtime_budget if self.runtime_budget is not None else 0.0
+        lft = latest_finish_times(deps, durations, budget)
+
+        # 预算短于关键路径时截止时间无法全部满足，此时按截止时间截断超时
+        # 只会让每个任务都失败；保留各任务自身的超时，截止时间只用于排序
+        use_deadlines = self.runtime_budget is not None
+        if use_deadlines and any(t - d < 0 for t, d in zip(lft, durations)):
+            logger.warning(
+                f"Runtime budget {self.runtime_budget:.0f}s is shorter than the critical path, "
+                f"keeping configured hook timeouts"
+            )
+            use_deadlines = False
+
+        start_time = time.monotonic()
+        deadlines = [start_time + t for t in lft] if use_deadlines else [None] * len(enabled_hooks)
+        starts: List[Optional[float]] = [None] * len(enabled_hooks)
+        ends: List[Optional[float]] = [None] * len(enabled_hooks)
+        statuses = ["pending"] * len(enabled_hooks)
         
         # 执行结果
         total_count = len(enabled_hooks)
-        success_count = 0
-        failed_count = 0
-        skipped_count = 0
+        counts = {"success": 0, "failed": 0, "skipped": 0}
         details = []
         aborted = False
-        
-        # 按优先级串行执行
-        for priority_index, priority in enumerate(sorted_priorities):
+
+        def progress(index: int, finished: int = 0) -> dict:
+            return {
+                "total": total_count,
+                "completed": counts["success"] + counts["failed"] + counts["skipped"] + finished,
+                "current_priority": enabled_hooks[index].get("priority", 99)
+            }
+
+        # 广播待执行状态
+        for index, hook_config in enumerate(enabled_hooks):
+            await self._broadcast_progress(
+                hook_name=hook_label(hook_config),
+                hook_id=hook_config.get("hook_id", "unknown"),
+                status="pending",
+                priority=hook_config.get("priority", 99),
+                duration=0,
+                error=None,
+                progress=progress(index)
+            )
+
+        waiting = [len(d) for d in deps]
+        ready = [i for i, count in enumerate(waiting) if count == 0]
+        running: Dict[asyncio.Task, int] = {}
+
+        while ready or running:
             # 检查是否需要取消
             if self.cancellation_callback and self.cancellation_callback():
                 aborted = True
-            
-            if aborted:
-                # 如果已经中止，跳过后续所有 hook
-                remaining = priority_groups[priority]
-                for hook_config in remaining:
-                    hook_name = hook_config.get("name", "Unknown")
-                    hook_id = hook_config.get("hook_id", "unknown")
-                    
-                    # 广播跳过状态
-                    await self._broadcast_progress(
-                        hook_name=hook_name,
-                        hook_id=hook_id,
-                        status="skipped",
-                        priority=priority,
-                        duration=0,
-                        error="Skipped due to previous failure with abort policy",
-                        progress={
-                            "total": total_count,
-                            "completed": success_count + failed_count + skipped_count,
-                            "current_priority": priority
-                        }
-                    )
-                    
-                    details.append({
+
+            # 启动就绪任务（余量最小的优先）
+            if not aborted:
+                ready.sort(key=lambda i: (lft[i], enabled_hooks[i].get("priority", 99)))
+                while ready and len(running) < self.max_parallel:
+                    index = ready.pop(0)
+                    starts[index] = time.monotonic()
+                    statuses[index] = "running"
+                    task = asyncio.create_task(self._execute_single_hook(enabled_hooks[index], deadlines[index]))
+                    running[task] = index
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = running.pop(task)
+                ends[index] = time.monotonic()
+                hook_config = enabled_hooks[index]
+                hook_name = hook_label(hook_config)
+                hook_id = hook_config.get("hook_id", "unknown")
+                on_failure = hook_config.get("on_failure", "continue")
+
+                try:
+                    result = task.result()
+                except Exception as e:
+                    # 执行过程中发生异常
+                    logger.error(f"Hook '{hook_name}' raised exception: {e}")
+                    result = {
                         "hook_name": hook_name,
                         "success": False,
-                        "error": "Skipped due to previous failure with abort policy",
+                        "error": str(e),
                         "duration": 0
-                    })
-                    skipped_count += 1
-                continue
-            
+                    }
 
-            # 同优先级并行执行
-            tasks = []
-            hook_configs = priority_groups[priority]
-            
-            for hook_config in hook_configs:
-                # 广播待执行状态
-                hook_name = hook_config.get("name", "Unknown")
-                hook_id = hook_config.get("hook_id", "unknown")
-                
+                status = "success" if result["success"] else "failed"
+                statuses[index] = status
+
+                # 广播执行状态
                 await self._broadcast_progress(
                     hook_name=hook_name,
                     hook_id=hook_id,
-                    status="pending",
-                    priority=priority,
-                    duration=0,
-                    error=None,
-                    progress={
-                        "total": total_count,
-                        "completed": success_count + failed_count + skipped_count,
-                        "current_priority": priority
-                    }
+                    status=status,
+                    priority=hook_config.get("priority", 99),
+                    duration=result["duration"],
+                    error=result.get("error"),
+                    progress=progress(index, finished=1)
                 )
-                
-                task = self._execute_single_hook(hook_config)
-                tasks.append(task)
-            
-            # 并行执行同优先级的 hook
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 处理结果
-            for hook_config, result in zip(hook_configs, results):
-                hook_name = hook_config.get("name", "Unknown")
-                hook_id = hook_config.get("hook_id", "unknown")
-                on_failure = hook_config.get("on_failure", "continue")
-                
-                if isinstance(result, Exception):
-                    # 执行过程中发生异常
-                    logger.error(f"Hook '{hook_name}' raised exception: {result}")
-                    
-                    # 广播失败状态
-                    await self._broadcast_progress(
-                        hook_name=hook_name,
-                        hook_id=hook_id,
-                        status="failed",
-                        priority=priority,
-                        duration=0,
-                        error=str(result),
-                        progress={
-                            "total": total_count,
-                            "completed": success_count + failed_count + skipped_count + 1,
-                            "current_priority": priority
-                        }
-                    )
-                    
-                    details.append({
-                        "hook_name": hook_name,
-                        "success": False,
-                        "error": str(result),
-                        "duration": 0
-                    })
-                    failed_count += 1
-                    
-                    if on_failure == "abort":
-                        logger.warning(f"Hook '{hook_name}' failed with abort policy, stopping execution")
-                        aborted = True
-                else:
-                    # 正常执行完成
-                    status = "success" if result["success"] else "failed"
-                    
-                    # 广播执行状态
-                    await self._broadcast_progress(
-                        hook_name=hook_name,
-                        hook_id=hook_id,
-                        status=status,
-                        priority=priority,
-                        duration=result["duration"],
-                        error=result.get("error"),
-                        progress={
-                            "total": total_count,
-                            "completed": success_count + failed_count + skipped_count + 1,
-                            "current_priority": priority
-                        }
-                    )
-                    
-                    details.append(result)
-                    
-                    if result["success"]:
-                        success_count += 1
-                    else:
-                        failed_count += 1
-                        
-                        if on_failure == "abort":
-                            logger.warning(f"Hook '{hook_name}' failed with abort policy, stopping execution")
-                            aborted = True
-        
+
+                details.append(result)
+                counts[status] += 1
+
+                # 记录实测耗时（仅生产模式下成功的执行；失败、超时和取消的耗时不代表正常关机时长）
+                if self.duration_store is not None and self.test_mode == "production" and result["success"]:
+                    await self.duration_store.record(hook_name, ends[index] - starts[index])
+
+                if not result["success"] and on_failure == "abort":
+                    logger.warning(f"Hook '{hook_name}' failed with abort policy, stopping execution")
+                    aborted = True
+
+                # 依赖全部结束的后继任务进入就绪队列
+                for succ in dependents[index]:
+                    waiting[succ] -= 1
+                    if waiting[succ] == 0:
+                        ready.append(succ)
+
+        # 中止或取消：未开始的任务全部跳过
+        for index, hook_config in enumerate(enabled_hooks):
+            if statuses[index] != "pending":
+                continue
+            hook_name = hook_label(hook_config)
+            statuses[index] = "skipped"
+
+            # 广播跳过状态
+            await self._broadcast_progress(
+                hook_name=hook_name,
+                hook_id=hook_config.get("hook_id", "unknown"),
+                status="skipped",
+                priority=hook_config.get("priority", 99),
+                duration=0,
+                error="Skipped due to previous failure with abort policy",
+                progress=progress(index)
+            )
+
+            details.append({
+                "hook_name": hook_name,
+                "success": False,
+                "error": "Skipped due to previous failure with abort policy",
+                "duration": 0
+            })
+            counts["skipped"] += 1
+
+        def relative(t: Optional[float]) -> Optional[float]:
+            return round(t - start_time, 2) if t is not None else None
+
+        timeline = [
+            {
+                "hook_name": hook_label(hook_config),
+                "status": statuses[index],
+                "start": relative(starts[index]),
+                "end": relative(ends[index]),
+                "duration": round(ends[index] - starts[index], 2) if ends[index] is not None else 0,
+                "deadline": relative(deadlines[index]),
+                "depends_on": sorted({hook_label(enabled_hooks[d]) for d in deps[index]})
+            }
+            for index, hook_config in enumerate(enabled_hooks)
+        ]
+        path = [hook_label(enabled_hooks[i]) for i in critical_path(deps, ends)]
 
         return {
             "total": total_count,
-            "success": success_count,
-            "failed": failed_count,
-            "skipped": skipped_count,
-            "details": details
+            "success": counts["success"],
+            "failed": counts["failed"],
+            "skipped": counts["skipped"],
+            "details": details,
+            "elapsed": round(time.monotonic() - start_time, 2),
+            "timeline": timeline,
+            "critical_path": path
+        }
+
+    @staticmethod
+    def _empty_result(total: int, skipped: int) -> dict:
+        return {
+            "total": total,
+            "success": 0,
+            "failed": 0,
+            "skipped": skipped,
+            "details": [],
+            "elapsed": 0,
+            "timeline": [],
+            "critical_path": []
         }
     
-    async def _execute_single_hook(self, hook_config: dict) -> dict:
+    async def _execute_single_hook(self, hook_config: dict, deadline: Optional[float] = None) -> dict:
         """
         执行单个 hook（带重试）
         
         Args:
             hook_config: Hook 配置
+            deadline: 截止时间（time.monotonic），每次尝试的超时不超过剩余时间，
+                      到期后不再重试
         
         Returns:
             执行结果字典：{hook_name, success, error, duration, attempts}
@@ -286,6 +339,11 @@ class HookExecutor:
                     "cancelled": True
                 }
             
+            # 本次尝试的超时（受截止时间限制）
+            attempt_timeout = timeout
+            if deadline is not None:
+                attempt_timeout = min(timeout, max(MIN_ATTEMPT_TIMEOUT, deadline - time.monotonic()))
+
             # 广播执行中状态
             status = "retrying" if attempt > 1 else "executing"
             await self._broadcast_progress(
@@ -312,7 +370,7 @@ class HookExecutor:
                 if self.test_mode == "dry_run":
                     success = await asyncio.wait_for(
                         hook_instance.test_connection(),
-                        timeout=timeout
+                        timeout=attempt_timeout
                     )
                     duration = time.time() - start_time
                     
@@ -333,7 +391,7 @@ class HookExecutor:
                     # 生产模式：实际执行 hook
                     success = await asyncio.wait_for(
                         hook_instance.execute(),
-                        timeout=timeout
+                        timeout=attempt_timeout
                     )
                     
                     if success:
@@ -352,7 +410,7 @@ class HookExecutor:
                         logger.warning(f"Hook '{hook_name}' failed (attempt {attempt}/{max_retries + 1}): {last_error}")
             
             except asyncio.TimeoutError:
-                last_error = f"Hook execution timed out after {timeout}s"
+                last_error = f"Hook execution timed out after {attempt_timeout:.0f}s"
                 logger.warning(f"Hook '{hook_name}' timed out (attempt {attempt}/{max_retries + 1})")
             
             except ValueError as e:
@@ -371,6 +429,17 @@ class HookExecutor:
                 last_error = str(e)
                 logger.warning(f"Hook '{hook_name}' raised exception (attempt {attempt}/{max_retries + 1}): {e}")
             
+            # 截止时间已到：不再重试
+            if deadline is not None and attempt <= max_retries and time.monotonic() + retry_delay >= deadline:
+                logger.warning(f"Hook '{hook_name}' reached its runtime deadline, giving up after {attempt} attempts")
+                return {
+                    "hook_name": hook_name,
+                    "success": False,
+                    "error": f"{last_error} (runtime deadline reached)",
+                    "duration": time.time() - start_time,
+                    "attempts": attempt
+                }
+
             # 如果还有重试机会，等待后重试
             if attempt <= max_retries:
                 # 再次检查是否需要取消
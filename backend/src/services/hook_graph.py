@@ -0,0 +1,167 @@
+"""关机前置任务依赖图
+
+HookExecutor 原来按 priority 分组串行执行，组内 asyncio.gather 要等最慢
+的任务结束才能进入下一组：一台 SSH 超时 120 秒的主机会拖慢所有低优先级
+主机。
+
+现在每个任务可以用 depends_on 声明依赖（任务名称列表，例如 NAS 依赖所有
+虚拟机），执行器按依赖图调度：依赖全部结束后即可开始，不再等待整组。
+
+- 声明了 depends_on 的任务只依赖列出的任务（空列表表示不依赖任何任务）
+- 未声明 depends_on 的任务沿用优先级语义：依赖优先级数字比它小的最近
+  一组任务，旧配置的执行顺序保持不变
+- 最晚完成时间（latest finish time）按依赖图从后往前推算：
+  LFT(n) = min(LFT(s) - 预计耗时(s))，s 为 n 的后继任务。
+  有续航预算时作为每个任务的截止时间；没有预算时用于排序，
+  余量最小的就绪任务先执行
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+# 未指定预计耗时时使用的默认值（秒），不超过任务超时
+DEFAULT_ESTIMATED_SECONDS = 30.0
+
+
+def hook_label(hook_config: dict) -> str:
+    return hook_config.get("name", "Unknown")
+
+
+def _priority_dependencies(hooks: Sequence[dict]) -> List[Set[int]]:
+    """由优先级推导依赖：依赖优先级比自己小的最近一组"""
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for index, hook_config in enumerate(hooks):
+        groups[hook_config.get("priority", 99)].append(index)
+    priorities = sorted(groups)
+
+    deps: List[Set[int]] = [set() for _ in hooks]
+    for prev, current in zip(priorities, priorities[1:]):
+        for index in groups[current]:
+            deps[index] = set(groups[prev])
+    return deps
+
+
+def resolve_dependencies(hooks: Sequence[dict], strict: bool = True) -> List[Set[int]]:
+    """
+    解析任务依赖
+
+    Args:
+        hooks: 已启用的任务配置列表
+        strict: 为 True 时引用不存在的任务名称会抛出 ValueError，
+                否则忽略该引用
+
+    Returns:
+        每个任务依赖的任务下标集合
+
+    Raises:
+        ValueError: 引用了不存在的任务（strict）或依赖存在环
+    """
+    by_name: Dict[str, List[int]] = defaultdict(list)
+    for index, hook_config in enumerate(hooks):
+        by_name[hook_label(hook_config)].append(index)
+
+    deps = _priority_dependencies(hooks)
+    for index, hook_config in enumerate(hooks):
+        depends_on = hook_config.get("depends_on")
+        if depends_on is None:
+            continue
+        explicit: Set[int] = set()
+        for name in depends_on:
+            if name not in by_name:
+                if strict:
+                    raise ValueError(f"任务「{hook_label(hook_config)}」依赖的任务「{name}」不存在或未启用")
+                continue
+            explicit.update(i for i in by_name[name] if i != index)
+        deps[index] = explicit
+
+    topological_order(deps, hooks)
+    return deps
+
+
+def safe_dependencies(hooks: Sequence[dict]) -> List[Set[int]]:
+    """解析依赖；引用不存在的任务时忽略，存在环时退回纯优先级顺序"""
+    try:
+        return resolve_dependencies(hooks, strict=False)
+    except ValueError as e:
+        logger.error(f"Invalid hook dependencies, falling back to priority order: {e}")
+        return _priority_dependencies(hooks)
+
+
+def topological_order(deps: Sequence[Set[int]], hooks: Optional[Sequence[dict]] = None) -> List[int]:
+    """拓扑排序，存在环时抛出 ValueError"""
+    remaining = [len(d) for d in deps]
+    dependents = successors(deps)
+    order = [i for i, count in enumerate(remaining) if count == 0]
+    for index in order:
+        for succ in dependents[index]:
+            remaining[succ] -= 1
+            if remaining[succ] == 0:
+                order.append(succ)
+
+    if len(order) != len(deps):
+        cycle = [i for i, count in enumerate(remaining) if count > 0]
+        names = [hook_label(hooks[i]) if hooks else str(i) for i in cycle]
+        raise ValueError(f"任务依赖存在循环：{', '.join(names)}")
+    return order
+
+
+def successors(deps: Sequence[Set[int]]) -> List[List[int]]:
+    """每个任务的后继任务"""
+    result: List[List[int]] = [[] for _ in deps]
+    for index, dep_set in enumerate(deps):
+        for dep in dep_set:
+            result[dep].append(index)
+    return result
+
+
+def estimated_seconds(hook_config: dict, estimates: Optional[Dict[str, float]] = None) -> float:
+    """任务预计耗时：优先使用外部估计，其次配置项 estimated_seconds，不超过超时"""
+    timeout = float(hook_config.get("timeout", 120))
+    name = hook_label(hook_config)
+    if estimates and name in estimates:
+        estimate = float(estimates[name])
+    else:
+        estimate = float(hook_config.get("estimated_seconds", DEFAULT_ESTIMATED_SECONDS))
+    return max(0.0, min(estimate, timeout))
+
+
+def latest_finish_times(deps: Sequence[Set[int]], durations: Sequence[float], budget: float = 0.0) -> List[float]:
+    """
+    每个任务的最晚完成时间（相对开始时刻，秒）
+
+    Args:
+        deps: 每个任务依赖的任务下标集合
+        durations: 每个任务的预计耗时
+        budget: 全部任务必须完成的时间
+    """
+    order = topological_order(deps)
+    dependents = successors(deps)
+    lft = [budget] * len(deps)
+    for index in reversed(order):
+        for succ in dependents[index]:
+            lft[index] = min(lft[index], lft[succ] - durations[succ])
+    return lft
+
+
+def critical_path(deps: Sequence[Set[int]], ends: Sequence[Optional[float]]) -> List[int]:
+    """
+    实际执行的关键路径
+
+    从最后完成的任务开始，沿着“最后完成的依赖”（即实际限制其开始时间的
+    依赖）向前回溯。
+    """
+    finished = [i for i, end in enumerate(ends) if end is not None]
+    if not finished:
+        return []
+    current = max(finished, key=lambda i: ends[i])
+    path = [current]
+    while True:
+        candidates = [d for d in deps[current] if ends[d] is not None]
+        if not candidates:
+            break
+        current = max(candidates, key=lambda i: ends[i])
+        path.append(current)
+    path.reverse()
+    return path
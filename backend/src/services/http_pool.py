@@ -0,0 +1,303 @@
+"""共享 HTTP 客户端池
+
+通知插件和 HTTP 类关机前置任务原来每次请求都新建 httpx.AsyncClient：
+每次都要重新加载证书、建立 TCP + TLS 连接，而这恰好发生在断电、
+网络设备也在电池供电的时候。客户端池按 (源站, 代理, 是否校验证书)
+复用进程级客户端：
+
+- 连接保持（keep-alive），同一源站的后续请求直接复用已有连接；
+  群晖 / 威联通关机流程的登录和关机两步因此只握手一次
+- 安装了 h2 时启用 HTTP/2（同一连接多路复用），否则使用 HTTP/1.1
+- 配置加载时按已配置的通知渠道和关机前置任务预先创建客户端
+- 通过 httpcore 的 trace 扩展统计新建连接和 TLS 握手次数，
+  请求数减去新建连接数即为连接复用次数
+- 共享客户端不保存 Cookie：同一源站的不同渠道 / 任务（可能是不同账号）
+  不会互相带上对方的会话；需要会话的调用方自行传递 cookies 参数
+"""
+import asyncio
+import importlib.util
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict, Iterable, List, Optional, Tuple
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 是否可用 HTTP/2（需要可选依赖 h2）
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 默认连接池参数
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_MAX_KEEPALIVE = 5
+DEFAULT_KEEPALIVE_EXPIRY = 60.0  # 秒
+DEFAULT_MAX_CLIENTS = 32
+
+# 客户端键: (源站, 代理, 是否校验证书)
+ClientKey = Tuple[str, Optional[str], bool]
+# 预热端点: (URL, 代理, 是否校验证书)
+HttpEndpoint = Tuple[str, Optional[str], bool]
+
+
+class _ClientStats:
+    """单个客户端的统计"""
+
+    __slots__ = ("requests", "connections", "tls_handshakes", "errors")
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.errors = 0
+
+    def add(self, other: "_ClientStats"):
+        self.requests += other.requests
+        self.connections += other.connections
+        self.tls_handshakes += other.tls_handshakes
+        self.errors += other.errors
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "reused": max(0, self.requests - self.connections),
+            "tls_handshakes": self.tls_handshakes,
+            "errors": self.errors,
+        }
+
+
+class _NoCookiePolicy(DefaultCookiePolicy):
+    """拒绝保存和发送任何 Cookie 的策略"""
+
+    def set_ok(self, cookie, request) -> bool:
+        return False
+
+    def return_ok(self, cookie, request) -> bool:
+        return False
+
+
+class PooledClient:
+    """共享客户端的请求视图
+
+    附带调用方的默认超时；退出 async with 时不会关闭底层连接。
+    """
+
+    def __init__(self, client: httpx.AsyncClient, stats: _ClientStats, timeout):
+        self._client = client
+        self._stats = stats
+        self._timeout = timeout
+
+    async def _call(self, method, url, **kwargs) -> httpx.Response:
+        kwargs.setdefault("timeout", self._timeout)
+        try:
+            return await method(url, **kwargs)
+        except httpx.HTTPError:
+            self._stats.errors += 1
+            raise
+
+    async def get(self, url, **kwargs) -> httpx.Response:
+        return await self._call(self._client.get, url, **kwargs)
+
+    async def post(self, url, **kwargs) -> httpx.Response:
+        return await self._call(self._client.post, url, **kwargs)
+
+    async def put(self, url, **kwargs) -> httpx.Response:
+        return await self._call(self._client.put, url, **kwargs)
+
+
+def origin_of(url: str) -> str:
+    """URL 的源站（scheme://host:port）"""
+    parsed = httpx.URL(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    return f"{parsed.scheme}://{parsed.host}:{port}"
+
+
+class HttpClientPool:
+    """进程级 HTTP 客户端池"""
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        max_clients: int = DEFAULT_MAX_CLIENTS,
+    ):
+        """
+        Args:
+            max_connections: 每个客户端的最大连接数
+            max_keepalive: 每个客户端保持的空闲连接数
+            keepalive_expiry: 空闲连接保持时间（秒）
+            max_clients: 客户端数量上限，超出时关闭最久未使用的客户端
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[ClientKey, httpx.AsyncClient]" = OrderedDict()
+        self._stats: Dict[ClientKey, _ClientStats] = {}
+        # 已淘汰客户端的累计统计
+        self._retired = _ClientStats()
+        self._created = 0
+        self._evicted = 0
+
+    def _create(self, key: ClientKey) -> httpx.AsyncClient:
+        _, proxy, verify = key
+        stats = self._stats.setdefault(key, _ClientStats())
+
+        async def trace(event_name: str, info: dict):
+            if event_name.endswith("connect_tcp.complete"):
+                stats.connections += 1
+            elif event_name.endswith("start_tls.complete"):
+                stats.tls_handshakes += 1
+
+        async def on_request(request: httpx.Request):
+            stats.requests += 1
+            request.extensions["trace"] = trace
+
+        self._created += 1
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            proxy=proxy or None,
+            verify=verify,
+            limits=self.limits,
+            cookies=CookieJar(policy=_NoCookiePolicy()),
+            event_hooks={"request": [on_request]},
+        )
+
+    def get_client(self, url: str, proxy: Optional[str] = None, verify: bool = True) -> httpx.AsyncClient:
+        """获取（必要时创建）与 URL 源站对应的共享客户端"""
+        key = (origin_of(url), proxy or None, bool(verify))
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._create(key)
+            self._clients[key] = client
+            self._evict()
+        else:
+            self._clients.move_to_end(key)
+        return client
+
+    def _evict(self):
+        while len(self._clients) > self.max_clients:
+            key, client = self._clients.popitem(last=False)
+            self._evicted += 1
+            stats = self._stats.pop(key, None)
+            if stats is not None:
+                self._retired.add(stats)
+            try:
+                asyncio.get_running_loop().create_task(client.aclose())
+            except RuntimeError:
+                # 没有运行中的事件循环：由垃圾回收释放
+                pass
+
+    @asynccontextmanager
+    async def client(self, url: str, proxy: Optional[str] = None, verify: bool = True, timeout=10):
+        """
+        使用共享客户端发起请求
+
+        Args:
+            url: 请求地址（按源站选择客户端）
+            proxy: 代理地址
+            verify: 是否校验 TLS 证书
+            timeout: 请求默认超时（秒）
+        """
+        shared = self.get_client(url, proxy, verify)
+        key = (origin_of(url), proxy or None, bool(verify))
+        yield PooledClient(shared, self._stats[key], timeout)
+
+    def prewarm(self, endpoints: Iterable[HttpEndpoint]) -> int:
+        """预先创建客户端（加载证书、初始化连接池），返回新建数量"""
+        created = 0
+        for url, proxy, verify in endpoints:
+            try:
+                before = self._created
+                self.get_client(url, proxy, verify)
+                created += self._created - before
+            except Exception as e:
+                logger.debug(f"Failed to prewarm HTTP client for {url}: {e}")
+        return created
+
+    async def close(self):
+        """关闭所有客户端"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug(f"Error closing HTTP client: {e}")
+
+    def get_stats(self) -> dict:
+        """获取客户端池统计"""
+        totals = _ClientStats()
+        totals.add(self._retired)
+        origins = {}
+        for key, stats in self._stats.items():
+            origin, proxy, verify = key
+            label = origin if proxy is None else f"{origin} via proxy"
+            if not verify:
+                label += " (no verify)"
+            origins[label] = stats.as_dict()
+            totals.add(stats)
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "clients": len(self._clients),
+            "created": self._created,
+            "evicted": self._evicted,
+            **totals.as_dict(),
+            "origins": origins,
+        }
+
+
+def config_endpoints(config) -> List[HttpEndpoint]:
+    """当前配置中通知渠道和关机前置任务会访问的 HTTP 端点"""
+    from hooks.registry import get_registry as get_hook_registry
+    from plugins.registry import get_registry as get_plugin_registry
+
+    endpoints: List[HttpEndpoint] = []
+    plugin_registry = get_plugin_registry()
+    for channel in config.notify_channels:
+        if not channel.get("enabled", True):
+            continue
+        try:
+            notifier = plugin_registry.create_instance(channel.get("plugin_id"), channel.get("config", {}))
+            endpoints.extend(notifier.http_endpoints())
+        except Exception as e:
+            logger.debug(f"Skip prewarming notifier {channel.get('name')}: {e}")
+
+    hook_registry = get_hook_registry()
+    for hook in config.pre_shutdown_hooks:
+        if not hook.get("enabled", True):
+            continue
+        try:
+            instance = hook_registry.create_instance(hook.get("hook_id"), hook.get("config", {}))
+            endpoints.extend(instance.http_endpoints())
+        except Exception as e:
+            logger.debug(f"Skip prewarming hook {hook.get('name')}: {e}")
+    return endpoints
+
+
+def prewarm_from_config(config) -> int:
+    """按配置预先创建客户端（配置加载或更新后调用）"""
+    try:
+        created = get_http_pool().prewarm(config_endpoints(config))
+        if created:
+            logger.info(f"Prewarmed {created} HTTP clients")
+        return created
+    except Exception as e:
+        logger.warning(f"Failed to prewarm HTTP clients: {e}")
+        return 0
+
+
+# 全局客户端池
+_http_pool: Optional[HttpClientPool] = None
+
+
+def get_http_pool() -> HttpClientPool:
+    """获取 HTTP 客户端池实例"""
+    global _http_pool
+    if _http_pool is None:
+        _http_pool = HttpClientPool()
+    return _http_pool
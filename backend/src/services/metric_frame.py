@@ -0,0 +1,185 @@
+"""列式指标帧
+
+预测和电池分析需要在数十万条采样上做窗口切片和统计（30 天 × 10 秒采样
+约 26 万行）。逐行构造 Pydantic Metric 对象再反复列表推导会非常慢，
+这里直接从 SQLite 读取元组，按列存入 array('d')（缺失值为 NaN）：
+
+- 时间戳列为 UTC epoch 秒，按时间升序，窗口切片用二分查找
+- 每列预先计算有效值前缀计数，任意区间的有效样本数 O(1) 得到
+- 均值 / 标准差等统计在连续的 float 数组上单遍计算
+"""
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+NAN = float("nan")
+
+# 帧中包含的指标列
+FRAME_COLUMNS = (
+    "battery_charge",
+    "battery_runtime",
+    "input_voltage",
+    "output_voltage",
+    "load_percent",
+    "temperature",
+    "power_watts",
+)
+
+
+def to_epoch(value) -> float:
+    """datetime（无时区视为 UTC）、数据库时间字符串或 epoch 秒 → epoch 秒"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def mean_std(values: Sequence[float]) -> Tuple[float, float]:
+    """均值和总体标准差（空序列返回 0, 0）"""
+    n = len(values)
+    if n == 0:
+        return 0, 0
+    mean = math.fsum(values) / n
+    variance = math.fsum((x - mean) * (x - mean) for x in values) / n
+    return mean, math.sqrt(variance)
+
+
+class MetricFrame:
+    """按时间升序排列的列式指标数据"""
+
+    def __init__(self, timestamps: array, columns: Dict[str, array]):
+        self.timestamps = timestamps
+        self.columns = columns
+        # 列名 -> 有效值前缀计数（长度 n + 1）
+        self._valid_prefix: Dict[str, array] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence]) -> "MetricFrame":
+        """
+        从数据库行构建（列顺序: timestamp, *FRAME_COLUMNS）
+
+        行必须已按时间升序排列。
+        """
+        transposed = list(zip(*rows))
+        if not transposed:
+            return cls(array("d"), {name: array("d") for name in FRAME_COLUMNS})
+
+        raw_timestamps = transposed[0]
+        if all(isinstance(v, float) for v in raw_timestamps):
+            timestamps = array("d", raw_timestamps)
+        else:
+            timestamps = array("d", map(to_epoch, raw_timestamps))
+        columns = {
+            name: array("d", [NAN if v is None else v for v in values])
+            for name, values in zip(FRAME_COLUMNS, transposed[1:])
+        }
+        return cls(timestamps, columns)
+
+    @classmethod
+    def from_metrics(cls, metrics) -> "MetricFrame":
+        """从 Metric 对象列表构建（兼容旧调用方）"""
+        rows = sorted(
+            ((m.timestamp, *(getattr(m, name) for name in FRAME_COLUMNS)) for m in metrics),
+            key=lambda row: to_epoch(row[0])
+        )
+        return cls.from_rows(rows)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def extend(self, other: "MetricFrame"):
+        """追加更新的行（other 的时间必须不早于本帧最后一行）"""
+        self.timestamps.extend(other.timestamps)
+        for name in FRAME_COLUMNS:
+            self.columns[name].extend(other.columns[name])
+        self._valid_prefix.clear()
+
+    def drop_before(self, start: float) -> int:
+        """丢弃早于 start 的行，返回丢弃的行数"""
+        lo, _ = self.index_range(start=start)
+        if lo:
+            del self.timestamps[:lo]
+            for values in self.columns.values():
+                del values[:lo]
+            self._valid_prefix.clear()
+        return lo
+
+    def tail(self, lo: int) -> "MetricFrame":
+        """复制第 lo 行之后的行为新帧"""
+        if lo == 0:
+            return self
+        return MetricFrame(
+            self.timestamps[lo:],
+            {name: values[lo:] for name, values in self.columns.items()}
+        )
+
+    def since(self, start: float) -> "MetricFrame":
+        """复制 start 之后的行为新帧"""
+        lo, _ = self.index_range(start=start)
+        return self.tail(lo)
+
+    def index_range(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[int, int]:
+        """时间窗口 [start, end] 对应的行区间 [lo, hi)"""
+        lo = 0 if start is None else bisect_left(self.timestamps, start)
+        hi = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+        return lo, max(lo, hi)
+
+    def _prefix(self, column: str) -> array:
+        prefix = self._valid_prefix.get(column)
+        if prefix is None:
+            prefix = array("l", [0])
+            count = 0
+            for value in self.columns[column]:
+                if value == value:  # 非 NaN
+                    count += 1
+                prefix.append(count)
+            self._valid_prefix[column] = prefix
+        return prefix
+
+    def count_valid(self, column: str, lo: int = 0, hi: Optional[int] = None) -> int:
+        """区间内某列的有效样本数"""
+        hi = len(self) if hi is None else hi
+        prefix = self._prefix(column)
+        return prefix[hi] - prefix[lo]
+
+    def iter_valid(self, *columns: str, lo: int = 0, hi: Optional[int] = None):
+        """遍历区间内各列同时有效的行，产出 (index, value1, value2, ...)"""
+        hi = len(self) if hi is None else hi
+        arrays = [self.columns[name] for name in columns]
+        for i in range(lo, hi):
+            values = [a[i] for a in arrays]
+            if all(v == v for v in values):
+                yield (i, *values)
+
+    def valid_values(self, column: str, lo: int = 0, hi: Optional[int] = None) -> List[float]:
+        """区间内某列的有效值"""
+        hi = len(self) if hi is None else hi
+        return [v for v in self.columns[column][lo:hi] if v == v]
+
+    def first_valid(self, column: str, lo: int = 0, hi: Optional[int] = None) -> Optional[int]:
+        """区间内第一个有效值的下标"""
+        hi = len(self) if hi is None else hi
+        values = self.columns[column]
+        for i in range(lo, hi):
+            if values[i] == values[i]:
+                return i
+        return None
+
+    def last_valid(self, column: str, lo: int = 0, hi: Optional[int] = None) -> Optional[int]:
+        """区间内最后一个有效值的下标"""
+        hi = len(self) if hi is None else hi
+        values = self.columns[column]
+        for i in range(hi - 1, lo - 1, -1):
+            if values[i] == values[i]:
+                return i
+        return None
+
+    def value(self, column: str, index: int) -> Optional[float]:
+        """读取单个值（NaN 返回 None）"""
+        value = self.columns[column][index]
+        return None if value != value else value
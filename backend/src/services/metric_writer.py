@@ -0,0 +1,275 @@
+"""指标写入队列（write-behind）
+
+断电期间每 10 秒就会产生一次采样，如果每条采样都单独
+SELECT 上一条记录 + INSERT + COMMIT，会带来大量 fsync。
+这里把采样先放进内存队列，按刷新间隔或批量大小合并成一次
+多行事务写入（同一事务内更新 rollup 表），并在内存中维护累计
+用电量，避免每次回查数据库。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from db.metric_store import INSERT_METRIC_SQL, decode_value, from_epoch_ms, metric_row, next_ts
+from db.rollups import build_rollup_operations
+from models import DEFAULT_UPS_ID, Metric
+
+logger = logging.getLogger(__name__)
+
+
+class MetricWriter:
+    """指标批量写入器
+
+    - 有界队列：超过 max_queue_size 时丢弃最旧的采样并计数
+    - 刷新策略：达到 batch_size 立即刷新，否则每 flush_interval 秒刷新一次
+    - 停止时保证把队列中剩余采样全部写入
+    """
+
+    def __init__(
+        self,
+        db,
+        flush_interval: float = 30.0,
+        batch_size: int = 50,
+        max_queue_size: int = 5000,
+        on_flush: Optional[Callable[[Set[str]], None]] = None,
+    ):
+        """
+        Args:
+            db: 数据库实例（需提供 execute_transaction / fetch_one）
+            flush_interval: 最长刷新间隔（秒）
+            batch_size: 队列达到该数量时立即刷新
+            max_queue_size: 队列上限，超出时丢弃最旧采样
+            on_flush: 写入成功后的回调，参数为本批涉及的 ups_id 集合
+        """
+        self.db = db
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue_size = max_queue_size
+
+        self._queue: Deque[Tuple[datetime, Metric, str, str]] = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+        # 累计用电量状态：(test_mode, ups_id) -> (上次采样时间 UTC, 累计 kWh)
+        self._energy_state: Dict[Tuple[str, str], Tuple[datetime, float]] = {}
+        # (test_mode, ups_id) -> 上一条写入的 ts（epoch 毫秒）
+        self._last_ts: Dict[Tuple[str, str], int] = {}
+
+        # 统计计数
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._flush_count = 0
+        self._flush_failures = 0
+        self._max_queue_depth = 0
+        self._last_flush_ms: Optional[float] = None
+        self._max_flush_ms: Optional[float] = None
+        self._total_flush_ms = 0.0
+        self._last_flush_at: Optional[datetime] = None
+
+    async def start(self):
+        """启动后台刷新任务"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(
+            f"Metric writer started (flush_interval={self.flush_interval}s, "
+            f"batch_size={self.batch_size}, max_queue_size={self.max_queue_size})"
+        )
+
+    async def stop(self):
+        """停止后台任务并写入剩余采样"""
+        self._running = False
+        if self._task:
+            # 不取消任务：取消可能落在 flush 中途，已取出的一批采样会丢失
+            self._wakeup.set()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"Metric writer stopped ({self._written} samples written, {self._dropped} dropped)")
+
+    def enqueue(self, metric: Metric, test_mode: str, ups_id: str = DEFAULT_UPS_ID):
+        """放入一条采样（不做任何 IO，立即返回）"""
+        if len(self._queue) >= self.max_queue_size:
+            self._queue.popleft()
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 100 == 0:
+                logger.warning(f"Metric queue full ({self.max_queue_size}), dropped {self._dropped} oldest samples")
+
+        sampled_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self._queue.append((sampled_at, metric, test_mode, ups_id))
+        self._enqueued += 1
+        self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def reset_energy_state(self):
+        """清空内存中的累计用电量（历史数据被清空后调用）"""
+        self._energy_state.clear()
+
+    def pending(self) -> int:
+        """队列中待写入的采样数"""
+        return len(self._queue)
+
+    async def flush(self) -> int:
+        """把当前队列中的采样合并为一次事务写入
+
+        Returns:
+            写入的采样数
+        """
+        async with self._flush_lock:
+            if not self._queue:
+                return 0
+
+            batch = list(self._queue)
+            self._queue.clear()
+
+            start = time.perf_counter()
+            try:
+                rows = []
+                samples = []
+                # 能量和时间戳状态在副本上计算，事务提交后才生效
+                energy_state = dict(self._energy_state)
+                last_ts = dict(self._last_ts)
+                for sampled_at, metric, test_mode, ups_id in batch:
+                    energy_kwh = await self._accumulate_energy(energy_state, sampled_at, metric, test_mode, ups_id)
+                    sample = {
+                        "timestamp": sampled_at,
+                        "battery_charge": metric.battery_charge,
+                        "battery_runtime": metric.battery_runtime,
+                        "input_voltage": metric.input_voltage,
+                        "output_voltage": metric.output_voltage,
+                        "load_percent": metric.load_percent,
+                        "temperature": metric.temperature,
+                        "power_watts": metric.power_watts,
+                        "energy_kwh": energy_kwh,
+                    }
+                    ts = next_ts(last_ts, sampled_at, test_mode, ups_id)
+                    rows.append(metric_row(ts, sample, test_mode, ups_id))
+                    samples.append((sample, test_mode, ups_id))
+
+                # 原始采样与各层级 rollup 在同一事务中写入
+                await self.db.execute_transaction(
+                    [(INSERT_METRIC_SQL, rows)] + build_rollup_operations(samples)
+                )
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except Exception as e:
+                self._flush_failures += 1
+                self._requeue(batch)
+                logger.error(f"Failed to flush {len(batch)} metric samples: {e}")
+                return 0
+
+            self._energy_state = energy_state
+            self._last_ts = last_ts
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._written += len(batch)
+            self._flush_count += 1
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms or 0.0, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            self._last_flush_at = datetime.now()
+            logger.debug(f"Flushed {len(batch)} metric samples in {elapsed_ms:.2f}ms")
+            if self.on_flush:
+                try:
+                    self.on_flush({item[3] for item in batch})
+                except Exception as e:
+                    logger.error(f"Error in metric flush callback: {e}")
+            return len(batch)
+
+    def _requeue(self, batch: List[Tuple[datetime, Metric, str, str]]):
+        """未写入的采样放回队列头部，下次再试（仍受队列上限约束）"""
+        room = self.max_queue_size - len(self._queue)
+        if room > 0:
+            self._queue.extendleft(reversed(batch[-room:]))
+        self._dropped += max(0, len(batch) - max(room, 0))
+
+    async def _accumulate_energy(
+        self,
+        energy_state: Dict[Tuple[str, str], Tuple[datetime, float]],
+        sampled_at: datetime,
+        metric: Metric,
+        test_mode: str,
+        ups_id: str = DEFAULT_UPS_ID,
+    ) -> Optional[float]:
+        """计算累计用电量: 上一条采样的 energy_kwh + 本次采样间隔的用电量"""
+        key = (test_mode, ups_id)
+        if metric.energy_kwh is not None:
+            energy_state[key] = (sampled_at, metric.energy_kwh)
+            return metric.energy_kwh
+        if metric.power_watts is None:
+            return None
+
+        if key not in energy_state:
+            # 首次写入该模式 / UPS 时从数据库取一次最新值作为起点
+            try:
+                row = await self.db.fetch_one(
+                    "SELECT ts, energy_kwh FROM metrics WHERE test_mode = ? AND ups_id = ? "
+                    "AND energy_kwh IS NOT NULL ORDER BY ts DESC LIMIT 1",
+                    (test_mode, ups_id)
+                )
+                if row and row[1] is not None:
+                    energy_state[key] = (from_epoch_ms(row[0]), decode_value("energy_kwh", row[1]))
+            except Exception as e:
+                logger.debug(f"Failed to load last energy_kwh for {test_mode}/{ups_id}: {e}")
+
+        previous = energy_state.get(key)
+        if previous is None:
+            # 首条记录
+            energy_kwh = 0.0
+        else:
+            prev_time, prev_energy = previous
+            dt_hours = (sampled_at - prev_time).total_seconds() / 3600
+            if 0 < dt_hours < 24:  # 防止异常数据
+                energy_kwh = prev_energy + (metric.power_watts * dt_hours / 1000)
+            else:
+                energy_kwh = prev_energy
+
+        energy_state[key] = (sampled_at, energy_kwh)
+        return energy_kwh
+
+    async def _flush_loop(self):
+        """后台刷新循环"""
+        while self._running:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in metric flush loop: {e}")
+                await asyncio.sleep(1)
+
+    def get_stats(self) -> dict:
+        """获取写入队列统计"""
+        return {
+            "running": self._running,
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self._max_queue_depth,
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self._enqueued,
+            "written": self._written,
+            "dropped": self._dropped,
+            "flush_count": self._flush_count,
+            "flush_failures": self._flush_failures,
+            "last_flush_ms": round(self._last_flush_ms, 2) if self._last_flush_ms is not None else None,
+            "avg_flush_ms": round(self._total_flush_ms / self._flush_count, 2) if self._flush_count else None,
+            "max_flush_ms": round(self._max_flush_ms, 2) if self._max_flush_ms is not None else None,
+            "last_flush_at": self._last_flush_at.isoformat() if self._last_flush_at else None,
+        }
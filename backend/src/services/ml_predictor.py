@@ -1,17 +1,42 @@
-"""机器学习预测服务 - 使用轻量级统计分析方法"""
+"""机器学习预测服务 - 使用轻量级统计分析方法
+
+指标数据以列式 MetricFrame 传入（兼容 Metric 列表），
+停电窗口通过二分查找切片，统计量在 float 数组上单遍计算。
+"""
 import logging
+from itertools import islice
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, NamedTuple, Union
 from models import Event, Metric, EventType
+from services.metric_frame import MetricFrame, mean_std, to_epoch
 
 logger = logging.getLogger(__name__)
 
+# 参与异常检测的信号
+ANOMALY_SIGNALS = ('input_voltage', 'output_voltage', 'load_percent', 'temperature')
+
+
+class SignalStats(NamedTuple):
+    """单个信号在检测窗口内的统计量"""
+    count: int
+    mean: float
+    std: float
+    recent: Optional[float]
+    previous: Optional[float]
+
 
 class MLPredictor:
     """轻量级机器学习预测器，基于统计分析"""
     
     def __init__(self):
         self.min_samples_for_prediction = 5  # 最少需要的样本数
+
+    @staticmethod
+    def _as_frame(metrics: Union[MetricFrame, List[Metric]]) -> MetricFrame:
+        """统一转换为列式帧"""
+        if isinstance(metrics, MetricFrame):
+            return metrics
+        return MetricFrame.from_metrics(metrics or [])
     
     async def predict_outage_duration(
         self, 
@@ -78,7 +103,7 @@ class MLPredictor:
     
     async def assess_battery_health(
         self, 
-        metrics: List[Metric],
+        metrics: Union[MetricFrame, List[Metric]],
         events: List[Event]
     ) -> Optional[Dict[str, Any]]:
         """
@@ -86,7 +111,8 @@ class MLPredictor:
         基于断电后的电池放电速率
         对比不同时期的放电速率变化趋势
         """
-        if not metrics or not events:
+        frame = self._as_frame(metrics)
+        if not len(frame) or not events:
             return {
                 'available': False,
                 'message': '数据不足，需要更多历史数据'
@@ -100,18 +126,16 @@ class MLPredictor:
             if event.event_type == EventType.POWER_LOST:
                 power_lost_time = event.timestamp
             elif event.event_type == EventType.POWER_RESTORED and power_lost_time:
-                # 提取这段时间的指标
-                period_metrics = [
-                    m for m in metrics 
-                    if power_lost_time <= m.timestamp <= event.timestamp
-                    and m.battery_charge is not None
-                ]
-                
-                if len(period_metrics) >= 2:
+                # 二分定位这段时间的指标
+                lo, hi = frame.index_range(to_epoch(power_lost_time), to_epoch(event.timestamp))
+                if frame.count_valid('battery_charge', lo, hi) >= 2:
                     # 计算放电速率（%/小时）
                     duration_hours = (event.timestamp - power_lost_time).total_seconds() / 3600
                     if duration_hours > 0:
-                        charge_drop = period_metrics[0].battery_charge - period_metrics[-1].battery_charge
+                        charge = frame.columns['battery_charge']
+                        first = frame.first_valid('battery_charge', lo, hi)
+                        last = frame.last_valid('battery_charge', lo, hi)
+                        charge_drop = charge[first] - charge[last]
                         discharge_rate = charge_drop / duration_hours
                         
                         discharge_periods.append({
@@ -176,7 +200,7 @@ class MLPredictor:
         self,
         current_battery_charge: Optional[float],
         current_load: Optional[float],
-        metrics: List[Metric],
+        metrics: Union[MetricFrame, List[Metric]],
         events: List[Event]
     ) -> Optional[Dict[str, Any]]:
         """
@@ -197,29 +221,20 @@ class MLPredictor:
                 'message': '电池电量已耗尽'
             }
         
-        # 找到最近的断电期间的放电数据
-        power_lost_time = None
-        recent_discharge_metrics = []
+        frame = self._as_frame(metrics)
+        
+        # 找到最近的断电期间的放电数据（断电时刻之后的电量、负载同时有效的采样）
+        discharge_start = None
         
         for event in sorted(events, key=lambda e: e.timestamp, reverse=True):
-            if event.event_type == EventType.POWER_RESTORED:
-                power_lost_time = None
-            elif event.event_type == EventType.POWER_LOST:
-                power_lost_time = event.timestamp
-                
-                # 获取这次断电期间的指标
-                discharge_metrics = [
-                    m for m in metrics 
-                    if m.timestamp >= power_lost_time
-                    and m.battery_charge is not None
-                    and m.load_percent is not None
-                ]
-                
-                if len(discharge_metrics) >= 3:
-                    recent_discharge_metrics = discharge_metrics
+            if event.event_type == EventType.POWER_LOST:
+                lo, _ = frame.index_range(start=to_epoch(event.timestamp))
+                valid = frame.iter_valid('battery_charge', 'load_percent', lo=lo)
+                if sum(1 for _ in islice(valid, 3)) >= 3:
+                    discharge_start = lo
                     break
         
-        if len(recent_discharge_metrics) < 3:
+        if discharge_start is None:
             # 使用简单估算：假设线性放电
             # 典型 UPS 在 100% 负载下约 10-30 分钟
             estimated_full_runtime = 20  # 默认估算值（分钟）
@@ -244,21 +259,25 @@ class MLPredictor:
         # 计算平均放电速率（考虑负载）
         total_rate = 0
         count = 0
-        
-        for i in range(len(recent_discharge_metrics) - 1):
-            current_m = recent_discharge_metrics[i]
-            next_m = recent_discharge_metrics[i + 1]
-            
-            time_diff = (next_m.timestamp - current_m.timestamp).total_seconds() / 3600  # 小时
-            if time_diff > 0:
-                charge_diff = current_m.battery_charge - next_m.battery_charge
-                avg_load = (current_m.load_percent + next_m.load_percent) / 2
-                
-                if avg_load > 0:
-                    # 放电速率（%/小时），归一化到100%负载
-                    normalized_rate = (charge_diff / time_diff) * (100 / avg_load)
-                    total_rate += normalized_rate
-                    count += 1
+        sample_count = 0
+        timestamps = frame.timestamps
+        previous = None
+        
+        for i, charge, load in frame.iter_valid('battery_charge', 'load_percent', lo=discharge_start):
+            sample_count += 1
+            if previous is not None:
+                prev_i, prev_charge, prev_load = previous
+                time_diff = (timestamps[i] - timestamps[prev_i]) / 3600  # 小时
+                if time_diff > 0:
+                    charge_diff = prev_charge - charge
+                    avg_load = (prev_load + load) / 2
+                    
+                    if avg_load > 0:
+                        # 放电速率（%/小时），归一化到100%负载
+                        normalized_rate = (charge_diff / time_diff) * (100 / avg_load)
+                        total_rate += normalized_rate
+                        count += 1
+            previous = (i, charge, load)
         
         if count == 0:
             return {
@@ -286,93 +305,85 @@ class MLPredictor:
             'predicted_runtime_minutes': int(min(predicted_minutes, 999)),
             'confidence': 'high',
             'discharge_rate_per_hour': round(actual_rate, 2),
-            'sample_count': len(recent_discharge_metrics),
+            'sample_count': sample_count,
             'method': 'historical_data'
         }
     
     async def detect_anomalies(
         self,
-        metrics: List[Metric]
+        metrics: Union[MetricFrame, List[Metric]]
     ) -> Dict[str, Any]:
         """
         异常检测
         基于历史数据的统计分布（均值 ± 3σ）
         检测电压异常、负载突变等
         """
-        if len(metrics) < 10:
+        frame = self._as_frame(metrics)
+        stats = {}
+        for signal in ANOMALY_SIGNALS:
+            values = frame.valid_values(signal)
+            mean, std = mean_std(values)
+            stats[signal] = SignalStats(
+                count=len(values),
+                mean=mean,
+                std=std,
+                recent=values[-1] if values else None,
+                previous=values[-2] if len(values) >= 2 else None,
+            )
+        return self.build_anomaly_report(stats, len(frame))
+
+    def build_anomaly_report(self, stats: Dict[str, SignalStats], sample_count: int) -> Dict[str, Any]:
+        """
+        根据各信号的统计量生成异常报告
+
+        统计量既可以从完整窗口计算（detect_anomalies），
+        也可以由预测缓存增量维护。
+        """
+        if sample_count < 10:
             return {
                 'available': False,
                 'message': '数据不足，需要至少10个指标样本',
-                'current_samples': len(metrics)
+                'current_samples': sample_count
             }
         
         anomalies = []
         
-        # 计算各指标的统计特征
-        def calc_stats(values: List[float]) -> Tuple[float, float]:
-            """计算均值和标准差"""
-            if not values:
-                return 0, 0
-            mean = sum(values) / len(values)
-            variance = sum((x - mean) ** 2 for x in values) / len(values)
-            std = variance ** 0.5
-            return mean, std
-        
-        # 输入电压异常检测
-        input_voltages = [m.input_voltage for m in metrics if m.input_voltage is not None]
-        if len(input_voltages) >= 10:
-            mean, std = calc_stats(input_voltages)
-            recent_voltage = input_voltages[-1]
-            
-            if abs(recent_voltage - mean) > 3 * std:
-                severity = 'high' if abs(recent_voltage - mean) > 4 * std else 'medium'
-                anomalies.append({
-                    'type': 'input_voltage',
-                    'severity': severity,
-                    'message': f'输入电压异常: {recent_voltage:.1f}V (正常范围: {mean-3*std:.1f}-{mean+3*std:.1f}V)',
-                    'current_value': recent_voltage,
-                    'expected_range': [mean - 3 * std, mean + 3 * std]
-                })
+        # 输入 / 输出电压异常检测
+        for signal, label in (('input_voltage', '输入电压'), ('output_voltage', '输出电压')):
+            stat = stats.get(signal)
+            if stat and stat.count >= 10:
+                mean, std = stat.mean, stat.std
+                recent_voltage = stat.recent
+                
+                if abs(recent_voltage - mean) > 3 * std:
+                    severity = 'high' if abs(recent_voltage - mean) > 4 * std else 'medium'
+                    anomalies.append({
+                        'type': signal,
+                        'severity': severity,
+                        'message': f'{label}异常: {recent_voltage:.1f}V (正常范围: {mean-3*std:.1f}-{mean+3*std:.1f}V)',
+                        'current_value': recent_voltage,
+                        'expected_range': [mean - 3 * std, mean + 3 * std]
+                    })
         
-        # 输出电压异常检测
-        output_voltages = [m.output_voltage for m in metrics if m.output_voltage is not None]
-        if len(output_voltages) >= 10:
-            mean, std = calc_stats(output_voltages)
-            recent_voltage = output_voltages[-1]
-            
-            if abs(recent_voltage - mean) > 3 * std:
-                severity = 'high' if abs(recent_voltage - mean) > 4 * std else 'medium'
+        # 负载突变检测（与前一个值相比）
+        stat = stats.get('load_percent')
+        if stat and stat.count >= 10:
+            recent_load = stat.recent
+            load_change = abs(recent_load - stat.previous)
+            if load_change > 20:  # 负载变化超过20%
                 anomalies.append({
-                    'type': 'output_voltage',
-                    'severity': severity,
-                    'message': f'输出电压异常: {recent_voltage:.1f}V (正常范围: {mean-3*std:.1f}-{mean+3*std:.1f}V)',
-                    'current_value': recent_voltage,
-                    'expected_range': [mean - 3 * std, mean + 3 * std]
+                    'type': 'load_change',
+                    'severity': 'medium',
+                    'message': f'负载突变: {load_change:.1f}% (从 {stat.previous:.1f}% 到 {recent_load:.1f}%)',
+                    'current_value': recent_load,
+                    'change': load_change
                 })
         
-        # 负载突变检测
-        loads = [m.load_percent for m in metrics if m.load_percent is not None]
-        if len(loads) >= 10:
-            mean, std = calc_stats(loads)
-            recent_load = loads[-1]
-            
-            # 检测负载突变（与前一个值相比）
-            if len(loads) >= 2:
-                load_change = abs(recent_load - loads[-2])
-                if load_change > 20:  # 负载变化超过20%
-                    anomalies.append({
-                        'type': 'load_change',
-                        'severity': 'medium',
-                        'message': f'负载突变: {load_change:.1f}% (从 {loads[-2]:.1f}% 到 {recent_load:.1f}%)',
-                        'current_value': recent_load,
-                        'change': load_change
-                    })
-        
         # 温度异常检测
-        temperatures = [m.temperature for m in metrics if m.temperature is not None]
-        if len(temperatures) >= 10:
-            mean, std = calc_stats(temperatures)
-            recent_temp = temperatures[-1]
+        stat = stats.get('temperature')
+        if stat and stat.count >= 10:
+            mean, std = stat.mean, stat.std
+            recent_temp = stat.recent
             
             # 温度过高警告
             if recent_temp > 45:  # 超过45°C
@@ -396,7 +407,7 @@ class MLPredictor:
             'available': True,
             'anomaly_count': len(anomalies),
             'anomalies': anomalies,
-            'sample_count': len(metrics),
+            'sample_count': sample_count,
             'has_critical': any(a['severity'] == 'high' for a in anomalies)
         }
 
@@ -2,12 +2,15 @@
 import asyncio
 import logging
 from datetime import datetime
-from typing import Optional, Callable
-from models import UpsStatus, UpsData, EventType, Metric
+from typing import Iterable, Optional, Callable
+from models import DEFAULT_UPS_ID, UpsStatus, UpsData, EventType, Metric
 from services.nut_client import NutClientInterface
 from services.shutdown_manager import ShutdownManager
 from services.history import get_history_service
 from services.notifier import get_notifier_service
+from services.var_catalog import VariableCatalog
+from services.anomaly_detector import OnlineAnomalyDetector
+from services.ssh_pool import get_ssh_pool
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,10 @@ class UpsMonitor:
         shutdown_manager: ShutdownManager,
         poll_interval: int = 5,
         sample_interval: int = 60,
-        config = None
+        config = None,
+        ups_id: str = DEFAULT_UPS_ID,
+        shutdown_enabled: bool = True,
+        config_overrides: Iterable[str] = ()
     ):
         """
         初始化监控器
@@ -32,9 +38,15 @@ class UpsMonitor:
             poll_interval: 状态轮询间隔（秒）
             sample_interval: 指标采样间隔（秒）
             config: 系统配置对象
+            ups_id: UPS 标识（多 UPS 监控时区分数据来源）
+            shutdown_enabled: 该 UPS 断电时是否触发关机流程
+            config_overrides: 该 UPS 单独配置的关机策略项，全局配置变更时不覆盖
         """
         self.nut_client = nut_client
         self.shutdown_manager = shutdown_manager
+        self.ups_id = ups_id
+        self.shutdown_enabled = shutdown_enabled
+        self.config_overrides = frozenset(config_overrides)
         self.poll_interval = poll_interval
         self.sample_interval = sample_interval
         self.config = config
@@ -43,6 +55,7 @@ class UpsMonitor:
         self._current_data: Optional[UpsData] = None
         self._monitor_task: Optional[asyncio.Task] = None
         self._sample_task: Optional[asyncio.Task] = None
+        self._prewarm_task: Optional[asyncio.Task] = None  # 断电时预建 SSH 连接
         self._running = False
         self._last_sample_time = datetime.now()
         self._connection_notified = False  # 跟踪是否已通知连接断开
@@ -57,6 +70,7 @@ class UpsMonitor:
         # 事件驱动相关
         self._event_driven_client = None
         self._event_mode_active = False
+        self._event_poll_backoff = True  # 事件模式下是否改用较长的备份轮询间隔
         self._communication_count_today = 0
         self._last_update_time: Optional[datetime] = None
         self._start_time = datetime.now()
@@ -74,7 +88,36 @@ class UpsMonitor:
         # 智能采样间隔
         self._sample_interval_normal = 300  # 正常状态：5分钟
         self._sample_interval_active = 10   # 活跃状态（断电/变化）：10秒
+
+        # 变量目录：热变量每次读取，静态变量长 TTL
+        self.var_catalog = VariableCatalog()
+
+        # 在线异常检测：每个样本 O(1) 更新统计量
+        self.anomaly_detector = OnlineAnomalyDetector()
     
+    def apply_config(self, change):
+        """配置变更订阅回调：同步配置引用，只热更新变化的轮询/采样间隔"""
+        self.config = change.config  # 同步 monitoring_mode, event_driven_* 等
+        updated = []
+        if change.touches("poll_interval_seconds"):
+            self.poll_interval = change.config.poll_interval_seconds
+            updated.append(f"poll_interval={self.poll_interval}s")
+        if change.touches("sample_interval_seconds"):
+            self.sample_interval = change.config.sample_interval_seconds
+            updated.append(f"sample_interval={self.sample_interval}s")
+        if updated:
+            logger.info(f"UpsMonitor hot-reloaded: {', '.join(updated)}")
+        self.shutdown_manager.apply_config(change.without(self.config_overrides))
+
+    @property
+    def is_primary(self) -> bool:
+        """是否为主 UPS（单机部署时唯一的 UPS）"""
+        return self.ups_id == DEFAULT_UPS_ID
+
+    def _unit_title(self, title: str) -> str:
+        """附加 UPS 的通知标题带上 UPS 标识"""
+        return title if self.is_primary else f"[{self.ups_id}] {title}"
+
     def add_status_callback(self, callback: Callable[[UpsData], None]):
         """添加状态变化回调"""
         self._status_callbacks.append(callback)
@@ -152,11 +195,12 @@ class UpsMonitor:
                         "load_percent": data.load_percent,
                         "ups_status": data.status.value if data.status else None,
                         "trigger": "startup_detection"
-                    }
+                    },
+                    ups_id=self.ups_id
                 )
                 await notifier_service.notify(
                     EventType.POWER_LOST,
-                    "UPS 处于电池供电状态",
+                    self._unit_title("UPS 处于电池供电状态"),
                     f"服务启动时检测到 UPS 正在使用电池供电，当前电量：{data.battery_charge}%",
                     metadata=self._build_notification_metadata(data, "启动检测到电池供电")
                 )
@@ -174,11 +218,12 @@ class UpsMonitor:
                         "load_percent": data.load_percent,
                         "ups_status": data.status.value if data.status else None,
                         "trigger": "startup_detection"
-                    }
+                    },
+                    ups_id=self.ups_id
                 )
                 await notifier_service.notify(
                     EventType.LOW_BATTERY,
-                    "UPS 电池电量过低",
+                    self._unit_title("UPS 电池电量过低"),
                     f"服务启动时检测到 UPS 电池电量过低：{data.battery_charge}%，请立即检查！",
                     metadata=self._build_notification_metadata(data, "启动检测到低电量")
                 )
@@ -191,7 +236,8 @@ class UpsMonitor:
                     metadata={
                         "ups_status": "offline",
                         "trigger": "startup_detection"
-                    }
+                    },
+                    ups_id=self.ups_id
                 )
         except Exception as e:
             logger.error(f"Error checking initial status: {e}")
@@ -222,36 +268,33 @@ class UpsMonitor:
             await history_service.add_event(
                 EventType.NUT_DISCONNECTED,
                 "NUT 服务器连接断开，正在尝试重新连接...",
-                metadata=metadata
+                metadata=metadata,
+                ups_id=self.ups_id
             )
             await notifier_service.notify(
                 EventType.NUT_DISCONNECTED,
-                "NUT 连接断开",
+                self._unit_title("NUT 连接断开"),
                 "UPS Guard 与 NUT 服务器的连接已断开，正在尝试自动重新连接。",
                 metadata=metadata
             )
 
             # 通过 WebSocket 广播连接状态变化，让前端实时感知
             try:
-                from api.websocket import broadcast_event, manager
+                from api.websocket import broadcast_event, broadcast_offline_status
                 logger.info("Broadcasting NUT_DISCONNECTED event to WebSocket clients...")
                 await broadcast_event(
                     "NUT_DISCONNECTED",
                     "NUT 服务器连接断开",
-                    {"status": "disconnected", "reason": "connection_lost"}
+                    {"status": "disconnected", "reason": "connection_lost", "ups_id": self.ups_id}
                 )
                 logger.info("NUT_DISCONNECTED event broadcast completed")
 
                 # 同时推送一个状态更新，将 status 设为 offline，确保前端 wsData 更新
                 logger.info("Broadcasting offline status update...")
-                await manager.broadcast({
-                    "type": "status_update",
-                    "data": {
-                        "status": "offline",
-                        "last_update": None,
-                        "shutdown": self.shutdown_manager.get_status() if self.shutdown_manager else {}
-                    }
-                })
+                await broadcast_offline_status(
+                    self.ups_id,
+                    self.shutdown_manager.get_status() if self.shutdown_manager else {}
+                )
                 logger.info("Offline status update broadcast completed")
             except Exception as e:
                 logger.error(f"Failed to broadcast connection lost event: {e}")
@@ -284,11 +327,12 @@ class UpsMonitor:
             await history_service.add_event(
                 EventType.NUT_RECONNECTED,
                 "NUT 服务器连接已恢复",
-                metadata=metadata
+                metadata=metadata,
+                ups_id=self.ups_id
             )
             await notifier_service.notify(
                 EventType.NUT_RECONNECTED,
-                "NUT 连接恢复",
+                self._unit_title("NUT 连接恢复"),
                 "UPS Guard 已成功重新连接到 NUT 服务器。",
                 metadata=metadata
             )
@@ -300,7 +344,7 @@ class UpsMonitor:
                 await broadcast_event(
                     "NUT_RECONNECTED",
                     "NUT 服务器连接已恢复",
-                    {"status": "connected", "reason": "reconnection_successful"}
+                    {"status": "connected", "reason": "reconnection_successful", "ups_id": self.ups_id}
                 )
                 logger.info("NUT_RECONNECTED event broadcast completed")
             except Exception as e:
@@ -322,6 +366,14 @@ class UpsMonitor:
                 await self._monitor_task
             except asyncio.CancelledError:
                 pass
+
+        if self._prewarm_task:
+            self._prewarm_task.cancel()
+            try:
+                await self._prewarm_task
+            except asyncio.CancelledError:
+                pass
+            self._prewarm_task = None
         
         # 持久化最终统计
         await self._persist_daily_stats()
@@ -332,6 +384,8 @@ class UpsMonitor:
     async def force_update(self):
         """强制立即更新状态并广播（用于 Mock API 调用后立即响应）"""
         try:
+            # 命令或参数修改后完整刷新变量
+            self.var_catalog.invalidate("force update")
             data = await self._read_ups_data()
 
             if data:
@@ -382,8 +436,8 @@ class UpsMonitor:
                             await self._persist_daily_stats()
                         
                         # 根据模式调整轮询间隔
-                        if not self._event_mode_active:
-                            # 纯轮询模式或事件驱动失败
+                        if not self._event_mode_active or not self._event_poll_backoff:
+                            # 纯轮询模式、事件驱动失败，或事件不覆盖数值变化
                             poll_interval = self.poll_interval
                         else:
                             # 事件驱动模式下，使用较长的轮询间隔作为备份
@@ -423,6 +477,7 @@ class UpsMonitor:
                                 try:
                                     reconnected = await self.nut_client._reconnect()
                                     if reconnected:
+                                        self.var_catalog.invalidate("reconnected")
                                         # 验证连接：立即读取数据
                                         verify_data = await self._read_ups_data()
                                         if verify_data:
@@ -468,7 +523,7 @@ class UpsMonitor:
         start_time = datetime.now()
         
         try:
-            vars_dict = await self.nut_client.list_vars()
+            vars_dict = await self.var_catalog.read(self.nut_client)
             
             if not vars_dict:
                 logger.debug("_read_ups_data: vars_dict is empty, returning None")
@@ -595,6 +650,7 @@ class UpsMonitor:
                 ups_alarm_del=vars_dict.get("ups.alarm.delay"),
                 ups_starttime=vars_dict.get("ups.starttime"),
                 ups_backend=self.config.ups_backend if self.config and hasattr(self.config, 'ups_backend') else "nut",
+                ups_id=self.ups_id,
                 last_update=datetime.now()
             )
 
@@ -851,6 +907,7 @@ class UpsMonitor:
             元数据字典
         """
         metadata = {
+            "ups_id": self.ups_id,
             "ups_status": data.status.value if data else None,
             "battery_charge": data.battery_charge if data else None,
             "battery_runtime": data.battery_runtime if data else None,
@@ -903,27 +960,37 @@ class UpsMonitor:
                 await history_service.add_event(
                     EventType.POWER_LOST,
                     "检测到市电断电，UPS 切换到电池供电",
-                    metadata={**ups_metadata, "trigger": "status_change"}
+                    metadata={**ups_metadata, "trigger": "status_change"},
+                    ups_id=self.ups_id
                 )
                 await notifier_service.notify(
                     EventType.POWER_LOST,
-                    "UPS 市电断电",
+                    self._unit_title("UPS 市电断电"),
                     f"UPS 已切换到电池供电，当前电量：{data.battery_charge}%",
                     metadata=self._build_notification_metadata(data, "市电断电")
                 )
+
+                # 预先建立关机任务的 SSH 连接（不阻塞主流程）
+                if self.shutdown_enabled and (self._prewarm_task is None or self._prewarm_task.done()):
+                    self._prewarm_task = asyncio.create_task(self._prewarm_ssh_sessions())
             
             elif new_status == UpsStatus.ONLINE and old_status in [UpsStatus.ON_BATTERY, UpsStatus.LOW_BATTERY]:
                 # 市电恢复
                 await history_service.add_event(
                     EventType.POWER_RESTORED,
                     "市电已恢复",
-                    metadata={**ups_metadata, "trigger": "status_change"}
+                    metadata={**ups_metadata, "trigger": "status_change"},
+                    ups_id=self.ups_id
                 )
                 await notifier_service.notify(
                     EventType.POWER_RESTORED,
-                    "UPS 市电恢复",
+                    self._unit_title("UPS 市电恢复"),
                     "市电已恢复正常供电"
                 )
+
+                # 预热的 SSH 连接不再需要保持
+                if self.shutdown_enabled:
+                    get_ssh_pool().release_pins()
                 
                 # 来电后自动发送 WOL（如果启用）
                 try:
@@ -933,7 +1000,8 @@ class UpsMonitor:
                     config_manager = await get_config_manager()
                     config = await config_manager.get_config()
                     
-                    if config.wol_on_power_restore:
+                    # WOL 目标属于主 UPS 保护的设备，附加 UPS 不触发
+                    if config.wol_on_power_restore and self.is_primary:
 
                         # 异步启动 WOL 任务（不阻塞主流程）
                         # 传入 monitor 实例以便检查电压稳定性
@@ -941,7 +1009,7 @@ class UpsMonitor:
                             send_wol_to_devices(
                                 config.pre_shutdown_hooks,
                                 delay_seconds=config.wol_delay_seconds,
-                                monitor=monitor,  # 传入 monitor 实例
+                                monitor=self,  # 传入 monitor 实例
                                 check_voltage_stability=True
                             )
                         )
@@ -958,19 +1026,43 @@ class UpsMonitor:
                 await history_service.add_event(
                     EventType.LOW_BATTERY,
                     f"UPS 电池电量过低：{data.battery_charge}%{runtime_info}",
-                    metadata={**ups_metadata, "trigger": "status_change"}
+                    metadata={**ups_metadata, "trigger": "status_change"},
+                    ups_id=self.ups_id
                 )
                 await notifier_service.notify(
                     EventType.LOW_BATTERY,
-                    "UPS 电池电量过低",
+                    self._unit_title("UPS 电池电量过低"),
                     f"当前电量：{data.battery_charge}%{runtime_info}",
                     metadata=self._build_notification_metadata(data, f"电池电量低于阈值 ({data.battery_charge}%)")
                 )
         except Exception as e:
             logger.error(f"Error in _on_status_changed: {e}", exc_info=True)
     
+    async def _prewarm_ssh_sessions(self):
+        """按关机前置任务配置预先建立 SSH 连接"""
+        try:
+            from config import get_config_manager
+            from hooks.registry import get_registry
+            from services.ssh_pool import ssh_hook_configs
+
+            if get_registry().mock_mode:
+                return
+            config_manager = await get_config_manager()
+            config = await config_manager.get_config()
+            configs = ssh_hook_configs(config.pre_shutdown_hooks)
+            if not configs:
+                return
+            ready = await get_ssh_pool().prewarm(configs)
+            logger.info(f"Prewarmed SSH sessions: {ready}/{len(configs)} hosts ready")
+        except Exception as e:
+            logger.error(f"Failed to prewarm SSH sessions: {e}")
+
     async def _handle_status(self, data: UpsData):
         """根据状态执行相应操作"""
+        if not self.shutdown_enabled:
+            # 仅监控的 UPS 不参与关机流程
+            return
+
         if data.status == UpsStatus.ONLINE:
             # 在线状态，如果之前有关机计划，取消它
             self.shutdown_manager.on_power_restored()
@@ -1021,7 +1113,7 @@ class UpsMonitor:
                 power_watts=power_watts
             )
             
-            await history_service.add_metric(metric)
+            await history_service.add_metric(metric, ups_id=self.ups_id)
             logger.debug(f"Metric sample recorded: charge={data.battery_charge}%, runtime={data.battery_runtime}s")
         except Exception as e:
             logger.error(f"Failed to record metric sample: {e}", exc_info=True)
@@ -1036,14 +1128,32 @@ class UpsMonitor:
             
         try:
             # 动态导入避免循环依赖
+            from services.apcupsd_client import ApcupsdClient
             from services.nut_client import EventDrivenNutClient
-            
+
+            if isinstance(self.nut_client, ApcupsdClient):
+                # apcupsd 没有 LISTEN，由客户端读取事件日志；事件日志只记录断电、
+                # 恢复等状态变化，电量等数值仍按正常间隔轮询
+                self._event_poll_backoff = False
+                self._event_mode_active = await self.nut_client.start_listen(
+                    "ups", self._on_event_data_changed
+                )
+                if self._event_mode_active:
+                    self._event_driven_client = self.nut_client
+                    logger.info("apcupsd event listening activated")
+                else:
+                    logger.info("apcupsd events not available, falling back to polling")
+                return
+
+            self._event_poll_backoff = True
             self._event_driven_client = EventDrivenNutClient(
                 host=self.nut_client.host,
                 port=self.nut_client.port,
                 username=self.nut_client.username,
                 password=self.nut_client.password,
-                ups_name=self.nut_client.ups_name
+                ups_name=self.nut_client.ups_name,
+                # 使用主连接已确定的 UPS 名称，避免多 UPS 时发现到其他设备
+                discover_ups=False
             )
             
             success = await self._event_driven_client.start_listen(
@@ -1065,6 +1175,7 @@ class UpsMonitor:
     async def _on_event_data_changed(self):
         """事件驱动模式下的数据变化回调"""
         try:
+            self.var_catalog.invalidate("DATACHANGED")
             ups_data = await self._read_ups_data()
             if ups_data:
                 await self._process_ups_data(ups_data)
@@ -1092,6 +1203,9 @@ class UpsMonitor:
         # 根据状态执行相应操作
         await self._handle_status(data)
         
+        # 在线异常检测（每个样本都参与统计，不受采样间隔影响）
+        await self._detect_anomalies(data)
+        
         # 定期采样指标（根据 UPS 状态动态调整间隔）
         now = datetime.now()
         dynamic_interval = self._get_dynamic_sample_interval()
@@ -1106,8 +1220,39 @@ class UpsMonitor:
             except Exception as e:
                 logger.error(f"Error in status callback: {e}")
     
+    async def _detect_anomalies(self, data: UpsData):
+        """在线异常检测，确认的异常写入事件并推送给前端"""
+        try:
+            anomalies = self.anomaly_detector.observe(data)
+        except Exception as e:
+            logger.error(f"Anomaly detection failed: {e}")
+            return
+
+        for anomaly in anomalies:
+            metadata = {**anomaly, "ups_id": self.ups_id}
+            logger.warning(f"Anomaly detected on {self.ups_id}: {anomaly['message']}")
+            try:
+                history_service = await get_history_service()
+                await history_service.add_event(
+                    EventType.ANOMALY_DETECTED,
+                    anomaly["message"],
+                    metadata=metadata,
+                    ups_id=self.ups_id
+                )
+            except Exception as e:
+                logger.error(f"Failed to record ANOMALY_DETECTED event: {e}")
+
+            try:
+                from api.websocket import broadcast_event
+                await broadcast_event("ANOMALY_DETECTED", anomaly["message"], metadata)
+            except Exception as e:
+                logger.error(f"Failed to broadcast ANOMALY_DETECTED event: {e}")
+
     async def _persist_daily_stats(self):
         """持久化每日统计到数据库"""
+        if not self.is_primary:
+            # monitoring_stats 按日期唯一，仅记录主 UPS 的通信统计
+            return
         try:
             from services.history import get_history_service
             
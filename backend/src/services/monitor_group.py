@@ -0,0 +1,227 @@
+"""多 UPS 监控组
+
+一个后端实例同时监控多台 UPS（同一 upsd 上的多台设备或不同的 apcupsd）。
+主 UPS 仍由原有配置（NUT_* / APCUPSD_*）定义，ups_id 为 "default"；
+附加 UPS 通过 UPS_UNITS 环境变量以 JSON 数组声明，例如：
+
+    [{"id": "rack2", "host": "nut-server", "ups_name": "ups2"},
+     {"id": "rack3", "backend": "apcupsd", "host": "10.0.0.5"}]
+
+所有 UpsMonitor 运行在同一个事件循环上，共享历史服务、通知服务和
+WebSocket 连接，每台 UPS 只额外占用一个客户端连接和一个轮询任务。
+"""
+import asyncio
+import json
+import logging
+import re
+from typing import Dict, List, Optional
+from models import DEFAULT_UPS_ID, UpsUnitConfig
+from services.monitor import UpsMonitor
+from services.shutdown_manager import ShutdownManager
+
+logger = logging.getLogger(__name__)
+
+# 各后端默认端口
+DEFAULT_PORTS = {"nut": 3493, "apcupsd": 3551}
+
+_UPS_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+# 可按 UPS 单独配置的关机策略项（留空时沿用全局配置，并跟随全局配置热更新）
+UNIT_OVERRIDE_KEYS = ("shutdown_wait_minutes", "shutdown_battery_percent", "estimated_runtime_threshold")
+
+
+def parse_ups_units(raw: str) -> List[UpsUnitConfig]:
+    """
+    解析 UPS_UNITS 配置
+
+    无效条目记录错误并跳过，不影响主 UPS 启动。
+
+    Args:
+        raw: JSON 数组字符串
+
+    Returns:
+        附加 UPS 配置列表
+    """
+    if not raw or not raw.strip():
+        return []
+
+    try:
+        entries = json.loads(raw)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid UPS_UNITS JSON: {e}")
+        return []
+
+    if not isinstance(entries, list):
+        logger.error("UPS_UNITS must be a JSON array")
+        return []
+
+    units = []
+    seen = {DEFAULT_UPS_ID}
+    for entry in entries:
+        try:
+            unit = UpsUnitConfig(**entry)
+        except Exception as e:
+            logger.error(f"Invalid UPS unit config {entry}: {e}")
+            continue
+
+        if not _UPS_ID_PATTERN.match(unit.id):
+            logger.error(f"Invalid UPS id '{unit.id}' (allowed: letters, digits, '_' and '-')")
+            continue
+        if unit.id in seen:
+            logger.error(f"Duplicate UPS id '{unit.id}', skipped")
+            continue
+        if unit.backend not in DEFAULT_PORTS:
+            logger.error(f"Unsupported backend '{unit.backend}' for UPS '{unit.id}'")
+            continue
+
+        seen.add(unit.id)
+        units.append(unit)
+
+    return units
+
+
+def create_unit_monitor(
+    unit: UpsUnitConfig,
+    config,
+    shutdown_client,
+    mock_mode: bool = False,
+    aux_pool_size: int = 0,
+    snapshot_ttl: float = 2.0,
+) -> UpsMonitor:
+    """
+    为附加 UPS 创建监控器
+
+    Args:
+        unit: 附加 UPS 配置
+        config: 系统配置（未单独配置的关机阈值沿用全局值）
+        shutdown_client: 关机客户端（与主 UPS 共用）
+        mock_mode: Mock 模式
+        aux_pool_size: NUT 辅助连接数
+        snapshot_ttl: apcupsd 状态快照缓存时间（秒）
+    """
+    from services.apcupsd_client import create_ups_client
+
+    client = create_ups_client(
+        backend=unit.backend,
+        host=unit.host,
+        port=unit.port or DEFAULT_PORTS[unit.backend],
+        username=unit.username,
+        password=unit.password,
+        ups_name=unit.ups_name,
+        mock_mode=mock_mode,
+        aux_pool_size=aux_pool_size,
+        # 指定了 ups_name 时不自动发现，避免同一 upsd 上的多台 UPS 被识别为同一台
+        discover_ups=not unit.ups_name,
+        snapshot_ttl=snapshot_ttl,
+    )
+
+    shutdown_manager = ShutdownManager(
+        shutdown_client,
+        unit.shutdown_wait_minutes if unit.shutdown_wait_minutes is not None else config.shutdown_wait_minutes,
+        unit.shutdown_battery_percent if unit.shutdown_battery_percent is not None else config.shutdown_battery_percent,
+        config.shutdown_final_wait_seconds,
+        unit.estimated_runtime_threshold if unit.estimated_runtime_threshold is not None else config.estimated_runtime_threshold,
+        config.test_mode
+    )
+
+    return UpsMonitor(
+        client,
+        shutdown_manager,
+        poll_interval=config.poll_interval_seconds,
+        sample_interval=config.sample_interval_seconds,
+        config=config,
+        ups_id=unit.id,
+        shutdown_enabled=unit.shutdown_enabled,
+        config_overrides=[key for key in UNIT_OVERRIDE_KEYS if getattr(unit, key) is not None],
+    )
+
+
+class MonitorGroup:
+    """多 UPS 监控组"""
+
+    def __init__(self):
+        # ups_id -> 监控器（插入顺序，主 UPS 在前）
+        self._monitors: Dict[str, UpsMonitor] = {}
+
+    def add(self, monitor: UpsMonitor):
+        """加入监控器"""
+        if monitor.ups_id in self._monitors:
+            raise ValueError(f"Duplicate UPS id: {monitor.ups_id}")
+        self._monitors[monitor.ups_id] = monitor
+
+    def get(self, ups_id: Optional[str] = None) -> Optional[UpsMonitor]:
+        """按 ups_id 获取监控器，未指定时返回主 UPS"""
+        return self._monitors.get(ups_id or DEFAULT_UPS_ID)
+
+    @property
+    def primary(self) -> Optional[UpsMonitor]:
+        """主 UPS 监控器"""
+        return self._monitors.get(DEFAULT_UPS_ID)
+
+    def ids(self) -> List[str]:
+        """所有 UPS 标识"""
+        return list(self._monitors)
+
+    def monitors(self) -> List[UpsMonitor]:
+        """所有监控器"""
+        return list(self._monitors.values())
+
+    def add_status_callback(self, callback):
+        """为所有监控器添加状态回调"""
+        for monitor in self._monitors.values():
+            monitor.add_status_callback(callback)
+
+    async def start(self):
+        """并发启动所有监控器（初始连接重试互不阻塞）"""
+        results = await asyncio.gather(
+            *(monitor.start() for monitor in self._monitors.values()),
+            return_exceptions=True
+        )
+        for ups_id, result in zip(self._monitors, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to start monitor for UPS '{ups_id}': {result}")
+        logger.info(f"Monitor group started with {len(self._monitors)} UPS unit(s): {', '.join(self._monitors)}")
+
+    async def stop(self):
+        """停止所有监控器"""
+        results = await asyncio.gather(
+            *(monitor.stop() for monitor in self._monitors.values()),
+            return_exceptions=True
+        )
+        for ups_id, result in zip(self._monitors, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error stopping monitor for UPS '{ups_id}': {result}")
+
+    def get_summary(self) -> List[dict]:
+        """所有 UPS 的状态摘要"""
+        summary = []
+        for ups_id, monitor in self._monitors.items():
+            data = monitor.get_current_data()
+            summary.append({
+                "ups_id": ups_id,
+                "primary": monitor.is_primary,
+                "running": monitor._running,
+                "status": monitor.get_current_status().value,
+                "battery_charge": data.battery_charge if data else None,
+                "battery_runtime": data.battery_runtime if data else None,
+                "load_percent": data.load_percent if data else None,
+                "ups_model": data.ups_model if data else None,
+                "shutdown_enabled": monitor.shutdown_enabled,
+                "last_update": data.last_update.isoformat() if data else None,
+            })
+        return summary
+
+
+# 全局监控组实例
+monitor_group: Optional[MonitorGroup] = None
+
+
+def get_monitor_group() -> Optional[MonitorGroup]:
+    """获取监控组实例"""
+    return monitor_group
+
+
+def set_monitor_group(group: MonitorGroup):
+    """设置监控组实例"""
+    global monitor_group
+    monitor_group = group
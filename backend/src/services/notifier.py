@@ -1,13 +1,22 @@
-"""通知服务"""
+"""通知服务
+
+notify 只做过滤和格式化，然后把消息交给各渠道的分发队列后立即返回，
+实际发送（重试、限速、熔断、合并）由 services.notify_dispatcher 的
+后台 worker 完成，不会阻塞监控循环。
+"""
 import asyncio
 import logging
 from typing import List, Set, Dict, Tuple, Optional
 from datetime import datetime
 from models import EventType, NotifierConfig
 from plugins.registry import get_registry
+from services.notify_dispatcher import ChannelDispatcher, PendingNotification
 
 logger = logging.getLogger(__name__)
 
+# 通知服务关心的配置项
+NOTIFY_CONFIG_KEYS = ["notify_channels", "notify_events", "notification_enabled"]
+
 
 class NotifierService:
     """通知服务"""
@@ -18,6 +27,7 @@ class NotifierService:
         self._enabled_events: Set[str] = set()  # 启用的事件类型
         self._notification_enabled: bool = True  # 通知总开关
         self._channel_errors: Dict[str, str] = {}  # 渠道错误状态 {渠道ID: 错误信息}
+        self._dispatchers: Dict[str, ChannelDispatcher] = {}  # 渠道发送队列 {渠道ID: 分发器}
 
     def configure(self, channels: List[NotifierConfig], notify_events: List[str] = None, notification_enabled: bool = True):
         """
@@ -68,8 +78,43 @@ class NotifierService:
         # 清除已删除渠道的错误状态
         self._channel_errors = {k: v for k, v in self._channel_errors.items() if k in current_channel_ids}
 
+        self._sync_dispatchers()
+
         status = "enabled" if notification_enabled else "disabled"
     
+    def apply_config(self, change):
+        """
+        配置变更订阅回调
+
+        只修改了事件过滤或总开关时不重建渠道实例，已排队的消息和熔断状态保持不变。
+        """
+        config = change.config
+        if change.touches("notify_channels"):
+            channels = [NotifierConfig(**ch) for ch in config.notify_channels]
+            self.configure(channels, config.notify_events, config.notification_enabled)
+            return
+        self._enabled_events = set(config.notify_events) if config.notify_events else set()
+        self._notification_enabled = config.notification_enabled
+
+    def _sync_dispatchers(self):
+        """按当前渠道更新分发队列（保留同一渠道未发送的消息）"""
+        dispatchers = {}
+        for notifier_info in self._notifiers:
+            channel_id = notifier_info["channel_id"]
+            dispatcher = self._dispatchers.pop(channel_id, None)
+            if dispatcher is None:
+                dispatcher = ChannelDispatcher(notifier_info, self._send_with_retry, self._on_delivery_result)
+            else:
+                # 配置可能已修改（如更换了代理），重新开始熔断计数
+                dispatcher.notifier_info = notifier_info
+                dispatcher.reset_breaker()
+            dispatchers[channel_id] = dispatcher
+
+        # 已删除或禁用的渠道
+        for dispatcher in self._dispatchers.values():
+            dispatcher.close()
+        self._dispatchers = dispatchers
+
     async def _send_with_retry(self, notifier_info: dict, title: str, content: str, 
                                level: str, timestamp: str, max_retries: int = 2) -> Tuple[bool, Optional[str]]:
         """带重试的通知发送
@@ -225,6 +270,8 @@ class NotifierService:
                 EventType.UPS_PARAM_CHANGED: "info",
                 # 电池维护事件
                 EventType.BATTERY_REPLACED: "info",
+                # 在线异常检测事件
+                EventType.ANOMALY_DETECTED: "warning",
                 # 兼容旧事件
                 EventType.CONNECTION_ISSUE: "warning",
                 EventType.CONNECTION_RESTORED: "info",
@@ -239,32 +286,54 @@ class NotifierService:
         
         # 生成时间戳
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
 
-        # 并发发送到所有渠道
-        for notifier_info in self._notifiers:
-            channel_id = notifier_info['channel_id']
-            channel_name = notifier_info['name']
-            try:
-                success, error_msg = await self._send_with_retry(notifier_info, title, content, level, timestamp)
-                if success:
-                    # 成功时清除错误状态
-                    if channel_id in self._channel_errors:
-                        del self._channel_errors[channel_id]
-                else:
-                    error_detail = error_msg or "未知错误"
-                    logger.warning(f"Failed to send notification via {channel_name}: {error_detail}")
-                    # 保存错误状态（使用唯一标识符）
-                    self._channel_errors[channel_id] = error_detail
-                    # 记录到事件日志
-                    await self._record_notification_failure(channel_name, error_detail)
-            except Exception as e:
-                error_detail = str(e)
-                logger.error(f"Error sending notification via {channel_name}: {error_detail}")
-                # 保存错误状态（使用唯一标识符）
-                self._channel_errors[channel_id] = error_detail
-                # 记录到事件日志
-                await self._record_notification_failure(channel_name, error_detail)
+        # 放入各渠道的发送队列，由各自的 worker 并发发送
+        key = (event_name, title)
+        for dispatcher in self._dispatchers.values():
+            dispatcher.submit(PendingNotification(key, title, content, level, timestamp))
+
+    async def _on_delivery_result(self, notifier_info: dict, success: bool, error_msg: Optional[str]):
+        """分发 worker 每次投递完成后更新渠道错误状态"""
+        channel_id = notifier_info['channel_id']
+        channel_name = notifier_info['name']
+        if success:
+            # 成功时清除错误状态
+            if channel_id in self._channel_errors:
+                del self._channel_errors[channel_id]
+            return
+
+        error_detail = error_msg or "未知错误"
+        logger.warning(f"Failed to send notification via {channel_name}: {error_detail}")
+        # 保存错误状态（使用唯一标识符）
+        self._channel_errors[channel_id] = error_detail
+        # 记录到事件日志
+        await self._record_notification_failure(channel_name, error_detail)
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有渠道的队列发送完毕，返回是否在超时前完成"""
+        if not self._dispatchers:
+            return True
+        results = await asyncio.gather(
+            *(dispatcher.flush(timeout) for dispatcher in self._dispatchers.values())
+        )
+        return all(results)
+
+    async def stop(self, timeout: float = 10.0):
+        """停止分发（先在 timeout 内尽量发送剩余通知）"""
+        if not await self.flush(timeout):
+            logger.warning(f"Notification queues not drained within {timeout}s")
+        for dispatcher in self._dispatchers.values():
+            dispatcher.close()
+
+    def get_stats(self) -> dict:
+        """获取通知分发统计"""
+        return {
+            "enabled": self._notification_enabled,
+            "channels": {
+                channel_id: dispatcher.get_stats()
+                for channel_id, dispatcher in self._dispatchers.items()
+            },
+        }
 
     async def _record_notification_failure(self, channel_name: str, error: str):
         """记录通知发送失败到事件日志"""
@@ -0,0 +1,294 @@
+"""通知分发队列
+
+NotifierService.notify 原来在调用方协程里逐个渠道发送，每个渠道最多
+三次尝试（每次可能等到超时）加退避。UpsMonitor 在 POWER_LOST 之后
+直接 await 通知，一个不可用的代理就能让监控循环卡住几十秒。
+
+现在 notify 只把消息放进各渠道的队列后立即返回，每个渠道一个后台
+worker 负责发送：
+
+- 渠道之间并发，互不阻塞
+- 令牌桶限速：允许短时突发，长期不超过每分钟 rate_per_minute 条
+- 熔断：连续 failure_threshold 次投递失败后暂停该渠道，冷却期过后
+  只做一次不重试的探测，成功则恢复，失败则冷却时间加倍（有上限）
+- 合并：同一渠道尚未发出的相同通知（事件类型 + 标题相同）合并为一条，
+  内容取最新一次并移到队尾（保持与其他通知的先后顺序），注明合并条数；渠道限速或熔断期间的突发事件因此
+  只发送一次
+- 有界队列：超过 max_queue_size 时丢弃最旧的消息并计数
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认分发参数
+DEFAULT_RATE_PER_MINUTE = 20
+DEFAULT_BURST = 5
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_BREAKER_COOLDOWN = 60  # 秒
+MAX_BREAKER_COOLDOWN = 900  # 秒
+DEFAULT_MAX_QUEUE_SIZE = 100
+DEFAULT_MAX_RETRIES = 2
+
+
+class PendingNotification:
+    """等待发送的通知"""
+
+    __slots__ = ("key", "title", "content", "level", "timestamp", "first_timestamp", "count")
+
+    def __init__(self, key: Tuple[str, str], title: str, content: str, level: str, timestamp: str):
+        self.key = key
+        self.title = title
+        self.content = content
+        self.level = level
+        self.timestamp = timestamp
+        self.first_timestamp = timestamp
+        self.count = 1
+
+    def merge(self, other: "PendingNotification"):
+        """合并一条相同的通知（内容取最新）"""
+        self.content = other.content
+        self.level = other.level
+        self.timestamp = other.timestamp
+        self.count += other.count
+
+    def render_content(self) -> str:
+        if self.count == 1:
+            return self.content
+        return f"{self.content}\n\n（已合并 {self.count} 条相同通知，首次发生于 {self.first_timestamp}）"
+
+
+# 发送函数: (notifier_info, title, content, level, timestamp, max_retries) -> (成功, 错误信息)
+SendFunc = Callable[[dict, str, str, str, str, int], Awaitable[Tuple[bool, Optional[str]]]]
+# 投递结果回调: (notifier_info, 成功, 错误信息)
+ResultFunc = Callable[[dict, bool, Optional[str]], Awaitable[None]]
+
+
+class ChannelDispatcher:
+    """单个通知渠道的发送队列与 worker"""
+
+    def __init__(
+        self,
+        notifier_info: dict,
+        send: SendFunc,
+        on_result: Optional[ResultFunc] = None,
+        rate_per_minute: float = DEFAULT_RATE_PER_MINUTE,
+        burst: int = DEFAULT_BURST,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        breaker_cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        """
+        Args:
+            notifier_info: 渠道信息（channel_id / name / notifier ...）
+            send: 发送函数（带重试）
+            on_result: 每次投递完成后的回调
+            rate_per_minute: 长期发送速率上限
+            burst: 令牌桶容量（允许的突发条数）
+            failure_threshold: 触发熔断的连续失败次数
+            breaker_cooldown: 熔断初始冷却时间（秒）
+            max_queue_size: 队列上限，超出时丢弃最旧消息
+            max_retries: 正常发送时的重试次数
+        """
+        self.notifier_info = notifier_info
+        self._send = send
+        self._on_result = on_result
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+
+        self._pending: Deque[PendingNotification] = deque()
+        self._pending_by_key: Dict[Tuple[str, str], PendingNotification] = {}
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+
+        # 令牌桶
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+
+        # 熔断状态
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._current_cooldown = breaker_cooldown
+
+        # 统计
+        self._submitted = 0
+        self._sent = 0
+        self._failed = 0
+        self._coalesced = 0
+        self._dropped = 0
+        self._max_queue_depth = 0
+        self._last_error: Optional[str] = None
+
+    @property
+    def breaker_open(self) -> bool:
+        return self._consecutive_failures >= self.failure_threshold
+
+    def submit(self, notification: PendingNotification):
+        """放入一条通知（不做任何 IO，立即返回）"""
+        self._submitted += 1
+        existing = self._pending_by_key.get(notification.key)
+        if existing is not None:
+            existing.merge(notification)
+            self._coalesced += 1
+            # 合并后的通知移到队尾，不能排到之后发生的其他通知前面
+            # （例如“断电 → 恢复 → 断电”不能变成“断电 → 恢复”）
+            if self._pending[-1] is not existing:
+                self._pending.remove(existing)
+                self._pending.append(existing)
+            return
+
+        if len(self._pending) >= self.max_queue_size:
+            oldest = self._pending.popleft()
+            self._pending_by_key.pop(oldest.key, None)
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 100 == 0:
+                logger.warning(
+                    f"Notification queue for {self.notifier_info['name']} full ({self.max_queue_size}), "
+                    f"dropped {self._dropped} oldest notifications"
+                )
+
+        self._pending.append(notification)
+        self._pending_by_key[notification.key] = notification
+        self._max_queue_depth = max(self._max_queue_depth, len(self._pending))
+        self._idle.clear()
+        self._wakeup.set()
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def reset_breaker(self):
+        """渠道配置变更后重新开始计数"""
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._current_cooldown = self.breaker_cooldown
+
+    def pending(self) -> int:
+        """队列中待发送的通知数"""
+        return len(self._pending)
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列发送完毕，返回是否在超时前完成"""
+        if self._idle.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        """停止 worker 并丢弃未发送的通知（渠道被删除或服务停止时调用）"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._pending:
+            logger.warning(f"Discarding {len(self._pending)} unsent notifications for {self.notifier_info['name']}")
+            self._dropped += len(self._pending)
+            self._pending.clear()
+            self._pending_by_key.clear()
+        self._idle.set()
+
+    async def _take_token(self):
+        """令牌桶限速：没有令牌时等待补充"""
+        rate = self.rate_per_minute / 60.0
+        while True:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / rate)
+
+    async def _run(self):
+        """后台发送循环"""
+        while True:
+            try:
+                if not self._pending:
+                    self._idle.set()
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                # 熔断打开：等到冷却结束再探测
+                delay = self._open_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                await self._take_token()
+                notification = self._pending.popleft()
+                self._pending_by_key.pop(notification.key, None)
+                await self._deliver(notification)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in notification worker for {self.notifier_info['name']}: {e}")
+                await asyncio.sleep(1)
+
+    async def _deliver(self, notification: PendingNotification):
+        probing = self.breaker_open
+        try:
+            success, error = await self._send(
+                self.notifier_info,
+                notification.title,
+                notification.render_content(),
+                notification.level,
+                notification.timestamp,
+                0 if probing else self.max_retries,
+            )
+        except Exception as e:
+            success, error = False, str(e)
+
+        if success:
+            self._sent += 1
+            if probing:
+                logger.info(f"Notification channel {self.notifier_info['name']} recovered, closing circuit breaker")
+            self.reset_breaker()
+        else:
+            self._failed += 1
+            self._last_error = error
+            self._consecutive_failures += 1
+            if self.breaker_open:
+                if probing:
+                    self._current_cooldown = min(self._current_cooldown * 2, MAX_BREAKER_COOLDOWN)
+                self._open_until = time.monotonic() + self._current_cooldown
+                logger.warning(
+                    f"Notification channel {self.notifier_info['name']} failed {self._consecutive_failures} "
+                    f"times in a row, pausing for {self._current_cooldown:.0f}s"
+                )
+
+        if self._on_result:
+            try:
+                await self._on_result(self.notifier_info, success, error)
+            except Exception as e:
+                logger.error(f"Error in notification result callback: {e}")
+
+    def get_stats(self) -> dict:
+        """获取渠道分发统计"""
+        return {
+            "name": self.notifier_info["name"],
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self._max_queue_depth,
+            "submitted": self._submitted,
+            "sent": self._sent,
+            "failed": self._failed,
+            "coalesced": self._coalesced,
+            "dropped": self._dropped,
+            "breaker_open": self.breaker_open,
+            "consecutive_failures": self._consecutive_failures,
+            "breaker_retry_in": round(max(0.0, self._open_until - time.monotonic()), 1) if self.breaker_open else None,
+            "last_error": self._last_error,
+        }
@@ -1,7 +1,8 @@
 """NUT (Network UPS Tools) 异步客户端"""
 import asyncio
 import logging
-from typing import Dict, Optional, Protocol, Callable
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Protocol, Callable
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -25,6 +26,10 @@ class NutClientInterface(Protocol):
     async def list_vars(self) -> Dict[str, str]:
         """列出所有变量"""
         ...
+
+    async def get_vars(self, var_names: List[str]) -> Dict[str, Optional[str]]:
+        """批量获取多个变量值"""
+        ...
     
     async def list_ups(self) -> list:
         """列出所有 UPS 设备"""
@@ -48,15 +53,24 @@ class NutClientInterface(Protocol):
 
 
 class RealNutClient:
-    """真实的 NUT 客户端实现"""
+    """真实的 NUT 客户端实现
+
+    同一条 TCP 连接上的请求/响应必须成对出现，监控循环、API 调用、
+    电池测试轮询等会并发使用同一个客户端，因此所有会话都通过
+    _conversation_lock 串行化。aux_pool_size > 0 时，LIST RW / LIST CMD
+    等较慢的查询走独立的辅助连接，不会阻塞状态轮询。
+    """
     
-    def __init__(self, host: str, port: int, username: str, password: str, ups_name: str):
+    def __init__(self, host: str, port: int, username: str, password: str, ups_name: str,
+                 aux_pool_size: int = 0, discover_ups: bool = True):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.ups_name = ups_name  # 可以为空，连接后自动发现
         self._auto_discovered = False  # 标记是否已自动发现
+        # 同一 upsd 上监控多台 UPS 时需固定名称，禁止自动发现覆盖
+        self._discover_ups = discover_ups or not ups_name
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
         self._connected = False
@@ -66,6 +80,12 @@ class RealNutClient:
         # 连接状态变化回调
         self._on_disconnected_callback = None
         self._on_reconnected_callback = None
+        # 串行化同一连接上的请求/响应会话
+        self._conversation_lock = asyncio.Lock()
+        # 辅助连接池（用于较慢的 LIST RW / LIST CMD）
+        self._aux_pool_size = aux_pool_size
+        self._aux_clients: List["RealNutClient"] = []
+        self._aux_idle: asyncio.Queue = asyncio.Queue()
 
     def set_connection_callbacks(self, on_disconnected=None, on_reconnected=None):
         """设置连接状态变化回调"""
@@ -96,6 +116,11 @@ class RealNutClient:
 
     async def connect(self):
         """连接到 NUT 服务器"""
+        async with self._conversation_lock:
+            await self._connect_unlocked()
+
+    async def _connect_unlocked(self):
+        """连接并登录（调用方需持有 _conversation_lock）"""
         try:
             logger.info(f"Connecting to NUT server at {self.host}:{self.port}...")
             self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
@@ -112,7 +137,7 @@ class RealNutClient:
             self._last_connection_error = None
 
             # 如果需要自动发现 UPS（首次连接或重连时需要重新发现）
-            if not self._auto_discovered:
+            if not self._auto_discovered and self._discover_ups:
                 await self._auto_discover_ups()
 
             logger.info(f"Successfully connected to NUT server, UPS: {self.ups_name}")
@@ -203,6 +228,11 @@ class RealNutClient:
 
     async def _reconnect(self):
         """自动重连（带指数退避）"""
+        async with self._conversation_lock:
+            return await self._reconnect_unlocked()
+
+    async def _reconnect_unlocked(self):
+        """自动重连（调用方需持有 _conversation_lock）"""
         self._reconnect_attempts += 1
         
         # 先关闭旧连接
@@ -226,7 +256,7 @@ class RealNutClient:
             old_ups_name = self.ups_name
             self._auto_discovered = False  # 重置自动发现标记，允许重新发现
 
-            await self.connect()
+            await self._connect_unlocked()
 
             # 如果 UPS 名称改变了，记录日志
             if old_ups_name and old_ups_name != self.ups_name:
@@ -272,6 +302,11 @@ class RealNutClient:
     
     async def disconnect(self):
         """断开连接"""
+        for aux in self._aux_clients:
+            await aux.disconnect()
+        self._aux_clients = []
+        self._aux_idle = asyncio.Queue()
+
         if self.writer:
             try:
                 self.writer.close()
@@ -290,14 +325,58 @@ class RealNutClient:
             "connected": self._connected,
             "reconnect_attempts": self._reconnect_attempts,
             "last_error": self._last_connection_error,
+            "aux_connections": len(self._aux_clients),
         }
-    
-    async def _send_command(self, command: str, timeout: float = 10.0) -> str:
-        """发送命令并获取响应（带超时）"""
+
+    async def _ensure_connected(self):
+        """确保连接可用，必要时重连（调用方需持有 _conversation_lock）"""
         if not self._connected:
             # Try to reconnect
-            if not await self._reconnect():
+            if not await self._reconnect_unlocked():
                 raise RuntimeError("Not connected to NUT server and reconnection failed")
+
+    @asynccontextmanager
+    async def _aux_connection(self):
+        """借用一条辅助连接；未启用连接池或辅助连接不可用时得到 None"""
+        client = None
+        if self._aux_pool_size > 0:
+            client = await self._acquire_aux()
+        try:
+            yield client
+        finally:
+            if client is not None:
+                self._aux_idle.put_nowait(client)
+
+    async def _acquire_aux(self) -> Optional["RealNutClient"]:
+        """从连接池获取空闲辅助连接，不足时按需创建"""
+        if not self._aux_idle.empty():
+            client = self._aux_idle.get_nowait()
+        elif len(self._aux_clients) < self._aux_pool_size:
+            client = RealNutClient(self.host, self.port, self.username, self.password, self.ups_name)
+            client._auto_discovered = True
+            # 连接前先占用名额，并发调用方不会超出连接池上限
+            self._aux_clients.append(client)
+            try:
+                await client.connect()
+            except Exception as e:
+                if client in self._aux_clients:
+                    self._aux_clients.remove(client)
+                # 唤醒可能正在等待空闲连接的调用方（得到 None，改用主连接）
+                self._aux_idle.put_nowait(None)
+                logger.warning(f"Failed to open auxiliary NUT connection, using primary: {e}")
+                return None
+            logger.info(f"Opened auxiliary NUT connection ({len(self._aux_clients)}/{self._aux_pool_size})")
+        else:
+            client = await self._aux_idle.get()
+        if client is None:
+            return None
+        # 主连接重新发现 UPS 后同步名称
+        client.ups_name = self.ups_name
+        return client
+    
+    async def _send_command(self, command: str, timeout: float = 10.0) -> str:
+        """发送命令并获取响应（带超时，调用方需持有 _conversation_lock）"""
+        await self._ensure_connected()
         
         try:
             self.writer.write(f"{command}\n".encode())
@@ -353,26 +432,62 @@ class RealNutClient:
     async def get_var(self, var_name: str) -> Optional[str]:
         """获取单个变量值"""
         try:
-            response = await self._send_command(f"GET VAR {self.ups_name} {var_name}")
-            # 响应格式: VAR <upsname> <varname> "<value>"
-            if response.startswith("VAR"):
-                parts = response.split('"')
-                if len(parts) >= 2:
-                    return parts[1]
-            return None
+            async with self._conversation_lock:
+                response = await self._send_command(f"GET VAR {self.ups_name} {var_name}")
+            return self._parse_var_response(response)
         except Exception as e:
             logger.error(f"Error getting variable {var_name}: {e}")
             # Try to reconnect on next call
             self._connected = False
             return None
+
+    @staticmethod
+    def _parse_var_response(response: str) -> Optional[str]:
+        """解析 GET VAR 响应: VAR <upsname> <varname> "<value>"，错误响应返回 None"""
+        if response.startswith("VAR"):
+            parts = response.split('"')
+            if len(parts) >= 2:
+                return parts[1]
+        return None
+
+    async def get_vars(self, var_names: List[str], timeout: float = 10.0) -> Dict[str, Optional[str]]:
+        """批量获取多个变量值（流水线）
+
+        一次写入多条 GET VAR 请求，再按顺序读取对应数量的响应行，
+        整个过程只占用一次会话锁，避免 N 次往返。
+
+        Returns:
+            变量名 -> 值（不支持的变量为 None）；连接失败时返回空字典
+        """
+        if not var_names:
+            return {}
+        try:
+            async with self._conversation_lock:
+                await self._ensure_connected()
+                payload = "".join(f"GET VAR {self.ups_name} {name}\n" for name in var_names)
+                self.writer.write(payload.encode())
+                await self.writer.drain()
+
+                result: Dict[str, Optional[str]] = {}
+                for name in var_names:
+                    line = await asyncio.wait_for(self.reader.readline(), timeout=timeout)
+                    if not line:
+                        raise ConnectionError("Connection closed while reading pipelined response")
+                    result[name] = self._parse_var_response(line.decode().strip())
+                return result
+        except Exception as e:
+            logger.error(f"Error getting variables {var_names}: {e}")
+            self._connected = False
+            return {}
     
     async def list_vars(self) -> Dict[str, str]:
         """列出所有变量"""
         was_connected = self._connected
         logger.debug(f"list_vars() called, was_connected={was_connected}")
         try:
-            await self._send_command(f"LIST VAR {self.ups_name}")
-            lines = await self._read_until("END LIST VAR")
+            async with self._conversation_lock:
+                await self._send_command(f"LIST VAR {self.ups_name}")
+                lines = await self._read_until("END LIST VAR")
             
             # 如果没有收到任何数据，标记断开连接并重置自动发现
             if not lines:
@@ -408,8 +523,9 @@ class RealNutClient:
     async def list_ups(self) -> list:
         """列出所有 UPS 设备"""
         try:
-            await self._send_command("LIST UPS")
-            lines = await self._read_until("END LIST UPS")
+            async with self._conversation_lock:
+                await self._send_command("LIST UPS")
+                lines = await self._read_until("END LIST UPS")
             
             ups_list = []
             for line in lines:
@@ -431,7 +547,8 @@ class RealNutClient:
     async def run_command(self, command: str) -> bool:
         """执行 UPS 即时命令"""
         try:
-            response = await self._send_command(f"INSTCMD {self.ups_name} {command}")
+            async with self._conversation_lock:
+                response = await self._send_command(f"INSTCMD {self.ups_name} {command}")
             if response.startswith("OK"):
                 logger.info(f"UPS command '{command}' executed successfully")
                 return True
@@ -449,9 +566,10 @@ class RealNutClient:
         响应: OK 或 ERR <message>
         """
         try:
-            response = await self._send_command(
-                f'SET VAR {self.ups_name} {var_name} "{value}"'
-            )
+            async with self._conversation_lock:
+                response = await self._send_command(
+                    f'SET VAR {self.ups_name} {var_name} "{value}"'
+                )
             if response.startswith("OK"):
                 logger.info(f"Successfully set {var_name} = {value}")
                 return True
@@ -471,9 +589,15 @@ class RealNutClient:
         RW <upsname> <varname> "<value>"
         END LIST RW <upsname>
         """
+        # 启用辅助连接池时走独立连接，避免阻塞状态轮询
+        async with self._aux_connection() as aux:
+            if aux is not None:
+                return await aux.list_rw()
+
         try:
-            await self._send_command(f"LIST RW {self.ups_name}")
-            lines = await self._read_until("END LIST RW")
+            async with self._conversation_lock:
+                await self._send_command(f"LIST RW {self.ups_name}")
+                lines = await self._read_until("END LIST RW")
             
             rw_vars = {}
             for line in lines:
@@ -504,9 +628,15 @@ class RealNutClient:
         CMD <upsname> <cmdname>
         END LIST CMD <upsname>
         """
+        # 启用辅助连接池时走独立连接，避免阻塞状态轮询
+        async with self._aux_connection() as aux:
+            if aux is not None:
+                return await aux.list_commands()
+
         try:
-            await self._send_command(f"LIST CMD {self.ups_name}")
-            lines = await self._read_until("END LIST CMD")
+            async with self._conversation_lock:
+                await self._send_command(f"LIST CMD {self.ups_name}")
+                lines = await self._read_until("END LIST CMD")
 
             commands = []
             for line in lines:
@@ -529,8 +659,9 @@ class EventDrivenNutClient(RealNutClient):
     支持 NUT LISTEN 机制，实现实时状态更新
     """
     
-    def __init__(self, host: str, port: int, username: str, password: str, ups_name: str):
-        super().__init__(host, port, username, password, ups_name)
+    def __init__(self, host: str, port: int, username: str, password: str, ups_name: str,
+                 discover_ups: bool = True):
+        super().__init__(host, port, username, password, ups_name, discover_ups=discover_ups)
         self._listen_mode = False
         self._listen_task: Optional[asyncio.Task] = None
         self._on_data_changed: Optional[Callable] = None
@@ -554,7 +685,8 @@ class EventDrivenNutClient(RealNutClient):
             await self.connect()
             
             # 发送 LISTEN 命令
-            response = await self._send_command(f"LISTEN {ups_name}")
+            async with self._conversation_lock:
+                response = await self._send_command(f"LISTEN {ups_name}")
             
             if not response.startswith("OK"):
                 logger.warning(f"NUT LISTEN not supported: {response}")
@@ -639,7 +771,8 @@ class EventDrivenNutClient(RealNutClient):
             while self._listen_mode:
                 await asyncio.sleep(self._heartbeat_interval)
                 try:
-                    response = await self._send_command("VER")
+                    async with self._conversation_lock:
+                        response = await self._send_command("VER")
                     self._last_heartbeat = datetime.now()
                     logger.debug(f"Heartbeat OK: {response}")
                 except Exception as e:
@@ -658,7 +791,8 @@ class EventDrivenNutClient(RealNutClient):
                 await asyncio.sleep(delay)
                 
                 await self.connect()
-                response = await self._send_command(f"LISTEN {ups_name}")
+                async with self._conversation_lock:
+                    response = await self._send_command(f"LISTEN {ups_name}")
                 
                 if response.startswith("OK"):
                     logger.info("Reconnected and re-listening successfully")
@@ -760,6 +894,11 @@ class MockNutClient:
         """列出所有变量（模拟）"""
         await asyncio.sleep(0.05)
         return self._mock_data.copy()
+
+    async def get_vars(self, var_names: List[str]) -> Dict[str, Optional[str]]:
+        """批量获取多个变量值（模拟）"""
+        await asyncio.sleep(0.01)
+        return {name: self._mock_data.get(name) for name in var_names}
     
     async def list_ups(self) -> list:
         """列出所有 UPS 设备（模拟）"""
@@ -832,9 +971,9 @@ class MockNutClient:
 
 
 def create_nut_client(host: str, port: int, username: str, password: str, 
-                     ups_name: str, mock_mode: bool = False) -> NutClientInterface:
+                     ups_name: str, mock_mode: bool = False, aux_pool_size: int = 0) -> NutClientInterface:
     """创建 NUT 客户端实例"""
     if mock_mode:
         return MockNutClient(host, port, username, password, ups_name)
     else:
-        return RealNutClient(host, port, username, password, ups_name)
+        return RealNutClient(host, port, username, password, ups_name, aux_pool_size=aux_pool_size)
@@ -0,0 +1,330 @@
+"""预测结果缓存
+
+/api/predictions 原来每次请求都重新加载 30 天事件和 720 小时指标并重算
+所有模型，各子接口还会各自再加载一遍。预测缓存常驻一份最近 90 天的
+列式指标帧和停电事件，并通过 HistoryService 的写入监听器感知新数据：
+
+- 新采样落库后只增量读取新行并追加到帧末尾
+- 异常检测的 7 天滑动窗口维护各信号的累计量，窗口移动时只加减进出的样本
+- 只有相关数据变化时才让对应模型失效：停电/恢复事件影响停电时长、
+  电池健康度和续航预测；新采样影响续航预测和异常检测，落在已结束
+  停电窗口内的迟到采样才会影响电池健康度
+- 结果附带 computed_at；即使没有新数据，超过 max_age 也会重算（时间窗口在移动）
+"""
+import asyncio
+import logging
+import math
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from models import DEFAULT_UPS_ID, Event, EventType
+from services.metric_frame import MetricFrame, to_epoch
+from services.ml_predictor import ANOMALY_SIGNALS, SignalStats
+
+logger = logging.getLogger(__name__)
+
+# 各模型使用的数据窗口（天）
+MODEL_WINDOWS = {
+    "outage_duration": 90,
+    "battery_health": 90,
+    "runtime_prediction": 30,
+    "anomalies": 7,
+}
+HISTORY_DAYS = max(MODEL_WINDOWS.values())
+
+# 影响预测结果的事件类型
+RELEVANT_EVENTS = {EventType.POWER_LOST, EventType.POWER_RESTORED}
+
+# 结果最长复用时间（秒）
+DEFAULT_MAX_AGE = 300
+
+
+class RollingStats:
+    """滑动窗口内单个信号的累计量
+
+    以进入窗口的第一个值为偏移量累加，减小电压这类大均值、小方差信号的相消误差。
+    """
+
+    __slots__ = ("count", "shift", "total", "total_sq")
+
+    def __init__(self):
+        self.count = 0
+        self.shift: Optional[float] = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, value: float):
+        if self.shift is None:
+            self.shift = value
+        d = value - self.shift
+        self.count += 1
+        self.total += d
+        self.total_sq += d * d
+
+    def remove(self, value: float):
+        d = value - self.shift
+        self.count -= 1
+        self.total -= d
+        self.total_sq -= d * d
+        if self.count == 0:
+            self.shift = None
+            self.total = self.total_sq = 0.0
+
+    def mean_std(self):
+        if self.count == 0:
+            return 0, 0
+        mean = self.total / self.count
+        variance = max(0.0, self.total_sq / self.count - mean * mean)
+        return self.shift + mean, math.sqrt(variance)
+
+
+def _db_time(epoch: float) -> datetime:
+    """epoch 秒 → 数据库使用的无时区 UTC 时间"""
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+class PredictionCache:
+    """预测结果缓存（单台 UPS）"""
+
+    def __init__(self, history_service, predictor, ups_id: str = DEFAULT_UPS_ID, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Args:
+            history_service: 历史服务
+            predictor: MLPredictor
+            ups_id: UPS 标识
+            max_age: 结果最长复用时间（秒）
+        """
+        self.history = history_service
+        self.predictor = predictor
+        self.ups_id = ups_id
+        self.max_age = max_age
+
+        self._lock = asyncio.Lock()
+        self._test_mode: Optional[str] = None
+        self._frame: Optional[MetricFrame] = None
+        self._events: List[Event] = []
+        # 最近一次已结束停电的恢复时间（epoch）
+        self._last_outage_end: Optional[float] = None
+
+        self._needs_reload = True
+        self._events_dirty = False
+        self._metrics_dirty = False
+
+        # 异常检测窗口 [_anomaly_lo, len(frame)) 的累计量
+        self._anomaly_lo = 0
+        self._anomaly_stats: Dict[str, RollingStats] = {}
+
+        # 模型 -> (结果, 计算时刻 monotonic, 计算时间)
+        self._results: Dict[str, tuple] = {}
+
+        # 统计
+        self._hits = 0
+        self._misses = 0
+        self._full_loads = 0
+        self._incremental_loads = 0
+
+    def on_history_write(self, kind: str, ups_id: Optional[str] = None, event_type: Optional[EventType] = None):
+        """HistoryService 写入监听器"""
+        if kind == "reset":
+            self._needs_reload = True
+        elif ups_id != self.ups_id:
+            return
+        elif kind == "event":
+            if event_type in RELEVANT_EVENTS:
+                self._events_dirty = True
+        elif kind == "metrics":
+            self._metrics_dirty = True
+
+    async def get(self, model: str) -> dict:
+        """获取单个模型的结果"""
+        if model not in MODEL_WINDOWS:
+            raise ValueError(f"Unknown prediction model: {model}")
+        async with self._lock:
+            await self._refresh()
+            return await self._result(model)
+
+    async def get_all(self) -> Dict[str, dict]:
+        """获取所有模型的结果"""
+        async with self._lock:
+            await self._refresh()
+            return {model: await self._result(model) for model in MODEL_WINDOWS}
+
+    def _invalidate(self, *models: str):
+        for model in models:
+            self._results.pop(model, None)
+
+    async def _resolve_test_mode(self) -> str:
+        try:
+            from config import get_config_manager
+            config_manager = await get_config_manager()
+            config = await config_manager.get_config()
+            return config.test_mode
+        except Exception as e:
+            logger.warning(f"Failed to get test_mode from config: {e}, defaulting to 'production'")
+            return 'production'
+
+    async def _refresh(self):
+        """同步缓存数据（按需完整加载或增量追加）"""
+        test_mode = await self._resolve_test_mode()
+        if test_mode != self._test_mode:
+            self._needs_reload = True
+
+        if self._needs_reload:
+            await self._full_load(test_mode)
+        else:
+            if self._events_dirty:
+                await self._load_events()
+                self._invalidate("outage_duration", "battery_health", "runtime_prediction")
+            if self._metrics_dirty:
+                await self._load_new_metrics()
+
+        now = time.time()
+        removed = self._frame.drop_before(now - HISTORY_DAYS * 86400)
+        self._anomaly_lo = max(0, self._anomaly_lo - removed)
+        self._advance_anomaly_window(now)
+
+    async def _full_load(self, test_mode: str):
+        self._needs_reload = False
+        self._metrics_dirty = False
+        self._test_mode = test_mode
+        self._frame = await self.history.get_metric_frame(HISTORY_DAYS * 24, test_mode, self.ups_id)
+        await self._load_events()
+
+        self._anomaly_stats = {signal: RollingStats() for signal in ANOMALY_SIGNALS}
+        self._anomaly_lo, _ = self._frame.index_range(start=time.time() - MODEL_WINDOWS["anomalies"] * 86400)
+        self._add_to_anomaly_window(self._anomaly_lo, len(self._frame))
+
+        self._results.clear()
+        self._full_loads += 1
+
+    async def _load_events(self):
+        self._events_dirty = False
+        events = await self.history.get_events(days=HISTORY_DAYS, test_mode=self._test_mode, ups_id=self.ups_id)
+        self._events = sorted(
+            (e for e in events if e.event_type in RELEVANT_EVENTS),
+            key=lambda e: e.timestamp
+        )
+        restored = [e for e in self._events if e.event_type == EventType.POWER_RESTORED]
+        self._last_outage_end = to_epoch(restored[-1].timestamp) if restored else None
+
+    async def _load_new_metrics(self):
+        """只读取最后一行（含同一时刻）之后的新采样"""
+        self._metrics_dirty = False
+        frame = self._frame
+        if not len(frame):
+            new = await self.history.get_metric_frame(HISTORY_DAYS * 24, self._test_mode, self.ups_id)
+        else:
+            last = frame.timestamps[-1]
+            new = await self.history.get_metric_frame(
+                test_mode=self._test_mode, ups_id=self.ups_id, start=_db_time(last)
+            )
+            # 跳过与最后一行同一时刻、已经加载过的行
+            loaded_at_last = len(frame) - bisect_left(frame.timestamps, last)
+            equal_lo = bisect_left(new.timestamps, last)
+            equal_hi = bisect_right(new.timestamps, last)
+            new = new.tail(equal_lo + min(loaded_at_last, equal_hi - equal_lo))
+        if not len(new):
+            return
+
+        old_len = len(frame)
+        frame.extend(new)
+        self._add_to_anomaly_window(old_len, len(frame))
+        self._incremental_loads += 1
+
+        self._invalidate("runtime_prediction", "anomalies")
+        # 迟到的采样落在已结束的停电窗口内时才影响电池健康度
+        if self._last_outage_end is not None and new.timestamps[0] <= self._last_outage_end:
+            self._invalidate("battery_health")
+
+    def _add_to_anomaly_window(self, lo: int, hi: int):
+        for signal in ANOMALY_SIGNALS:
+            stats = self._anomaly_stats[signal]
+            for value in self._frame.columns[signal][lo:hi]:
+                if value == value:
+                    stats.add(value)
+
+    def _advance_anomaly_window(self, now: float):
+        new_lo, _ = self._frame.index_range(start=now - MODEL_WINDOWS["anomalies"] * 86400)
+        if new_lo <= self._anomaly_lo:
+            return
+        for signal in ANOMALY_SIGNALS:
+            stats = self._anomaly_stats[signal]
+            for value in self._frame.columns[signal][self._anomaly_lo:new_lo]:
+                if value == value:
+                    stats.remove(value)
+        self._anomaly_lo = new_lo
+        self._invalidate("anomalies")
+
+    async def _result(self, model: str) -> dict:
+        cached = self._results.get(model)
+        if cached and time.monotonic() - cached[1] < self.max_age:
+            self._hits += 1
+            result, computed_at = cached[0], cached[2]
+        else:
+            self._misses += 1
+            result = await self._compute(model)
+            computed_at = datetime.now()
+            self._results[model] = (result, time.monotonic(), computed_at)
+        return {**result, "computed_at": computed_at.isoformat()} if result else result
+
+    async def _compute(self, model: str) -> dict:
+        frame = self._frame
+        if model == "outage_duration":
+            return await self.predictor.predict_outage_duration(self._events)
+        if model == "battery_health":
+            return await self.predictor.assess_battery_health(frame, self._events)
+        if model == "runtime_prediction":
+            since = time.time() - MODEL_WINDOWS[model] * 86400
+            window = frame.since(since)
+            events = [e for e in self._events if to_epoch(e.timestamp) >= since]
+            charge = window.value('battery_charge', -1) if len(window) else None
+            load = window.value('load_percent', -1) if len(window) else None
+            return await self.predictor.predict_runtime(charge, load, window, events)
+
+        # anomalies
+        stats = {}
+        n = len(frame)
+        for signal in ANOMALY_SIGNALS:
+            rolling = self._anomaly_stats[signal]
+            mean, std = rolling.mean_std()
+            recent_index = frame.last_valid(signal, self._anomaly_lo, n)
+            previous_index = (
+                frame.last_valid(signal, self._anomaly_lo, recent_index) if recent_index is not None else None
+            )
+            stats[signal] = SignalStats(
+                count=rolling.count,
+                mean=mean,
+                std=std,
+                recent=frame.value(signal, recent_index) if recent_index is not None else None,
+                previous=frame.value(signal, previous_index) if previous_index is not None else None,
+            )
+        return self.predictor.build_anomaly_report(stats, n - self._anomaly_lo)
+
+    def get_stats(self) -> dict:
+        """缓存统计"""
+        return {
+            "samples": len(self._frame) if self._frame is not None else 0,
+            "events": len(self._events),
+            "cached_models": sorted(self._results),
+            "hits": self._hits,
+            "misses": self._misses,
+            "full_loads": self._full_loads,
+            "incremental_loads": self._incremental_loads,
+        }
+
+
+# 全局实例
+_prediction_cache: Optional[PredictionCache] = None
+
+
+async def get_prediction_cache() -> PredictionCache:
+    """获取预测缓存实例（首次调用时注册历史写入监听）"""
+    global _prediction_cache
+    if _prediction_cache is None:
+        from services.history import get_history_service
+        from services.ml_predictor import get_ml_predictor
+        history_service = await get_history_service()
+        _prediction_cache = PredictionCache(history_service, get_ml_predictor())
+        history_service.add_write_listener(_prediction_cache.on_history_write)
+    return _prediction_cache
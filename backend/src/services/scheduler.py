@@ -1,14 +1,39 @@
-"""设备定时任务调度器"""
+"""设备定时任务调度器
+
+任务保存在 device_schedules 表中，重启后自动恢复；每次执行（包括停机期间
+错过的执行）记录到 device_schedule_runs。一次性任务执行后删除，执行记录
+保留（每个任务最近 MAX_RUNS_PER_SCHEDULE 条，且不超过 RUN_RETENTION_DAYS 天）；
+用户删除任务时执行记录一并删除。
+
+调度循环维护一个按下次执行时间排序的最小堆，只睡眠到堆顶任务到期（或
+新任务加入时被唤醒），而不是定期扫描全部任务。同一时刻到期的任务并发
+执行，并发数受信号量限制，批量定时关机时每台设备都能准时开始。
+"""
 import asyncio
+import heapq
+import itertools
 import logging
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 
+from utils.cron import CronExpression
+
 logger = logging.getLogger(__name__)
 
+# 同时执行的任务上限
+DEFAULT_MAX_PARALLEL = 16
+# 最长睡眠时间（秒）：系统时间被调整或休眠唤醒后按墙上时间重新判断
+MAX_SLEEP_SECONDS = 60.0
+# 到期后多久内发现仍然执行（秒），更晚发现的执行（停机期间错过）记为 missed 并跳过
+MISFIRE_GRACE_SECONDS = 60
+# 每个任务保留的执行记录条数
+MAX_RUNS_PER_SCHEDULE = 50
+# 执行记录保留天数（已完成的一次性任务的记录只按天数清理）
+RUN_RETENTION_DAYS = 90
+
 
 class ScheduleAction(str, Enum):
     """定时操作类型"""
@@ -24,6 +49,7 @@ class ScheduleRepeat(str, Enum):
     ONCE = "once"
     DAILY = "daily"
     WEEKLY = "weekly"
+    CRON = "cron"
 
 
 @dataclass
@@ -33,33 +59,70 @@ class ScheduledTask:
     device_index: int
     device_name: str
     action: ScheduleAction
-    scheduled_time: datetime
+    scheduled_time: Optional[datetime]
     repeat: ScheduleRepeat
     created_at: datetime
     enabled: bool = True
     last_executed: Optional[datetime] = None
     next_execution: Optional[datetime] = None
+    cron: Optional[str] = None
+
+
+def _to_local(moment: datetime) -> datetime:
+    """带时区的时间转换为本地时间（调度统一使用不带时区的本地时间）"""
+    if moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def _parse_time(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _format_time(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
 
 
 class DeviceScheduler:
     """设备定时任务调度器"""
-    
-    def __init__(self):
+
+    def __init__(self, db=None, max_parallel: int = DEFAULT_MAX_PARALLEL):
+        """
+        Args:
+            db: 数据库实例（为空时启动时获取全局实例）
+            max_parallel: 同时执行的任务上限
+        """
+        self.db = db
+        self.max_parallel = max_parallel
         self._schedules: Dict[str, ScheduledTask] = {}
+        # (下次执行时间, 序号, schedule_id)；任务删除或改期后旧条目在出堆时丢弃
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._in_flight: Set[asyncio.Task] = set()
         self._scheduler_task: Optional[asyncio.Task] = None
         self._running = False
-    
+        self._loaded = False
+
+        # 统计
+        self._executed = 0
+        self._failed = 0
+        self._missed = 0
+        self._max_lateness_ms = 0.0
+
     async def start(self):
-        """启动调度器"""
+        """启动调度器（从数据库恢复任务）"""
         if self._running:
             logger.warning("Scheduler is already running")
             return
-        
+
+        await self._load()
         self._running = True
         self._scheduler_task = asyncio.create_task(self._scheduler_loop())
 
     async def stop(self):
-        """停止调度器"""
+        """停止调度器（取消进行中的任务）"""
         self._running = False
         if self._scheduler_task:
             self._scheduler_task.cancel()
@@ -68,25 +131,86 @@ class DeviceScheduler:
             except asyncio.CancelledError:
                 pass
             self._scheduler_task = None
+        for task in list(self._in_flight):
+            task.cancel()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _get_db(self):
+        if self.db is None:
+            from db.database import get_db
+            self.db = await get_db()
+        return self.db
+
+    async def _load(self):
+        """从数据库加载任务，处理停机期间错过的执行"""
+        if self._loaded:
+            return
+        db = await self._get_db()
+        rows = await db.fetch_all(
+            "SELECT schedule_id, device_index, device_name, action, scheduled_time, repeat, cron, "
+            "enabled, created_at, last_executed, next_execution FROM device_schedules"
+        )
+        now = datetime.now()
+        for row in rows:
+            try:
+                task = ScheduledTask(
+                    schedule_id=row[0],
+                    device_index=row[1],
+                    device_name=row[2],
+                    action=ScheduleAction(row[3]),
+                    scheduled_time=_parse_time(row[4]),
+                    repeat=ScheduleRepeat(row[5]),
+                    cron=row[6],
+                    enabled=bool(row[7]),
+                    created_at=_parse_time(row[8]),
+                    last_executed=_parse_time(row[9]),
+                    next_execution=_parse_time(row[10]),
+                )
+            except ValueError as e:
+                logger.error(f"Skipping invalid schedule {row[0]}: {e}")
+                continue
+
+            self._schedules[task.schedule_id] = task
+            due = task.next_execution
+            if not task.enabled or due is None:
+                continue
+            if (now - due).total_seconds() > MISFIRE_GRACE_SECONDS:
+                # 停机期间错过的执行不补做（几小时后关机比不关机更危险）
+                if task.repeat == ScheduleRepeat.ONCE:
+                    task.next_execution = None
+                else:
+                    task.next_execution = self._next_execution(task, now)
+                await self._save(task)
+                await self._record_missed(task, due, now)
+                if task.schedule_id not in self._schedules:
+                    continue
+            self._push(task)
+
+        self._loaded = True
+        if self._schedules:
+            logger.info(f"Loaded {len(self._schedules)} device schedules")
 
     async def add_schedule(
         self,
         device_index: int,
         device_name: str,
         action: str,
-        scheduled_time: datetime,
-        repeat: str = "once"
+        scheduled_time: Optional[datetime] = None,
+        repeat: str = "once",
+        cron: Optional[str] = None
     ) -> str:
         """
         添加定时任务
-        
+
         Args:
             device_index: 设备索引
             device_name: 设备名称
             action: 操作类型
-            scheduled_time: 计划执行时间
+            scheduled_time: 计划执行时间（cron 任务可为空）
             repeat: 重复类型
-        
+            cron: cron 表达式（repeat 为 cron 时必填）
+
         Returns:
             schedule_id: 任务ID
         """
@@ -95,21 +219,21 @@ class DeviceScheduler:
             schedule_repeat = ScheduleRepeat(repeat)
         except ValueError as e:
             raise ValueError(f"Invalid action or repeat type: {e}")
-        
+
+        if schedule_repeat == ScheduleRepeat.CRON:
+            if not cron:
+                raise ValueError("Cron expression is required for cron schedules")
+            CronExpression(cron)
+        elif scheduled_time is None:
+            raise ValueError("Scheduled time is required")
+        else:
+            cron = None
+        if scheduled_time is not None:
+            scheduled_time = _to_local(scheduled_time)
+
         schedule_id = str(uuid.uuid4())
         now = datetime.now()
-        
-        # Calculate next execution time
-        next_execution = scheduled_time
-        if next_execution <= now:
-            if schedule_repeat == ScheduleRepeat.ONCE:
-                raise ValueError("Scheduled time must be in the future for one-time tasks")
-            else:
-                # For repeating tasks, calculate next occurrence
-                next_execution = self._calculate_next_execution(
-                    scheduled_time, schedule_repeat, now
-                )
-        
+
         task = ScheduledTask(
             schedule_id=schedule_id,
             device_index=device_index,
@@ -120,35 +244,54 @@ class DeviceScheduler:
             created_at=now,
             enabled=True,
             last_executed=None,
-            next_execution=next_execution
+            cron=cron
         )
-        
+
+        # Calculate next execution time
+        if schedule_repeat == ScheduleRepeat.CRON:
+            # 给定 scheduled_time 时从该时间之后开始按 cron 执行
+            task.next_execution = self._next_execution(task, max(now, scheduled_time or now))
+        elif scheduled_time > now:
+            task.next_execution = scheduled_time
+        elif schedule_repeat == ScheduleRepeat.ONCE:
+            raise ValueError("Scheduled time must be in the future for one-time tasks")
+        else:
+            task.next_execution = self._next_execution(task, now)
+
+        await self._save(task)
         self._schedules[schedule_id] = task
+        self._push(task)
 
         return schedule_id
-    
+
     async def remove_schedule(self, schedule_id: str) -> bool:
         """
         移除定时任务
-        
+
         Args:
             schedule_id: 任务ID
-        
+
         Returns:
             是否成功移除
         """
         if schedule_id in self._schedules:
-            task = self._schedules.pop(schedule_id)
+            # 堆中的条目在出堆时发现任务不存在后丢弃
+            await self._delete(schedule_id, with_runs=True)
             return True
         return False
-    
+
+    def has_schedule(self, schedule_id: str, device_index: Optional[int] = None) -> bool:
+        """任务是否存在（指定 device_index 时还要求属于该设备）"""
+        task = self._schedules.get(schedule_id)
+        return task is not None and (device_index is None or task.device_index == device_index)
+
     async def get_schedules(self, device_index: Optional[int] = None) -> List[Dict]:
         """
         获取定时任务列表
-        
+
         Args:
             device_index: 可选，只获取指定设备的任务
-        
+
         Returns:
             任务列表
         """
@@ -157,101 +300,241 @@ class DeviceScheduler:
             if device_index is None or task.device_index == device_index:
                 task_dict = asdict(task)
                 # Convert datetime to ISO string
-                task_dict['scheduled_time'] = task.scheduled_time.isoformat()
+                task_dict['scheduled_time'] = _format_time(task.scheduled_time)
                 task_dict['created_at'] = task.created_at.isoformat()
-                if task.last_executed:
-                    task_dict['last_executed'] = task.last_executed.isoformat()
-                if task.next_execution:
-                    task_dict['next_execution'] = task.next_execution.isoformat()
+                task_dict['last_executed'] = _format_time(task.last_executed)
+                task_dict['next_execution'] = _format_time(task.next_execution)
                 schedules.append(task_dict)
-        
+
         # Sort by next execution time
-        schedules.sort(key=lambda x: x.get('next_execution', '9999-12-31'))
+        schedules.sort(key=lambda x: x.get('next_execution') or '9999-12-31')
         return schedules
-    
+
+    async def get_runs(self, schedule_id: str, limit: int = 20, device_index: Optional[int] = None) -> List[Dict]:
+        """
+        获取任务的执行记录（最新的在前，已完成的一次性任务也可查询）
+
+        Args:
+            schedule_id: 任务ID
+            limit: 返回条数
+            device_index: 可选，只返回该设备的记录
+        """
+        db = await self._get_db()
+        sql = "SELECT due_at, started_at, finished_at, result, message FROM device_schedule_runs WHERE schedule_id = ?"
+        params: list = [schedule_id]
+        if device_index is not None:
+            sql += " AND device_index = ?"
+            params.append(device_index)
+        rows = await db.fetch_all(sql + " ORDER BY id DESC LIMIT ?", (*params, limit))
+        return [
+            {
+                "due_at": row[0],
+                "started_at": row[1],
+                "finished_at": row[2],
+                "result": row[3],
+                "message": row[4],
+            }
+            for row in rows
+        ]
+
+    def _push(self, task: ScheduledTask):
+        """把任务的下次执行时间放入堆，并唤醒调度循环重新计算睡眠时间"""
+        if task.enabled and task.next_execution is not None:
+            heapq.heappush(self._heap, (task.next_execution, next(self._sequence), task.schedule_id))
+            self._wakeup.set()
+
+    async def _save(self, task: ScheduledTask):
+        db = await self._get_db()
+        await db.execute(
+            "INSERT OR REPLACE INTO device_schedules (schedule_id, device_index, device_name, action, "
+            "scheduled_time, repeat, cron, enabled, created_at, last_executed, next_execution) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                task.schedule_id, task.device_index, task.device_name, task.action.value,
+                _format_time(task.scheduled_time), task.repeat.value, task.cron, int(task.enabled),
+                task.created_at.isoformat(), _format_time(task.last_executed), _format_time(task.next_execution),
+            )
+        )
+
+    async def _delete(self, schedule_id: str, with_runs: bool = False):
+        """删除任务（with_runs 时连同执行记录）"""
+        self._schedules.pop(schedule_id, None)
+        db = await self._get_db()
+        operations = [("DELETE FROM device_schedules WHERE schedule_id = ?", [(schedule_id,)])]
+        if with_runs:
+            operations.append(("DELETE FROM device_schedule_runs WHERE schedule_id = ?", [(schedule_id,)]))
+        await db.execute_transaction(operations)
+
+    async def _record_run(
+        self,
+        task: ScheduledTask,
+        due_at: datetime,
+        started_at: datetime,
+        finished_at: Optional[datetime],
+        result: str,
+        message: Optional[str]
+    ):
+        """写入一条执行记录，只保留每个任务最近 MAX_RUNS_PER_SCHEDULE 条，并清理过期记录"""
+        try:
+            db = await self._get_db()
+            await db.execute_transaction([
+                (
+                    "INSERT INTO device_schedule_runs (schedule_id, device_index, action, due_at, started_at, "
+                    "finished_at, result, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(
+                        task.schedule_id, task.device_index, task.action.value, due_at.isoformat(),
+                        started_at.isoformat(), _format_time(finished_at), result, message,
+                    )]
+                ),
+                (
+                    "DELETE FROM device_schedule_runs WHERE schedule_id = ? AND id NOT IN "
+                    "(SELECT id FROM device_schedule_runs WHERE schedule_id = ? ORDER BY id DESC LIMIT ?)",
+                    [(task.schedule_id, task.schedule_id, MAX_RUNS_PER_SCHEDULE)]
+                ),
+                (
+                    "DELETE FROM device_schedule_runs WHERE started_at < ?",
+                    [((started_at - timedelta(days=RUN_RETENTION_DAYS)).isoformat(),)]
+                ),
+            ])
+        except Exception as e:
+            logger.error(f"Failed to record run of scheduled task {task.schedule_id}: {e}")
+
+    async def _record_missed(self, task: ScheduledTask, due_at: datetime, now: datetime):
+        """记录一次错过的执行（一次性任务随之删除）"""
+        self._missed += 1
+        logger.warning(f"Missed scheduled task {task.device_name} {task.action.value} due at {due_at}")
+        await self._record_run(task, due_at, now, now, "missed", "超过计划时间过久，已跳过")
+        if task.repeat == ScheduleRepeat.ONCE:
+            try:
+                await self._delete(task.schedule_id)
+            except Exception as e:
+                logger.error(f"Failed to delete scheduled task {task.schedule_id}: {e}")
+
     async def _scheduler_loop(self):
-        """调度循环，每分钟检查一次是否有到期任务"""
+        """调度循环：睡眠到堆顶任务到期，或有新任务加入"""
 
         while self._running:
             try:
-                await self._check_and_execute_tasks()
-                # Sleep for 30 seconds before next check
-                await asyncio.sleep(30)
+                self._wakeup.clear()
+                delay = await self._dispatch_due_tasks()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in scheduler loop: {e}")
-                await asyncio.sleep(30)
-        
+                await asyncio.sleep(1)
 
-    async def _check_and_execute_tasks(self):
-        """检查并执行到期的任务"""
+    async def _dispatch_due_tasks(self) -> float:
+        """
+        取出所有到期任务并发执行
+
+        Returns:
+            距离下一个任务到期的秒数（不超过 MAX_SLEEP_SECONDS）
+        """
         now = datetime.now()
-        tasks_to_execute = []
-        
-        for schedule_id, task in self._schedules.items():
-            if not task.enabled:
+        while self._heap and self._heap[0][0] <= now:
+            due_at, _, schedule_id = heapq.heappop(self._heap)
+            task = self._schedules.get(schedule_id)
+            if task is None or not task.enabled or task.next_execution != due_at:
                 continue
-            
-            if task.next_execution and task.next_execution <= now:
-                tasks_to_execute.append((schedule_id, task))
-        
-        for schedule_id, task in tasks_to_execute:
+
+            # 先确定下一次执行时间再开始执行，执行耗时不影响下次计划
+            if task.repeat == ScheduleRepeat.ONCE:
+                task.next_execution = None
+            else:
+                task.next_execution = self._next_execution(task, now)
+                self._push(task)
             try:
-                await self._execute_task(task)
-                
-                # Update task
-                task.last_executed = now
-                
-                # Calculate next execution or remove if one-time
-                if task.repeat == ScheduleRepeat.ONCE:
-                    self._schedules.pop(schedule_id, None)
-                else:
-                    task.next_execution = self._calculate_next_execution(
-                        task.scheduled_time, task.repeat, now
-                    )
+                await self._save(task)
+            except Exception as e:
+                # 保存失败不影响本次执行；内存中的下次执行时间仍然有效，
+                # 执行结束后会再次保存
+                logger.error(f"Failed to save scheduled task {task.schedule_id}: {e}")
+
+            if (now - due_at).total_seconds() > MISFIRE_GRACE_SECONDS:
+                # 事件循环长时间阻塞或系统休眠后才发现到期，不再执行
+                await self._record_missed(task, due_at, now)
+                continue
+
+            run = asyncio.create_task(self._run_task(task, due_at))
+            self._in_flight.add(run)
+            run.add_done_callback(self._in_flight.discard)
+
+        if not self._heap:
+            return MAX_SLEEP_SECONDS
+        delay = (self._heap[0][0] - datetime.now()).total_seconds()
+        return min(max(delay, 0.0), MAX_SLEEP_SECONDS)
+
+    async def _run_task(self, task: ScheduledTask, due_at: datetime):
+        """在并发上限内执行一次任务并记录结果"""
+        async with self._semaphore:
+            # 延迟包含等待并发名额的时间
+            started_at = datetime.now()
+            lateness_ms = (started_at - due_at).total_seconds() * 1000
+            self._max_lateness_ms = max(self._max_lateness_ms, lateness_ms)
 
-            
+            try:
+                outcome = await self._execute_task(task)
+                success = bool(outcome and outcome.get("success"))
+                message = (outcome or {}).get("message")
+            except Exception as e:
+                success, message = False, str(e)
+                logger.error(f"Failed to execute scheduled task {task.schedule_id}: {e}")
+            self._executed += 1
+            if not success:
+                self._failed += 1
+            task.last_executed = started_at
+
+            result = "success" if success else "failed"
+            await self._record_run(task, due_at, started_at, datetime.now(), result, message)
+            try:
+                if task.repeat == ScheduleRepeat.ONCE:
+                    await self._delete(task.schedule_id)
+                elif task.schedule_id in self._schedules:
+                    await self._save(task)
             except Exception as e:
-                logger.error(f"Failed to execute scheduled task {schedule_id}: {e}")
-                # Keep the task in schedule for retry
-    
-    async def _execute_task(self, task: ScheduledTask):
-        """执行定时任务"""
+                logger.error(f"Failed to update scheduled task {task.schedule_id}: {e}")
+
+    async def _execute_task(self, task: ScheduledTask) -> Optional[dict]:
+        """执行定时任务，返回设备操作结果"""
 
         # Import here to avoid circular dependency
         from api.devices import (
             shutdown_device, wake_device, reboot_device,
             sleep_device, hibernate_device
         )
-        
-        try:
-            # Call the appropriate API endpoint
-            if task.action == ScheduleAction.SHUTDOWN:
-                result = await shutdown_device(task.device_index)
-            elif task.action == ScheduleAction.WAKE:
-                result = await wake_device(task.device_index)
-            elif task.action == ScheduleAction.REBOOT:
-                result = await reboot_device(task.device_index)
-            elif task.action == ScheduleAction.SLEEP:
-                result = await sleep_device(task.device_index)
-            elif task.action == ScheduleAction.HIBERNATE:
-                result = await hibernate_device(task.device_index)
-            else:
-                logger.error(f"Unknown action: {task.action}")
-                return
-            
-            if not result.get("success"):
-                logger.warning(
-                    f"Scheduled task failed: {task.device_name} {task.action} - "
-                    f"{result.get('message', 'Unknown error')}"
-                )
-        
-        except Exception as e:
-            logger.error(
-                f"Error executing scheduled task {task.device_name} {task.action}: {e}"
+
+        # Call the appropriate API endpoint
+        if task.action == ScheduleAction.SHUTDOWN:
+            result = await shutdown_device(task.device_index)
+        elif task.action == ScheduleAction.WAKE:
+            result = await wake_device(task.device_index)
+        elif task.action == ScheduleAction.REBOOT:
+            result = await reboot_device(task.device_index)
+        elif task.action == ScheduleAction.SLEEP:
+            result = await sleep_device(task.device_index)
+        elif task.action == ScheduleAction.HIBERNATE:
+            result = await hibernate_device(task.device_index)
+        else:
+            logger.error(f"Unknown action: {task.action}")
+            return None
+
+        if not result.get("success"):
+            logger.warning(
+                f"Scheduled task failed: {task.device_name} {task.action} - "
+                f"{result.get('message', 'Unknown error')}"
             )
-    
+        return result
+
+    def _next_execution(self, task: ScheduledTask, from_time: datetime) -> datetime:
+        """重复任务在 from_time 之后的下次执行时间"""
+        if task.repeat == ScheduleRepeat.CRON:
+            return CronExpression(task.cron).next_after(from_time)
+        return self._calculate_next_execution(task.scheduled_time, task.repeat, from_time)
+
     def _calculate_next_execution(
         self,
         scheduled_time: datetime,
@@ -269,7 +552,7 @@ class DeviceScheduler:
             if next_time <= from_time:
                 next_time += timedelta(days=1)
             return next_time
-        
+
         elif repeat == ScheduleRepeat.WEEKLY:
             # Same day and time next week
             next_time = scheduled_time.replace(
@@ -288,11 +571,27 @@ class DeviceScheduler:
                 second=scheduled_time.second
             )
             return next_time
-        
+
         else:
             # ONCE - should not be called
             return scheduled_time
 
+    def get_stats(self) -> dict:
+        """获取调度器统计"""
+        next_due = self._heap[0][0] if self._heap else None
+        return {
+            "running": self._running,
+            "schedules": len(self._schedules),
+            "queued": len(self._heap),
+            "in_flight": len(self._in_flight),
+            "max_parallel": self.max_parallel,
+            "next_execution": _format_time(next_due),
+            "executed": self._executed,
+            "failed": self._failed,
+            "missed": self._missed,
+            "max_lateness_ms": round(self._max_lateness_ms, 1),
+        }
+
 
 # Global scheduler instance
 _scheduler: Optional[DeviceScheduler] = None
@@ -7,10 +7,38 @@ from models import EventType
 from services.lzc_shutdown import ShutdownInterface
 from services.history import get_history_service
 from services.notifier import get_notifier_service
+from services.shutdown_planner import ShutdownPlanner, get_hook_duration_store
 
 logger = logging.getLogger(__name__)
 
 
+# 关机策略相关的配置项 -> ShutdownManager 属性
+SHUTDOWN_CONFIG_FIELDS = {
+    "shutdown_wait_minutes": "wait_minutes",
+    "shutdown_battery_percent": "battery_percent",
+    "shutdown_final_wait_seconds": "final_wait_seconds",
+    "estimated_runtime_threshold": "estimated_runtime_threshold",
+    "test_mode": "test_mode",
+}
+
+# 预留给本机关机的续航（秒），关机前置任务需在剩余续航减去该值之前完成
+HOST_SHUTDOWN_RESERVE_SECONDS = 60
+# 执行本机关机前等待通知队列发送完毕的最长时间（秒，包含在上面的预留时间内）
+NOTIFY_FLUSH_TIMEOUT_SECONDS = 10
+
+
+def _hook_result_message(hook_result: dict) -> str:
+    """关机前置任务执行结果的事件描述（附关键路径）"""
+    message = (
+        f"关机前置任务执行完成：{hook_result['success']}/{hook_result['total']} 成功，"
+        f"{hook_result['failed']} 失败，{hook_result['skipped']} 跳过"
+    )
+    path = hook_result.get("critical_path")
+    if path:
+        message += f"；耗时 {hook_result.get('elapsed', 0):.0f} 秒，关键路径：{' → '.join(path)}"
+    return message
+
+
 class ShutdownManager:
     """关机管理器"""
     
@@ -51,10 +79,24 @@ class ShutdownManager:
         self._skip_reason: Optional[str] = None  # 跳过等待的原因
         self._cancelled_until_restore = False  # 取消后直到市电恢复才重新计时
         self._current_phase = "idle"  # 当前阶段：idle/waiting/final_countdown/executing_hooks/shutting_down_host/completed
+        self.planner = ShutdownPlanner()
+        self._plan: Optional[dict] = None  # 最近一次关机时间规划
+
+    def apply_config(self, change):
+        """配置变更订阅回调：只热更新变化的关机策略"""
+        updated = []
+        for key, attr in SHUTDOWN_CONFIG_FIELDS.items():
+            if change.touches(key):
+                setattr(self, attr, change.changes[key][1])
+                updated.append(f"{attr}={getattr(self, attr)}")
+        if updated:
+            logger.info(f"ShutdownManager hot-reloaded: {', '.join(updated)}")
 
     def on_power_lost(self, ups_data=None):
         """当检测到停电时调用"""
         self._current_ups_data = ups_data
+        if ups_data is not None:
+            self.planner.observe(ups_data)
 
         # 如果用户取消了关机且市电未恢复，不重新开始倒计时
         if self._cancelled_until_restore:
@@ -73,6 +115,8 @@ class ShutdownManager:
         """当检测到恢复供电时调用"""
         # 清除取消保护标记
         self._cancelled_until_restore = False
+        self.planner.reset()
+        self._plan = None
 
         if self._power_lost_time is not None:
             duration = (datetime.now() - self._power_lost_time).total_seconds()
@@ -204,6 +248,15 @@ class ShutdownManager:
                         logger.warning("Runtime critically low, skipping wait period")
                         self._skip_reason = "low_runtime"
                         break
+
+                # 预计续航不足以完成关机前置任务时提前开始
+                if await self._update_plan():
+                    logger.warning(
+                        f"Projected runtime {self._plan['projected_runtime_seconds']}s is below the "
+                        f"{self._plan['required_seconds']}s needed for the shutdown sequence, skipping wait period"
+                    )
+                    self._skip_reason = "runtime_budget"
+                    break
             else:
                 self._skip_reason = None  # 正常等待完成
 
@@ -223,6 +276,11 @@ class ShutdownManager:
             if hasattr(self, '_skip_reason') and self._skip_reason == "low_runtime":
                 runtime_min = self._current_ups_data.battery_runtime / 60 if self._current_ups_data.battery_runtime else 0
                 shutdown_reason = f"UPS 预计续航时间过短（{runtime_min:.1f} 分钟）"
+            elif self._skip_reason == "runtime_budget":
+                shutdown_reason = (
+                    f"按当前放电速度预计续航约 {self._plan['projected_runtime_seconds'] / 60:.1f} 分钟，"
+                    f"不足以完成关机流程（预计需要 {self._plan['required_seconds']} 秒）"
+                )
             else:
                 shutdown_reason = f"UPS 电池供电已超过 {self.wait_minutes} 分钟"
 
@@ -272,7 +330,9 @@ class ShutdownManager:
                         test_mode=self.test_mode,
                         progress_callback=broadcast_hook_progress,
                         cancellation_callback=lambda: self._shutdown_cancelled,
-                        urgent=self._skip_reason == "low_runtime"
+                        urgent=self._skip_reason in ("low_runtime", "runtime_budget"),
+                        runtime_budget=self._hook_runtime_budget(),
+                        duration_store=get_hook_duration_store()
                     )
                     hook_result = await executor.execute_all()
 
@@ -280,8 +340,8 @@ class ShutdownManager:
                     history_service = await get_history_service()
                     await history_service.add_event(
                         EventType.SHUTDOWN,
-                        f"关机前置任务执行完成：{hook_result['success']}/{hook_result['total']} 成功，"
-                        f"{hook_result['failed']} 失败，{hook_result['skipped']} 跳过"
+                        _hook_result_message(hook_result),
+                        metadata={"timeline": hook_result.get("timeline", [])}
                     )
             except Exception as e:
                 logger.error(f"Error executing pre-shutdown hooks: {e}")
@@ -294,6 +354,8 @@ class ShutdownManager:
                 # Dry-run 模式：不执行实际关机
                 self._current_phase = "completed"
             else:
+                # 通知在后台队列中发送，关机前先等待"即将关机"等通知发出
+                await self._flush_notifications()
                 logger.critical("Executing system shutdown NOW!")
                 success = await self.shutdown_client.shutdown()
                 
@@ -313,6 +375,7 @@ class ShutdownManager:
                         "宿主机关机中",
                         "宿主机关机命令已成功执行，系统正在关闭。"
                     )
+                    await self._flush_notifications()
                 else:
                     logger.error("Failed to execute shutdown command")
                     self._current_phase = "idle"
@@ -343,6 +406,45 @@ class ShutdownManager:
                 except Exception:
                     pass
     
+    async def _update_plan(self) -> bool:
+        """更新关机时间规划，返回是否应立即开始关机"""
+        try:
+            from config import get_config_manager
+            config_manager = await get_config_manager()
+            config = await config_manager.get_config()
+            self._plan = self.planner.plan(
+                config.pre_shutdown_hooks,
+                self.final_wait_seconds,
+                HOST_SHUTDOWN_RESERVE_SECONDS,
+                low_charge=self._low_charge_threshold()
+            )
+        except Exception as e:
+            logger.error(f"Failed to update shutdown plan: {e}")
+            return False
+        slack = self._plan["slack_seconds"]
+        return slack is not None and slack <= 0
+
+    def _low_charge_threshold(self) -> float:
+        """低电量阈值（%）：配置的关机电量和 UPS 上报的 battery.charge.low 中较高的一个"""
+        ups_low = getattr(self._current_ups_data, "battery_charge_low", None) if self._current_ups_data else None
+        return max(float(self.battery_percent or 0), float(ups_low or 0))
+
+    def _hook_runtime_budget(self) -> Optional[float]:
+        """关机前置任务可用的时间（剩余续航减去本机关机预留），续航未知时不限制"""
+        if self._current_ups_data is None or not self._current_ups_data.battery_runtime:
+            return None
+        return max(0.0, self._current_ups_data.battery_runtime - HOST_SHUTDOWN_RESERVE_SECONDS)
+
+    async def _flush_notifications(self):
+        """等待通知队列发送完毕（有上限，超时后继续关机）"""
+        try:
+            if not await get_notifier_service().flush(timeout=NOTIFY_FLUSH_TIMEOUT_SECONDS):
+                logger.warning(
+                    f"Notifications still queued after {NOTIFY_FLUSH_TIMEOUT_SECONDS}s, shutting down anyway"
+                )
+        except Exception as e:
+            logger.error(f"Error flushing notifications before shutdown: {e}")
+
     async def _broadcast_countdown(self):
         """广播关机倒计时"""
         try:
@@ -399,7 +501,8 @@ class ShutdownManager:
                     "elapsed_seconds": int(elapsed),
                     "remaining_seconds": int(remaining),
                     "in_final_countdown": False,
-                    "phase": self._current_phase
+                    "phase": self._current_phase,
+                    "plan": self._plan
                 }
             else:
                 # 立即关机模式（没有倒计时）
@@ -454,7 +557,8 @@ class ShutdownManager:
                         test_mode=self.test_mode,
                         progress_callback=broadcast_hook_progress,
                         cancellation_callback=lambda: self._shutdown_cancelled,
-                        urgent=False  # 手动触发的立即关机不算紧急
+                        urgent=False,  # 手动触发的立即关机不算紧急
+                        duration_store=get_hook_duration_store()
                     )
                     hook_result = await executor.execute_all()
 
@@ -467,8 +571,8 @@ class ShutdownManager:
                     history_service = await get_history_service()
                     await history_service.add_event(
                         EventType.SHUTDOWN,
-                        f"关机前置任务执行完成：{hook_result['success']}/{hook_result['total']} 成功，"
-                        f"{hook_result['failed']} 失败，{hook_result['skipped']} 跳过"
+                        _hook_result_message(hook_result),
+                        metadata={"timeline": hook_result.get("timeline", [])}
                     )
             except Exception as e:
                 logger.error(f"Error executing pre-shutdown hooks: {e}")
@@ -486,6 +590,8 @@ class ShutdownManager:
                 self._current_phase = "completed"
                 return True
             else:
+                # 通知在后台队列中发送，关机前先等待"即将关机"等通知发出
+                await self._flush_notifications()
                 logger.critical("Executing system shutdown NOW!")
                 success = await self.shutdown_client.shutdown()
                 
@@ -504,6 +610,7 @@ class ShutdownManager:
                         "宿主机关机中",
                         "宿主机关机命令已成功执行，系统正在关闭。"
                     )
+                    await self._flush_notifications()
                     return True
                 else:
                     logger.error("Failed to execute shutdown command")
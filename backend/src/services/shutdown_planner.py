@@ -0,0 +1,285 @@
+"""关机时间规划
+
+ShutdownManager 原来只按固定的 wait_minutes 和 estimated_runtime_threshold
+判断何时开始关机，不知道关机前置任务实际要花多久：任务多、主机慢时，
+阈值可能根本不够用。
+
+规划器把两部分结合起来：
+
+- 任务耗时：HookExecutor 每次真实执行后记录各任务耗时（指数加权平均，
+  持久化到 hook_durations 表），按依赖图求关键路径得到整个任务序列的
+  预计耗时
+- 续航：断电期间跟踪 battery.charge 和 battery.runtime 的放电斜率
+  （最近几分钟的最小二乘），UPS 上报的续航按实际下降速度修正，电量
+  按当前放电速度外推到低电量阈值，取较保守的一个。斜率要求数分钟内
+  持续存在（整个窗口和后半段都陡），断电初期的表面电荷压降或一次负载
+  跳变不会单独拉低预计续航；预计续航也不低于上报续航的一定比例
+
+所需时间 = 任务预计耗时 × (1 + 安全系数) + 最终等待 + 本机关机预留，
+最晚安全开始时间 = 现在 + 预计续航 - 所需时间。余量不足时提前开始关机。
+"""
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from services.hook_graph import estimated_seconds, latest_finish_times, safe_dependencies
+
+logger = logging.getLogger(__name__)
+
+# 放电斜率计算参数
+DISCHARGE_WINDOW_SECONDS = 600.0  # 只使用最近 10 分钟的采样
+MIN_SLOPE_SAMPLES = 10
+MIN_SLOPE_SPAN_SECONDS = 180.0  # 至少 3 分钟的趋势才用于修正续航
+# 预计续航最多低于 UPS 上报续航的比例（上报 10 分钟时不低于 5 分钟）
+MIN_PROJECTION_RATIO = 0.5
+
+# 任务耗时统计参数
+DURATION_EWMA_ALPHA = 0.3
+
+# 规划安全系数
+HOOK_DURATION_SAFETY_FACTOR = 0.2
+MIN_SAFETY_MARGIN_SECONDS = 30.0
+
+
+def _slope(points: Sequence[Tuple[float, float]]) -> Optional[float]:
+    """最小二乘斜率（单位 / 秒）"""
+    n = len(points)
+    if n < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if var_t <= 0:
+        return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t
+
+
+class DischargeTracker:
+    """跟踪断电期间的放电速度"""
+
+    def __init__(self, window_seconds: float = DISCHARGE_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._charge: Deque[Tuple[float, float]] = deque()
+        self._runtime: Deque[Tuple[float, float]] = deque()
+
+    def reset(self):
+        self._charge.clear()
+        self._runtime.clear()
+
+    def observe(self, battery_charge: Optional[float], battery_runtime: Optional[float], now: Optional[float] = None):
+        """记录一次采样（now 为 time.monotonic 秒）"""
+        now = time.monotonic() if now is None else now
+        if battery_charge is not None:
+            self._charge.append((now, float(battery_charge)))
+        if battery_runtime is not None:
+            self._runtime.append((now, float(battery_runtime)))
+        for samples in (self._charge, self._runtime):
+            while samples and now - samples[0][0] > self.window_seconds:
+                samples.popleft()
+
+    @staticmethod
+    def _sustained_slope(samples: Deque[Tuple[float, float]]) -> Optional[float]:
+        """
+        持续的变化速度
+
+        要求采样覆盖 MIN_SLOPE_SPAN_SECONDS 以上；取整个窗口和后半段两个
+        斜率中较平缓的一个，只在一段时间内持续存在的下降才被采用。
+        """
+        if len(samples) < MIN_SLOPE_SAMPLES or samples[-1][0] - samples[0][0] < MIN_SLOPE_SPAN_SECONDS:
+            return None
+        full = _slope(samples)
+        midpoint = (samples[0][0] + samples[-1][0]) / 2
+        recent = [point for point in samples if point[0] >= midpoint]
+        recent_slope = _slope(recent) if len(recent) >= MIN_SLOPE_SAMPLES // 2 else None
+        if full is None or recent_slope is None:
+            return full
+        return max(full, recent_slope)
+
+    def charge_slope(self) -> Optional[float]:
+        """电量变化速度（%/秒，放电为负）"""
+        return self._sustained_slope(self._charge)
+
+    def runtime_slope(self) -> Optional[float]:
+        """UPS 上报续航的变化速度（秒/秒，理想情况约为 -1）"""
+        return self._sustained_slope(self._runtime)
+
+    def projected_runtime(self, low_charge: float = 0.0) -> Optional[float]:
+        """
+        预计剩余续航（秒）
+
+        - UPS 上报的续航：若上报值下降得比真实时间快（斜率 < -1），
+          按实际下降速度修正
+        - 电量外推：当前电量降到 low_charge（低电量阈值）所需时间
+        取两者中较小的一个，但不低于上报续航的 MIN_PROJECTION_RATIO；
+        采样不足时直接使用上报值。
+
+        Args:
+            low_charge: 低电量阈值（%）
+        """
+        estimates = []
+        reported = self._runtime[-1][1] if self._runtime else None
+        if reported is not None:
+            slope = self.runtime_slope()
+            if slope is not None and slope < -1:
+                estimates.append(reported / -slope)
+            else:
+                estimates.append(reported)
+        charge_slope = self.charge_slope()
+        if self._charge and charge_slope is not None and charge_slope < 0:
+            estimates.append(max(0.0, self._charge[-1][1] - low_charge) / -charge_slope)
+        if not estimates:
+            return None
+        projected = min(estimates)
+        if reported is not None:
+            projected = max(projected, reported * MIN_PROJECTION_RATIO)
+        return projected
+
+
+class HookDurationStore:
+    """关机前置任务的历史耗时（按任务名称）"""
+
+    def __init__(self, alpha: float = DURATION_EWMA_ALPHA):
+        self.alpha = alpha
+        # 名称 -> {avg, max, last, runs}
+        self._durations: Dict[str, Dict[str, float]] = {}
+
+    async def load(self):
+        """从数据库加载历史耗时"""
+        try:
+            from db.database import get_db
+            db = await get_db()
+            rows = await db.fetch_all(
+                "SELECT hook_name, avg_seconds, max_seconds, last_seconds, runs FROM hook_durations"
+            )
+            self._durations = {
+                row[0]: {"avg": row[1], "max": row[2], "last": row[3], "runs": row[4]}
+                for row in rows
+            }
+        except Exception as e:
+            logger.error(f"Failed to load hook durations: {e}")
+
+    async def record(self, hook_name: str, seconds: float):
+        """记录一次执行耗时并持久化"""
+        entry = self._durations.get(hook_name)
+        if entry is None:
+            entry = {"avg": seconds, "max": seconds, "last": seconds, "runs": 1}
+        else:
+            entry = {
+                "avg": self.alpha * seconds + (1 - self.alpha) * entry["avg"],
+                "max": max(entry["max"], seconds),
+                "last": seconds,
+                "runs": entry["runs"] + 1,
+            }
+        self._durations[hook_name] = entry
+
+        try:
+            from db.database import get_db
+            db = await get_db()
+            await db.execute(
+                """
+                INSERT INTO hook_durations (hook_name, avg_seconds, max_seconds, last_seconds, runs, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(hook_name) DO UPDATE SET
+                    avg_seconds = excluded.avg_seconds,
+                    max_seconds = excluded.max_seconds,
+                    last_seconds = excluded.last_seconds,
+                    runs = excluded.runs,
+                    updated_at = excluded.updated_at
+                """,
+                (hook_name, entry["avg"], entry["max"], entry["last"], entry["runs"])
+            )
+        except Exception as e:
+            logger.error(f"Failed to persist duration for hook '{hook_name}': {e}")
+
+    def estimates(self) -> Dict[str, float]:
+        """各任务的预计耗时（取平均值和最近一次中较大的一个）"""
+        return {name: max(entry["avg"], entry["last"]) for name, entry in self._durations.items()}
+
+    def get_stats(self) -> Dict[str, dict]:
+        return {
+            name: {key: round(value, 2) if isinstance(value, float) else value for key, value in entry.items()}
+            for name, entry in self._durations.items()
+        }
+
+
+def sequence_duration(hooks_config: List[dict], estimates: Optional[Dict[str, float]] = None) -> float:
+    """已启用任务按依赖图执行的预计总耗时（关键路径长度，秒）"""
+    enabled = [h for h in hooks_config if h.get("enabled", True)]
+    if not enabled:
+        return 0.0
+    deps = safe_dependencies(enabled)
+    durations = [estimated_seconds(h, estimates) for h in enabled]
+    lft = latest_finish_times(deps, durations)
+    return max(durations[i] - lft[i] for i in range(len(enabled)))
+
+
+class ShutdownPlanner:
+    """根据放电速度和任务耗时推算最晚安全开始关机的时间"""
+
+    def __init__(self, duration_store: Optional[HookDurationStore] = None):
+        self.tracker = DischargeTracker()
+        self.duration_store = duration_store or get_hook_duration_store()
+
+    def reset(self):
+        """市电恢复后清空放电采样"""
+        self.tracker.reset()
+
+    def observe(self, ups_data):
+        """记录一次断电期间的 UPS 采样"""
+        self.tracker.observe(ups_data.battery_charge, ups_data.battery_runtime)
+
+    def plan(
+        self,
+        hooks_config: List[dict],
+        final_wait_seconds: float,
+        host_reserve_seconds: float,
+        low_charge: float = 0.0,
+    ) -> dict:
+        """
+        计算当前的关机规划
+
+        Args:
+            hooks_config: 关机前置任务配置
+            final_wait_seconds: 最终倒计时秒数
+            host_reserve_seconds: 预留给本机关机的时间（秒）
+            low_charge: 低电量阈值（%），电量按放电速度外推到该值
+
+        Returns:
+            规划字典；slack_seconds 为负或为 0 表示应立即开始关机，
+            预计续航未知时 slack_seconds 为 None
+        """
+        hooks_seconds = sequence_duration(hooks_config, self.duration_store.estimates())
+        margin = max(MIN_SAFETY_MARGIN_SECONDS, hooks_seconds * HOOK_DURATION_SAFETY_FACTOR)
+        required = hooks_seconds + margin + final_wait_seconds + host_reserve_seconds
+
+        projected = self.tracker.projected_runtime(low_charge)
+        charge_slope = self.tracker.charge_slope()
+        runtime_slope = self.tracker.runtime_slope()
+        slack = projected - required if projected is not None else None
+        latest_start = None
+        if slack is not None:
+            latest_start = (datetime.now() + timedelta(seconds=max(0.0, slack))).isoformat()
+
+        return {
+            "projected_runtime_seconds": round(projected) if projected is not None else None,
+            "hooks_seconds": round(hooks_seconds, 1),
+            "required_seconds": round(required),
+            "slack_seconds": round(slack) if slack is not None else None,
+            "latest_safe_start": latest_start,
+            "charge_slope_per_minute": round(charge_slope * 60, 3) if charge_slope is not None else None,
+            "runtime_slope": round(runtime_slope, 3) if runtime_slope is not None else None,
+        }
+
+
+# 全局任务耗时统计
+_hook_duration_store: Optional[HookDurationStore] = None
+
+
+def get_hook_duration_store() -> HookDurationStore:
+    """获取任务耗时统计实例"""
+    global _hook_duration_store
+    if _hook_duration_store is None:
+        _hook_duration_store = HookDurationStore()
+    return _hook_duration_store
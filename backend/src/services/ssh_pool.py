@@ -0,0 +1,306 @@
+"""SSH 会话池
+
+SSH 关机任务和设备管理接口（执行命令、检查、查看日志、重启）原来每次
+操作都重新建立 SSH 连接：TCP 握手、密钥交换、认证都要重来一遍。
+几十台主机同时关机时，大部分时间都花在握手上。
+
+会话池按 (主机, 端口, 用户, 凭据摘要) 保持已认证的连接：
+
+- 同一主机的后续操作直接在已有连接上开新通道（预关机命令和关机命令
+  共用一个连接）
+- 使用 asyncssh 自带的 keepalive 检测断线；复用空闲超过 probe_after
+  秒的连接前先执行一次空命令探测，避免把关机命令发到已经失效的连接上
+  （关机命令之后的断线会被当作成功）
+- UPS 切换到电池供电时按关机前置任务配置预先建立连接并固定（pinned），
+  市电恢复后取消固定，由后台清理任务按空闲时间关闭
+- 连接上的操作出现 SSH / 网络异常时丢弃该连接，下次重新建立
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncssh
+
+logger = logging.getLogger(__name__)
+
+# 走 SSH 的关机前置任务类型
+SSH_HOOK_IDS = ("ssh_shutdown", "windows_shutdown")
+
+# 默认参数
+DEFAULT_CONNECT_TIMEOUT = 10.0  # 秒
+DEFAULT_KEEPALIVE_INTERVAL = 15  # 秒
+DEFAULT_KEEPALIVE_COUNT_MAX = 3
+DEFAULT_IDLE_TTL = 300.0  # 未固定连接的最长空闲时间（秒）
+DEFAULT_PROBE_AFTER = 10.0  # 复用前探测的空闲阈值（秒）
+DEFAULT_PREWARM_CONCURRENCY = 16
+REAP_INTERVAL = 60.0  # 秒
+
+SessionKey = Tuple[str, int, str, str]
+
+
+def ssh_connect_kwargs(config: dict) -> dict:
+    """由设备 / 任务配置生成 asyncssh.connect 参数"""
+    connect_kwargs = {
+        "host": config.get("host"),
+        "port": config.get("port", 22),
+        "username": config.get("username"),
+        "known_hosts": None  # 禁用 host key 检查
+    }
+    if config.get("auth_type", "password") == "password":
+        connect_kwargs["password"] = config.get("password")
+    else:
+        # 使用私钥认证
+        connect_kwargs["client_keys"] = [config.get("private_key")]
+    return connect_kwargs
+
+
+def session_key(config: dict) -> SessionKey:
+    """会话键（凭据只保留摘要，修改密码或私钥后使用新连接）"""
+    secret = config.get("password") or config.get("private_key") or ""
+    digest = hashlib.sha256(f"{config.get('auth_type', 'password')}:{secret}".encode()).hexdigest()[:16]
+    return (str(config.get("host")), int(config.get("port", 22)), str(config.get("username")), digest)
+
+
+class _Session:
+    """池中的一个已认证连接"""
+
+    __slots__ = ("conn", "created_at", "last_used", "in_use", "pinned")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.in_use = 0
+        self.pinned = False
+
+
+class SSHSessionPool:
+    """SSH 会话池"""
+
+    def __init__(
+        self,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        probe_after: float = DEFAULT_PROBE_AFTER,
+        keepalive_interval: int = DEFAULT_KEEPALIVE_INTERVAL,
+        keepalive_count_max: int = DEFAULT_KEEPALIVE_COUNT_MAX,
+    ):
+        """
+        Args:
+            idle_ttl: 未固定连接的最长空闲时间（秒）
+            probe_after: 空闲超过该时间的连接复用前先探测（秒）
+            keepalive_interval: SSH keepalive 间隔（秒）
+            keepalive_count_max: keepalive 连续无响应多少次视为断线
+        """
+        self.idle_ttl = idle_ttl
+        self.probe_after = probe_after
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count_max = keepalive_count_max
+
+        self._sessions: Dict[SessionKey, _Session] = {}
+        # 每个主机的建连锁及等待 / 持有该锁的协程数；没有连接且无人使用时移除
+        self._locks: Dict[SessionKey, asyncio.Lock] = {}
+        self._lock_users: Dict[SessionKey, int] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+        # 统计
+        self._connects = 0
+        self._reuses = 0
+        self._probe_failures = 0
+        self._connect_failures = 0
+        self._discarded = 0
+        self._expired = 0
+        self._total_connect_ms = 0.0
+
+    async def _connect(self, config: dict, connect_timeout: float):
+        start = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(
+                asyncssh.connect(
+                    **ssh_connect_kwargs(config),
+                    keepalive_interval=self.keepalive_interval,
+                    keepalive_count_max=self.keepalive_count_max,
+                ),
+                timeout=connect_timeout
+            )
+        except Exception:
+            self._connect_failures += 1
+            raise
+        self._connects += 1
+        self._total_connect_ms += (time.perf_counter() - start) * 1000
+        return conn
+
+    async def _probe(self, conn) -> bool:
+        """在连接上执行空命令，确认连接可用"""
+        try:
+            await asyncio.wait_for(conn.run("exit 0", check=False), timeout=3)
+            return True
+        except Exception:
+            return False
+
+    async def _acquire(self, config: dict, connect_timeout: float) -> _Session:
+        key = session_key(config)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                session = self._sessions.get(key)
+                if session is not None:
+                    idle = time.monotonic() - session.last_used
+                    if not session.conn.is_closed() and (idle < self.probe_after or await self._probe(session.conn)):
+                        self._reuses += 1
+                        return session
+                    if not session.conn.is_closed():
+                        self._probe_failures += 1
+                    self._drop(key, session)
+
+                conn = await self._connect(config, connect_timeout)
+                session = _Session(conn)
+                self._sessions[key] = session
+                self._ensure_reaper()
+                return session
+        finally:
+            self._lock_users[key] -= 1
+            self._prune_lock(key)
+
+    def _prune_lock(self, key: SessionKey):
+        """主机没有连接且没有协程在等待建连时移除其锁"""
+        if key not in self._sessions and not self._lock_users.get(key):
+            self._locks.pop(key, None)
+            self._lock_users.pop(key, None)
+
+    def _drop(self, key: SessionKey, session: _Session):
+        if self._sessions.get(key) is session:
+            del self._sessions[key]
+            self._prune_lock(key)
+        try:
+            session.conn.close()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def session(self, config: dict, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT):
+        """
+        获取与配置对应的已认证连接
+
+        Args:
+            config: 设备 / 任务配置（host / port / username / 认证信息）
+            connect_timeout: 需要新建连接时的超时（秒）
+
+        操作中出现 SSH 或网络异常时连接会被丢弃。
+        """
+        key = session_key(config)
+        session = await self._acquire(config, connect_timeout)
+        session.in_use += 1
+        try:
+            yield session.conn
+        except (asyncssh.Error, OSError):
+            self._drop(key, session)
+            raise
+        finally:
+            session.in_use -= 1
+            session.last_used = time.monotonic()
+
+    def discard(self, config: dict):
+        """关闭并移除连接（发送关机 / 重启等命令后调用）"""
+        key = session_key(config)
+        session = self._sessions.get(key)
+        if session is not None:
+            self._drop(key, session)
+            self._discarded += 1
+
+    async def prewarm(self, configs: Iterable[dict], concurrency: int = DEFAULT_PREWARM_CONCURRENCY) -> int:
+        """并发预先建立连接并固定，返回可用连接数"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _warm(config: dict) -> bool:
+            async with semaphore:
+                try:
+                    session = await self._acquire(config, DEFAULT_CONNECT_TIMEOUT)
+                    session.pinned = True
+                    return True
+                except Exception as e:
+                    logger.warning(f"Failed to prewarm SSH session to {config.get('host')}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(_warm(config) for config in configs))
+        return sum(results)
+
+    def release_pins(self):
+        """取消所有固定（市电恢复后调用），空闲连接随后由清理任务关闭"""
+        for session in self._sessions.values():
+            session.pinned = False
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        """定期关闭已断开或空闲过久的连接，池为空时退出"""
+        while self._sessions:
+            try:
+                await asyncio.sleep(REAP_INTERVAL)
+                self.reap()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in SSH session reaper: {e}")
+
+    def reap(self) -> int:
+        """关闭已断开或空闲过久的连接，返回关闭数量"""
+        now = time.monotonic()
+        removed = 0
+        for key, session in list(self._sessions.items()):
+            closed = session.conn.is_closed()
+            idle = session.in_use == 0 and not session.pinned and now - session.last_used > self.idle_ttl
+            if closed or idle:
+                self._drop(key, session)
+                self._expired += 1
+                removed += 1
+        return removed
+
+    async def close(self):
+        """关闭所有连接"""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        for key, session in list(self._sessions.items()):
+            self._drop(key, session)
+
+    def get_stats(self) -> dict:
+        """获取会话池统计"""
+        return {
+            "sessions": len(self._sessions),
+            "pinned": sum(1 for s in self._sessions.values() if s.pinned),
+            "in_use": sum(s.in_use for s in self._sessions.values()),
+            "connects": self._connects,
+            "reuses": self._reuses,
+            "connect_failures": self._connect_failures,
+            "probe_failures": self._probe_failures,
+            "discarded": self._discarded,
+            "expired": self._expired,
+            "avg_connect_ms": round(self._total_connect_ms / self._connects, 2) if self._connects else None,
+            "hosts": sorted(f"{key[2]}@{key[0]}:{key[1]}" for key in self._sessions),
+        }
+
+
+def ssh_hook_configs(hooks_config: List[dict]) -> List[dict]:
+    """关机前置任务中走 SSH 的已启用任务配置"""
+    return [
+        hook.get("config", {})
+        for hook in hooks_config
+        if hook.get("enabled", True) and hook.get("hook_id") in SSH_HOOK_IDS and hook.get("config", {}).get("host")
+    ]
+
+
+# 全局会话池
+_ssh_pool: Optional[SSHSessionPool] = None
+
+
+def get_ssh_pool() -> SSHSessionPool:
+    """获取 SSH 会话池实例"""
+    global _ssh_pool
+    if _ssh_pool is None:
+        _ssh_pool = SSHSessionPool()
+    return _ssh_pool
@@ -0,0 +1,131 @@
+"""存储统计与容量预测
+
+读取 db.storage_stats 中由触发器维护的统计（与数据量无关的常数级查询），
+按最近几天的每日增量计算各表增长速度，再结合保留天数预测数据库稳定后
+的大小：每个表稳定后的数据量 ≈ 每日增量 × 保留天数。估算的行字节数不含
+页和索引开销，按数据库文件实际大小与估算总量的比例校准。
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from db.rollups import ROLLUP_TIERS
+
+# 计算增长速度使用的天数（不含今天）
+GROWTH_WINDOW_DAYS = 7
+
+# 今天的数据按已过去的时间折算每日增量，至少按 1 小时计
+MIN_DAY_FRACTION = 1 / 24
+
+# 文件大小 / 估算数据量 的校准范围
+MIN_OVERHEAD_FACTOR = 1.0
+MAX_OVERHEAD_FACTOR = 4.0
+
+# 各表对应的保留天数配置项
+TABLE_RETENTION_KEYS: Dict[str, str] = {
+    "events": "history_retention_days",
+    "metrics": "history_retention_days",
+    **{table: f"rollup_{tier}_retention_days" for tier, (table, _) in ROLLUP_TIERS.items()},
+}
+
+
+def growth_rate(daily: List[dict], earliest: Optional[str], now: datetime) -> Dict[str, float]:
+    """
+    每日增量（行数和字节数）
+
+    Args:
+        daily: 最近几天的每日统计 [{day, rows, bytes}]（UTC 日期）
+        earliest: 表中最早记录的时间
+        now: 当前时间（UTC，无时区）
+    """
+    today = now.date()
+    window_start = today - timedelta(days=GROWTH_WINDOW_DAYS)
+    complete = [d for d in daily if window_start <= date.fromisoformat(d["day"]) < today]
+
+    if complete:
+        first_day = window_start
+        if earliest:
+            first_day = max(first_day, date.fromisoformat(earliest[:10]))
+        span = max(1, (today - first_day).days)
+        rows = sum(d["rows"] for d in complete)
+        size = sum(d["bytes"] for d in complete)
+    else:
+        # 只有今天的数据：按已过去的时间折算
+        todays = [d for d in daily if d["day"] == today.isoformat()]
+        midnight = datetime.combine(today, datetime.min.time())
+        span = max(MIN_DAY_FRACTION, (now - midnight).total_seconds() / 86400)
+        rows = sum(d["rows"] for d in todays)
+        size = sum(d["bytes"] for d in todays)
+
+    return {"rows_per_day": rows / span, "bytes_per_day": size / span}
+
+
+async def load_storage_stats(db, now: Optional[datetime] = None) -> Dict[str, dict]:
+    """读取各表统计和增长速度"""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    since = (now.date() - timedelta(days=GROWTH_WINDOW_DAYS)).isoformat()
+
+    rows = await db.fetch_all("SELECT table_name, row_count, earliest, latest, bytes FROM storage_stats")
+    daily_rows = await db.fetch_all(
+        "SELECT table_name, day, rows, bytes FROM storage_daily WHERE day >= ? ORDER BY day",
+        (since,)
+    )
+    daily: Dict[str, List[dict]] = {}
+    for row in daily_rows:
+        daily.setdefault(row[0], []).append({"day": row[1], "rows": row[2], "bytes": row[3]})
+
+    tables = {}
+    for row in rows:
+        table_daily = daily.get(row[0], [])
+        tables[row[0]] = {
+            "rows": row[1],
+            "earliest": row[2],
+            "latest": row[3],
+            "bytes": row[4],
+            "daily": table_daily,
+            **growth_rate(table_daily, row[2], now),
+        }
+    return tables
+
+
+def forecast_usage(tables: Dict[str, dict], config, db_size_bytes: int) -> dict:
+    """
+    按保留天数预测数据库稳定后的大小
+
+    Args:
+        tables: load_storage_stats 的结果
+        config: 系统配置（读取各保留天数）
+        db_size_bytes: 数据库文件当前大小
+    """
+    tracked = sum(t["bytes"] for t in tables.values())
+    overhead = 1.0
+    if tracked > 0 and db_size_bytes > 0:
+        overhead = min(MAX_OVERHEAD_FACTOR, max(MIN_OVERHEAD_FACTOR, db_size_bytes / tracked))
+
+    result_tables = {}
+    projected = 0.0
+    unbounded = []
+    for table, stats in tables.items():
+        key = TABLE_RETENTION_KEYS.get(table)
+        retention = getattr(config, key, None) if key else None
+        if not retention:
+            # 未配置保留期的表会一直增长
+            unbounded.append(table)
+            table_projected = None
+        else:
+            table_projected = stats["bytes_per_day"] * retention * overhead
+            projected += table_projected
+        result_tables[table] = {
+            "retention_days": retention,
+            "bytes_per_day": round(stats["bytes_per_day"] * overhead),
+            "rows_per_day": round(stats["rows_per_day"], 1),
+            "projected_bytes": round(table_projected) if table_projected is not None else None,
+        }
+
+    return {
+        "overhead_factor": round(overhead, 2),
+        "projected_bytes": round(projected),
+        "projected_mb": round(projected / 1024 / 1024, 2),
+        "growth_bytes_per_day": round(sum(t["bytes_per_day"] for t in tables.values()) * overhead),
+        "unbounded_tables": unbounded,
+        "tables": result_tables,
+    }
@@ -0,0 +1,191 @@
+"""NUT 变量目录（增量轮询）
+
+每次轮询都 LIST VAR 会把约 60 个变量全部传输并重新解析一遍，
+而型号、序列号、额定值等静态变量几乎不会变化。变量目录缓存上一次
+的完整变量表，并按变量分级刷新：
+
+- 热变量（状态、电量、续航、输入电压、负载）每次轮询都读取
+- 静态变量（device.*、序列号、额定值、生产日期等）长 TTL
+- 其余变量使用较短的 TTL
+
+首次读取、DATACHANGED 事件、重连、ups.status 变化或超过完整刷新间隔时
+重新 LIST VAR，以发现新出现或消失的变量（如 ups.alarm）。
+"""
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 每次轮询都读取的热变量
+HOT_VARIABLES = (
+    "ups.status",
+    "battery.charge",
+    "battery.runtime",
+    "input.voltage",
+    "ups.load",
+)
+
+# 静态变量前缀（设备信息、驱动参数）
+STATIC_PREFIXES = ("device.", "driver.")
+
+# 静态变量
+STATIC_VARIABLES = {
+    "ups.model",
+    "ups.mfr",
+    "ups.mfr.date",
+    "ups.serial",
+    "ups.productid",
+    "ups.vendorid",
+    "ups.firmware",
+    "ups.firmware.aux",
+    "ups.power.nominal",
+    "ups.realpower.nominal",
+    "input.voltage.nominal",
+    "input.frequency.nominal",
+    "output.voltage.nominal",
+    "output.frequency.nominal",
+    "output.current.nominal",
+    "battery.voltage.nominal",
+    "battery.type",
+    "battery.date",
+    "battery.mfr.date",
+    "battery.packs",
+}
+
+# 默认刷新参数（秒）
+DEFAULT_WARM_TTL = 30
+DEFAULT_STATIC_TTL = 3600
+DEFAULT_FULL_REFRESH_INTERVAL = 300
+
+
+def is_static_variable(name: str) -> bool:
+    """判断变量是否为静态变量"""
+    return name in STATIC_VARIABLES or name.startswith(STATIC_PREFIXES)
+
+
+class VariableCatalog:
+    """NUT 变量目录，按刷新计划增量读取变量"""
+
+    def __init__(
+        self,
+        warm_ttl: float = DEFAULT_WARM_TTL,
+        static_ttl: float = DEFAULT_STATIC_TTL,
+        full_refresh_interval: float = DEFAULT_FULL_REFRESH_INTERVAL,
+    ):
+        """
+        Args:
+            warm_ttl: 普通变量的刷新间隔（秒）
+            static_ttl: 静态变量的刷新间隔（秒）
+            full_refresh_interval: 完整 LIST VAR 的最长间隔（秒）
+        """
+        self.warm_ttl = warm_ttl
+        self.static_ttl = static_ttl
+        self.full_refresh_interval = full_refresh_interval
+
+        self._values: Dict[str, str] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        self._last_full_refresh: Optional[float] = None
+        self._invalidated = True
+
+        # 统计
+        self._full_refreshes = 0
+        self._incremental_polls = 0
+        self._last_requested = 0
+
+    def invalidate(self, reason: str = ""):
+        """标记下一次读取需要完整刷新"""
+        if not self._invalidated:
+            logger.debug(f"Variable catalog invalidated{f': {reason}' if reason else ''}")
+        self._invalidated = True
+
+    def _ttl_for(self, name: str) -> float:
+        """获取变量的刷新间隔"""
+        if name in HOT_VARIABLES:
+            return 0
+        if is_static_variable(name):
+            return self.static_ttl
+        return self.warm_ttl
+
+    def _needs_full_refresh(self, now: float) -> bool:
+        """是否需要完整 LIST VAR"""
+        if self._invalidated or not self._values or self._last_full_refresh is None:
+            return True
+        return now - self._last_full_refresh >= self.full_refresh_interval
+
+    def due_variables(self, now: Optional[float] = None) -> List[str]:
+        """返回本次需要读取的已知变量"""
+        now = time.monotonic() if now is None else now
+        return [
+            name for name in self._values
+            if now - self._refreshed_at.get(name, 0) >= self._ttl_for(name)
+        ]
+
+    async def read(self, client) -> Dict[str, str]:
+        """
+        读取变量表（完整或增量）
+
+        Args:
+            client: NUT / apcupsd 客户端
+
+        Returns:
+            合并后的完整变量表；读取失败时返回空字典
+        """
+        now = time.monotonic()
+        if self._needs_full_refresh(now) or not hasattr(client, "get_vars"):
+            return await self._full_refresh(client, now)
+
+        names = self.due_variables(now)
+        values = await client.get_vars(names) if names else {}
+        if names and not values:
+            # 连接异常，下次读取时完整刷新
+            self.invalidate("incremental read failed")
+            return {}
+
+        self._incremental_polls += 1
+        self._last_requested = len(names)
+
+        old_status = self._values.get("ups.status")
+        for name, value in values.items():
+            if value is None:
+                # 变量已消失（如告警清除）
+                self._values.pop(name, None)
+                self._refreshed_at.pop(name, None)
+            else:
+                self._values[name] = value
+                self._refreshed_at[name] = now
+
+        # 状态变化时可能出现新变量（如 ups.alarm），立即完整刷新
+        if self._values.get("ups.status") != old_status:
+            logger.debug(f"ups.status changed ({old_status} -> {self._values.get('ups.status')}), refreshing catalog")
+            return await self._full_refresh(client, now)
+
+        return dict(self._values)
+
+    async def _full_refresh(self, client, now: float) -> Dict[str, str]:
+        """完整 LIST VAR 并重建目录"""
+        vars_dict = await client.list_vars()
+        if not vars_dict:
+            self._invalidated = True
+            return {}
+
+        self._values = dict(vars_dict)
+        self._refreshed_at = {name: now for name in vars_dict}
+        self._last_full_refresh = now
+        self._invalidated = False
+        self._full_refreshes += 1
+        self._last_requested = len(vars_dict)
+        return dict(self._values)
+
+    def snapshot(self) -> Dict[str, str]:
+        """最近一次读取后的完整变量表（不访问 NUT）"""
+        return dict(self._values)
+
+    def get_stats(self) -> dict:
+        """获取目录统计信息"""
+        return {
+            "variables": len(self._values),
+            "full_refreshes": self._full_refreshes,
+            "incremental_polls": self._incremental_polls,
+            "last_requested": self._last_requested,
+        }
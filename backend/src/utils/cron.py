@@ -0,0 +1,144 @@
+"""cron 表达式解析
+
+支持标准 5 段格式：分 时 日 月 周
+
+- 每段可以是 *、数字、范围 a-b、步长 */n 或 a-b/n，以及逗号分隔的组合
+- 月份和星期可以使用英文缩写（jan-dec、sun-sat），星期 0 和 7 都表示周日
+- 日和周都不是 * 时，两者满足其一即可（与 cron 一致）
+- 别名：@yearly、@annually、@monthly、@weekly、@daily、@midnight、@hourly
+
+时间按本地时间（不带时区的 datetime）计算。
+"""
+from datetime import datetime, timedelta
+from typing import FrozenSet, Tuple
+
+ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+)}
+DAY_NAMES = {name: i for i, name in enumerate(("sun", "mon", "tue", "wed", "thu", "fri", "sat"))}
+
+# 段名, 最小值, 最大值, 名称表
+FIELDS: Tuple[Tuple[str, int, int, dict], ...] = (
+    ("minute", 0, 59, {}),
+    ("hour", 0, 23, {}),
+    ("day", 1, 31, {}),
+    ("month", 1, 12, MONTH_NAMES),
+    ("weekday", 0, 7, DAY_NAMES),
+)
+
+# 查找下一次执行时间的最远范围（年），超出视为表达式永不触发（如 2 月 30 日）
+MAX_SEARCH_YEARS = 5
+
+
+def _parse_value(text: str, name: str, low: int, high: int, names: dict) -> int:
+    value = names.get(text.lower())
+    if value is None:
+        try:
+            value = int(text)
+        except ValueError:
+            raise ValueError(f"Invalid {name} value: {text!r}")
+    if not low <= value <= high:
+        raise ValueError(f"{name} value {value} out of range {low}-{high}")
+    return value
+
+
+def _parse_field(text: str, name: str, low: int, high: int, names: dict) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        if not part:
+            raise ValueError(f"Empty item in {name} field: {text!r}")
+        body, _, step_text = part.partition("/")
+        step = 1
+        if step_text:
+            step = _parse_value(step_text, f"{name} step", 1, high, {})
+        if body == "*":
+            start, end = low, high
+        elif "-" in body:
+            start_text, end_text = body.split("-", 1)
+            start = _parse_value(start_text, name, low, high, names)
+            end = _parse_value(end_text, name, low, high, names)
+            if start > end:
+                raise ValueError(f"Invalid {name} range: {body!r}")
+        else:
+            start = _parse_value(body, name, low, high, names)
+            # a/n 表示从 a 开始到最大值的步长
+            end = high if step_text else start
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """解析后的 cron 表达式"""
+
+    def __init__(self, expression: str):
+        """
+        Args:
+            expression: cron 表达式
+
+        Raises:
+            ValueError: 表达式格式错误
+        """
+        self.expression = expression.strip()
+        text = ALIASES.get(self.expression.lower(), self.expression)
+        parts = text.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression must have 5 fields (minute hour day month weekday): {expression!r}")
+
+        minutes, hours, days, months, weekdays = (
+            _parse_field(part, name, low, high, names)
+            for part, (name, low, high, names) in zip(parts, FIELDS)
+        )
+        self.minutes = sorted(minutes)
+        self.hours = hours
+        self.days = days
+        self.months = months
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self._day_restricted = not parts[2].startswith("*")
+        self._weekday_restricted = not parts[4].startswith("*")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        # Python 周一为 0，cron 周日为 0
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._day_restricted and self._weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """moment 之后（不含）的下一次触发时间（精确到分钟）"""
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = moment.year + MAX_SEARCH_YEARS
+
+        while current.year <= last_year:
+            if current.month not in self.months:
+                if current.month == 12:
+                    current = current.replace(year=current.year + 1, month=1, day=1, hour=0, minute=0)
+                else:
+                    current = current.replace(month=current.month + 1, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(current):
+                current = (current + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if current.hour not in self.hours:
+                current = (current + timedelta(hours=1)).replace(minute=0)
+                continue
+            minute = next((m for m in self.minutes if m >= current.minute), None)
+            if minute is None:
+                current = (current + timedelta(hours=1)).replace(minute=0)
+                continue
+            return current.replace(minute=minute)
+
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"CronExpression({self.expression!r})"
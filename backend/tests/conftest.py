@@ -118,6 +118,25 @@ async def temp_db():
     Path(db_path).unlink()
 
 
+@pytest_asyncio.fixture
+async def real_db(request):
+    """使用完整 schema 的临时数据库
+
+    只读连接数可通过间接参数指定：
+    ``@pytest.mark.parametrize("real_db", [2], indirect=True)``
+    """
+    from db.database import Database
+
+    options = {}
+    if hasattr(request, "param"):
+        options["read_connections"] = request.param
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(str(Path(tmp_dir) / "test.db"), **options)
+        await db.connect()
+        yield db
+        await db.close()
+
+
 @pytest.fixture
 def mock_nut_client():
     """创建 Mock NUT 客户端"""
@@ -0,0 +1,158 @@
+"""测试在线异常检测"""
+from unittest.mock import AsyncMock, patch
+import pytest
+from models import EventType, UpsData, UpsStatus
+from services.anomaly_detector import EwmaStats, OnlineAnomalyDetector
+from services.metric_frame import mean_std
+
+
+def _sample(status=UpsStatus.ONLINE, voltage=230.0, load=30.0, temperature=30.0, frequency=50.0, output=230.0):
+    return UpsData(
+        status=status,
+        input_voltage=voltage,
+        output_voltage=output,
+        input_frequency=frequency,
+        load_percent=load,
+        temperature=temperature,
+    )
+
+
+def _warm_up(detector, count=40, start=0.0):
+    """以 10 秒间隔喂入平稳样本，返回下一个时刻"""
+    now = start
+    for i in range(count):
+        assert detector.observe(_sample(voltage=229.0 + (i % 3)), now=now) == []
+        now += 10
+    return now
+
+
+class TestEwmaStats:
+    """测试指数加权统计量"""
+
+    def test_warmup_matches_population_stats(self):
+        values = [2, 4, 4, 4, 5, 5, 7, 9]
+        stats = EwmaStats()
+        for value in values:
+            stats.update(value, alpha=0.0)
+
+        mean, std = mean_std(values)
+        assert stats.count == 8
+        assert stats.mean == pytest.approx(mean)
+        assert stats.std == pytest.approx(std)
+
+    def test_tracks_level_shift(self):
+        stats = EwmaStats()
+        for _ in range(50):
+            stats.update(230.0, alpha=0.1)
+        for _ in range(100):
+            stats.update(240.0, alpha=0.1)
+
+        assert stats.mean == pytest.approx(240.0, abs=0.01)
+
+
+class TestOnlineAnomalyDetector:
+    """测试检测规则与去抖"""
+
+    def test_no_alerts_during_warmup(self):
+        detector = OnlineAnomalyDetector(warmup=30)
+        for i in range(10):
+            assert detector.observe(_sample(voltage=200.0 + 10 * (i % 2)), now=i * 10) == []
+
+    def test_voltage_deviation_needs_confirmation(self):
+        detector = OnlineAnomalyDetector()
+        now = _warm_up(detector)
+
+        assert detector.observe(_sample(voltage=260.0), now=now) == []
+        anomalies = detector.observe(_sample(voltage=260.0), now=now + 10)
+
+        assert [a["type"] for a in anomalies] == ["input_voltage"]
+        assert anomalies[0]["severity"] == "high"
+        low, high = anomalies[0]["expected_range"]
+        assert low < 230 < high
+
+    def test_single_spike_is_ignored(self):
+        detector = OnlineAnomalyDetector()
+        now = _warm_up(detector)
+
+        assert detector.observe(_sample(voltage=260.0), now=now) == []
+        assert detector.observe(_sample(voltage=230.0), now=now + 10) == []
+        assert detector.get_stats()["candidates"] == 1
+
+    def test_cooldown_suppresses_repeats(self):
+        detector = OnlineAnomalyDetector(cooldown=600)
+        now = _warm_up(detector)
+
+        reported = []
+        for i in range(10):
+            reported += detector.observe(_sample(frequency=47.0), now=now + i * 10)
+
+        assert [a["type"] for a in reported] == ["input_frequency"]
+        assert detector.get_stats()["suppressed"] > 0
+
+    def test_cooldown_expires(self):
+        detector = OnlineAnomalyDetector(cooldown=600)
+        assert detector.observe(_sample(load=20.0), now=0) == []
+        assert len(detector.observe(_sample(load=60.0), now=10)) == 1
+        assert detector.observe(_sample(load=20.0), now=20) == []
+        assert len(detector.observe(_sample(load=60.0), now=700)) == 1
+
+    def test_load_step_reports_immediately(self):
+        detector = OnlineAnomalyDetector()
+        detector.observe(_sample(load=20.0), now=0)
+        anomalies = detector.observe(_sample(load=55.0), now=10)
+
+        assert [a["type"] for a in anomalies] == ["load_change"]
+        assert anomalies[0]["change"] == pytest.approx(35.0)
+
+    def test_over_temperature_without_warmup(self):
+        detector = OnlineAnomalyDetector()
+        detector.observe(_sample(temperature=48.0), now=0)
+        anomalies = detector.observe(_sample(temperature=52.0), now=10)
+
+        assert anomalies[0]["type"] == "temperature"
+        assert anomalies[0]["severity"] == "high"
+        assert anomalies[0]["threshold"] == 45
+
+    def test_mains_signals_skipped_on_battery(self):
+        detector = OnlineAnomalyDetector()
+        now = _warm_up(detector)
+
+        for i in range(5):
+            assert detector.observe(_sample(status=UpsStatus.ON_BATTERY, voltage=0.0, frequency=0.0), now=now + i * 10) == []
+        # 停电期间的 0V 不进入统计
+        assert detector.get_stats()["signals"]["input_voltage"]["mean"] == pytest.approx(230.0, abs=1)
+
+    def test_offline_samples_are_ignored(self):
+        detector = OnlineAnomalyDetector()
+        detector.observe(_sample(load=20.0), now=0)
+        detector.observe(_sample(status=UpsStatus.OFFLINE, load=0.0), now=10)
+
+        # 离线后负载基线重新开始，不会误报突变
+        assert detector.observe(_sample(load=60.0), now=20) == []
+        assert detector.get_stats()["samples"] == 2
+
+
+class TestMonitorIntegration:
+    """测试监控热路径接入"""
+
+    @pytest.mark.asyncio
+    async def test_confirmed_anomaly_is_recorded_and_broadcast(self):
+        from services.monitor import UpsMonitor
+
+        monitor = UpsMonitor.__new__(UpsMonitor)
+        monitor.ups_id = "rack2"
+        monitor.anomaly_detector = OnlineAnomalyDetector()
+        monitor.anomaly_detector.observe(_sample(load=10.0), now=0)
+
+        history = AsyncMock()
+        with patch("services.monitor.get_history_service", AsyncMock(return_value=history)), \
+                patch("api.websocket.broadcast_event", AsyncMock()) as broadcast:
+            await monitor._detect_anomalies(_sample(load=80.0))
+
+        history.add_event.assert_awaited_once()
+        args, kwargs = history.add_event.call_args
+        assert args[0] == EventType.ANOMALY_DETECTED
+        assert kwargs["ups_id"] == "rack2"
+        assert kwargs["metadata"]["type"] == "load_change"
+        broadcast.assert_awaited_once()
+        assert broadcast.call_args[0][0] == "ANOMALY_DETECTED"
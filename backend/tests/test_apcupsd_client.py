@@ -0,0 +1,146 @@
+"""测试 apcupsd 客户端的状态快照与事件日志监听"""
+import asyncio
+
+import pytest
+from services.apcupsd_client import ApcupsdClient
+
+STATUS = {
+    "STATUS": "ONLINE",
+    "BCHARGE": "100.0 Percent",
+    "TIMELEFT": "30.0 Minutes",
+    "LINEV": "230.0 Volts",
+    "MODEL": "Back-UPS 650",
+    "SERIALNO": "ABC123",
+}
+
+
+async def _start_fake_apcupsd(status, events):
+    """启动一个最小的 apcupsd NIS 模拟服务，返回 (server, port, 收到的请求列表)"""
+    received = []
+
+    async def handle(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode().strip()
+            received.append(command)
+            if command == "status":
+                body = "".join(f"{key:<9}: {value}\n" for key, value in status.items())
+            elif command == "events":
+                body = "".join(f"{event}\n" for event in events)
+            else:
+                body = ""
+            writer.write(f"BEGIN APC\n{body}END APC\n".encode())
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, port, received
+
+
+class TestSnapshotCache:
+    """测试 status 快照缓存"""
+
+    @pytest.mark.asyncio
+    async def test_reads_share_one_round_trip(self):
+        server, port, received = await _start_fake_apcupsd(STATUS, [])
+        client = ApcupsdClient("127.0.0.1", port, snapshot_ttl=60)
+        try:
+            await client.connect()
+            results = await asyncio.gather(
+                client.get_var("ups.status"),
+                client.get_var("battery.runtime"),
+                client.get_var("apc_model"),
+                client.get_vars(["battery.charge", "input.voltage"]),
+                client.list_ups(),
+            )
+
+            assert results[:3] == ["OL", "1800", "Back-UPS 650"]
+            assert results[3] == {"battery.charge": "100.0", "input.voltage": "230.0"}
+            assert results[4] == [{"name": "ups", "description": "Back-UPS 650 (ABC123)"}]
+            assert received == ["status"]
+
+            # 返回副本，调用方修改不影响快照
+            vars_dict = await client.list_vars()
+            vars_dict["ups.status"] = "OB"
+            assert await client.get_var("ups.status") == "OL"
+            assert received == ["status"]
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_expired_or_invalidated_snapshot_is_refetched(self):
+        status = dict(STATUS)
+        server, port, received = await _start_fake_apcupsd(status, [])
+        client = ApcupsdClient("127.0.0.1", port, snapshot_ttl=60)
+        try:
+            await client.connect()
+            assert await client.get_var("ups.status") == "OL"
+
+            status["STATUS"] = "ONBATT"
+            assert await client.get_var("ups.status") == "OL"
+            client.invalidate_snapshot()
+            assert await client.get_var("ups.status") == "OB"
+
+            client.snapshot_ttl = 0
+            status["STATUS"] = "ONLINE"
+            assert await client.get_var("ups.status") == "OL"
+            assert received == ["status"] * 3
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+
+
+class TestEventListening:
+    """测试事件日志监听"""
+
+    def test_new_events(self):
+        lines = ["a", "b", "c"]
+
+        assert ApcupsdClient._new_events(lines, "c") == []
+        assert ApcupsdClient._new_events(lines, "a") == ["b", "c"]
+        assert ApcupsdClient._new_events(lines, None) == lines
+        # 日志被截断后上次的最后一行不存在
+        assert ApcupsdClient._new_events(lines, "z") == lines
+
+    @pytest.mark.asyncio
+    async def test_new_event_refreshes_snapshot_and_notifies(self):
+        status = dict(STATUS)
+        events = ["2026-10-01 08:00:00 +0000  apcupsd 3.14.14 startup succeeded"]
+        server, port, received = await _start_fake_apcupsd(status, events)
+        client = ApcupsdClient("127.0.0.1", port, snapshot_ttl=60, events_interval=0.01)
+        changes = []
+
+        async def on_data_changed():
+            changes.append(await client.get_var("ups.status"))
+
+        try:
+            await client.connect()
+            assert await client.get_var("ups.status") == "OL"
+            assert await client.start_listen("ups", on_data_changed)
+
+            # 已有的事件不触发回调
+            await asyncio.sleep(0.05)
+            assert changes == []
+
+            status["STATUS"] = "ONBATT"
+            events.append("2026-10-01 09:00:00 +0000  Power failure.")
+            for _ in range(100):
+                if changes:
+                    break
+                await asyncio.sleep(0.01)
+
+            assert changes == ["OB"]
+            assert client.get_connection_status()["listening"] is True
+        finally:
+            await client.stop_listen()
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+
+        assert client.get_connection_status()["listening"] is False
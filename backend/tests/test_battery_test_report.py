@@ -0,0 +1,164 @@
+"""测试电池测试采样表与报告降采样"""
+import json
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from db.battery_samples import INSERT_BATTERY_SAMPLE_SQL, bucket_size, sample_row
+from db.database import Database
+from services import battery_test_report
+from services.battery_test_report import BatteryTestReportService
+
+
+@pytest.fixture(autouse=True)
+def reset_current_test(monkeypatch):
+    monkeypatch.setattr(battery_test_report, "_current_test", None)
+
+
+async def _insert_report(db, started_at: str, samples):
+    cursor = await db.execute(
+        "INSERT INTO battery_test_reports (test_type, test_type_label, started_at, result) VALUES (?, ?, ?, ?)",
+        ("deep", "深度测试", started_at, "passed")
+    )
+    report_id = cursor.lastrowid
+    await db.execute_many(
+        INSERT_BATTERY_SAMPLE_SQL,
+        [sample_row(report_id, elapsed, {"battery_charge": charge}) for elapsed, charge in samples]
+    )
+    return report_id
+
+
+class TestSampling:
+    """测试测试期间的采样写入"""
+
+    @pytest.mark.asyncio
+    async def test_samples_are_persisted_in_batches(self, real_db, monkeypatch):
+        monkeypatch.setattr(battery_test_report, "SAMPLE_BATCH_SIZE", 3)
+        service = BatteryTestReportService(real_db)
+
+        report_id = await service.start_test("quick", "快速测试", {"battery_charge": 100.0})
+        for charge in (99.0, 98.0, 97.0):
+            await service.add_sample({"battery_charge": charge, "battery_voltage": 13.1})
+
+        # 第三条采样达到批量大小后写入，进程在此时崩溃也不会丢失
+        rows = await real_db.fetch_all(
+            "SELECT battery_charge FROM battery_test_samples WHERE report_id = ? ORDER BY elapsed_ms",
+            (report_id,)
+        )
+        assert [row[0] for row in rows] == [100.0, 99.0, 98.0, 97.0]
+
+        await service.add_sample({"battery_charge": 96.0})
+        assert service.get_stats()["pending_samples"] == 1
+
+        # 进行中的报告读取前先写入内存中的采样
+        report = await service.get_report(report_id)
+        assert report["sample_count"] == 5
+        assert service.get_stats()["pending_samples"] == 0
+
+        await service.complete_test("passed", "OK", {"battery_charge": 95.0})
+        report = await service.get_report(report_id)
+
+        assert report["result"] == "passed"
+        assert [s["battery_charge"] for s in report["samples"]] == [100.0, 99.0, 98.0, 97.0, 96.0, 95.0]
+        assert report["samples"][0]["elapsed_seconds"] == 0
+        assert report["samples"][0]["timestamp"] == report["started_at"]
+        assert report["sample_bucket_seconds"] is None
+
+    @pytest.mark.asyncio
+    async def test_cancel_flushes_pending_samples(self, real_db):
+        service = BatteryTestReportService(real_db)
+
+        report_id = await service.start_test("deep", "深度测试", {"battery_charge": 100.0})
+        await service.add_sample({"battery_charge": 99.5})
+        await service.cancel_test()
+
+        report = await service.get_report(report_id)
+        assert report["result"] == "cancelled"
+        assert report["sample_count"] == 2
+
+
+class TestDownsampling:
+    """测试读取报告时的降采样与曲线对齐"""
+
+    def test_bucket_size(self):
+        assert bucket_size(10_000, 10, 300) == 1
+        assert bucket_size(3_599_000, 3600, 300) == 12_000
+        assert bucket_size(3_599_000, 3600, 0) == 1
+
+    @pytest.mark.asyncio
+    async def test_long_test_is_downsampled(self, real_db):
+        # 1 Hz 采样 1 小时，电量线性下降
+        samples = [(i * 1000, 100 - i / 60) for i in range(3600)]
+        report_id = await _insert_report(real_db, "2026-10-01T08:00:00+00:00", samples)
+        service = BatteryTestReportService(real_db)
+
+        report = await service.get_report(report_id, max_points=300)
+
+        assert report["sample_count"] == 3600
+        assert len(report["samples"]) == 300
+        assert report["sample_bucket_seconds"] == 12
+        second = report["samples"][1]
+        assert second["elapsed_seconds"] == 12
+        assert second["timestamp"] == "2026-10-01T08:00:12+00:00"
+        # 桶内 12 条采样的平均值
+        assert second["battery_charge"] == pytest.approx(100 - 17.5 / 60)
+
+        full = await service.get_report(report_id, max_points=0)
+        assert len(full["samples"]) == 3600
+
+    @pytest.mark.asyncio
+    async def test_curves_align_on_elapsed_time(self, real_db):
+        first = await _insert_report(real_db, "2026-09-01T08:00:00+00:00", [(0, 100), (1002, 99), (2001, 98)])
+        second = await _insert_report(real_db, "2026-10-01T20:30:00+00:00", [(0, 100), (998, 97)])
+        service = BatteryTestReportService(real_db)
+
+        result = await service.get_aligned_curves([second, first])
+
+        assert result["bucket_seconds"] == 1
+        assert [r["id"] for r in result["reports"]] == [first, second]
+        curves = {r["id"]: r["samples"] for r in result["reports"]}
+        assert [s["elapsed_seconds"] for s in curves[first]] == [0, 1, 2]
+        assert [s["elapsed_seconds"] for s in curves[second]] == [0]
+        assert curves[second][0]["battery_charge"] == 98.5
+
+
+class TestLegacySamples:
+    """测试旧报告 JSON 采样的迁移"""
+
+    @pytest.mark.asyncio
+    async def test_json_samples_are_moved(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "test.db")
+            db = Database(db_path)
+            await db.connect()
+            await db.execute("DROP TABLE battery_test_samples")
+            await db.close()
+
+            started = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+            samples = [
+                {"timestamp": (started + timedelta(seconds=s)).isoformat(), "battery_charge": c, "battery_voltage": 13.0}
+                for s, c in ((0, 100.0), (15, 98.5), (30, 97.0))
+            ]
+            conn = sqlite3.connect(db_path)
+            conn.execute(
+                "INSERT INTO battery_test_reports (test_type, test_type_label, started_at, result, samples) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ("deep", "深度测试", started.isoformat(), "passed", json.dumps(samples))
+            )
+            conn.commit()
+            conn.close()
+
+            db = Database(db_path)
+            await db.connect()
+            try:
+                report = await BatteryTestReportService(db).get_latest_report()
+                assert report["sample_count"] == 3
+                assert [s["elapsed_seconds"] for s in report["samples"]] == [0, 15, 30]
+                assert [s["timestamp"] for s in report["samples"]] == [s["timestamp"] for s in samples]
+
+                row = await db.fetch_one("SELECT samples FROM battery_test_reports")
+                assert row[0] is None
+            finally:
+                await db.close()
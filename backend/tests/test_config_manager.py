@@ -0,0 +1,120 @@
+"""测试配置管理器的差异写入与变更通知"""
+from types import SimpleNamespace
+
+import pytest
+from config import ConfigManager
+from services.shutdown_manager import ShutdownManager
+
+
+async def _updated_at(db):
+    rows = await db.fetch_all("SELECT key, updated_at FROM config")
+    return {row[0]: row[1] for row in rows}
+
+
+class TestConfigManagerUpdate:
+    """测试 update_config"""
+
+    @pytest.mark.asyncio
+    async def test_only_changed_keys_are_written(self, real_db):
+        manager = ConfigManager(real_db)
+        config = await manager.get_config()
+        # 先写一次，补齐数据库中缺少的默认配置项
+        await manager.update_config(config.model_copy())
+        await real_db.execute("UPDATE config SET updated_at = '2000-01-01 00:00:00'")
+
+        change = await manager.update_config(config.model_copy(update={"shutdown_wait_minutes": 9}))
+
+        assert change.keys == {"shutdown_wait_minutes"}
+        assert change.changes["shutdown_wait_minutes"] == (config.shutdown_wait_minutes, 9)
+        updated = {k for k, v in (await _updated_at(real_db)).items() if v != "2000-01-01 00:00:00"}
+        assert updated == {"shutdown_wait_minutes"}
+
+        # 重新加载后值一致
+        reloaded = await ConfigManager(real_db).get_config()
+        assert reloaded.shutdown_wait_minutes == 9
+
+    @pytest.mark.asyncio
+    async def test_unchanged_update_does_not_bump_version(self, real_db):
+        manager = ConfigManager(real_db)
+        config = await manager.get_config()
+        await manager.update_config(config.model_copy(update={"poll_interval_seconds": 7}))
+        version = manager.version
+
+        assert await manager.update_config((await manager.get_config()).model_copy()) is None
+        assert manager.version == version
+
+    @pytest.mark.asyncio
+    async def test_set_value_detects_change(self, real_db):
+        manager = ConfigManager(real_db)
+        await manager.get_config()
+
+        await manager.set_value("test_mode", "dry_run")
+
+        assert manager.version == 1
+        assert (await ConfigManager(real_db).get_config()).test_mode == "dry_run"
+
+    @pytest.mark.asyncio
+    async def test_failed_write_keeps_cache(self, real_db, monkeypatch):
+        manager = ConfigManager(real_db)
+        config = await manager.get_config()
+
+        async def fail(*args, **kwargs):
+            raise RuntimeError("disk full")
+
+        monkeypatch.setattr(real_db, "execute_many", fail)
+        with pytest.raises(RuntimeError):
+            await manager.update_config(config.model_copy(update={"shutdown_wait_minutes": 42}))
+
+        assert (await manager.get_config()).shutdown_wait_minutes == config.shutdown_wait_minutes
+        assert manager.version == 0
+
+
+class TestConfigSubscribers:
+    """测试变更订阅"""
+
+    @pytest.mark.asyncio
+    async def test_subscribers_filtered_by_keys(self, real_db):
+        manager = ConfigManager(real_db)
+        config = await manager.get_config()
+        received = {"all": [], "notify": [], "async": []}
+
+        async def on_async(change):
+            received["async"].append(change.version)
+
+        def broken(change):
+            raise ValueError("boom")
+
+        manager.subscribe(lambda change: received["all"].append(change.keys))
+        manager.subscribe(lambda change: received["notify"].append(change.keys), ["notify_events"])
+        manager.subscribe(broken)
+        manager.subscribe(on_async, ["shutdown_battery_percent"])
+
+        await manager.update_config(config.model_copy(update={"shutdown_battery_percent": 35}))
+
+        assert received["all"] == [{"shutdown_battery_percent"}]
+        assert received["notify"] == []
+        assert received["async"] == [1]
+
+        manager.unsubscribe(on_async)
+        await manager.update_config(config.model_copy(update={"shutdown_battery_percent": 40}))
+        assert received["async"] == [1]
+
+    @pytest.mark.asyncio
+    async def test_shutdown_manager_applies_only_changed_fields(self, real_db, mock_shutdown_client):
+        manager = ConfigManager(real_db)
+        config = await manager.get_config()
+        sm = ShutdownManager(mock_shutdown_client, wait_minutes=1, battery_percent=50)
+        manager.subscribe(sm.apply_config)
+
+        await manager.update_config(config.model_copy(update={"shutdown_battery_percent": 25}))
+
+        assert sm.battery_percent == 25
+        # 未变化的配置项不覆盖运行中的值
+        assert sm.wait_minutes == 1
+
+    def test_touches(self):
+        from config import ConfigChange
+        change = ConfigChange(version=1, config=SimpleNamespace(), changes={"test_mode": ("production", "mock")})
+
+        assert change.touches("test_mode", "poll_interval_seconds")
+        assert not change.touches("poll_interval_seconds")
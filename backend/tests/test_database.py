@@ -0,0 +1,92 @@
+"""测试数据库读写连接分离"""
+import asyncio
+
+import pytest
+from db.database import QueryStats
+
+# 使用 2 个只读连接的临时数据库
+with_readers = pytest.mark.parametrize("real_db", [2], indirect=True)
+
+
+class TestConnectionRoles:
+    """测试读写连接"""
+
+    @pytest.mark.asyncio
+    @with_readers
+    async def test_reads_use_read_only_connections(self, real_db):
+        await real_db.execute("INSERT INTO events (event_type, message) VALUES (?, ?)", ("STARTUP", "hello"))
+
+        # 写入提交后只读连接立即可见
+        row = await real_db.fetch_one("SELECT message FROM events")
+        assert row["message"] == "hello"
+
+        async with real_db._reader() as (conn, role):
+            assert role == "reader"
+            with pytest.raises(Exception):
+                await conn.execute("DELETE FROM events")
+
+        stats = real_db.get_stats()
+        assert stats["read_connections"] == 2
+        assert stats["idle_readers"] == 2
+        assert stats["roles"]["reader"]["count"] == 1
+        assert stats["roles"]["writer"]["count"] == 1
+
+    @pytest.mark.asyncio
+    @with_readers
+    async def test_write_not_blocked_by_busy_readers(self, real_db):
+        # 占用全部只读连接
+        readers = [real_db._reader() for _ in range(2)]
+        for reader in readers:
+            await reader.__aenter__()
+
+        try:
+            await asyncio.wait_for(
+                real_db.execute("INSERT INTO events (event_type, message) VALUES (?, ?)", ("POWER_LOST", "lost")),
+                timeout=2
+            )
+        finally:
+            for reader in readers:
+                await reader.__aexit__(None, None, None)
+
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM events WHERE event_type = 'POWER_LOST'")
+        assert row[0] == 1
+
+    @pytest.mark.asyncio
+    @with_readers
+    async def test_concurrent_transactions_do_not_interleave(self, real_db):
+        async def batch(prefix):
+            await real_db.execute_many(
+                "INSERT INTO events (event_type, message) VALUES (?, ?)",
+                [("STARTUP", f"{prefix}-{i}") for i in range(50)]
+            )
+
+        await asyncio.gather(batch("a"), batch("b"), real_db.execute(
+            "INSERT INTO events (event_type, message) VALUES (?, ?)", ("STARTUP", "single")
+        ))
+
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM events")
+        assert row[0] == 101
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("real_db", [0], indirect=True)
+    async def test_without_readers_reads_share_writer(self, real_db):
+        await real_db.fetch_all("SELECT * FROM events")
+        assert real_db.get_stats()["roles"]["writer"]["count"] == 1
+
+
+class TestQueryStats:
+    """测试查询耗时统计"""
+
+    def test_record(self):
+        stats = QueryStats(slow_seconds=0.1)
+        stats.record("reader", "SELECT *\n   FROM events", 0.02, waited=0.01)
+        stats.record("reader", "SELECT * FROM events", 0.2)
+
+        result = stats.get_stats()
+        assert result["roles"]["reader"]["count"] == 2
+        assert result["roles"]["reader"]["slow"] == 1
+        assert result["roles"]["reader"]["max_wait_ms"] == 10
+        # 空白归一化后视为同一语句
+        assert result["top_statements"] == [
+            {"sql": "SELECT * FROM events", "count": 2, "total_ms": 220.0, "max_ms": 200.0}
+        ]
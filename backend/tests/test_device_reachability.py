@@ -0,0 +1,179 @@
+"""测试设备连通性缓存"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+import hooks.registry as hook_registry_module
+from services.device_reachability import (
+    DeviceReachabilityService, MOCK_DEVICES, device_hooks, device_key
+)
+
+
+class FakeHook:
+    def __init__(self, host, behaviour):
+        self.host = host
+        self.behaviour = behaviour
+
+    async def probe(self):
+        self.behaviour.calls.append(self.host)
+        if self.behaviour.delay:
+            await asyncio.sleep(self.behaviour.delay)
+        result = self.behaviour.results.get(self.host, True)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def behaviour(monkeypatch):
+    """替换 hook 注册表，记录探测调用"""
+    state = SimpleNamespace(calls=[], results={}, delay=0.0)
+    registry = SimpleNamespace(create_instance=lambda hook_id, config: FakeHook(config["host"], state))
+    monkeypatch.setattr(hook_registry_module, "get_registry", lambda: registry)
+    return state
+
+
+def _hook(name, host, enabled=True):
+    return {"name": name, "hook_id": "ssh_shutdown", "enabled": enabled, "config": {"host": host}}
+
+
+class TestDeviceReachabilityService:
+    """测试缓存、共享探测与变化回调"""
+
+    @pytest.mark.asyncio
+    async def test_statuses_are_served_from_cache(self, behaviour):
+        service = DeviceReachabilityService()
+        hooks = [_hook("a", "10.0.0.1"), _hook("b", "10.0.0.2"), _hook("c", "10.0.0.3", enabled=False)]
+        behaviour.results["10.0.0.2"] = False
+
+        first = await service.get_statuses(hooks)
+        for _ in range(5):
+            again = await service.get_statuses(hooks)
+
+        assert sorted(behaviour.calls) == ["10.0.0.1", "10.0.0.2"]
+        assert [s["online"] for s in first] == [True, False, False]
+        assert first[1]["error"] == "连接测试失败"
+        assert first[2]["error"] == "设备已禁用"
+        assert first[0]["latency_ms"] is not None
+        assert again == first
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_probe(self, behaviour):
+        behaviour.delay = 0.05
+        service = DeviceReachabilityService()
+        hooks = [_hook("a", "10.0.0.1")]
+
+        await asyncio.gather(*(service.get_statuses(hooks) for _ in range(5)))
+
+        assert behaviour.calls == ["10.0.0.1"]
+
+    @pytest.mark.asyncio
+    async def test_timeout_and_errors(self, behaviour):
+        behaviour.results["10.0.0.2"] = ValueError("缺少用户名")
+        behaviour.delay = 0.2
+        service = DeviceReachabilityService(probe_timeout=0.05)
+
+        statuses = await service.get_statuses([_hook("a", "10.0.0.1")])
+        assert statuses[0]["error"] == "连接超时"
+
+        behaviour.delay = 0
+        statuses = await service.get_statuses([_hook("b", "10.0.0.2")])
+        assert statuses[0]["error"] == "配置错误: 缺少用户名"
+        assert service.get_stats()["failures"] == 2
+
+    @pytest.mark.asyncio
+    async def test_changes_are_pushed(self, behaviour):
+        service = DeviceReachabilityService()
+        changes = []
+
+        async def on_change(status):
+            changes.append((status["name"], status["online"]))
+
+        service.add_change_callback(on_change)
+        hook = _hook("a", "10.0.0.1")
+        key = device_key(hook)
+
+        await service._probe(key, hook)
+        await service._probe(key, hook)
+        behaviour.results["10.0.0.1"] = False
+        await service._probe(key, hook)
+
+        assert changes == [("a", True), ("a", False)]
+        history = (await service.get_statuses([hook], history=True))[0]["history"]
+        assert [h["latency_ms"] is None for h in history] == [False, False, True]
+
+    @pytest.mark.asyncio
+    async def test_background_loop_probes_on_interval(self, behaviour, monkeypatch):
+        service = DeviceReachabilityService(jitter=0)
+        hooks = [_hook("a", "10.0.0.1"), _hook("b", "10.0.0.2")]
+
+        async def load():
+            return hooks, 0.1
+
+        monkeypatch.setattr(service, "_load", load)
+        monkeypatch.setattr("services.device_reachability.IDLE_CHECK_INTERVAL", 0.05)
+        await service.start()
+        await asyncio.sleep(0.35)
+        await service.stop()
+
+        # 每台设备首次探测在 0.05 秒内错开，之后每 0.1 秒一次
+        assert 2 <= behaviour.calls.count("10.0.0.1") <= 4
+        assert 2 <= behaviour.calls.count("10.0.0.2") <= 4
+
+        # 从配置中移除的设备不再保留状态
+        hooks.pop()
+        service._prune(hooks)
+        assert service.get_stats()["devices"] == 1
+
+    @pytest.mark.asyncio
+    async def test_config_change_triggers_new_probe(self, behaviour):
+        service = DeviceReachabilityService()
+        await service.get_statuses([_hook("a", "10.0.0.1")])
+        await service.get_statuses([_hook("a", "10.0.0.9")])
+
+        assert behaviour.calls == ["10.0.0.1", "10.0.0.9"]
+
+
+@pytest.mark.asyncio
+async def test_http_api_hook_is_probed_without_executing(monkeypatch):
+    """HTTP API 插件的 test_connection 会实际调用接口，后台探测只能建立 TCP 连接"""
+    from hooks.http_api import HTTPAPIHook
+
+    executed = []
+
+    async def execute(self):
+        executed.append(self.config["url"])
+        return True
+
+    monkeypatch.setattr(HTTPAPIHook, "execute", execute)
+    server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    hooks = [{
+        "name": "nas", "hook_id": "http_api", "enabled": True,
+        "config": {"url": f"http://127.0.0.1:{port}/api/shutdown", "method": "POST"},
+    }]
+    service = DeviceReachabilityService(jitter=0)
+
+    async def load():
+        return hooks, 0.05
+
+    monkeypatch.setattr(service, "_load", load)
+    monkeypatch.setattr("services.device_reachability.IDLE_CHECK_INTERVAL", 0.02)
+    try:
+        await service.start()
+        await asyncio.sleep(0.3)
+        await service.stop()
+        statuses = await service.get_statuses(hooks)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert executed == []
+    assert service.get_stats()["probes"] >= 2
+    assert statuses[0]["online"] is True
+
+
+def test_device_hooks_injects_mock_devices_only_in_mock_mode():
+    assert device_hooks(SimpleNamespace(test_mode="mock", pre_shutdown_hooks=[])) is MOCK_DEVICES
+    assert device_hooks(SimpleNamespace(test_mode="production", pre_shutdown_hooks=[])) == []
+    hooks = [_hook("a", "10.0.0.1")]
+    assert device_hooks(SimpleNamespace(test_mode="mock", pre_shutdown_hooks=hooks)) is hooks
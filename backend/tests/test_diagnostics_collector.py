@@ -0,0 +1,141 @@
+"""测试诊断信息后台收集器"""
+from types import SimpleNamespace
+
+import pytest
+from models import UpsStatus
+from services.diagnostics_collector import DiagnosticsCollector
+
+
+class FakeClient:
+    """记录能力查询次数的 NUT 客户端"""
+
+    def __init__(self):
+        self.connected = True
+        self.calls = []
+        self.fail = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def list_rw(self):
+        self.calls.append("list_rw")
+        if self.fail:
+            raise ConnectionError("connection lost")
+        return {"ups.delay.shutdown": {"value": "20"}}
+
+    async def list_commands(self):
+        self.calls.append("list_commands")
+        return ["test.battery.start.quick"]
+
+    async def list_vars(self):
+        raise AssertionError("collector must not read variables from NUT")
+
+
+class FakeCatalog:
+    def __init__(self, values):
+        self.values = values
+
+    def snapshot(self):
+        return dict(self.values)
+
+
+def _monitor(client, values):
+    data = SimpleNamespace(
+        status=UpsStatus.ONLINE, status_raw="OL", battery_charge=100.0, battery_runtime=1800,
+        input_voltage=230.0, output_voltage=230.0, load_percent=20.0, temperature=None,
+    )
+    return SimpleNamespace(nut_client=client, var_catalog=FakeCatalog(values), get_current_data=lambda: data)
+
+
+DRIVER = {"driver.name": "usbhid-ups", "driver.version": "2.8.0", "ups.model": "Back-UPS 650"}
+
+
+class TestCapabilities:
+    """测试可写变量和命令只在连接建立或驱动变化时刷新"""
+
+    @pytest.mark.asyncio
+    async def test_refreshed_on_connect_and_driver_change(self):
+        client = FakeClient()
+        values = dict(DRIVER)
+        collector = DiagnosticsCollector()
+        collector._monitor = _monitor(client, values)
+
+        await collector.collect()
+        assert client.calls == ["list_rw", "list_commands"]
+        assert collector.capabilities()["reason"] == "connected"
+        assert collector.capabilities()["supported_commands"] == ["test.battery.start.quick"]
+
+        # 没有变化时不再访问 NUT
+        await collector.collect()
+        await collector.collect()
+        assert len(client.calls) == 2
+
+        values["driver.name"] = "nutdrv_qx"
+        await collector.collect()
+        assert len(client.calls) == 4
+        assert collector.capabilities()["reason"] == "driver changed"
+
+        # 断线重连后重新读取
+        client.connected = False
+        await collector.collect()
+        client.connected = True
+        await collector.collect()
+        assert len(client.calls) == 6
+        assert collector.capabilities()["reason"] == "connected"
+
+        assert len(collector.snapshots()) == 6
+        assert collector.snapshots()[-1]["status"] == UpsStatus.ONLINE.value
+
+    @pytest.mark.asyncio
+    async def test_failed_refresh_keeps_previous_and_retries(self):
+        client = FakeClient()
+        collector = DiagnosticsCollector()
+        collector._monitor = _monitor(client, dict(DRIVER))
+
+        await collector.collect()
+        client.fail = True
+        client.connected = False
+        await collector.collect()
+        client.connected = True
+        await collector.collect()
+
+        capabilities = collector.capabilities()
+        assert capabilities["error"] == "connection lost"
+        assert capabilities["writable_variables"] == {"ups.delay.shutdown": {"value": "20"}}
+
+        client.fail = False
+        await collector.collect()
+        assert collector.capabilities()["reason"] == "retry"
+        assert collector.capabilities()["error"] is None
+
+    @pytest.mark.asyncio
+    async def test_snapshot_history_is_bounded(self):
+        collector = DiagnosticsCollector(history_size=3)
+        collector._monitor = _monitor(FakeClient(), dict(DRIVER))
+
+        for _ in range(5):
+            await collector.collect()
+
+        assert len(collector.snapshots()) == 3
+        assert collector.get_stats()["snapshots"] == 3
+
+
+class TestInvalidation:
+    """测试缓存部分的失效"""
+
+    def test_event_write_invalidates_events_only(self):
+        collector = DiagnosticsCollector()
+        collector._events = []
+        collector._config = ({}, {})
+
+        collector.invalidate_events("metrics", "ups", None)
+        assert collector._events == []
+
+        collector.invalidate_events("event", "ups", None)
+        assert collector._events is None
+        assert collector._config == ({}, {})
+
+        collector._events = []
+        collector.invalidate_config()
+        assert collector._events is None
+        assert collector._config is None
@@ -0,0 +1,113 @@
+"""测试事件分页查询与全文检索"""
+
+import pytest
+from db.event_index import has_events_fts
+from models import EventType
+from services.event_query import EventQuery, build_page_query, decode_cursor, encode_cursor
+from services.history import HistoryService
+
+
+async def _insert(db, event_type, message, timestamp, metadata=None, test_mode="mock", ups_id="default"):
+    await db.execute(
+        "INSERT INTO events (event_type, message, timestamp, metadata, test_mode, ups_id) VALUES (?, ?, ?, ?, ?, ?)",
+        (event_type, message, timestamp, metadata, test_mode, ups_id)
+    )
+
+
+class TestEventCursor:
+    """测试分页游标"""
+
+    def test_round_trip(self):
+        cursor = encode_cursor("2026-01-02 03:04:05", 42)
+        assert decode_cursor(cursor) == ("2026-01-02 03:04:05", 42)
+
+    def test_invalid_cursor(self):
+        with pytest.raises(ValueError):
+            decode_cursor("not-a-cursor")
+        with pytest.raises(ValueError):
+            build_page_query(EventQuery(test_mode="mock", cursor="e30"), fts_enabled=False)
+
+
+class TestQueryEvents:
+    """测试 HistoryService.query_events"""
+
+    @pytest.mark.asyncio
+    async def test_keyset_pagination_is_stable(self, real_db):
+        # 同一秒内多条事件，按 id 区分先后
+        for i in range(5):
+            await _insert(real_db, "STARTUP", f"startup {i}", "2026-01-01 00:00:00")
+        for i in range(3):
+            await _insert(real_db, "POWER_LOST", f"lost {i}", f"2026-01-01 00:0{i + 1}:00")
+        service = HistoryService(real_db)
+
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = await service.query_events(EventQuery(test_mode="mock", cursor=cursor, limit=3))
+            seen.extend(event.id for event in page)
+            if cursor is None:
+                break
+
+        assert len(seen) == 8
+        assert seen == sorted(seen, key=lambda i: (i <= 5, -i))
+
+    @pytest.mark.asyncio
+    async def test_filters(self, real_db):
+        await _insert(real_db, "POWER_LOST", "lost", "2026-01-01 00:00:00")
+        await _insert(real_db, "POWER_RESTORED", "restored", "2026-01-01 00:01:00", ups_id="rack2")
+        await _insert(real_db, "STARTUP", "startup", "2026-01-01 00:02:00")
+        await _insert(real_db, "STARTUP", "other mode", "2026-01-01 00:03:00", test_mode="production")
+        service = HistoryService(real_db)
+
+        page, _ = await service.query_events(
+            EventQuery(test_mode="mock", event_types=["POWER_LOST", "POWER_RESTORED"])
+        )
+        assert [e.event_type for e in page] == [EventType.POWER_RESTORED, EventType.POWER_LOST]
+
+        page, _ = await service.query_events(EventQuery(test_mode="mock", ups_id="rack2"))
+        assert [e.message for e in page] == ["restored"]
+
+        counts = await service.count_events_by_type(EventQuery(test_mode="mock", event_types=["STARTUP"]))
+        assert counts == {"POWER_LOST": 1, "POWER_RESTORED": 1, "STARTUP": 1}
+
+    @pytest.mark.asyncio
+    async def test_full_text_search(self, real_db):
+        assert await has_events_fts(real_db.conn)
+        service = HistoryService(real_db)
+        await service.add_event(EventType.DEVICE_SHUTDOWN, "设备关机成功", {"device_name": "群晖 NAS"}, test_mode="mock")
+        await service.add_event(EventType.DEVICE_SHUTDOWN, "设备关机失败", {"device_name": "Windows PC"}, test_mode="mock")
+        await service.add_event(EventType.STARTUP, "UPS Guard 服务已启动", test_mode="mock")
+
+        async def search(text):
+            page, _ = await service.query_events(EventQuery(test_mode="mock", search=text))
+            return sorted(e.message for e in page)
+
+        # message 子串（trigram）
+        assert await search("关机成功") == ["设备关机成功"]
+        # metadata 内容
+        assert await search("Windows") == ["设备关机失败"]
+        # 多个词全部匹配，短词退回 LIKE
+        assert await search("设备 NAS") == ["设备关机成功"]
+        assert await search("不存在的内容") == []
+
+    @pytest.mark.asyncio
+    async def test_search_without_fts_falls_back_to_like(self, real_db):
+        service = HistoryService(real_db)
+        service._fts_enabled = False
+        await _insert(real_db, "STARTUP", "100% ready", "2026-01-01 00:00:00")
+        await _insert(real_db, "STARTUP", "100 ready", "2026-01-01 00:01:00")
+
+        page, _ = await service.query_events(EventQuery(test_mode="mock", search="100%"))
+
+        assert [e.message for e in page] == ["100% ready"]
+
+    @pytest.mark.asyncio
+    async def test_fts_follows_deletes(self, real_db):
+        service = HistoryService(real_db)
+        await _insert(real_db, "STARTUP", "temporary message", "2026-01-01 00:00:00")
+        await real_db.execute("DELETE FROM events")
+
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM events_fts WHERE events_fts MATCH '\"temporary\"'")
+        assert row[0] == 0
+        page, _ = await service.query_events(EventQuery(test_mode="mock", search="temporary"))
+        assert page == []
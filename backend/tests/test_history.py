@@ -2,6 +2,7 @@
 import pytest
 import asyncio
 from datetime import datetime, timedelta
+from db.metric_store import INSERT_METRIC_SQL, decoded_columns_sql, metric_row
 from models import EventType, Metric
 from services.history import HistoryService
 
@@ -80,7 +81,7 @@ class TestHistoryService:
         await service.add_metric(metric)
         
         # 验证指标已添加
-        cursor = await temp_db.execute("SELECT * FROM metrics")
+        cursor = await temp_db.execute(f"SELECT ts, {decoded_columns_sql()} FROM metrics")
         rows = await cursor.fetchall()
         
         assert len(rows) == 1
@@ -134,10 +135,7 @@ class TestHistoryService:
         await service.add_metric(Metric(battery_charge=90.0))
         
         # 手动添加旧指标（10天前）
-        await temp_db.execute(
-            "INSERT INTO metrics (timestamp, battery_charge) VALUES (?, ?)",
-            (old_time, 50.0)
-        )
+        await temp_db.execute(INSERT_METRIC_SQL, metric_row(old_time, {"battery_charge": 50.0}, "production"))
         await temp_db.commit()
         
         # 清理 7 天前的数据
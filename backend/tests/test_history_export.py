@@ -0,0 +1,122 @@
+"""测试历史数据流式导出"""
+import io
+import tempfile
+from datetime import datetime
+from pathlib import Path
+import pytest
+import pytest_asyncio
+from openpyxl import load_workbook
+from api.history import export_csv, export_xlsx
+from db.database import Database
+from db.metric_store import INSERT_METRIC_SQL, metric_row
+from services.history import HistoryService
+
+
+@pytest_asyncio.fixture
+async def history():
+    """带样例数据的历史服务"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(str(Path(tmp_dir) / "test.db"))
+        await db.connect()
+        service = HistoryService(db)
+
+        for minute in range(5):
+            # 同一秒内两条采样，验证键集分页不会漏行
+            for millis in (0, 500):
+                await db.execute(INSERT_METRIC_SQL, metric_row(
+                    f"2024-01-01 10:0{minute}:00.{millis:03d}",
+                    {"battery_charge": 100 - minute, "power_watts": 123.45, "energy_kwh": 0.5},
+                    "production"
+                ))
+        await db.execute(
+            INSERT_METRIC_SQL, metric_row("2024-01-01 10:00:00", {"battery_charge": 50}, "production", "rack2")
+        )
+        for day in range(1, 4):
+            await db.execute(
+                "INSERT INTO events (event_type, message, timestamp, test_mode) VALUES ('POWER_LOST', ?, ?, 'production')",
+                (f"event {day}", f"2024-01-0{day} 08:00:00")
+            )
+
+        yield service
+        await db.close()
+
+
+async def _body(response) -> bytes:
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk.encode() if isinstance(chunk, str) else chunk)
+    return b"".join(chunks)
+
+
+class TestRangeIterators:
+    """测试按时间范围分块读取"""
+
+    @pytest.mark.asyncio
+    async def test_iter_metrics_chunks_cover_all_rows(self, history):
+        chunks = [
+            rows async for rows in history.iter_metrics(
+                datetime(2024, 1, 1), datetime(2024, 1, 2), test_mode="production", chunk_size=3
+            )
+        ]
+
+        assert [len(rows) for rows in chunks] == [3, 3, 3, 1]
+        timestamps = [row['ts'] for rows in chunks for row in rows]
+        assert len(set(timestamps)) == 10
+        assert timestamps == sorted(timestamps)
+
+    @pytest.mark.asyncio
+    async def test_iter_metrics_respects_bounds(self, history):
+        rows = [
+            row async for chunk in history.iter_metrics(
+                datetime(2024, 1, 1, 10, 1), datetime(2024, 1, 1, 10, 2), test_mode="production"
+            )
+            for row in chunk
+        ]
+
+        assert len(rows) == 4
+        assert {row['battery_charge'] for row in rows} == {99, 98}
+
+    @pytest.mark.asyncio
+    async def test_iter_events_descending(self, history):
+        rows = [
+            row async for chunk in history.iter_events(
+                datetime(2024, 1, 1), datetime(2024, 1, 31), test_mode="production", chunk_size=2
+            )
+            for row in chunk
+        ]
+
+        assert [row['message'] for row in rows] == ["event 3", "event 2", "event 1"]
+
+
+class TestExport:
+    """测试导出响应"""
+
+    @pytest.mark.asyncio
+    async def test_csv_export(self, history):
+        response = await export_csv(history, "all", datetime(2024, 1, 1), datetime(2024, 1, 31), "x.csv")
+        lines = (await _body(response)).decode().splitlines()
+
+        assert lines[0] == "时间,事件类型,描述"
+        assert lines[1] == "2024-01-03 08:00:00,POWER_LOST,event 3"
+        assert "指标数据" in lines
+        metric_lines = lines[lines.index("指标数据") + 2:]
+        assert len(metric_lines) == 10
+        assert metric_lines[0] == "2024-01-01 10:00:00,100.0,,,,,,123.5,0.5"
+
+    @pytest.mark.asyncio
+    async def test_csv_export_other_ups(self, history):
+        response = await export_csv(history, "metrics", datetime(2024, 1, 1), datetime(2024, 1, 31), "x.csv", "rack2")
+        lines = (await _body(response)).decode().splitlines()
+
+        assert lines[1:] == ["2024-01-01 10:00:00,50.0,,,,,,,"]
+
+    @pytest.mark.asyncio
+    async def test_xlsx_export(self, history):
+        response = await export_xlsx(history, "all", datetime(2024, 1, 1), datetime(2024, 1, 31), "x.xlsx")
+        wb = load_workbook(io.BytesIO(await _body(response)))
+
+        assert wb.sheetnames == ["事件记录", "指标数据"]
+        assert wb["事件记录"].max_row == 4
+        assert wb["指标数据"].max_row == 11
+        assert wb["指标数据"]["H2"].value == 123.5
+        assert wb["指标数据"]["A1"].font.bold
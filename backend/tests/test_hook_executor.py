@@ -433,3 +433,158 @@ class TestHookExecutorFailurePolicy:
         # 所有任务都应该尝试执行
         assert result["total"] == 2
         assert result["skipped"] == 0
+
+
+class TestHookExecutorDependencies:
+    """测试按依赖图调度"""
+
+    def _hook(self, name, execution_time, priority=1, **extra):
+        return {
+            "hook_id": "ssh_shutdown",
+            "name": name,
+            "priority": priority,
+            "enabled": True,
+            "timeout": 60,
+            "max_retries": 0,
+            "on_failure": "continue",
+            "config": {"host": name, "_mock_execution_time": execution_time},
+            **extra
+        }
+
+    @pytest.mark.asyncio
+    async def test_slow_hook_does_not_block_unrelated_hooks(self, mock_hook_registry, monkeypatch):
+        """慢任务只阻塞依赖它的任务"""
+        hooks_config = [
+            self._hook("slow vm", 0.3),
+            self._hook("fast vm", 0.01),
+            self._hook("fast host", 0.01, priority=2, depends_on=["fast vm"]),
+            self._hook("nas", 0.01, priority=3, depends_on=["slow vm", "fast vm"]),
+        ]
+        executor = HookExecutor(hooks_config=hooks_config)
+        monkeypatch.setattr(executor.registry, "create_instance", mock_hook_registry)
+
+        result = await executor.execute_all()
+
+        timeline = {item["hook_name"]: item for item in result["timeline"]}
+        assert result["success"] == 4
+        assert timeline["fast host"]["end"] < 0.2
+        assert timeline["nas"]["start"] >= timeline["slow vm"]["end"]
+        assert result["critical_path"] == ["slow vm", "nas"]
+
+    @pytest.mark.asyncio
+    async def test_max_parallel(self, mock_hook_registry, monkeypatch):
+        """同时执行的任务数受限"""
+        hooks_config = [self._hook(f"vm{i}", 0.05) for i in range(4)]
+        executor = HookExecutor(hooks_config=hooks_config, max_parallel=2)
+        monkeypatch.setattr(executor.registry, "create_instance", mock_hook_registry)
+
+        result = await executor.execute_all()
+
+        starts = sorted(item["start"] for item in result["timeline"])
+        assert result["success"] == 4
+        assert starts[2] >= 0.04
+
+    @pytest.mark.asyncio
+    async def test_abort_skips_hooks_not_started(self, monkeypatch):
+        """abort 策略跳过尚未开始的任务"""
+        def create(hook_id, config):
+            return MockHook(config, should_succeed=config["host"] != "bad", execution_time=0.01)
+
+        hooks_config = [
+            self._hook("bad", 0.01, on_failure="abort"),
+            self._hook("after", 0.01, priority=2),
+        ]
+        executor = HookExecutor(hooks_config=hooks_config)
+        monkeypatch.setattr(executor.registry, "create_instance", create)
+
+        result = await executor.execute_all()
+
+        assert result["failed"] == 1
+        assert result["skipped"] == 1
+        assert result["timeline"][1]["status"] == "skipped"
+
+    @pytest.mark.asyncio
+    async def test_runtime_budget_limits_attempt_timeout(self, monkeypatch):
+        """续航预算决定截止时间，超时不超过剩余时间"""
+        import services.hook_executor as hook_executor_module
+        monkeypatch.setattr(hook_executor_module, "MIN_ATTEMPT_TIMEOUT", 0.05)
+
+        def create(hook_id, config):
+            return MockHook(config, execution_time=config["_mock_execution_time"])
+
+        hooks_config = [
+            self._hook("hung vm", 5, estimated_seconds=0.1, max_retries=2),
+            self._hook("nas", 0.01, priority=2, estimated_seconds=0.1),
+        ]
+        executor = HookExecutor(hooks_config=hooks_config, runtime_budget=0.3, duration_estimates={})
+        monkeypatch.setattr(executor.registry, "create_instance", create)
+
+        result = await executor.execute_all()
+
+        timeline = {item["hook_name"]: item for item in result["timeline"]}
+        assert timeline["hung vm"]["deadline"] == pytest.approx(0.2, abs=0.01)
+        assert timeline["hung vm"]["status"] == "failed"
+        assert timeline["hung vm"]["end"] < 0.5
+        assert timeline["nas"]["status"] == "success"
+        assert "deadline" in result["details"][0]["error"]
+
+    @pytest.mark.asyncio
+    async def test_infeasible_budget_keeps_hook_timeouts(self, monkeypatch):
+        """预算短于关键路径时不截断超时，截止时间只用于排序"""
+        def create(hook_id, config):
+            return MockHook(config, execution_time=config["_mock_execution_time"])
+
+        hooks_config = [
+            self._hook("vm", 0.2, estimated_seconds=30),
+            self._hook("nas", 0.01, priority=2, estimated_seconds=30),
+        ]
+        executor = HookExecutor(hooks_config=hooks_config, runtime_budget=10, duration_estimates={})
+        monkeypatch.setattr(executor.registry, "create_instance", create)
+
+        captured = []
+        original_wait_for = asyncio.wait_for
+
+        async def wait_for(awaitable, timeout):
+            captured.append(timeout)
+            return await original_wait_for(awaitable, timeout)
+
+        import services.hook_executor as hook_executor_module
+        monkeypatch.setattr(hook_executor_module.asyncio, "wait_for", wait_for)
+
+        result = await executor.execute_all()
+
+        assert result["success"] == 2
+        assert captured == [60, 60]
+        assert all(item["deadline"] is None for item in result["timeline"])
+
+    @pytest.mark.asyncio
+    async def test_durations_recorded_only_with_injected_store(self, mock_hook_registry, monkeypatch):
+        """只有注入了耗时记录时才写入实测耗时"""
+        class FakeStore:
+            def __init__(self):
+                self.recorded = []
+
+            def estimates(self):
+                return {"vm": 42}
+
+            async def record(self, name, seconds):
+                self.recorded.append(name)
+
+        store = FakeStore()
+        hooks = [
+            self._hook("vm", 0.01),
+            self._hook("broken", 0.01, config={"host": "broken", "_mock_should_succeed": False}),
+        ]
+        executor = HookExecutor(hooks_config=hooks, duration_store=store)
+        monkeypatch.setattr(executor.registry, "create_instance", mock_hook_registry)
+        result = await executor.execute_all()
+        assert result["failed"] == 1
+        assert executor.duration_estimates == {"vm": 42}
+        # 失败的执行不记录耗时，避免拉高估算
+        assert store.recorded == ["vm"]
+
+        executor = HookExecutor(hooks_config=[self._hook("vm", 0.01)])
+        monkeypatch.setattr(executor.registry, "create_instance", mock_hook_registry)
+        result = await executor.execute_all()
+        assert result["success"] == 1
+        assert executor.duration_estimates == {}
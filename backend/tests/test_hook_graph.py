@@ -0,0 +1,67 @@
+"""测试关机前置任务依赖图"""
+import pytest
+from services.hook_graph import (
+    critical_path, estimated_seconds, latest_finish_times, resolve_dependencies
+)
+
+
+def _hook(name, priority=10, **extra):
+    return {"name": name, "priority": priority, **extra}
+
+
+class TestResolveDependencies:
+    """测试依赖解析"""
+
+    def test_priority_groups_become_edges(self):
+        hooks = [_hook("vm1", 1), _hook("vm2", 1), _hook("nas", 2), _hook("switch", 3)]
+        deps = resolve_dependencies(hooks)
+
+        assert deps == [set(), set(), {0, 1}, {2}]
+
+    def test_explicit_dependencies_override_priority(self):
+        hooks = [
+            _hook("vm1", 1),
+            _hook("vm2", 1),
+            _hook("nas", 2, depends_on=["vm1"]),
+            _hook("printer", 2, depends_on=[]),
+        ]
+        deps = resolve_dependencies(hooks)
+
+        assert deps[2] == {0}
+        assert deps[3] == set()
+
+    def test_unknown_dependency(self):
+        hooks = [_hook("nas", depends_on=["missing"])]
+
+        with pytest.raises(ValueError, match="missing"):
+            resolve_dependencies(hooks)
+        assert resolve_dependencies(hooks, strict=False) == [set()]
+
+    def test_cycle_is_rejected(self):
+        hooks = [_hook("a", depends_on=["b"]), _hook("b", depends_on=["a"])]
+
+        with pytest.raises(ValueError, match="循环"):
+            resolve_dependencies(hooks)
+
+
+class TestSchedulingHelpers:
+    """测试最晚完成时间与关键路径"""
+
+    def test_latest_finish_times(self):
+        # vm1 -> nas, vm2 -> nas
+        deps = [set(), set(), {0, 1}]
+        lft = latest_finish_times(deps, [30, 30, 60], budget=300)
+
+        assert lft == [240, 240, 300]
+
+    def test_estimated_seconds_is_capped_by_timeout(self):
+        assert estimated_seconds({"timeout": 20}) == 20
+        assert estimated_seconds({"timeout": 120, "estimated_seconds": 45}) == 45
+        assert estimated_seconds({"name": "a", "timeout": 120}, {"a": 12}) == 12
+
+    def test_critical_path_follows_latest_dependency(self):
+        deps = [set(), set(), {0, 1}, set()]
+        ends = [5.0, 20.0, 25.0, 10.0]
+
+        assert critical_path(deps, ends) == [1, 2]
+        assert critical_path(deps, [None] * 4) == []
@@ -0,0 +1,153 @@
+"""测试共享 HTTP 客户端池"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+import pytest_asyncio
+from services.http_pool import HttpClientPool, config_endpoints, origin_of
+
+
+@pytest_asyncio.fixture
+async def server():
+    """支持 keep-alive 的最小 HTTP/1.1 服务器，记录建立的连接数"""
+    state = SimpleNamespace(connections=0)
+
+    async def handle(reader, writer):
+        state.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                if length:
+                    await reader.readexactly(length)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    srv = await asyncio.start_server(handle, "127.0.0.1", 0)
+    state.url = f"http://127.0.0.1:{srv.sockets[0].getsockname()[1]}"
+    yield state
+    srv.close()
+    await srv.wait_closed()
+
+
+class TestHttpClientPool:
+    """测试客户端复用与统计"""
+
+    def test_origin_of(self):
+        assert origin_of("https://api.telegram.org/bot1/sendMessage") == "https://api.telegram.org:443"
+        assert origin_of("http://nas.local:5000/webapi/auth.cgi?x=1") == "http://nas.local:5000"
+
+    @pytest.mark.asyncio
+    async def test_same_origin_shares_client(self):
+        pool = HttpClientPool()
+        a = pool.get_client("https://example.com/a")
+        b = pool.get_client("https://example.com:443/b?x=1")
+        c = pool.get_client("https://example.com/a", verify=False)
+        d = pool.get_client("https://example.com/a", proxy="http://proxy:8080")
+
+        assert a is b
+        assert len({id(a), id(c), id(d)}) == 3
+        assert pool.get_stats()["clients"] == 3
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_connections_are_reused(self, server):
+        pool = HttpClientPool()
+        for path in ("/login", "/shutdown", "/logout"):
+            async with pool.client(server.url + path, timeout=5) as client:
+                response = await client.post(server.url + path, data={"a": "1"})
+                assert response.text == "ok"
+
+        stats = pool.get_stats()
+        assert server.connections == 1
+        assert stats["requests"] == 3
+        assert stats["connections"] == 1
+        assert stats["reused"] == 2
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_cookies_are_not_shared(self):
+        """共享客户端不保存服务器下发的 Cookie"""
+        requests = []
+
+        async def handle(reader, writer):
+            head = await reader.readuntil(b"\r\n\r\n")
+            requests.append(head)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nSet-Cookie: sid=secret; Path=/\r\n"
+                b"Content-Length: 2\r\nConnection: close\r\n\r\nok"
+            )
+            await writer.drain()
+            writer.close()
+
+        srv = await asyncio.start_server(handle, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{srv.sockets[0].getsockname()[1]}/"
+        pool = HttpClientPool()
+        try:
+            for _ in range(2):
+                async with pool.client(url, timeout=5) as client:
+                    await client.get(url)
+        finally:
+            await pool.close()
+            srv.close()
+            await srv.wait_closed()
+
+        assert len(requests) == 2
+        assert b"cookie" not in requests[1].lower()
+        assert not pool.get_client(url).cookies
+
+    @pytest.mark.asyncio
+    async def test_errors_are_counted(self):
+        pool = HttpClientPool()
+        with pytest.raises(Exception):
+            async with pool.client("http://127.0.0.1:1/", timeout=1) as client:
+                await client.get("http://127.0.0.1:1/")
+
+        assert pool.get_stats()["errors"] == 1
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used(self):
+        pool = HttpClientPool(max_clients=2)
+        first = pool.get_client("http://a.local/")
+        pool.get_client("http://b.local/")
+        pool.get_client("http://a.local/")
+        pool.get_client("http://c.local/")
+        await asyncio.sleep(0)
+
+        assert pool.get_client("http://a.local/") is first
+        stats = pool.get_stats()
+        assert stats["evicted"] == 1
+        # 被淘汰客户端的统计不再按源站保留
+        assert list(stats["origins"]) == ["http://a.local:80", "http://c.local:80"]
+        await pool.close()
+
+    def test_prewarm_from_config(self):
+        config = SimpleNamespace(
+            notify_channels=[
+                {"name": "tg", "plugin_id": "telegram", "enabled": True,
+                 "config": {"bot_token": "123456:abcdefghijklmn", "chat_id": "1", "proxy_url": "http://proxy:8080"}},
+                {"name": "off", "plugin_id": "serverchan", "enabled": False, "config": {"sendkey": "x"}},
+            ],
+            pre_shutdown_hooks=[
+                {"name": "nas", "hook_id": "synology_shutdown", "enabled": True,
+                 "config": {"host": "nas.local", "username": "u", "password": "p"}},
+                {"name": "broken", "hook_id": "http_api", "enabled": True, "config": {}},
+            ],
+        )
+
+        endpoints = config_endpoints(config)
+
+        assert ("https://api.telegram.org/", "http://proxy:8080", True) in endpoints
+        assert ("https://nas.local:5001", None, False) in endpoints
+        assert len(endpoints) == 2
+
+        pool = HttpClientPool()
+        assert pool.prewarm(endpoints) == 2
+        assert pool.prewarm(endpoints) == 0
@@ -0,0 +1,153 @@
+"""测试列式指标帧及基于它的预测"""
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import pytest
+import pytest_asyncio
+from db.database import Database
+from db.metric_store import INSERT_METRIC_SQL, metric_row
+from models import Event, EventType, Metric
+from services.history import HistoryService
+from services.metric_frame import MetricFrame, mean_std, to_epoch
+from services.ml_predictor import MLPredictor
+
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _metric(minutes: float, charge=None, load=None, voltage=None) -> Metric:
+    return Metric(
+        timestamp=BASE + timedelta(minutes=minutes),
+        battery_charge=charge,
+        load_percent=load,
+        input_voltage=voltage,
+    )
+
+
+def _event(minutes: float, event_type: EventType) -> Event:
+    return Event(event_type=event_type, message="", timestamp=BASE + timedelta(minutes=minutes))
+
+
+class TestMetricFrame:
+    """测试帧构建与切片"""
+
+    def test_from_metrics_sorts_and_marks_missing(self):
+        frame = MetricFrame.from_metrics([_metric(2, charge=90), _metric(1), _metric(0, charge=100)])
+
+        assert len(frame) == 3
+        assert list(frame.timestamps) == sorted(frame.timestamps)
+        assert frame.value('battery_charge', 0) == 100
+        assert frame.value('battery_charge', 1) is None
+
+    def test_index_range_is_inclusive(self):
+        frame = MetricFrame.from_metrics([_metric(m, charge=100 - m) for m in range(10)])
+
+        lo, hi = frame.index_range(to_epoch(BASE + timedelta(minutes=3)), to_epoch(BASE + timedelta(minutes=5)))
+        assert (lo, hi) == (3, 6)
+        assert frame.index_range(to_epoch(BASE + timedelta(hours=1))) == (10, 10)
+
+    def test_valid_helpers(self):
+        frame = MetricFrame.from_metrics([
+            _metric(0, charge=100, load=10),
+            _metric(1, load=10),
+            _metric(2, charge=98),
+            _metric(3, charge=97, load=12),
+        ])
+
+        assert frame.count_valid('battery_charge') == 3
+        assert frame.count_valid('battery_charge', 1, 3) == 1
+        assert frame.first_valid('battery_charge', 1) == 2
+        assert frame.last_valid('load_percent', 0, 3) == 1
+        assert [row[0] for row in frame.iter_valid('battery_charge', 'load_percent')] == [0, 3]
+        assert frame.valid_values('battery_charge') == [100, 98, 97]
+
+    def test_mean_std(self):
+        assert mean_std([]) == (0, 0)
+        mean, std = mean_std([2, 4, 4, 4, 5, 5, 7, 9])
+        assert mean == 5
+        assert std == 2
+
+
+class TestPredictorsOnFrame:
+    """测试预测器在列式帧上的结果"""
+
+    def _outage_history(self):
+        metrics, events = [], []
+        # 三次停电，每次 10 分钟
+        for n, drop in enumerate((1.0, 1.2, 1.5)):
+            start = n * 1000
+            events.append(_event(start, EventType.POWER_LOST))
+            for minute in range(11):
+                metrics.append(_metric(start + minute, charge=100 - drop * minute, load=50, voltage=0))
+            events.append(_event(start + 10, EventType.POWER_RESTORED))
+            # 停电之间的市电采样
+            metrics.append(_metric(start + 500, charge=100, load=50, voltage=230))
+        return metrics, events
+
+    @pytest.mark.asyncio
+    async def test_battery_health_matches_list_input(self):
+        metrics, events = self._outage_history()
+        predictor = MLPredictor()
+
+        from_list = await predictor.assess_battery_health(metrics, events)
+        from_frame = await predictor.assess_battery_health(MetricFrame.from_metrics(metrics), events)
+
+        assert from_list == from_frame
+        assert from_frame['available'] is True
+        assert from_frame['sample_count'] == 3
+        # 平均放电速率 (60 + 72 + 90) / 3 %/h
+        assert from_frame['avg_discharge_rate_per_hour'] == 74.0
+        assert from_frame['discharge_trend'] == 'stable'
+
+    @pytest.mark.asyncio
+    async def test_predict_runtime_uses_latest_outage(self):
+        metrics, events = self._outage_history()
+        result = await MLPredictor().predict_runtime(80, 50, MetricFrame.from_metrics(metrics), events)
+
+        assert result['method'] == 'historical_data'
+        # 最近一次停电之后的采样：11 个放电采样 + 1 个市电采样
+        assert result['sample_count'] == 12
+
+    @pytest.mark.asyncio
+    async def test_predict_runtime_without_outage_data(self):
+        result = await MLPredictor().predict_runtime(100, 50, MetricFrame.from_metrics([]), [])
+
+        assert result['method'] == 'default_estimate'
+        assert result['predicted_runtime_minutes'] == 40
+
+    @pytest.mark.asyncio
+    async def test_detect_anomalies(self):
+        metrics = [_metric(m, voltage=230 + (m % 2)) for m in range(30)]
+        metrics.append(_metric(30, voltage=260))
+
+        result = await MLPredictor().detect_anomalies(MetricFrame.from_metrics(metrics))
+
+        assert result['sample_count'] == 31
+        assert [a['type'] for a in result['anomalies']] == ['input_voltage']
+
+
+@pytest_asyncio.fixture
+async def history():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(str(Path(tmp_dir) / "test.db"))
+        await db.connect()
+        yield HistoryService(db)
+        await db.close()
+
+
+class TestMetricFrameLoading:
+    """测试从数据库直接加载"""
+
+    @pytest.mark.asyncio
+    async def test_get_metric_frame(self, history):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for minutes, charge in ((30, 90), (10, 95), (60 * 48, 50)):
+            await history.db.execute(
+                INSERT_METRIC_SQL,
+                metric_row(now - timedelta(minutes=minutes), {"battery_charge": charge}, "production")
+            )
+
+        frame = await history.get_metric_frame(hours=24, test_mode='production')
+
+        assert len(frame) == 2
+        assert frame.valid_values('battery_charge') == [90, 95]
+        assert frame.value('load_percent', -1) is None
@@ -0,0 +1,111 @@
+"""测试指标降采样（rollup）"""
+import tempfile
+import pytest
+from datetime import datetime
+from pathlib import Path
+from db.database import Database
+from db.metric_store import INSERT_METRIC_SQL, metric_row
+from db.rollups import bucket_start, select_tier
+from models import Metric
+from services.history import HistoryService
+from services.metric_writer import MetricWriter
+
+
+class TestRollupHelpers:
+    """测试 rollup 辅助函数"""
+
+    def test_bucket_start(self):
+        ts = datetime(2024, 5, 1, 12, 34, 56)
+        assert bucket_start(ts, 60) == "2024-05-01 12:34:00"
+        assert bucket_start(ts, 900) == "2024-05-01 12:30:00"
+        assert bucket_start(ts, 3600) == "2024-05-01 12:00:00"
+
+    def test_select_tier(self):
+        assert select_tier(hours=1, max_points=2000) is None
+        assert select_tier(hours=24, max_points=2000) == "1m"
+        assert select_tier(hours=72, max_points=2000) == "15m"
+        assert select_tier(hours=24 * 30, max_points=2000) == "1h"
+        # 超出所有层级预算时使用最粗层级
+        assert select_tier(hours=24 * 365 * 5, max_points=2000) == "1h"
+
+
+class TestRollupIngestion:
+    """测试采样写入时的增量聚合"""
+
+    @pytest.mark.asyncio
+    async def test_rollups_built_incrementally(self, real_db):
+        writer = MetricWriter(real_db, batch_size=100)
+        for charge in (90.0, 80.0, 70.0):
+            writer.enqueue(Metric(battery_charge=charge, input_voltage=220.0), "mock")
+        await writer.flush()
+
+        # 汇总所有桶（采样可能恰好跨越整点）
+        row = await real_db.fetch_one(
+            "SELECT SUM(samples), MIN(battery_charge_min), MAX(battery_charge_max), SUM(battery_charge_sum), "
+            "SUM(battery_charge_count), SUM(input_voltage_count), SUM(temperature_count) "
+            "FROM metrics_rollup_1h WHERE test_mode = 'mock'"
+        )
+        assert tuple(row) == (3, 70.0, 90.0, 240.0, 3, 3, 0)
+
+        row = await real_db.fetch_one(
+            "SELECT battery_charge_last FROM metrics_rollup_1h WHERE test_mode = 'mock' ORDER BY bucket DESC LIMIT 1"
+        )
+        assert row[0] == 70.0
+
+    @pytest.mark.asyncio
+    async def test_series_uses_rollup_for_long_window(self, real_db):
+        service = HistoryService(real_db)
+        await service.start_metric_writer(flush_interval=3600)
+        await service.add_metric(Metric(battery_charge=55.0, load_percent=30.0), test_mode="mock")
+
+        series = await service.get_metric_series(hours=24 * 30, max_points=2000, test_mode="mock")
+        assert series["resolution"] == "1h"
+        assert len(series["points"]) == 1
+        point = series["points"][0]
+        assert point["battery_charge"] == 55.0
+        assert point["battery_charge_min"] == 55.0
+        assert point["load_percent_max"] == 30.0
+
+        raw = await service.get_metric_series(hours=1, max_points=2000, test_mode="mock")
+        assert raw["resolution"] == "raw"
+        assert len(raw["points"]) == 1
+        await service.stop_metric_writer()
+
+    @pytest.mark.asyncio
+    async def test_cleanup_rollups_by_tier(self, real_db):
+        await real_db.execute(
+            "INSERT INTO metrics_rollup_1m (test_mode, bucket, samples) VALUES ('mock', '2000-01-01 00:00:00', 1)"
+        )
+        await real_db.execute(
+            "INSERT INTO metrics_rollup_1h (test_mode, bucket, samples) VALUES ('mock', '2000-01-01 00:00:00', 1)"
+        )
+        service = HistoryService(real_db)
+
+        result = await service.cleanup_old_data(30, rollup_retention_days={"1m": 30})
+
+        assert result["rollups_deleted"] == 1
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM metrics_rollup_1h")
+        assert row[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_backfill_existing_samples(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "test.db")
+            db = Database(db_path)
+            await db.connect()
+            await db.execute(INSERT_METRIC_SQL, metric_row("2024-05-01 12:00:10", {"battery_charge": 80}, "mock"))
+            await db.execute(INSERT_METRIC_SQL, metric_row("2024-05-01 12:00:40", {"battery_charge": 60}, "mock"))
+            await db.execute("DELETE FROM metrics_rollup_1m")
+            await db.close()
+
+            # 重新连接时 rollup 表为空，触发回填
+            db = Database(db_path)
+            await db.connect()
+            row = await db.fetch_one(
+                "SELECT samples, battery_charge_sum, battery_charge_last FROM metrics_rollup_1m "
+                "WHERE bucket = '2024-05-01 12:00:00'"
+            )
+            assert row["samples"] == 2
+            assert row["battery_charge_sum"] == 140.0
+            assert row["battery_charge_last"] == 60.0
+            await db.close()
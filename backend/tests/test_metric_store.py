@@ -0,0 +1,149 @@
+"""测试指标紧凑存储格式与旧表迁移"""
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from db.database import Database
+from db.metric_store import (
+    INSERT_METRIC_SQL, LEGACY_TABLE, decode_value, decoded_columns_sql, encode_value,
+    from_epoch_ms, metric_groups, metric_row, metric_time_range, to_epoch_ms,
+)
+from services.history import HistoryService
+
+# 用户升级前的 metrics 表
+LEGACY_SCHEMA = """
+CREATE TABLE metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    battery_charge REAL,
+    battery_runtime INTEGER,
+    input_voltage REAL,
+    output_voltage REAL,
+    load_percent REAL,
+    temperature REAL,
+    test_mode TEXT DEFAULT 'production',
+    power_watts REAL,
+    energy_kwh REAL,
+    ups_id TEXT DEFAULT 'default'
+);
+CREATE INDEX idx_metrics_timestamp ON metrics(timestamp);
+"""
+
+
+class TestEncoding:
+    """测试时间戳和数值换算"""
+
+    def test_epoch_ms_round_trip(self):
+        moment = datetime(2026, 3, 1, 12, 30, 45, 123000)
+        ms = to_epoch_ms(moment)
+
+        assert ms == to_epoch_ms("2026-03-01 12:30:45.123")
+        assert ms == to_epoch_ms(moment.replace(tzinfo=timezone.utc))
+        assert from_epoch_ms(ms) == moment
+
+    def test_scaled_values(self):
+        assert encode_value("input_voltage", 230.4) == 2304
+        assert decode_value("input_voltage", 2304) == 230.4
+        # 与 SQLite ROUND 一致：.5 远离 0
+        assert encode_value("power_watts", 123.45) == 1235
+        assert encode_value("temperature", -0.05) == -1
+        assert encode_value("battery_runtime", 1800) == 1800
+        assert encode_value("energy_kwh", None) is None
+
+
+class TestCompactLayout:
+    """测试新表的读写与查询计划"""
+
+    @pytest.mark.asyncio
+    async def test_range_query_uses_primary_key(self, real_db):
+        plan = await real_db.fetch_all(
+            f"EXPLAIN QUERY PLAN SELECT ts, {decoded_columns_sql()} FROM metrics "
+            f"WHERE test_mode = ? AND ups_id = ? AND ts >= ? ORDER BY ts ASC",
+            ("production", "default", 0)
+        )
+
+        detail = " ".join(row[3] for row in plan)
+        assert "PRIMARY KEY (test_mode=? AND ups_id=? AND ts>?)" in detail
+        assert "TEMP B-TREE" not in detail
+
+    @pytest.mark.asyncio
+    async def test_groups_and_cleanup(self, real_db):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = [
+            metric_row(now - timedelta(days=10), {"battery_charge": 50}, "production"),
+            metric_row(now - timedelta(days=9), {"battery_charge": 60}, "mock", "rack2"),
+            metric_row(now - timedelta(minutes=5), {"battery_charge": 90.5}, "production"),
+        ]
+        await real_db.execute_many(INSERT_METRIC_SQL, rows)
+        history = HistoryService(real_db)
+
+        assert await metric_groups(real_db) == [("mock", "rack2"), ("production", "default")]
+        assert await metric_time_range(real_db) == (rows[0][2], rows[2][2])
+
+        result = await history.cleanup_old_data(retention_days=7)
+
+        assert result["metrics_deleted"] == 2
+        metrics = await history.get_metrics(hours=1, test_mode="production")
+        assert [m.battery_charge for m in metrics] == [90.5]
+        stats = await real_db.fetch_one("SELECT row_count, earliest FROM storage_stats WHERE table_name = 'metrics'")
+        assert stats[0] == 1
+        assert stats[1] == from_epoch_ms(rows[2][2]).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class TestLegacyMigration:
+    """测试旧格式数据的后台搬迁"""
+
+    @pytest.mark.asyncio
+    async def test_legacy_rows_are_migrated(self, monkeypatch):
+        monkeypatch.setattr("db.metric_store.LEGACY_COPY_CHUNK", 2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "test.db")
+            conn = sqlite3.connect(db_path)
+            conn.executescript(LEGACY_SCHEMA)
+            conn.executemany(
+                "INSERT INTO metrics (timestamp, battery_charge, input_voltage, energy_kwh, test_mode, ups_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    ("2026-01-01 00:00:00", 100.0, 230.4, 0.0, "production", "default"),
+                    ("2026-01-01 00:01:00", 99.5, 229.8, 0.0125, "production", "default"),
+                    ("2026-01-01 00:02:00.250", 99.0, None, 0.025, "production", "default"),
+                    ("2026-01-01 00:00:30", 80.0, 231.0, None, None, None),
+                    ("not a timestamp", 1.0, None, None, "production", "default"),
+                ]
+            )
+            conn.commit()
+            conn.close()
+
+            db = Database(db_path)
+            await db.connect()
+            try:
+                await db._metric_migration_task
+
+                assert db.get_stats()["metric_migration"] == {"done": True, "copied": 5, "remaining": 0}
+                row = await db.fetch_one("SELECT name FROM sqlite_master WHERE name = ?", (LEGACY_TABLE,))
+                assert row is None
+
+                rows = await db.fetch_all(
+                    f"SELECT test_mode, ups_id, ts, {decoded_columns_sql()} FROM metrics ORDER BY ts, test_mode"
+                )
+                assert len(rows) == 4
+                first, last = rows[0], rows[-1]
+                assert from_epoch_ms(first["ts"]) == datetime(2026, 1, 1)
+                assert (first["battery_charge"], first["input_voltage"]) == (100.0, 230.4)
+                assert from_epoch_ms(last["ts"]) == datetime(2026, 1, 1, 0, 2, 0, 250000)
+                assert (last["input_voltage"], last["energy_kwh"]) == (None, 0.025)
+
+                # 缺失的 test_mode / ups_id 按旧表默认值迁移
+                assert (rows[1]["test_mode"], rows[1]["ups_id"], rows[1]["battery_charge"]) == (
+                    "production", "default", 80.0
+                )
+
+                # 统计随搬迁的插入重新累计
+                stats = await db.fetch_one(
+                    "SELECT row_count, earliest, latest FROM storage_stats WHERE table_name = 'metrics'"
+                )
+                assert tuple(stats) == (4, "2026-01-01 00:00:00", "2026-01-01 00:02:00")
+            finally:
+                await db.close()
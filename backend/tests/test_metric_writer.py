@@ -0,0 +1,142 @@
+"""测试指标批量写入队列"""
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+
+import pytest
+from db.metric_store import decode_value
+from models import Metric
+from services.history import HistoryService
+from services.metric_writer import MetricWriter
+
+
+class TestMetricWriter:
+    """测试 MetricWriter"""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_does_not_write_until_flush(self, real_db):
+        """入队不写库，flush 后一次写入"""
+        writer = MetricWriter(real_db, flush_interval=60, batch_size=100)
+
+        for i in range(5):
+            writer.enqueue(Metric(battery_charge=90 - i), "mock")
+
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM metrics")
+        assert row[0] == 0
+        assert writer.pending() == 5
+
+        written = await writer.flush()
+        assert written == 5
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM metrics WHERE test_mode = 'mock'")
+        assert row[0] == 5
+
+        stats = writer.get_stats()
+        assert stats["flush_count"] == 1
+        assert stats["written"] == 5
+        assert stats["queue_depth"] == 0
+        assert stats["max_queue_depth"] == 5
+        assert stats["last_flush_ms"] is not None
+
+    @pytest.mark.asyncio
+    async def test_bounded_queue_drops_oldest(self, real_db):
+        """超过队列上限时丢弃最旧采样"""
+        writer = MetricWriter(real_db, batch_size=100, max_queue_size=3)
+
+        for i in range(5):
+            writer.enqueue(Metric(battery_charge=float(i)), "mock")
+
+        assert writer.pending() == 3
+        assert writer.get_stats()["dropped"] == 2
+
+        await writer.flush()
+        rows = await real_db.fetch_all("SELECT battery_charge FROM metrics ORDER BY ts")
+        assert [decode_value("battery_charge", r[0]) for r in rows] == [2.0, 3.0, 4.0]
+
+    @pytest.mark.asyncio
+    async def test_energy_accumulates_in_memory(self, real_db):
+        """累计用电量在内存中递增，首条为 0"""
+        writer = MetricWriter(real_db, batch_size=100)
+
+        for _ in range(3):
+            writer.enqueue(Metric(power_watts=100.0), "mock")
+        # 采样间隔固定为 36 秒：100 W × 0.01 h = 0.001 kWh
+        base = datetime(2026, 1, 1)
+        writer._queue = deque(
+            (base + timedelta(seconds=36 * i), metric, test_mode, ups_id)
+            for i, (_, metric, test_mode, ups_id) in enumerate(writer._queue)
+        )
+        await writer.flush()
+
+        rows = await real_db.fetch_all("SELECT energy_kwh FROM metrics ORDER BY ts")
+        energy = [decode_value("energy_kwh", row[0]) for row in rows]
+        assert energy == [0.0, pytest.approx(0.001), pytest.approx(0.002)]
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_pending(self, real_db):
+        """停止时保证写入剩余采样"""
+        writer = MetricWriter(real_db, flush_interval=3600, batch_size=100)
+        await writer.start()
+
+        writer.enqueue(Metric(battery_charge=50.0), "mock")
+        await writer.stop()
+
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM metrics")
+        assert row[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_stop_during_flush_keeps_batch(self, real_db, monkeypatch):
+        """刷新进行中停止时，已取出的一批采样仍然写入"""
+        writer = MetricWriter(real_db, flush_interval=3600, batch_size=1)
+        started = asyncio.Event()
+        original = real_db.execute_transaction
+
+        async def slow_transaction(operations):
+            started.set()
+            await asyncio.sleep(0.05)
+            return await original(operations)
+
+        monkeypatch.setattr(real_db, "execute_transaction", slow_transaction)
+        await writer.start()
+        writer.enqueue(Metric(battery_charge=50.0), "mock")
+        await started.wait()
+        await writer.stop()
+
+        row = await real_db.fetch_one("SELECT COUNT(*) FROM metrics")
+        assert row[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_does_not_advance_timestamps(self, real_db, monkeypatch):
+        """事务失败时不推进 ts 状态，重试写入原来的时间"""
+        writer = MetricWriter(real_db, batch_size=100)
+        original = real_db.execute_transaction
+        calls = 0
+
+        async def flaky_transaction(operations):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise RuntimeError("database is locked")
+            return await original(operations)
+
+        monkeypatch.setattr(real_db, "execute_transaction", flaky_transaction)
+        writer.enqueue(Metric(battery_charge=50.0), "mock")
+        assert await writer.flush() == 0
+        assert writer._last_ts == {}
+
+        assert await writer.flush() == 1
+        sampled_at = writer._last_ts[("mock", "default")]
+        row = await real_db.fetch_one("SELECT ts FROM metrics")
+        assert row[0] == sampled_at
+
+    @pytest.mark.asyncio
+    async def test_history_service_reads_pending_samples(self, real_db):
+        """启用写入队列后 get_metrics 仍能读到刚入队的采样"""
+        service = HistoryService(real_db)
+        await service.start_metric_writer(flush_interval=3600)
+
+        await service.add_metric(Metric(battery_charge=80.0), test_mode="mock")
+        metrics = await service.get_metrics(hours=1, test_mode="mock")
+
+        assert len(metrics) == 1
+        assert metrics[0].battery_charge == 80.0
+        await service.stop_metric_writer()
@@ -32,6 +32,20 @@ class TestUpsMonitor:
         await monitor.stop()
         assert monitor._running is False
     
+    @pytest.mark.asyncio
+    async def test_stop_cancels_ssh_prewarm(self, mock_nut_client, mock_shutdown_client):
+        """停止监控时取消仍在进行的 SSH 预连接"""
+        shutdown_manager = ShutdownManager(mock_shutdown_client)
+        monitor = UpsMonitor(mock_nut_client, shutdown_manager, poll_interval=1)
+
+        await monitor.start()
+        prewarm = asyncio.create_task(asyncio.sleep(3600))
+        monitor._prewarm_task = prewarm
+
+        await monitor.stop()
+        assert prewarm.cancelled()
+        assert monitor._prewarm_task is None
+
     @pytest.mark.asyncio
     async def test_status_parsing_online(self, mock_nut_client, mock_shutdown_client):
         """测试在线状态解析"""
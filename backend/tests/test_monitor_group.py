@@ -0,0 +1,127 @@
+"""测试多 UPS 监控组"""
+import pytest
+from config import ConfigChange
+from models import Config, DEFAULT_UPS_ID, EventType, Metric, UpsStatus
+from services.history import HistoryService
+from services.monitor import UpsMonitor
+from services.monitor_group import MonitorGroup, create_unit_monitor, parse_ups_units
+from services.nut_client import MockNutClient
+from services.shutdown_manager import ShutdownManager
+
+
+class TestParseUpsUnits:
+    """测试 UPS_UNITS 解析"""
+
+    def test_empty(self):
+        assert parse_ups_units("") == []
+
+    def test_invalid_json(self):
+        assert parse_ups_units("not json") == []
+
+    def test_skips_invalid_entries(self):
+        units = parse_ups_units(
+            '[{"id": "rack2", "host": "nut", "ups_name": "ups2"},'
+            ' {"id": "rack2", "host": "nut"},'
+            ' {"id": "default", "host": "nut"},'
+            ' {"id": "bad id", "host": "nut"},'
+            ' {"id": "rack3", "backend": "snmp", "host": "nut"},'
+            ' {"id": "rack4"},'
+            ' {"id": "rack5", "backend": "apcupsd", "host": "10.0.0.5"}]'
+        )
+        assert [u.id for u in units] == ["rack2", "rack5"]
+        assert units[0].shutdown_enabled is False
+
+
+class TestMonitorGroup:
+    """测试 MonitorGroup"""
+
+    def test_create_unit_monitor(self, mock_shutdown_client):
+        unit = parse_ups_units('[{"id": "rack2", "host": "nut", "ups_name": "ups2", "shutdown_battery_percent": 40}]')[0]
+        monitor = create_unit_monitor(unit, Config(), mock_shutdown_client, mock_mode=True)
+
+        assert monitor.ups_id == "rack2"
+        assert not monitor.is_primary
+        assert monitor.shutdown_enabled is False
+        assert monitor.shutdown_manager.battery_percent == 40
+        assert isinstance(monitor.nut_client, MockNutClient)
+
+    def test_unit_follows_global_config_except_overrides(self, mock_shutdown_client):
+        unit = parse_ups_units('[{"id": "rack2", "host": "nut", "shutdown_battery_percent": 40}]')[0]
+        monitor = create_unit_monitor(unit, Config(), mock_shutdown_client, mock_mode=True)
+
+        config = Config(poll_interval_seconds=2, shutdown_battery_percent=15, shutdown_wait_minutes=9, test_mode="dry_run")
+        monitor.apply_config(ConfigChange(2, config, {
+            "poll_interval_seconds": (5, 2),
+            "shutdown_battery_percent": (20, 15),
+            "shutdown_wait_minutes": (5, 9),
+            "test_mode": ("production", "dry_run"),
+        }))
+
+        assert monitor.config is config
+        assert monitor.poll_interval == 2
+        assert monitor.shutdown_manager.wait_minutes == 9
+        assert monitor.shutdown_manager.test_mode == "dry_run"
+        # 单独配置的阈值不被全局配置覆盖
+        assert monitor.shutdown_manager.battery_percent == 40
+
+    @pytest.mark.asyncio
+    async def test_lookup_and_summary(self, mock_nut_client, mock_shutdown_client):
+        group = MonitorGroup()
+        primary = UpsMonitor(mock_nut_client, ShutdownManager(mock_shutdown_client))
+        unit = create_unit_monitor(
+            parse_ups_units('[{"id": "rack2", "host": "nut"}]')[0], Config(), mock_shutdown_client, mock_mode=True
+        )
+        group.add(primary)
+        group.add(unit)
+
+        assert group.get() is primary
+        assert group.get("rack2") is unit
+        assert group.get("missing") is None
+        with pytest.raises(ValueError):
+            group.add(unit)
+
+        data = await unit._read_ups_data()
+        assert data.ups_id == "rack2"
+        unit._current_data = data
+        unit._current_status = data.status
+
+        summary = {item["ups_id"]: item for item in group.get_summary()}
+        assert summary[DEFAULT_UPS_ID]["primary"] is True
+        assert summary["rack2"]["status"] == UpsStatus.ONLINE.value
+        assert summary["rack2"]["battery_charge"] == data.battery_charge
+
+    @pytest.mark.asyncio
+    async def test_monitor_only_unit_skips_shutdown(self, mock_shutdown_client):
+        unit = create_unit_monitor(
+            parse_ups_units('[{"id": "rack2", "host": "nut"}]')[0], Config(), mock_shutdown_client, mock_mode=True
+        )
+        unit.nut_client.set_power_lost()
+        data = await unit._read_ups_data()
+
+        await unit._handle_status(data)
+        assert unit.shutdown_manager.get_status()["shutting_down"] is False
+
+
+class TestUpsIdHistory:
+    """测试历史数据的 ups_id 维度"""
+
+    @pytest.mark.asyncio
+    async def test_metrics_and_events_separated_by_ups(self, real_db):
+        service = HistoryService(real_db)
+        await service.add_metric(Metric(battery_charge=90.0), test_mode="mock")
+        await service.add_metric(Metric(battery_charge=40.0), test_mode="mock", ups_id="rack2")
+        await service.add_event(EventType.POWER_LOST, "rack2 lost", test_mode="mock", ups_id="rack2")
+        await service.add_event(EventType.STARTUP, "started", test_mode="mock")
+
+        primary = await service.get_metrics(hours=1, test_mode="mock")
+        rack2 = await service.get_metrics(hours=1, test_mode="mock", ups_id="rack2")
+        assert [m.battery_charge for m in primary] == [90.0]
+        assert [m.battery_charge for m in rack2] == [40.0]
+
+        series = await service.get_metric_series(hours=24 * 30, test_mode="mock", ups_id="rack2")
+        assert [p["battery_charge"] for p in series["points"]] == [40.0]
+
+        events = await service.get_events(days=1, test_mode="mock", ups_id="rack2")
+        assert [e.message for e in events] == ["rack2 lost"]
+        assert events[0].ups_id == "rack2"
+        assert len(await service.get_events(days=1, test_mode="mock")) == 2
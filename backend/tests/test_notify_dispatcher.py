@@ -0,0 +1,209 @@
+"""测试通知分发队列"""
+import asyncio
+import time
+import pytest
+from models import EventType
+from services.notifier import NotifierService
+from services.notify_dispatcher import ChannelDispatcher, PendingNotification
+
+
+def _info(name="tg"):
+    return {"index": 0, "channel_id": name, "name": name, "plugin_id": "test", "notifier": None}
+
+
+def _message(title="断电", content="市电中断", key=None):
+    return PendingNotification(key or ("POWER_LOST", title), title, content, "warning", "2024-01-01 00:00:00")
+
+
+class Recorder:
+    """记录发送调用的假发送函数"""
+
+    def __init__(self, results=None, delay=0.0):
+        self.calls = []
+        self.results = list(results or [])
+        self.delay = delay
+
+    async def __call__(self, notifier_info, title, content, level, timestamp, max_retries):
+        self.calls.append((title, content, max_retries))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.results:
+            return self.results.pop(0)
+        return True, None
+
+
+class TestChannelDispatcher:
+    """测试单渠道队列"""
+
+    @pytest.mark.asyncio
+    async def test_submit_returns_immediately_and_flush_waits(self):
+        send = Recorder(delay=0.05)
+        dispatcher = ChannelDispatcher(_info(), send)
+
+        start = time.perf_counter()
+        dispatcher.submit(_message())
+        assert time.perf_counter() - start < 0.01
+        assert send.calls == []
+
+        assert await dispatcher.flush(timeout=1)
+        assert len(send.calls) == 1
+        assert dispatcher.get_stats()["sent"] == 1
+        dispatcher.close()
+
+    @pytest.mark.asyncio
+    async def test_pending_duplicates_are_coalesced(self):
+        send = Recorder(delay=0.05)
+        dispatcher = ChannelDispatcher(_info(), send)
+
+        dispatcher.submit(_message(title="other", key=("STARTUP", "other")))
+        for i in range(3):
+            dispatcher.submit(_message(content=f"第 {i} 次"))
+        await dispatcher.flush(timeout=1)
+
+        assert len(send.calls) == 2
+        title, content, _ = send.calls[1]
+        assert content.startswith("第 2 次")
+        assert "已合并 3 条" in content
+        assert dispatcher.get_stats()["coalesced"] == 2
+        dispatcher.close()
+
+    @pytest.mark.asyncio
+    async def test_coalescing_keeps_order(self):
+        """合并后的通知排在之后发生的通知后面"""
+        send = Recorder()
+        dispatcher = ChannelDispatcher(_info(), send)
+
+        dispatcher.submit(_message(title="断电", content="第 1 次"))
+        dispatcher.submit(_message(title="恢复", key=("POWER_RESTORED", "恢复")))
+        dispatcher.submit(_message(title="断电", content="第 2 次"))
+        await dispatcher.flush(timeout=1)
+
+        assert [call[0] for call in send.calls] == ["恢复", "断电"]
+        assert send.calls[1][1].startswith("第 2 次")
+        dispatcher.close()
+
+    @pytest.mark.asyncio
+    async def test_rate_limit(self):
+        send = Recorder()
+        dispatcher = ChannelDispatcher(_info(), send, rate_per_minute=600, burst=2)
+
+        start = time.perf_counter()
+        for i in range(4):
+            dispatcher.submit(_message(key=("E", str(i))))
+        await dispatcher.flush(timeout=2)
+
+        # 2 条突发 + 2 条按 10 条/秒补充令牌
+        assert len(send.calls) == 4
+        assert time.perf_counter() - start >= 0.15
+        dispatcher.close()
+
+    @pytest.mark.asyncio
+    async def test_circuit_breaker_opens_and_probes(self):
+        send = Recorder(results=[(False, "proxy down")] * 3)
+        results = []
+
+        async def on_result(info, success, error):
+            results.append((success, error))
+
+        dispatcher = ChannelDispatcher(_info(), send, on_result, failure_threshold=3, breaker_cooldown=0.1)
+        for i in range(4):
+            dispatcher.submit(_message(key=("E", str(i))))
+
+        await asyncio.sleep(0.05)
+        stats = dispatcher.get_stats()
+        assert stats["breaker_open"] is True
+        assert stats["failed"] == 3
+        assert stats["queue_depth"] == 1
+
+        await dispatcher.flush(timeout=1)
+        # 冷却结束后的探测不重试，成功后熔断关闭
+        assert send.calls[-1][2] == 0
+        assert [r[0] for r in results] == [False, False, False, True]
+        assert dispatcher.get_stats()["breaker_open"] is False
+        dispatcher.close()
+
+    @pytest.mark.asyncio
+    async def test_queue_is_bounded(self):
+        send = Recorder(delay=0.05)
+        dispatcher = ChannelDispatcher(_info(), send, max_queue_size=2)
+
+        for i in range(5):
+            dispatcher.submit(_message(key=("E", str(i))))
+
+        assert dispatcher.pending() == 2
+        assert dispatcher.get_stats()["dropped"] == 3
+        dispatcher.close()
+
+
+class SlowNotifier:
+    """发送很慢的通知插件"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, title, content, level, timestamp):
+        await asyncio.sleep(self.delay)
+        self.sent.append(title)
+        return True, None
+
+
+class TestNotifierService:
+    """测试 NotifierService 接入分发队列"""
+
+    def _service(self, *notifiers):
+        service = NotifierService()
+        service._notifiers = [
+            {"index": i, "channel_id": f"ch{i}", "name": f"ch{i}", "plugin_id": "test", "notifier": n}
+            for i, n in enumerate(notifiers)
+        ]
+        service._sync_dispatchers()
+        return service
+
+    @pytest.mark.asyncio
+    async def test_notify_does_not_wait_for_channels(self):
+        slow, fast = SlowNotifier(0.2), SlowNotifier(0)
+        service = self._service(slow, fast)
+
+        start = time.perf_counter()
+        await service.notify(EventType.POWER_LOST, "市电中断", "UPS 切换到电池供电")
+        assert time.perf_counter() - start < 0.05
+
+        # 慢渠道不影响其他渠道
+        await asyncio.sleep(0.05)
+        assert fast.sent == ["市电中断"]
+        assert slow.sent == []
+
+        assert await service.flush(timeout=1)
+        assert slow.sent == ["市电中断"]
+        stats = service.get_stats()["channels"]
+        assert stats["ch0"]["sent"] == stats["ch1"]["sent"] == 1
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_reconfigure_keeps_pending_messages(self):
+        notifier = SlowNotifier(0.05)
+        service = self._service(notifier)
+        dispatcher = service._dispatchers["ch0"]
+
+        await service.notify(EventType.POWER_LOST, "a", "x")
+        await service.notify(EventType.POWER_RESTORED, "b", "y")
+        service._sync_dispatchers()
+
+        assert service._dispatchers["ch0"] is dispatcher
+        await service.flush(timeout=1)
+        assert notifier.sent == ["a", "b"]
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_removed_channel_is_closed(self):
+        service = self._service(SlowNotifier(1))
+        dispatcher = service._dispatchers["ch0"]
+        await service.notify(EventType.POWER_LOST, "a", "x")
+
+        service._notifiers = []
+        service._sync_dispatchers()
+
+        assert service._dispatchers == {}
+        assert dispatcher.pending() == 0
+        assert await service.flush(timeout=0.1)
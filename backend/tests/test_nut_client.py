@@ -1,6 +1,7 @@
 """测试 NUT 客户端"""
+import asyncio
 import pytest
-from services.nut_client import MockNutClient
+from services.nut_client import MockNutClient, RealNutClient
 
 
 class TestMockNutClient:
@@ -168,3 +169,89 @@ class TestMockNutClient:
         # 检查 list_vars 也能获取到更新后的值
         vars_dict = await mock_nut_client.list_vars()
         assert vars_dict["input.transfer.low"] == "150"
+
+
+class TestRealNutClientPipelining:
+    """测试 RealNutClient 的会话串行化与流水线 GET VAR"""
+
+    @staticmethod
+    async def _start_fake_upsd(variables):
+        """启动一个最小的 upsd 模拟服务，返回 (server, port, 收到的请求列表)"""
+        received = []
+
+        async def handle(reader, writer):
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().strip()
+                received.append(command)
+                if command.startswith(("USERNAME", "PASSWORD")):
+                    writer.write(b"OK\n")
+                elif command == "LIST UPS":
+                    writer.write(b'BEGIN LIST UPS\nUPS myups "Fake"\nEND LIST UPS\n')
+                elif command.startswith("GET VAR"):
+                    _, _, ups, name = command.split(" ", 3)
+                    if name in variables:
+                        writer.write(f'VAR {ups} {name} "{variables[name]}"\n'.encode())
+                    else:
+                        writer.write(b"ERR VAR-NOT-SUPPORTED\n")
+                await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        return server, port, received
+
+    @pytest.mark.asyncio
+    async def test_get_vars_pipelined(self):
+        """批量获取变量，缺失变量返回 None"""
+        server, port, _ = await self._start_fake_upsd({"ups.status": "OL", "battery.charge": "100"})
+        client = RealNutClient("127.0.0.1", port, "user", "pass", "")
+        try:
+            await client.connect()
+            assert client.ups_name == "myups"
+
+            values = await client.get_vars(["ups.status", "battery.charge", "ups.temperature"])
+            assert values == {"ups.status": "OL", "battery.charge": "100", "ups.temperature": None}
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_get_var_not_interleaved(self):
+        """并发请求串行化，响应不会错配"""
+        variables = {f"test.var{i}": str(i) for i in range(20)}
+        server, port, _ = await self._start_fake_upsd(variables)
+        client = RealNutClient("127.0.0.1", port, "user", "pass", "")
+        try:
+            await client.connect()
+            names = list(variables)
+            results = await asyncio.gather(*(client.get_var(name) for name in names))
+            assert results == [variables[name] for name in names]
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+
+    @pytest.mark.asyncio
+    async def test_aux_pool_size_is_not_exceeded(self):
+        """并发借用辅助连接时不超过连接池上限"""
+        server, port, _ = await self._start_fake_upsd({"ups.status": "OL"})
+        client = RealNutClient("127.0.0.1", port, "user", "pass", "", aux_pool_size=1)
+
+        async def borrow():
+            async with client._aux_connection() as aux:
+                await asyncio.sleep(0.01)
+                return aux
+
+        try:
+            await client.connect()
+            borrowed = await asyncio.gather(*(borrow() for _ in range(5)))
+            assert len(client._aux_clients) == 1
+            assert all(aux is client._aux_clients[0] for aux in borrowed)
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
@@ -0,0 +1,188 @@
+"""测试预测结果缓存"""
+import itertools
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import pytest
+import pytest_asyncio
+from db.database import Database
+from db.metric_store import INSERT_METRIC_SQL, metric_row
+from models import Event, EventType
+from services.history import HistoryService
+from services.ml_predictor import MLPredictor
+from services.prediction_cache import PredictionCache, RollingStats
+
+
+# 每行错开 1 毫秒，同一时刻写入的多行不会主键冲突
+_sequence = itertools.count()
+
+
+def _ts(minutes_ago: float) -> datetime:
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    return now - timedelta(minutes=minutes_ago) + timedelta(milliseconds=next(_sequence) % 1000)
+
+
+async def _insert_metric(db, minutes_ago: float, voltage: float = 230.0, charge: float = 100.0, load: float = 30.0):
+    await db.execute(INSERT_METRIC_SQL, metric_row(
+        _ts(minutes_ago), {"battery_charge": charge, "input_voltage": voltage, "load_percent": load}, "production"
+    ))
+
+
+@pytest_asyncio.fixture
+async def cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(str(Path(tmp_dir) / "test.db"))
+        await db.connect()
+        history = HistoryService(db)
+        cache = PredictionCache(history, MLPredictor())
+        cache._resolve_test_mode = _production
+        history.add_write_listener(cache.on_history_write)
+
+        for i in range(20):
+            await _insert_metric(db, 100 - i, voltage=230 + (i % 2))
+
+        yield cache
+        await db.close()
+
+
+async def _production():
+    return "production"
+
+
+class TestRollingStats:
+    """测试滑动窗口累计量"""
+
+    def test_add_remove(self):
+        stats = RollingStats()
+        for value in (230.0, 231.0, 229.0, 240.0):
+            stats.add(value)
+        stats.remove(230.0)
+
+        mean, std = stats.mean_std()
+        assert stats.count == 3
+        assert mean == pytest.approx(233.333333)
+        assert std == pytest.approx(4.784233)
+
+    def test_empty(self):
+        stats = RollingStats()
+        stats.add(1.0)
+        stats.remove(1.0)
+        assert stats.mean_std() == (0, 0)
+
+
+class TestPredictionCache:
+    """测试缓存与增量更新"""
+
+    @pytest.mark.asyncio
+    async def test_results_are_reused(self, cache):
+        first = await cache.get_all()
+        second = await cache.get_all()
+
+        assert set(first) == {"outage_duration", "battery_health", "runtime_prediction", "anomalies"}
+        assert first == second
+        assert "computed_at" in first["anomalies"]
+        stats = cache.get_stats()
+        assert stats["full_loads"] == 1
+        assert stats["hits"] == 4
+
+    @pytest.mark.asyncio
+    async def test_new_samples_are_appended_incrementally(self, cache):
+        before = await cache.get("anomalies")
+        assert before["sample_count"] == 20
+
+        await _insert_metric(cache.history.db, 0, voltage=300)
+        cache.history._notify_write("metrics", "default")
+        after = await cache.get("anomalies")
+
+        assert after["sample_count"] == 21
+        assert [a["type"] for a in after["anomalies"]] == ["input_voltage"]
+        stats = cache.get_stats()
+        assert stats["full_loads"] == 1
+        assert stats["incremental_loads"] == 1
+        assert stats["samples"] == 21
+
+    @pytest.mark.asyncio
+    async def test_same_second_rows_are_not_duplicated(self, cache):
+        await cache.get("anomalies")
+        await _insert_metric(cache.history.db, 0)
+        cache.history._notify_write("metrics", "default")
+        await cache.get("anomalies")
+
+        # 与最后一行同一秒写入的新行
+        await _insert_metric(cache.history.db, 0)
+        cache.history._notify_write("metrics", "default")
+        result = await cache.get("anomalies")
+
+        assert result["sample_count"] == 22
+
+    @pytest.mark.asyncio
+    async def test_incremental_stats_match_batch_detection(self, cache):
+        for i in range(5):
+            await _insert_metric(cache.history.db, 0, voltage=228 + i)
+        cache.history._notify_write("metrics", "default")
+
+        cached = await cache.get("anomalies")
+        frame = await cache.history.get_metric_frame(hours=24 * 7, test_mode="production")
+        batch = await MLPredictor().detect_anomalies(frame)
+
+        cached.pop("computed_at")
+        assert cached == batch
+
+    @pytest.mark.asyncio
+    async def test_metric_writes_keep_event_models(self, cache):
+        await cache.get_all()
+        await _insert_metric(cache.history.db, 0)
+        cache.history._notify_write("metrics", "default")
+        await cache.get_all()
+
+        # 停电时长只依赖事件，新采样不会触发重算
+        assert "outage_duration" in cache.get_stats()["cached_models"]
+        assert cache.get_stats()["misses"] == 6
+
+    @pytest.mark.asyncio
+    async def test_only_relevant_events_invalidate(self, cache):
+        await cache.get("outage_duration")
+
+        await cache.history.add_event(EventType.NUT_RECONNECTED, "x", test_mode="production")
+        await cache.get("outage_duration")
+        assert cache.get_stats()["misses"] == 1
+
+        await cache.history.add_event(EventType.POWER_LOST, "lost", test_mode="production")
+        await cache.get("outage_duration")
+        assert cache.get_stats()["misses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_event_times_are_utc_on_non_utc_hosts(self, cache, monkeypatch):
+        """无时区的事件时间按 UTC 解读，与本机时区无关"""
+        restored_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        async def get_events(**kwargs):
+            return [Event(event_type=EventType.POWER_RESTORED, message="restored", timestamp=restored_at)]
+
+        monkeypatch.setattr(cache.history, "get_events", get_events)
+        monkeypatch.setenv("TZ", "Asia/Shanghai")
+        time.tzset()
+        try:
+            await cache._load_events()
+            assert abs(cache._last_outage_end - time.time()) < 60
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+    @pytest.mark.asyncio
+    async def test_other_ups_writes_are_ignored(self, cache):
+        await cache.get("anomalies")
+        cache.history._notify_write("metrics", "rack2")
+        await cache.get("anomalies")
+
+        assert cache.get_stats()["incremental_loads"] == 0
+
+    @pytest.mark.asyncio
+    async def test_reset_triggers_full_reload(self, cache):
+        await cache.get("anomalies")
+        await cache.history.cleanup_all_data()
+        result = await cache.get("anomalies")
+
+        assert result["available"] is False
+        assert cache.get_stats()["full_loads"] == 2
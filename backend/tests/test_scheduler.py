@@ -0,0 +1,249 @@
+"""测试设备定时任务调度器与 cron 表达式"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from services import scheduler as scheduler_module
+from services.scheduler import DeviceScheduler, ScheduleRepeat
+from utils.cron import CronExpression
+
+
+class TestCronExpression:
+    """测试 cron 表达式解析和下次触发时间"""
+
+    def test_next_after(self):
+        base = datetime(2026, 10, 16, 22, 30, 15)  # 周五
+
+        assert CronExpression("*/15 * * * *").next_after(base) == datetime(2026, 10, 16, 22, 45)
+        assert CronExpression("0 23 * * *").next_after(base) == datetime(2026, 10, 16, 23, 0)
+        assert CronExpression("0 22 * * *").next_after(base) == datetime(2026, 10, 17, 22, 0)
+        assert CronExpression("30 1 * * mon-fri").next_after(base) == datetime(2026, 10, 19, 1, 30)
+        assert CronExpression("0 0 1 jan *").next_after(base) == datetime(2027, 1, 1, 0, 0)
+        assert CronExpression("@daily").next_after(base) == datetime(2026, 10, 17, 0, 0)
+        # 周日可以写作 0 或 7
+        assert CronExpression("0 3 * * 7").next_after(base) == datetime(2026, 10, 18, 3, 0)
+
+    def test_day_and_weekday_match_either(self):
+        # 每月 1 日或每周一
+        cron = CronExpression("0 0 1 * 1")
+        assert cron.next_after(datetime(2026, 10, 16)) == datetime(2026, 10, 19)
+        assert cron.next_after(datetime(2026, 10, 27)) == datetime(2026, 11, 1)
+
+    @pytest.mark.parametrize("expression", [
+        "* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "*/0 * * * *", "a * * * *", "1,,2 * * * *",
+    ])
+    def test_invalid(self, expression):
+        with pytest.raises(ValueError):
+            CronExpression(expression)
+
+    def test_never_fires(self):
+        with pytest.raises(ValueError):
+            CronExpression("0 0 30 2 *").next_after(datetime(2026, 1, 1))
+
+
+class TestPersistence:
+    """测试任务持久化与重启恢复"""
+
+    @pytest.mark.asyncio
+    async def test_schedules_survive_restart(self, real_db):
+        scheduler = DeviceScheduler(real_db)
+        once_id = await scheduler.add_schedule(0, "NAS", "shutdown", datetime.now() + timedelta(hours=1))
+        cron_id = await scheduler.add_schedule(1, "PC", "wake", repeat="cron", cron="0 7 * * mon-fri")
+
+        restarted = DeviceScheduler(real_db)
+        await restarted.start()
+        try:
+            schedules = {s["schedule_id"]: s for s in await restarted.get_schedules()}
+            assert set(schedules) == {once_id, cron_id}
+            assert schedules[cron_id]["repeat"] == ScheduleRepeat.CRON
+            assert schedules[cron_id]["cron"] == "0 7 * * mon-fri"
+            assert schedules[cron_id]["next_execution"].endswith("T07:00:00")
+            assert restarted.get_stats()["schedules"] == 2
+
+            assert await restarted.remove_schedule(once_id)
+            rows = await real_db.fetch_all("SELECT schedule_id FROM device_schedules")
+            assert [row[0] for row in rows] == [cron_id]
+        finally:
+            await restarted.stop()
+
+    @pytest.mark.asyncio
+    async def test_missed_runs_are_recorded_not_executed(self, real_db):
+        scheduler = DeviceScheduler(real_db)
+        daily_id = await scheduler.add_schedule(0, "NAS", "shutdown", datetime.now() + timedelta(hours=1), "daily")
+        once_id = await scheduler.add_schedule(0, "NAS", "reboot", datetime.now() + timedelta(hours=1))
+        # 模拟停机期间到期
+        overdue = (datetime.now() - timedelta(hours=2)).isoformat()
+        await real_db.execute("UPDATE device_schedules SET next_execution = ?", (overdue,))
+
+        restarted = DeviceScheduler(real_db)
+        executed = []
+
+        async def execute(task):
+            executed.append(task.schedule_id)
+            return {"success": True}
+
+        restarted._execute_task = execute
+        await restarted.start()
+        try:
+            await asyncio.sleep(0.05)
+            assert executed == []
+            schedules = {s["schedule_id"]: s for s in await restarted.get_schedules()}
+            assert list(schedules) == [daily_id]
+            assert datetime.fromisoformat(schedules[daily_id]["next_execution"]) > datetime.now()
+
+            runs = await restarted.get_runs(daily_id)
+            assert [run["result"] for run in runs] == ["missed"]
+            # 一次性任务删除后执行记录保留
+            runs = await restarted.get_runs(once_id)
+            assert [run["result"] for run in runs] == ["missed"]
+            assert restarted.get_stats()["missed"] == 2
+        finally:
+            await restarted.stop()
+
+
+class TestDispatch:
+    """测试到期任务的调度执行"""
+
+    @pytest.mark.asyncio
+    async def test_due_tasks_run_concurrently_with_bounded_parallelism(self, real_db):
+        scheduler = DeviceScheduler(real_db, max_parallel=3)
+        active = 0
+        peak = 0
+        started = []
+
+        async def execute(task):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            started.append(datetime.now())
+            await asyncio.sleep(0.05)
+            active -= 1
+            return {"success": task.device_index != 4, "message": "ok"}
+
+        scheduler._execute_task = execute
+        await scheduler.start()
+        try:
+            due = datetime.now() + timedelta(milliseconds=200)
+            ids = [await scheduler.add_schedule(i, f"host-{i}", "shutdown", due) for i in range(6)]
+
+            for _ in range(100):
+                if scheduler.get_stats()["executed"] == 6 and not scheduler.get_stats()["in_flight"]:
+                    break
+                await asyncio.sleep(0.02)
+
+            stats = scheduler.get_stats()
+            assert stats["executed"] == 6
+            assert stats["failed"] == 1
+            assert peak == 3
+            # 睡眠到到期时间，而不是按固定间隔扫描
+            assert min(started) >= due
+            assert (min(started) - due).total_seconds() < 0.5
+            # 一次性任务执行后删除，执行记录保留
+            assert await scheduler.get_schedules() == []
+            runs = await scheduler.get_runs(ids[4])
+            assert [run["result"] for run in runs] == ["failed"]
+            assert await scheduler.get_runs(ids[4], device_index=3) == []
+        finally:
+            await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_repeating_task_is_rescheduled(self, real_db):
+        scheduler = DeviceScheduler(real_db)
+        executed = []
+
+        async def execute(task):
+            executed.append(task.schedule_id)
+            return {"success": True}
+
+        scheduler._execute_task = execute
+        await scheduler.start()
+        try:
+            scheduled = datetime.now() + timedelta(milliseconds=100)
+            schedule_id = await scheduler.add_schedule(0, "NAS", "shutdown", scheduled, "daily")
+            for _ in range(100):
+                if executed and not scheduler.get_stats()["in_flight"]:
+                    break
+                await asyncio.sleep(0.02)
+
+            assert executed == [schedule_id]
+            schedule = (await scheduler.get_schedules())[0]
+            assert schedule["next_execution"] == (scheduled + timedelta(days=1)).isoformat()
+            assert schedule["last_executed"] is not None
+            runs = await scheduler.get_runs(schedule_id)
+            assert [run["result"] for run in runs] == ["success"]
+        finally:
+            await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_save_failure_does_not_drop_run(self, real_db):
+        scheduler = DeviceScheduler(real_db)
+        executed = []
+
+        async def execute(task):
+            executed.append(task.schedule_id)
+            return {"success": True}
+
+        scheduler._execute_task = execute
+        schedule_id = await scheduler.add_schedule(0, "NAS", "shutdown", datetime.now() + timedelta(hours=1), "daily")
+        saves = 0
+        original_save = scheduler._save
+
+        async def flaky_save(task):
+            nonlocal saves
+            saves += 1
+            if saves == 1:
+                raise RuntimeError("database is locked")
+            await original_save(task)
+
+        scheduler._save = flaky_save
+        task = scheduler._schedules[schedule_id]
+        task.next_execution = datetime.now()
+        scheduler._push(task)
+
+        await scheduler._dispatch_due_tasks()
+        await asyncio.gather(*scheduler._in_flight)
+
+        assert executed == [schedule_id]
+        row = await real_db.fetch_one("SELECT next_execution FROM device_schedules WHERE schedule_id = ?", (schedule_id,))
+        assert row[0] == task.next_execution.isoformat()
+
+    @pytest.mark.asyncio
+    async def test_has_schedule_checks_device(self, real_db):
+        scheduler = DeviceScheduler(real_db)
+        schedule_id = await scheduler.add_schedule(1, "PC", "wake", datetime.now() + timedelta(hours=1))
+
+        assert scheduler.has_schedule(schedule_id)
+        assert scheduler.has_schedule(schedule_id, 1)
+        assert not scheduler.has_schedule(schedule_id, 0)
+        assert not scheduler.has_schedule("missing")
+
+    @pytest.mark.asyncio
+    async def test_run_history_is_capped(self, real_db, monkeypatch):
+        monkeypatch.setattr(scheduler_module, "MAX_RUNS_PER_SCHEDULE", 3)
+        scheduler = DeviceScheduler(real_db)
+        schedule_id = await scheduler.add_schedule(0, "NAS", "wake", repeat="cron", cron="* * * * *")
+        task = scheduler._schedules[schedule_id]
+
+        for i in range(5):
+            moment = datetime(2026, 10, 1, 8, i)
+            await scheduler._record_run(task, moment, moment, moment, "success", str(i))
+
+        runs = await scheduler.get_runs(schedule_id)
+        assert [run["message"] for run in runs] == ["4", "3", "2"]
+
+    @pytest.mark.asyncio
+    async def test_old_runs_expire_and_removal_deletes_runs(self, real_db):
+        scheduler = DeviceScheduler(real_db)
+        schedule_id = await scheduler.add_schedule(0, "NAS", "wake", repeat="cron", cron="0 7 * * *")
+        task = scheduler._schedules[schedule_id]
+        now = datetime.now()
+        old = now - timedelta(days=scheduler_module.RUN_RETENTION_DAYS + 1)
+
+        await scheduler._record_run(task, old, old, old, "success", "old")
+        await scheduler._record_run(task, now, now, now, "success", "new")
+        runs = await scheduler.get_runs(schedule_id)
+        assert [run["message"] for run in runs] == ["new"]
+
+        # 用户删除任务时执行记录一并删除
+        assert await scheduler.remove_schedule(schedule_id)
+        assert await scheduler.get_runs(schedule_id) == []
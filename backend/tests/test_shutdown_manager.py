@@ -291,6 +291,41 @@ class TestShutdownManager:
         status = manager.get_status()
         assert status["phase"] == "completed"
     
+    @pytest.mark.asyncio
+    async def test_notifications_flushed_before_host_shutdown(self, monkeypatch):
+        """通知在后台队列中发送，执行本机关机前需等待队列发送完毕"""
+        calls = []
+
+        async def mock_get_history():
+            class MockHistory:
+                async def add_event(self, *args, **kwargs):
+                    pass
+            return MockHistory()
+
+        class MockNotifier:
+            async def notify(self, event_type, title, content, *args, **kwargs):
+                calls.append(("notify", title))
+
+            async def flush(self, timeout=None):
+                calls.append(("flush", timeout))
+                return True
+
+        class RecordingShutdown:
+            async def shutdown(self):
+                calls.append(("shutdown", None))
+                return True
+
+        monkeypatch.setattr("services.shutdown_manager.get_history_service", mock_get_history)
+        monkeypatch.setattr("services.shutdown_manager.get_notifier_service", lambda: MockNotifier())
+
+        manager = ShutdownManager(RecordingShutdown(), test_mode="production")
+        assert await manager.immediate_shutdown() is True
+
+        shutdown_at = calls.index(("shutdown", None))
+        assert calls[shutdown_at - 1][0] == "flush"
+        assert calls[shutdown_at - 1][1] is not None  # 等待有上限
+        assert calls[shutdown_at + 1:] == [("notify", "宿主机关机中"), ("flush", calls[shutdown_at - 1][1])]
+
     @pytest.mark.asyncio
     async def test_hook_executor_cancellation(self, mock_shutdown_client, monkeypatch):
         """测试 Hook 执行器取消检查"""
@@ -0,0 +1,154 @@
+"""测试关机时间规划"""
+from types import SimpleNamespace
+import pytest
+from services.shutdown_manager import HOST_SHUTDOWN_RESERVE_SECONDS, ShutdownManager
+from services.shutdown_planner import (
+    DischargeTracker, HookDurationStore, ShutdownPlanner, sequence_duration
+)
+
+
+def _hook(name, priority=1, **extra):
+    return {"name": name, "priority": priority, "enabled": True, "timeout": 120, **extra}
+
+
+class TestDischargeTracker:
+    """测试放电速度跟踪"""
+
+    def test_reported_runtime_without_enough_samples(self):
+        tracker = DischargeTracker()
+        tracker.observe(90, 1200, now=0)
+
+        assert tracker.charge_slope() is None
+        assert tracker.projected_runtime() == 1200
+
+    def test_short_trend_is_not_trusted(self):
+        tracker = DischargeTracker()
+        # 30 秒内 3 个点的陡降不足以修正续航
+        for t in range(0, 31, 10):
+            tracker.observe(90 - t, 1200 - 10 * t, now=t)
+
+        assert tracker.runtime_slope() is None
+        assert tracker.projected_runtime() == 900
+
+    def test_runtime_corrected_by_actual_decline(self):
+        tracker = DischargeTracker()
+        # UPS 上报续航持续以每秒 1.5 秒的速度下降
+        for t in range(0, 241, 10):
+            tracker.observe(None, 1200 - 1.5 * t, now=t)
+
+        assert tracker.runtime_slope() == pytest.approx(-1.5)
+        assert tracker.projected_runtime() == pytest.approx(840 / 1.5)
+
+    def test_initial_sag_is_ignored(self):
+        tracker = DischargeTracker()
+        # 断电后第一分钟表面电荷压降，之后按真实时间下降
+        for t in range(0, 301, 10):
+            reported = 1200 - 5 * t if t <= 60 else 900 - (t - 60)
+            tracker.observe(None, reported, now=t)
+
+        assert tracker.runtime_slope() == pytest.approx(-1)
+        assert tracker.projected_runtime() == 660
+
+    def test_charge_extrapolated_to_low_threshold(self):
+        tracker = DischargeTracker()
+        # 每分钟掉 6%，续航上报偏乐观
+        for t in range(0, 241, 10):
+            tracker.observe(60 - 0.1 * t, 800 - t, now=t)
+
+        assert tracker.charge_slope() * 60 == pytest.approx(-6)
+        # 36% 降到 20% 需要 160 秒，但不低于上报续航 560 的一半
+        assert tracker.projected_runtime() == pytest.approx(360)
+        assert tracker.projected_runtime(low_charge=20) == pytest.approx(280)
+
+    def test_old_samples_leave_the_window(self):
+        tracker = DischargeTracker(window_seconds=60)
+        for t in range(0, 200, 10):
+            tracker.observe(100 - t * 0.01, None, now=t)
+
+        assert len(tracker._charge) == 7
+
+
+class TestHookDurationStore:
+    """测试任务耗时统计"""
+
+    @pytest.mark.asyncio
+    async def test_record_and_estimate(self):
+        store = HookDurationStore(alpha=0.5)
+        await store.record("nas", 40)
+        await store.record("nas", 20)
+
+        assert store.estimates()["nas"] == 30
+        stats = store.get_stats()["nas"]
+        assert stats["max"] == 40
+        assert stats["runs"] == 2
+
+    def test_sequence_duration_uses_critical_path(self):
+        hooks = [
+            _hook("vm1"),
+            _hook("vm2"),
+            _hook("nas", priority=2),
+            _hook("printer", priority=2, depends_on=[]),
+        ]
+        estimates = {"vm1": 50, "vm2": 90, "nas": 60, "printer": 10}
+
+        assert sequence_duration(hooks, estimates) == 150
+        assert sequence_duration([], estimates) == 0
+
+
+class TestShutdownPlanner:
+    """测试规划结果"""
+
+    def test_plan(self):
+        store = HookDurationStore()
+        store._durations["nas"] = {"avg": 100, "max": 100, "last": 100, "runs": 1}
+        planner = ShutdownPlanner(store)
+        for t in range(0, 61, 10):
+            planner.tracker.observe(None, 900 - t, now=t)
+
+        plan = planner.plan([_hook("nas")], final_wait_seconds=30, host_reserve_seconds=60)
+
+        # 100 + max(30, 20) + 30 + 60
+        assert plan["required_seconds"] == 220
+        assert plan["projected_runtime_seconds"] == 840
+        assert plan["slack_seconds"] == 620
+        assert plan["latest_safe_start"] is not None
+
+    def test_unknown_runtime(self):
+        plan = ShutdownPlanner(HookDurationStore()).plan([], 30, 60)
+
+        assert plan["slack_seconds"] is None
+        assert plan["latest_safe_start"] is None
+
+
+class TestShutdownManagerPlanning:
+    """测试 ShutdownManager 按规划提前关机"""
+
+    @pytest.mark.asyncio
+    async def test_plan_triggers_early_shutdown(self, mock_shutdown_client, monkeypatch):
+        manager = ShutdownManager(mock_shutdown_client, final_wait_seconds=30)
+        manager.planner = ShutdownPlanner(HookDurationStore())
+        config = SimpleNamespace(pre_shutdown_hooks=[_hook("nas", timeout=300, estimated_seconds=200)])
+
+        async def get_config_manager():
+            return SimpleNamespace(get_config=_async(config))
+
+        monkeypatch.setattr("config.get_config_manager", get_config_manager)
+
+        # 预计续航充足
+        manager.planner.observe(SimpleNamespace(battery_charge=90, battery_runtime=1800))
+        assert await manager._update_plan() is False
+
+        # 预计续航低于 200 + 40 + 30 + 本机关机预留
+        manager.planner.reset()
+        manager.planner.observe(SimpleNamespace(battery_charge=40, battery_runtime=250 + HOST_SHUTDOWN_RESERVE_SECONDS))
+        assert await manager._update_plan() is True
+        assert manager._plan["required_seconds"] == 270 + HOST_SHUTDOWN_RESERVE_SECONDS
+
+        manager.on_power_restored()
+        assert manager._plan is None
+
+
+def _async(value):
+    async def _inner():
+        return value
+    return _inner
@@ -0,0 +1,172 @@
+"""测试 SSH 会话池"""
+import time
+import pytest
+import asyncssh
+import services.ssh_pool as ssh_pool_module
+from services.ssh_pool import SSHSessionPool, session_key, ssh_hook_configs
+
+
+class FakeConnection:
+    """假 SSH 连接"""
+
+    def __init__(self, host):
+        self.host = host
+        self.closed = False
+        self.broken = False
+        self.commands = []
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    async def run(self, command, check=False):
+        if self.broken:
+            raise asyncssh.ConnectionLost("connection lost")
+        self.commands.append(command)
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """替换 asyncssh.connect，记录建立的连接"""
+    created = []
+
+    async def fake_connect(**kwargs):
+        conn = FakeConnection(kwargs["host"])
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(ssh_pool_module.asyncssh, "connect", fake_connect)
+    return created
+
+
+def _config(host="nas.local", password="secret"):
+    return {"host": host, "port": 22, "username": "root", "auth_type": "password", "password": password}
+
+
+class TestSSHSessionPool:
+    """测试连接复用、探测与清理"""
+
+    @pytest.mark.asyncio
+    async def test_session_is_reused(self, connections):
+        pool = SSHSessionPool()
+        async with pool.session(_config()) as a:
+            await a.run("sync")
+        async with pool.session(_config()) as b:
+            await b.run("shutdown -h now")
+
+        assert a is b
+        assert len(connections) == 1
+        stats = pool.get_stats()
+        assert stats["connects"] == 1
+        assert stats["reuses"] == 1
+        assert stats["hosts"] == ["root@nas.local:22"]
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_credentials_change_uses_new_session(self, connections):
+        assert session_key(_config()) != session_key(_config(password="other"))
+        assert "secret" not in "".join(map(str, session_key(_config())))
+
+        pool = SSHSessionPool()
+        async with pool.session(_config()):
+            pass
+        async with pool.session(_config(password="other")):
+            pass
+        assert len(connections) == 2
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_idle_session_is_probed_before_reuse(self, connections):
+        pool = SSHSessionPool(probe_after=0)
+        async with pool.session(_config()):
+            pass
+
+        # 探测成功：继续复用
+        async with pool.session(_config()) as conn:
+            assert conn is connections[0]
+        assert connections[0].commands == ["exit 0"]
+
+        # 探测失败：重新连接
+        connections[0].broken = True
+        async with pool.session(_config()) as conn:
+            assert conn is connections[1]
+        assert connections[0].closed
+        assert pool.get_stats()["probe_failures"] == 1
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_error_drops_session(self, connections):
+        pool = SSHSessionPool()
+        with pytest.raises(asyncssh.ConnectionLost):
+            async with pool.session(_config()) as conn:
+                conn.broken = True
+                await conn.run("uptime")
+
+        assert connections[0].closed
+        assert pool.get_stats()["sessions"] == 0
+
+        async with pool.session(_config()):
+            pass
+        assert len(connections) == 2
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_discard_after_shutdown(self, connections):
+        pool = SSHSessionPool()
+        async with pool.session(_config()):
+            pass
+        pool.discard(_config())
+
+        assert connections[0].closed
+        assert pool.get_stats()["discarded"] == 1
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_prewarm_pins_until_released(self, connections, monkeypatch):
+        pool = SSHSessionPool(idle_ttl=0)
+        ready = await pool.prewarm([_config("a"), _config("b")])
+
+        assert ready == 2
+        assert pool.get_stats()["pinned"] == 2
+
+        # 固定的连接不会因空闲被清理
+        time.sleep(0.01)
+        assert pool.reap() == 0
+
+        # 已断开的连接总会被清理
+        connections[0].closed = True
+        assert pool.reap() == 1
+
+        pool.release_pins()
+        assert pool.reap() == 1
+        assert pool.get_stats()["sessions"] == 0
+        # 连接关闭后不再保留该主机的建连锁
+        assert pool._locks == {}
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_prewarm_tolerates_unreachable_hosts(self, monkeypatch):
+        async def failing_connect(**kwargs):
+            raise OSError("unreachable")
+
+        monkeypatch.setattr(ssh_pool_module.asyncssh, "connect", failing_connect)
+        pool = SSHSessionPool()
+
+        assert await pool.prewarm([_config("a"), _config("b")]) == 0
+        assert pool.get_stats()["connect_failures"] == 2
+        assert pool._locks == {}
+        await pool.close()
+
+
+def test_ssh_hook_configs():
+    hooks = [
+        {"hook_id": "ssh_shutdown", "enabled": True, "config": _config("a")},
+        {"hook_id": "windows_shutdown", "enabled": True, "config": _config("b")},
+        {"hook_id": "ssh_shutdown", "enabled": False, "config": _config("c")},
+        {"hook_id": "synology_shutdown", "enabled": True, "config": _config("d")},
+        {"hook_id": "ssh_shutdown", "enabled": True, "config": {}},
+    ]
+
+    assert [c["host"] for c in ssh_hook_configs(hooks)] == ["a", "b"]
@@ -0,0 +1,133 @@
+"""测试存储统计与容量预测"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from db.metric_store import INSERT_METRIC_SQL, metric_row
+from db.storage_stats import refresh_rollup_bounds
+from services.storage_stats import forecast_usage, growth_rate, load_storage_stats
+
+
+async def _table_stats(db, table):
+    row = await db.fetch_one(
+        "SELECT row_count, earliest, latest, bytes FROM storage_stats WHERE table_name = ?", (table,)
+    )
+    return tuple(row)
+
+
+class TestStorageTriggers:
+    """测试触发器维护的统计"""
+
+    @pytest.mark.asyncio
+    async def test_insert_and_delete_keep_stats_in_sync(self, real_db):
+        for day in ("2026-01-01", "2026-01-02", "2026-01-03"):
+            await real_db.execute(
+                "INSERT INTO events (event_type, message, timestamp) VALUES (?, ?, ?)",
+                ("STARTUP", "hello", f"{day} 12:00:00")
+            )
+
+        count, earliest, latest, size = await _table_stats(real_db, "events")
+        assert (count, earliest, latest) == (3, "2026-01-01 12:00:00", "2026-01-03 12:00:00")
+        assert size > 0
+
+        # 删除最早的记录后重新计算最早时间，并移除空的每日统计
+        await real_db.execute("DELETE FROM events WHERE timestamp < '2026-01-02'")
+        count, earliest, _, remaining = await _table_stats(real_db, "events")
+        assert (count, earliest) == (2, "2026-01-02 12:00:00")
+        assert remaining == size * 2 // 3
+        days = await real_db.fetch_all("SELECT day FROM storage_daily WHERE table_name = 'events' ORDER BY day")
+        assert [row[0] for row in days] == ["2026-01-02", "2026-01-03"]
+
+        await real_db.execute("DELETE FROM events")
+        assert await _table_stats(real_db, "events") == (0, None, None, 0)
+
+    @pytest.mark.asyncio
+    async def test_metric_batches_and_backfill(self, real_db):
+        await real_db.execute_many(
+            INSERT_METRIC_SQL,
+            [metric_row(f"2026-01-01 00:00:{i:02d}", {"battery_charge": 90}, "production") for i in range(10)]
+        )
+        tracked = await _table_stats(real_db, "metrics")
+
+        # 统计表丢失后重新连接时从现有数据回填，结果与增量维护一致
+        await real_db.execute("DELETE FROM storage_stats WHERE table_name = 'metrics'")
+        await real_db.close()
+        await real_db.connect()
+
+        assert await _table_stats(real_db, "metrics") == tracked
+
+
+    @pytest.mark.asyncio
+    async def test_rollup_bounds_refreshed_after_bulk_delete(self, real_db):
+        table = "metrics_rollup_1m"
+        await real_db.execute_many(
+            f"INSERT INTO {table} (test_mode, ups_id, bucket, samples) VALUES (?, ?, ?, 1)",
+            [(mode, "default", f"2026-01-0{day} 00:00:00") for mode in ("mock", "production") for day in (1, 2, 3)]
+        )
+        count, earliest, latest, _ = await _table_stats(real_db, table)
+        assert (count, earliest, latest) == (6, "2026-01-01 00:00:00", "2026-01-03 00:00:00")
+
+        # 删除触发器不逐行查询边界（rollup 表没有 bucket 索引）
+        row = await real_db.fetch_one(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"storage_stats_{table}_delete",)
+        )
+        assert "MIN(" not in row[0]
+
+        await real_db.execute(f"DELETE FROM {table} WHERE bucket < '2026-01-02'")
+        await refresh_rollup_bounds(real_db, [table])
+        count, earliest, latest, _ = await _table_stats(real_db, table)
+        assert (count, earliest, latest) == (4, "2026-01-02 00:00:00", "2026-01-03 00:00:00")
+
+        await real_db.execute(f"DELETE FROM {table}")
+        await refresh_rollup_bounds(real_db)
+        assert await _table_stats(real_db, table) == (0, None, None, 0)
+
+
+class TestForecast:
+    """测试增长速度和容量预测"""
+
+    def test_growth_rate_uses_complete_days(self):
+        now = datetime(2026, 1, 10, 6, 0, 0)
+        daily = [
+            {"day": "2026-01-08", "rows": 100, "bytes": 1000},
+            {"day": "2026-01-09", "rows": 300, "bytes": 3000},
+            {"day": "2026-01-10", "rows": 999, "bytes": 9999},
+        ]
+
+        # 从 1 月 8 日开始记录：两个完整的天
+        assert growth_rate(daily, "2026-01-08 00:00:00", now) == {"rows_per_day": 200, "bytes_per_day": 2000}
+
+    def test_growth_rate_first_day_is_extrapolated(self):
+        now = datetime(2026, 1, 10, 6, 0, 0)
+        daily = [{"day": "2026-01-10", "rows": 25, "bytes": 500}]
+
+        assert growth_rate(daily, "2026-01-10 00:00:00", now) == {"rows_per_day": 100, "bytes_per_day": 2000}
+
+    def test_forecast_usage(self):
+        tables = {
+            "events": {"bytes": 1000, "bytes_per_day": 100, "rows_per_day": 1},
+            "metrics": {"bytes": 1000, "bytes_per_day": 1000, "rows_per_day": 10},
+            "metrics_rollup_1h": {"bytes": 0, "bytes_per_day": 10, "rows_per_day": 0.1},
+        }
+        config = SimpleNamespace(history_retention_days=30, rollup_1h_retention_days=0)
+
+        result = forecast_usage(tables, config, db_size_bytes=4000)
+
+        assert result["overhead_factor"] == 2
+        assert result["projected_bytes"] == (100 + 1000) * 30 * 2
+        assert result["unbounded_tables"] == ["metrics_rollup_1h"]
+        assert result["tables"]["metrics_rollup_1h"]["projected_bytes"] is None
+
+    @pytest.mark.asyncio
+    async def test_load_storage_stats(self, real_db):
+        await real_db.execute(
+            "INSERT INTO events (event_type, message, timestamp) VALUES (?, ?, ?)",
+            ("STARTUP", "hello", "2026-01-09 12:00:00")
+        )
+
+        tables = await load_storage_stats(real_db, now=datetime(2026, 1, 10, 12, 0, 0))
+
+        assert tables["events"]["rows"] == 1
+        assert tables["events"]["daily"][0]["day"] == "2026-01-09"
+        assert tables["events"]["bytes_per_day"] == tables["events"]["bytes"]
+        assert tables["metrics"]["rows"] == 0
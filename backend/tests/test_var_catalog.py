@@ -0,0 +1,90 @@
+"""测试 NUT 变量目录（增量轮询）"""
+import pytest
+from services.nut_client import MockNutClient
+from services.var_catalog import VariableCatalog, HOT_VARIABLES, is_static_variable
+
+
+class RecordingClient(MockNutClient):
+    """记录请求的 Mock 客户端"""
+
+    def __init__(self):
+        super().__init__("localhost", 3493, "test", "test", "test-ups")
+        self.list_calls = 0
+        self.requested = []
+
+    async def list_vars(self):
+        self.list_calls += 1
+        return await super().list_vars()
+
+    async def get_vars(self, var_names):
+        self.requested.append(list(var_names))
+        return await super().get_vars(var_names)
+
+
+class TestVariableCatalog:
+    """测试 VariableCatalog"""
+
+    def test_static_classification(self):
+        assert is_static_variable("device.model")
+        assert is_static_variable("ups.serial")
+        assert is_static_variable("battery.mfr.date")
+        assert not is_static_variable("ups.status")
+        assert not is_static_variable("battery.voltage")
+
+    @pytest.mark.asyncio
+    async def test_first_read_is_full_then_hot_only(self):
+        """首次完整读取，之后只读取热变量"""
+        client = RecordingClient()
+        catalog = VariableCatalog(warm_ttl=3600)
+
+        first = await catalog.read(client)
+        assert client.list_calls == 1
+        assert first["ups.model"] == client._mock_data["ups.model"]
+
+        client._mock_data["battery.charge"] = "42"
+        second = await catalog.read(client)
+        assert client.list_calls == 1
+        assert set(client.requested[-1]) == {n for n in HOT_VARIABLES if n in client._mock_data}
+        assert second["battery.charge"] == "42"
+        # 未刷新的静态变量仍来自缓存
+        assert second["ups.model"] == first["ups.model"]
+
+    @pytest.mark.asyncio
+    async def test_invalidate_forces_full_refresh(self):
+        """DATACHANGED / 重连后完整刷新"""
+        client = RecordingClient()
+        catalog = VariableCatalog(warm_ttl=3600)
+        await catalog.read(client)
+
+        catalog.invalidate("DATACHANGED")
+        await catalog.read(client)
+        assert client.list_calls == 2
+
+    @pytest.mark.asyncio
+    async def test_status_change_triggers_full_refresh(self):
+        """状态变化时重新发现变量（如新出现的 ups.alarm）"""
+        client = RecordingClient()
+        catalog = VariableCatalog(warm_ttl=3600)
+        await catalog.read(client)
+
+        client._mock_data["ups.status"] = "OB DISCHRG"
+        client._mock_data["ups.alarm"] = "Replace battery!"
+        result = await catalog.read(client)
+
+        assert client.list_calls == 2
+        assert result["ups.alarm"] == "Replace battery!"
+
+    @pytest.mark.asyncio
+    async def test_failed_incremental_read_invalidates(self):
+        """增量读取失败返回空并在下次完整刷新"""
+        client = RecordingClient()
+        catalog = VariableCatalog(warm_ttl=3600)
+        await catalog.read(client)
+
+        async def broken_get_vars(var_names):
+            return {}
+        client.get_vars = broken_get_vars
+
+        assert await catalog.read(client) == {}
+        await catalog.read(client)
+        assert client.list_calls == 2
@@ -0,0 +1,190 @@
+"""测试 WebSocket 状态流（增量帧、关键帧、限流合并）"""
+import asyncio
+import json
+import pytest
+from api import websocket as ws_module
+from api.websocket import ClientChannel, ConnectionManager, StatusStream
+
+
+class FakeWebSocket:
+    """记录发送内容的假 WebSocket"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(text))
+
+
+async def _drain(rounds: int = 5):
+    for _ in range(rounds):
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+
+class TestStatusStream:
+    """测试状态流编码"""
+
+    def test_first_publish_is_keyframe(self):
+        stream = StatusStream("default", primary=True)
+        stream.publish({"status": "ONLINE", "battery_charge": 100})
+
+        assert stream.seq == 1
+        assert stream.delta_frame is None
+        frame = json.loads(stream.full_frame)
+        assert frame["type"] == "status_update"
+        assert frame["seq"] == 1
+        assert frame["data"]["battery_charge"] == 100
+
+    def test_delta_contains_only_changed_fields(self):
+        stream = StatusStream("default", primary=True)
+        stream.publish({"status": "ONLINE", "battery_charge": 100, "load_percent": 20})
+        stream.publish({"status": "ONLINE", "battery_charge": 99, "load_percent": 20})
+
+        delta = json.loads(stream.delta_frame)
+        assert delta == {"type": "status_delta", "seq": 2, "ups_id": "default", "data": {"battery_charge": 99}}
+
+    def test_periodic_keyframe(self, monkeypatch):
+        monkeypatch.setattr(ws_module, "KEYFRAME_INTERVAL", 3)
+        stream = StatusStream("default", primary=True)
+        stream.publish({"v": 0})
+        stream.publish({"v": 1})
+        stream.publish({"v": 2})
+        assert stream.delta_frame is not None
+        stream.publish({"v": 3})
+        assert stream.delta_frame is None
+
+    def test_keyframe_when_fields_removed_or_added(self):
+        stream = StatusStream("default", primary=True)
+        stream.publish({"status": "ONLINE", "battery_charge": 100, "alarm": "overload"})
+        stream.publish({"status": "ONLINE", "battery_charge": 100})
+        assert stream.delta_frame is None
+        assert "alarm" not in json.loads(stream.full_frame)["data"]
+
+        stream.publish({"status": "ONLINE", "battery_charge": 99})
+        assert stream.delta_frame is not None
+        stream.publish({"status": "ONLINE", "battery_charge": 99, "alarm": "overload"})
+        assert stream.delta_frame is None
+
+    def test_unit_stream_frame_types(self):
+        stream = StatusStream("rack2", primary=False)
+        stream.publish({"v": 0})
+        stream.publish({"v": 1})
+        assert json.loads(stream.full_frame)["type"] == "unit_status_update"
+        assert json.loads(stream.delta_frame)["type"] == "unit_status_delta"
+
+
+class TestClientChannel:
+    """测试单连接发送通道"""
+
+    @pytest.mark.asyncio
+    async def test_legacy_client_receives_full_frames(self):
+        manager = ConnectionManager()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket)
+
+        await manager.publish_status("default", {"v": 1})
+        await _drain()
+        await manager.publish_status("default", {"v": 2})
+        await _drain()
+        await manager.disconnect(websocket)
+
+        assert [m["type"] for m in websocket.sent] == ["status_update", "status_update"]
+        assert websocket.sent[-1]["data"] == {"v": 2}
+
+    @pytest.mark.asyncio
+    async def test_delta_client_receives_deltas_after_keyframe(self):
+        manager = ConnectionManager()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, delta=True)
+
+        await manager.publish_status("default", {"v": 1, "x": 0})
+        await _drain()
+        await manager.publish_status("default", {"v": 2, "x": 0})
+        await _drain()
+        await manager.disconnect(websocket)
+
+        assert websocket.sent[0]["type"] == "status_update"
+        assert websocket.sent[1] == {"type": "status_delta", "seq": 2, "ups_id": "default", "data": {"v": 2}}
+
+    @pytest.mark.asyncio
+    async def test_late_joiner_gets_keyframe(self):
+        manager = ConnectionManager()
+        await manager.publish_status("default", {"v": 1})
+        await manager.publish_status("default", {"v": 2})
+
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, delta=True)
+        await manager.publish_status("default", {"v": 3})
+        await _drain()
+        await manager.disconnect(websocket)
+
+        # 客户端没有收到 seq 2，第一帧必须是关键帧
+        assert websocket.sent[0]["type"] == "status_update"
+        assert websocket.sent[0]["data"] == {"v": 3}
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_coalesces_updates(self):
+        manager = ConnectionManager()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, delta=True, max_rate=5)
+
+        await manager.publish_status("default", {"v": 0})
+        await _drain()
+        for i in range(1, 6):
+            await manager.publish_status("default", {"v": i})
+        await asyncio.sleep(0.3)
+        await manager.disconnect(websocket)
+
+        # 第一帧立即发送，后续 5 次更新合并为一个关键帧
+        assert len(websocket.sent) == 2
+        assert websocket.sent[1]["type"] == "status_update"
+        assert websocket.sent[1]["data"] == {"v": 5}
+
+    @pytest.mark.asyncio
+    async def test_slow_client_does_not_block_broadcast(self):
+        manager = ConnectionManager()
+        slow = FakeWebSocket(delay=0.5)
+        fast = FakeWebSocket()
+        await manager.connect(slow)
+        await manager.connect(fast)
+
+        start = asyncio.get_running_loop().time()
+        await manager.broadcast({"type": "event", "data": {}})
+        await manager.publish_status("default", {"v": 1})
+        assert asyncio.get_running_loop().time() - start < 0.1
+
+        await _drain()
+        assert len(fast.sent) == 2
+        await manager.disconnect(slow)
+        await manager.disconnect(fast)
+
+    @pytest.mark.asyncio
+    async def test_message_queue_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(ws_module, "CLIENT_QUEUE_SIZE", 3)
+        channel = ClientChannel(FakeWebSocket())
+        for i in range(5):
+            channel.enqueue(json.dumps({"i": i}))
+
+        assert channel.dropped == 2
+        assert [json.loads(m)["i"] for m in channel._messages] == [2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_failed_send_removes_connection(self):
+        class BrokenWebSocket(FakeWebSocket):
+            async def send_text(self, text: str):
+                raise RuntimeError("closed")
+
+        manager = ConnectionManager()
+        await manager.connect(BrokenWebSocket())
+        await manager.broadcast({"type": "event"})
+        await _drain()
+        await manager.broadcast({"type": "event"})
+
+        assert manager.active_connections == []
@@ -13,11 +13,13 @@ const latestHookProgress = ref<any>(null)  // 最新的 Hook 执行进度更新
 const connectionEvent = ref<{ type: string; message: string; timestamp: number } | null>(null)  // NUT 连接状态事件
 const lastReceivedAt = ref<number>(0)  // 客户端最后收到数据的时间戳（用于判断数据是否过时）
 const configChanged = ref<number>(0)  // 配置变更计数器，每次变更 +1，触发监听者重新加载
+const deviceStatus = ref<any>(null)  // 最新一次设备连通性变化（后台探测推送）
 
 let ws: WebSocket | null = null
 let reconnectTimer: number | null = null
 let heartbeatTimer: number | null = null
 let connectionCount = 0  // 跟踪有多少组件正在使用
+let lastSeq = 0  // 最近一次应用的状态帧序号（增量帧必须连续）
 
 const connect = () => {
   // 如果已经连接或正在连接，不重复连接
@@ -28,12 +30,14 @@ const connect = () => {
   const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
   // 从全局变量读取 Token（由 main.ts bootstrap 时设置）
   const apiToken = (window as any).__UPS_GUARD_TOKEN__ || import.meta.env.VITE_API_TOKEN || ''
-  const wsUrl = `${protocol}//${window.location.host}/api/ws?token=${apiToken}`
+  // delta=1：订阅增量状态帧，只传输变化的字段
+  const wsUrl = `${protocol}//${window.location.host}/api/ws?token=${apiToken}&delta=1`
 
   try {
     ws = new WebSocket(wsUrl)
 
     ws.onopen = () => {
+      lastSeq = 0
       connected.value = true
       error.value = null
 
@@ -47,7 +51,17 @@ const connect = () => {
 
         if (message.type === 'status_update') {
           data.value = message.data
+          lastSeq = message.seq ?? 0
           lastReceivedAt.value = Date.now()  // 记录客户端收到数据的时间
+        } else if (message.type === 'status_delta') {
+          // 增量帧：序号不连续时请求完整状态
+          if (data.value && message.seq === lastSeq + 1) {
+            data.value = { ...data.value, ...message.data }
+            lastSeq = message.seq
+            lastReceivedAt.value = Date.now()
+          } else if (ws && ws.readyState === WebSocket.OPEN) {
+            ws.send('resync')
+          }
         } else if (message.type === 'shutdown_countdown') {
           // 处理关机倒计时更新
           if (data.value) {
@@ -79,6 +93,9 @@ const connect = () => {
         } else if (message.type === 'heartbeat') {
           // 心跳响应
           console.debug('Heartbeat received')
+        } else if (message.type === 'device_status') {
+          // 设备连通性变化（在线 / 离线、错误信息）
+          deviceStatus.value = message.data
         } else if (message.type === 'config_changed') {
           // 配置变更通知（如 Agent 自动注册 hook）
           configChanged.value++
@@ -169,6 +186,7 @@ export function useWebSocket() {
     connectionEvent,
     lastReceivedAt,
     configChanged,
+    deviceStatus,
     connect,
     disconnect
   }
@@ -84,6 +84,18 @@ export interface ShutdownStatus {
   elapsed_seconds?: number
   remaining_seconds?: number
   in_final_countdown?: boolean
+  phase?: string
+  plan?: ShutdownPlan | null  // 关机时间规划（等待阶段）
+}
+
+export interface ShutdownPlan {
+  projected_runtime_seconds: number | null  // 按放电速度修正后的预计续航（秒）
+  hooks_seconds: number  // 关机前置任务预计耗时（关键路径，秒）
+  required_seconds: number  // 完成关机流程所需时间（秒）
+  slack_seconds: number | null  // 余量（秒），<= 0 时立即开始关机
+  latest_safe_start: string | null  // 最晚安全开始时间
+  charge_slope_per_minute: number | null  // 电量变化速度（%/分钟）
+  runtime_slope: number | null  // 上报续航变化速度（秒/秒）
 }
 
 export interface Event {
@@ -132,6 +144,7 @@ export interface Config {
   wol_on_power_restore: boolean  // 来电后自动 WOL
   wol_delay_seconds: number  // WOL 延迟秒数
   device_status_check_interval_seconds: number  // 设备状态检测间隔（秒），0 表示禁用
+  battery_test_sample_interval_seconds: number  // 电池测试采样间隔（秒）
 }
 
 export interface NotifyChannel {
@@ -160,6 +173,8 @@ export interface PreShutdownHook {
   config: Record<string, any>
   auto_registered?: boolean  // 标记是否为 Agent 自动注册
   wol_enabled?: boolean  // 是否参与来电自动唤醒
+  depends_on?: string[]  // 依赖的任务名称（未设置时按优先级顺序）
+  estimated_seconds?: number  // 预计耗时（秒），用于按续航推算截止时间
 }
 
 export interface HookPlugin {